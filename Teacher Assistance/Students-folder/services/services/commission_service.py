@@ -3,14 +3,21 @@ Commission Automation Service
 Handles automatic commission creation based on user actions
 """
 
-from datetime import datetime, timedelta
-from auth.models import Affiliate, Referral, Commission, AffiliateClick
+from collections import defaultdict
+from datetime import datetime
+from auth.models import Affiliate, Referral, Commission, CommissionRunCheckpoint, User
 from extensions import db
-from sqlalchemy import and_
+from services.fraud_signals import FraudSignalStore, MAX_CLICKS_PER_IP, MAX_SAME_DOMAIN_REFERRALS
+from sqlalchemy import and_, bindparam, func, insert, select, update
+import click
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# Referrals per chunk (one SELECT, one INSERT, one commit) in the monthly run
+RECURRING_COMMISSION_CHUNK_SIZE = int(os.getenv('RECURRING_COMMISSION_CHUNK_SIZE', '500'))
+
 
 class CommissionService:
     """Service for handling automatic commission generation"""
@@ -69,6 +76,7 @@ class CommissionService:
             db.session.commit()
             
             logger.info(f"Created trial commission ${commission.amount} for affiliate {affiliate.id}")
+            CommissionService.detect_fraud(affiliate.id)
             return commission
             
         except Exception as e:
@@ -142,6 +150,7 @@ class CommissionService:
             db.session.commit()
             
             logger.info(f"Created conversion commission ${commission.amount} for affiliate {affiliate.id}")
+            CommissionService.detect_fraud(affiliate.id)
             return commission
             
         except Exception as e:
@@ -249,64 +258,189 @@ class CommissionService:
             logger.error(f"Error handling cancellation: {str(e)}")
     
     @staticmethod
-    def process_monthly_recurring_commissions():
+    def process_monthly_recurring_commissions(run_key=None, chunk_size=RECURRING_COMMISSION_CHUNK_SIZE):
         """
         Batch process all active referrals for recurring commissions
-        This should be run monthly via cron job
+        This should be run monthly via cron job ('flask process-recurring-commissions')
+
+        Referrals are read in id-keyed chunks. Per chunk the due months are
+        worked out from one SELECT, months already paid are found with one
+        more, the commissions go in as one multi-row INSERT, and referral and
+        affiliate totals are updated set-wise - all committed together with
+        the run's checkpoint. Rerunning the same run_key (the current month by
+        default) resumes after the last committed chunk and does nothing once
+        the run has completed.
         """
+        now = datetime.utcnow()
+        run_key = run_key or now.strftime('%Y-%m')
+
         try:
-            # Get all active converted referrals
-            active_referrals = Referral.query.filter_by(
-                status='converted',
-                subscription_status='active'
-            ).all()
-            
-            processed = 0
-            errors = 0
-            
-            for referral in active_referrals:
-                try:
-                    # Calculate which month this is
-                    if not referral.conversion_at:
-                        continue
-                    
-                    months_since_conversion = (
-                        (datetime.utcnow() - referral.conversion_at).days // 30
-                    )
-                    
-                    # Skip if not yet time for next month
-                    if months_since_conversion <= referral.months_subscribed:
+            checkpoint = CommissionRunCheckpoint.query.filter_by(run_key=run_key).first()
+            if checkpoint is None:
+                checkpoint = CommissionRunCheckpoint(
+                    run_key=run_key,
+                    as_of=now,
+                    status='running',
+                    processed=0,
+                    skipped=0,
+                    chunks=0
+                )
+                db.session.add(checkpoint)
+            elif checkpoint.status == 'completed':
+                logger.info(f"Recurring commission run {run_key} already completed")
+                return dict(checkpoint.to_dict(), errors=0)
+            else:
+                logger.info(f"Resuming recurring commission run {run_key} after referral {checkpoint.last_referral_id}")
+                checkpoint.status = 'running'
+                checkpoint.last_error = None
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error starting recurring commission run {run_key}: {str(e)}")
+            return {'run_key': run_key, 'status': 'failed', 'processed': 0, 'skipped': 0, 'errors': 1}
+
+        referrals = Referral.__table__
+        affiliates = Affiliate.__table__
+        commissions = Commission.__table__
+
+        # A resumed run uses the original start time, so it sees the same due months
+        as_of = checkpoint.as_of
+        last_id = checkpoint.last_referral_id
+        errors = 0
+
+        update_referral = update(referrals).where(
+            referrals.c.id == bindparam('referral_id'),
+            func.coalesce(referrals.c.months_subscribed, 0) < bindparam('month')
+        ).values(
+            months_subscribed=bindparam('month'),
+            total_commissions_paid=func.coalesce(referrals.c.total_commissions_paid, 0) + bindparam('amount')
+        )
+        update_affiliate = update(affiliates).where(
+            affiliates.c.id == bindparam('affiliate_id')
+        ).values(
+            pending_earnings=func.coalesce(affiliates.c.pending_earnings, 0) + bindparam('amount'),
+            total_earnings=func.coalesce(affiliates.c.total_earnings, 0) + bindparam('amount')
+        )
+
+        while True:
+            query = select(
+                referrals.c.id,
+                referrals.c.affiliate_id,
+                referrals.c.conversion_at,
+                referrals.c.months_subscribed,
+                affiliates.c.recurring_commission
+            ).select_from(
+                referrals.join(affiliates, affiliates.c.id == referrals.c.affiliate_id)
+            ).where(
+                referrals.c.status == 'converted',
+                referrals.c.subscription_status == 'active',
+                referrals.c.conversion_at.isnot(None),
+                affiliates.c.status == 'active',
+                affiliates.c.recurring_commission_enabled == True
+            )
+            if last_id is not None:
+                query = query.where(referrals.c.id > last_id)
+
+            try:
+                rows = db.session.execute(query.order_by(referrals.c.id).limit(chunk_size)).all()
+                if not rows:
+                    break
+
+                # Which month each referral is due for, if any
+                due = {}
+                for referral_id, affiliate_id, conversion_at, months_subscribed, amount in rows:
+                    months_subscribed = months_subscribed or 0
+                    if (as_of - conversion_at).days // 30 > months_subscribed:
+                        due[referral_id] = (affiliate_id, months_subscribed + 1, amount or 0.0)
+
+                paid = set()
+                if due:
+                    paid = {
+                        (referral_id, month) for referral_id, month in db.session.execute(
+                            select(commissions.c.referral_id, commissions.c.recurring_month).where(
+                                commissions.c.referral_id.in_(list(due)),
+                                commissions.c.is_recurring == True,
+                                commissions.c.recurring_month.in_({month for _, month, _ in due.values()})
+                            )
+                        ).all()
+                    }
+
+                commission_rows, referral_params, earnings = [], [], defaultdict(float)
+                for referral_id, (affiliate_id, month, amount) in due.items():
+                    if (referral_id, month) in paid:
+                        # Already paid (e.g. by a webhook); only bring the month counter up to date
+                        referral_params.append({'referral_id': referral_id, 'month': month, 'amount': 0.0})
                         continue
-                    
-                    # Create recurring commission
-                    next_month = referral.months_subscribed + 1
-                    commission = CommissionService.create_recurring_commission(
-                        referral.referred_user_id,
-                        next_month
-                    )
-                    
-                    if commission:
-                        processed += 1
-                    else:
-                        errors += 1
-                        
-                except Exception as e:
-                    logger.error(f"Error processing referral {referral.id}: {str(e)}")
-                    errors += 1
-                    continue
-            
-            logger.info(f"Processed {processed} recurring commissions, {errors} errors")
-            return {'processed': processed, 'errors': errors}
-            
+                    commission_rows.append({
+                        'affiliate_id': affiliate_id,
+                        'referral_id': referral_id,
+                        'amount': amount,
+                        'commission_type': f'recurring_month_{month}',
+                        'status': 'approved',
+                        'is_recurring': True,
+                        'recurring_month': month,
+                        'approved_at': now
+                    })
+                    referral_params.append({'referral_id': referral_id, 'month': month, 'amount': amount})
+                    earnings[affiliate_id] += amount
+
+                if commission_rows:
+                    db.session.execute(insert(commissions), commission_rows)
+                if referral_params:
+                    db.session.execute(update_referral, referral_params)
+                if earnings:
+                    # Fixed lock order so concurrent webhook updates cannot deadlock with us
+                    db.session.execute(update_affiliate, [
+                        {'affiliate_id': affiliate_id, 'amount': earnings[affiliate_id]}
+                        for affiliate_id in sorted(earnings)
+                    ])
+
+                checkpoint.last_referral_id = rows[-1][0]
+                checkpoint.processed = (checkpoint.processed or 0) + len(commission_rows)
+                checkpoint.skipped = (checkpoint.skipped or 0) + len(due) - len(commission_rows)
+                checkpoint.chunks = (checkpoint.chunks or 0) + 1
+                db.session.commit()
+
+            except Exception as e:
+                db.session.rollback()
+                errors += 1
+                logger.error(f"Error processing recurring commissions after referral {last_id}: {str(e)}")
+                try:
+                    checkpoint.status = 'failed'
+                    checkpoint.last_error = str(e)[:1000]
+                    db.session.commit()
+                except Exception as checkpoint_error:
+                    db.session.rollback()
+                    logger.error(f"Error saving recurring commission checkpoint: {str(checkpoint_error)}")
+                return dict(checkpoint.to_dict(), errors=errors)
+
+            last_id = checkpoint.last_referral_id
+            logger.info(f"Recurring commissions {run_key}: chunk {checkpoint.chunks} up to referral {last_id}, "
+                        f"{len(commission_rows)} created")
+
+        try:
+            checkpoint.status = 'completed'
+            checkpoint.completed_at = datetime.utcnow()
+            db.session.commit()
         except Exception as e:
-            logger.error(f"Error in batch processing: {str(e)}")
-            return {'processed': 0, 'errors': 0}
+            db.session.rollback()
+            errors += 1
+            logger.error(f"Error completing recurring commission run {run_key}: {str(e)}")
+
+        logger.info(f"Processed {checkpoint.processed} recurring commissions, {errors} errors")
+        return dict(checkpoint.to_dict(), errors=errors)
     
     @staticmethod
-    def detect_fraud(affiliate_id):
+    def detect_fraud(affiliate_id, ip_address=None):
         """
         Simple fraud detection
         Check for suspicious patterns
+
+        Runs after every trial signup and conversion commission. Reads the
+        incrementally maintained counters in services.fraud_signals rather
+        than the raw clicks and referrals (aggregate queries over those until
+        'flask rebuild-fraud-counters' has created them); pass the IP of a
+        click being handled to check only that IP's window.
         """
         try:
             affiliate = Affiliate.query.get(affiliate_id)
@@ -314,18 +448,8 @@ class CommissionService:
                 return False
             
             # Check 1: Too many clicks from same IP
-            recent_clicks = AffiliateClick.query.filter(
-                AffiliateClick.affiliate_id == affiliate_id,
-                AffiliateClick.created_at >= datetime.utcnow() - timedelta(days=1)
-            ).all()
-            
-            ip_counts = {}
-            for click in recent_clicks:
-                ip = click.ip_address
-                ip_counts[ip] = ip_counts.get(ip, 0) + 1
-            
             # Flag if any IP has more than 10 clicks in 24 hours
-            if any(count > 10 for count in ip_counts.values()):
+            if FraudSignalStore.excessive_clicks(affiliate_id, ip_address, MAX_CLICKS_PER_IP):
                 affiliate.suspicious_activity_count += 1
                 affiliate.fraud_flag = True
                 db.session.commit()
@@ -343,17 +467,10 @@ class CommissionService:
                     return True
             
             # Check 3: Self-referrals (same email domain)
-            referrals = Referral.query.filter_by(affiliate_id=affiliate_id).all()
-            affiliate_email_domain = affiliate.user.email.split('@')[1]
-            
-            suspicious_count = 0
-            for referral in referrals:
-                if referral.referred_email and '@' in referral.referred_email:
-                    ref_domain = referral.referred_email.split('@')[1]
-                    if ref_domain == affiliate_email_domain:
-                        suspicious_count += 1
+            affiliate_email = db.session.query(User.email).filter_by(id=affiliate.user_id).scalar()
+            suspicious_count = FraudSignalStore.referral_domain_count(affiliate_id, affiliate_email)
             
-            if suspicious_count > 3:  # More than 3 referrals from same domain
+            if suspicious_count > MAX_SAME_DOMAIN_REFERRALS:  # More than 3 referrals from same domain
                 affiliate.suspicious_activity_count += 1
                 logger.warning(f"Potential self-referral fraud for affiliate {affiliate_id}")
             
@@ -434,4 +551,20 @@ class WebhookHandler:
     def handle_paypal_webhook(event_type, data):
         """Handle PayPal webhook events"""
         # Similar implementation for PayPal
-        pass
\ No newline at end of file
+        pass
+
+
+def register_commission_jobs(app):
+    """Register the monthly recurring-commission CLI command (schedule it from cron)"""
+
+    @app.cli.command('process-recurring-commissions')
+    @click.argument('run_key', required=False)
+    def process_recurring_commissions_command(run_key):
+        """Create this month's recurring commissions; rerun to resume a stopped run"""
+        result = CommissionService.process_monthly_recurring_commissions(run_key=run_key)
+        if result['status'] == 'completed':
+            print(f"✅ Recurring commissions {result['run_key']}: {result['processed']} created, "
+                  f"{result['skipped']} already paid")
+        else:
+            print(f"❌ Recurring commissions {result['run_key']} stopped: {result.get('last_error')} "
+                  f"(rerun to resume)")
@@ -23,12 +23,10 @@ import jwt
 from flask import current_app
 from extensions import db
 from sqlalchemy import create_engine, event, inspect
-from sqlalchemy.pool import QueuePool
 from sqlalchemy.engine import Engine
 from flask import Flask, request, jsonify, render_template_string, redirect, url_for
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-import mysql.connector
 from flask_jwt_extended import create_access_token
 from mysql.connector import Error
 import anthropic
@@ -59,7 +57,6 @@ from markupsafe import Markup
 import html
 from sqlalchemy.pool import Pool
 from sqlalchemy import text
-from anthropic import Anthropic
 from twilio.rest import Client as TwilioClient
 # auth_bp import moved to after app creation (line ~250) to avoid import errors
 from flask import Blueprint
@@ -80,7 +77,7 @@ from services.commission_service import CommissionService
 from services.commission_service import WebhookHandler
 # auth_bp import removed (duplicate) - imported after app creation
 from auth.models import BlogSubscription, GeometryQuiz, GeometryQuizSubmission, LessonPlanModel, MathLessonPlanModel, QuizMasRegistration, QuizMasGameResult
-from auth.models import WebinarRegistration, WebinarFeedback
+from auth.models import WebinarRegistration, WebinarFeedback, CourseInterestLead
 from auth.models import ParentFeedback
 from auth.models import Student
 from auth.models import Tutor
@@ -129,7 +126,7 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 from sqlalchemy.exc import SQLAlchemyError, OperationalError
-from flask import Flask, request, jsonify, send_file, make_response, send_from_directory, abort
+from flask import Flask, request, jsonify, send_file, make_response, send_from_directory, abort, g
 from typing import List, Dict, Optional, Set, Tuple
 
 
@@ -200,15 +197,18 @@ app.config['SQLALCHEMY_ECHO'] = False  # Set to True for debugging
 app.config['SQLALCHEMY_RECORD_QUERIES'] = False  # Disable for performance
 
 # CRITICAL: Railway + comprehensive fix optimized connection pool settings
+# Size per gunicorn worker from the counters in /api/health/database (sqlalchemy_pool)
+from services.pool_liveness import InstrumentedQueuePool
 app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     # Connection Pool Settings
-    'pool_size': 10,                     # Max persistent connections
-    'max_overflow': 20,                  # Max overflow connections
+    'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),        # Max persistent connections
+    'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '20')),  # Max overflow connections
     'pool_timeout': 30,                  # Seconds to wait for connection
-    'poolclass': QueuePool,              # Use QueuePool for better management
+    'poolclass': InstrumentedQueuePool,  # QueuePool that records wait time and overflow use
     
     # Connection Health & Recycling - CRITICAL FIXES
-    'pool_pre_ping': True,               # CRITICAL: Test connection before use (prevents null errors)
+    # Liveness is checked by services.pool_liveness (ping only after DB_PING_IDLE_SECONDS idle)
+    'pool_pre_ping': False,
     'pool_recycle': 280,                 # CRITICAL: Recycle before Railway's 5-min timeout
     
     # MySQL Connection Settings
@@ -292,6 +292,10 @@ db.init_app(app)
 
 logger.info('✅ SQLAlchemy initialized with app')
 
+# Single liveness check + pool telemetry (replaces pool_pre_ping and the checkout listeners)
+from services.pool_liveness import pool_telemetry, register_pool_liveness
+register_pool_liveness(app)
+
 # Import auth_bp after app and db are initialized
 from auth.routes import auth_bp
 logger.info('✅ Auth blueprint imported')
@@ -367,15 +371,7 @@ def receive_connect(dbapi_conn, connection_record):
     except Exception as e:
         logger.warning(f'⚠️ Could not set session variables: {e}')
 
-@event.listens_for(Pool, "checkout")
-def receive_checkout(dbapi_conn, connection_record, connection_proxy):
-    """Verify connection before use"""
-    try:
-        with dbapi_conn.cursor() as cursor:
-            cursor.execute("SELECT 1")
-    except Exception as e:
-        logger.warning(f'💀 Dead connection detected: {e}')
-        raise exc.DisconnectionError()
+# Checkout liveness is handled once by services.pool_liveness
 
 # ============================================================================
 # HEALTH CHECK ENDPOINTS (CRITICAL - MUST BE FIRST)
@@ -406,7 +402,7 @@ logger.info('✅ Health check endpoints ready')
 def before_request():
     """
     REMOVED: Database connection check on every request
-    Reason: pool_pre_ping=True already handles dead connections efficiently.
+    Reason: services.pool_liveness already handles dead connections efficiently.
     The SELECT 1 check on every request was causing 504 timeouts due to:
     - Added latency on every request
     - Connection pool contention with multiple workers
@@ -421,7 +417,7 @@ def before_request():
         logger.info(f"View function: {app.view_functions.get(request.endpoint)}")
         logger.info(f"=========================================")
 
-    # No database check needed - pool_pre_ping handles this automatically
+    # No database check needed - services.pool_liveness handles this automatically
 
 @app.teardown_appcontext
 def shutdown_session(exception=None):
@@ -473,6 +469,9 @@ def handle_internal_error(error):
 # ============================================================================
 # TOKEN DECORATOR
 # ============================================================================
+# Auth decorators resolve principals through a short-lived in-process cache
+from services.principal_cache import get_principal
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -484,10 +483,9 @@ def token_required(f):
             return jsonify({'error': 'Token is missing'}), 401
         
         try:
-            from auth.models import User
             token = token.split(' ')[1]
             data = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
+            current_user = get_principal('user', data['user_id'])
             
             if not current_user or not current_user.is_active:
                 return jsonify({'error': 'Invalid user'}), 401
@@ -555,19 +553,6 @@ def execute_with_retry(func, max_retries=3, delay=0.5):
 # HEALTH CHECK ENDPOINT
 # =============================================================================
 
-# Add reconnection handling
-@event.listens_for(Pool, "checkout")
-def checkout_db_connection(dbapi_connection, connection_record, connection_proxy):
-    """Ensure the connection is alive before using it"""
-    try:
-        cursor = dbapi_connection.cursor()
-        cursor.execute("SELECT 1")
-        cursor.close()
-    except Exception as e:
-        # Connection is dead, raise DisconnectionError to get a new connection
-        logger.warning(f"Dead database connection detected: {str(e)}")
-        raise exc.DisconnectionError()
-
 # Add connection management for  MySQL
 @event.listens_for(Pool, "connect")
 def set_mysql_params(dbapi_connection, connection_record):
@@ -636,10 +621,13 @@ os.environ['GOOGLE_CLIENT_ID'] = '587123593268-765h8r0680mgtqvc3coko7dg66gqf7n2.
 mail = Mail(app)
 serializer = URLSafeTimedSerializer(JWT_SECRET_KEY) if JWT_SECRET_KEY else None
 
+# Every Anthropic client is wrapped so its calls get limits, retries and metrics
+from services.ai_gateway import AIGatewayBusy, ai_gateway
+
 # Configure Anthropic client
 anthropic_api_key = os.getenv('ANTHROPIC_API_KEY')
 if anthropic_api_key:
-    anthropic_client = anthropic.Anthropic(api_key=anthropic_api_key)
+    anthropic_client = ai_gateway.wrap(anthropic.Anthropic(api_key=anthropic_api_key))
     logger.info("✓ Anthropic client initialized")
 else:
     anthropic_client = None
@@ -692,6 +680,57 @@ app.register_blueprint(affiliate_bp)
 from services.commission_service import CommissionService
 print("Commission service loaded successfully")
 
+# Chunked, resumable monthly run: 'flask process-recurring-commissions'
+from services.commission_service import register_commission_jobs
+register_commission_jobs(app)
+
+# Sliding-window click / referral-domain counters read by CommissionService.detect_fraud
+from services.fraud_signals import register_fraud_signals
+register_fraud_signals(app)
+
+# 'flask migrate-schema' (typed score columns, new tables, indexes) and the backfill commands
+from services.schema_migrations import register_schema_migrations
+register_schema_migrations(app)
+
+# 'flask index-advisor' plus optional query-shape recording (QUERY_SHAPE_LOG)
+from services.index_advisor import register_index_advisor
+register_index_advisor(app)
+
+# Opt-in per-request query counting / N+1 detection (QUERY_BUDGET_ENABLED=1)
+from services.query_budget import query_budget, register_query_budget
+register_query_budget(app)
+
+# Materialized student scoreboard, kept current by a session flush listener
+from services.leaderboard_service import LeaderboardService, register_leaderboard
+register_leaderboard(app)
+
+# Chunked multi-row task / subject / skill assignment for the bulk admin endpoints
+from services.bulk_assignment_service import BulkAssignmentService, parse_due_date
+
+# Atomic, set-based A-Card postings and the 'flask snapshot-acard-balances' command
+from services.acard_ledger import ACardLedger, InsufficientBalance, register_acard_ledger
+register_acard_ledger(app)
+
+# Constant-memory CSV/XLSX downloads for the admin export endpoints
+from services.streaming_export import export_column, formatted_date, stream_export, yes_no
+
+# In-memory prefix/trigram index for tutor suggestions and student lookups
+from services.search_index import SEARCH_INDEX_MAX_IDS, register_search_indexes, student_search_index, tutor_search_index
+register_search_indexes(app)
+
+# Memory + SQLite cache of model responses for endpoints with repeated prompts
+from services.llm_cache import cached_message, cached_text, cached_text_stream, has_json_object, llm_cache
+
+# Server-sent event responses for the streaming chat / lesson plan endpoints
+from services.sse_stream import IncrementalFormatter, sse_response
+
+from services.social_scoreboard_service import SocialMediaScoreboardService
+from services.analytics_service import TaskAnalyticsEngine
+
+# Optional read replica (MYSQL_REPLICA_URL) for @replica_reads endpoints
+from services.read_replica import init_read_replica, replica_reads, replica_status
+init_read_replica(app)
+
 
 # Define models
 # In your models.py or equivalent file
@@ -714,7 +753,7 @@ def token_required(f):
         try:
             token = token.split(' ')[1]  # Remove 'Bearer ' prefix
             data = jwt.decode(token, JWT_SECRET_KEY, algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
+            current_user = get_principal('user', data['user_id'])
             
             if not current_user:
                 return jsonify({'error': 'User not found'}), 401
@@ -724,23 +763,8 @@ def token_required(f):
             
             # Add subscription check for premium endpoints
             if is_premium_endpoint(request.path, request.method):
-                # Check subscription or trial status
-                has_active_subscription = False
-                
-                # Check trial period
-                if current_user.trial_ends_at and current_user.trial_ends_at > datetime.utcnow():
-                    has_active_subscription = True
-                else:
-                    # Check for active subscription
-                    subscription = Subscription.query.filter_by(
-                        user_id=current_user.id,
-                        status='active'
-                    ).first()
-                    
-                    if subscription and subscription.ends_at > datetime.utcnow():
-                        has_active_subscription = True
-                
-                if not has_active_subscription:
+                # Check trial period, then active subscription (cached with the principal)
+                if not current_user.has_active_subscription():
                     return jsonify({
                         'error': 'Subscription required',
                         'message': 'Your free trial has ended. Please subscribe to continue using this service.'
@@ -753,6 +777,31 @@ def token_required(f):
             return jsonify({'error': 'Invalid token'}), 401
             
     return decorated
+
+# ?async=1 on the slow generation endpoints queues the request as a background job
+from services.job_queue import job_queue, register_job_queue
+
+# Flask endpoint -> default job priority class (interactive quizzes ahead of documents)
+ASYNC_JOB_ENDPOINTS = {
+    'generate_quiz': 'high',
+    'generate_geometry_quiz_atomic_with_transformations': 'high',
+    'generate_questions_from_video': 'normal',
+    'lesson_plan_routes.generate_lesson_plan': 'normal',
+    'lesson_plan_routes.generate_stem_lesson_plan': 'normal',
+}
+
+def job_user_id():
+    """The user or student id in the request's bearer token, or None; only decides who owns a job"""
+    token = request.headers.get('Authorization', '')
+    try:
+        payload = jwt.decode(token.split(' ')[1], JWT_SECRET_KEY, algorithms=['HS256'])
+    except Exception:
+        return None
+    owner = payload.get('user_id') or payload.get('sub') or payload.get('student_id')
+    return str(owner) if owner is not None else None
+
+register_job_queue(app, ASYNC_JOB_ENDPOINTS, identify=job_user_id)
+
 # Setup CORS
 CORS(app, resources={
     r"/*": {
@@ -785,9 +834,9 @@ def ping():
     """Ultra-fast ping endpoint"""
     return 'pong', 200
 
-anthropic_client = anthropic.Anthropic(
+anthropic_client = ai_gateway.wrap(anthropic.Anthropic(
     api_key=os.getenv('ANTHROPIC_API_KEY')
-)
+))
 logger.info(f"Anthropic API key configured: {bool(os.getenv('ANTHROPIC_API_KEY'))}")
 
 # Import and register blueprints
@@ -863,6 +912,13 @@ if MYSQL_URL:
 else:
     DB_CONFIG = {}
 
+# Shared, bounded pool for the raw mysql.connector paths (story builder, enrollment)
+from services.connection_pool import (
+    MYSQL_POOL, configure_pool, get_pool, pool_metrics,
+    mysql_connection_factory, sqlite_connection_factory
+)
+configure_pool(MYSQL_POOL, mysql_connection_factory(DB_CONFIG))
+
 # Register coach blueprint
 logger.info("=" * 60)
 logger.info("ATTEMPTING TO REGISTER COACH BLUEPRINT")
@@ -1071,8 +1127,8 @@ def student_required(f):
                     logger.warning('Token missing student_id and sub')
                     return jsonify({'error': 'Invalid token format'}), 401
                 
-                # Get student from database
-                student = Student.query.get(student_id)
+                # Get student from database (via the principal cache)
+                student = get_principal('student', student_id)
                 if not student:
                     logger.warning(f'Student not found: {student_id}')
                     return jsonify({'error': 'Student not found'}), 404
@@ -1661,12 +1717,9 @@ def admin_required(f):
             return jsonify({'error': 'Token is invalid or expired'}), 401
         
         try:
-            admin = Admin.query.filter_by(
-                id=payload['admin_id'],
-                is_active=True
-            ).first()
+            admin = get_principal('admin', payload['admin_id'])
             
-            if not admin:
+            if not admin or not admin.is_active:
                 return jsonify({'error': 'Admin not found or inactive'}), 401
             
             # Store admin in request context
@@ -2253,8 +2306,23 @@ def bulk_assign_subjects():
             'details': []
         }
 
+        # Validate once: one query each for the students and the subjects
+        students = {
+            str(student.id): student for student in db.session.query(Student.id, Student.name, Student.email)
+            .filter(Student.id.in_(data['student_ids'])).all()
+        }
+        subject_names = dict(
+            db.session.query(Subject.id, Subject.name).filter(Subject.id.in_(data['subject_ids'])).all()
+        )
+
+        # Existing rows checked per chunk as a set; inserts are multi-row
+        assigned = BulkAssignmentService.assign_links(
+            StudentSubject, 'subject_id', request.current_admin.id,
+            [student.id for student in students.values()], list(subject_names)
+        )
+
         for student_id in data['student_ids']:
-            student = Student.query.get(student_id)
+            student = students.get(str(student_id))
             if not student:
                 results['details'].append({
                     'student_id': student_id,
@@ -2264,36 +2332,7 @@ def bulk_assign_subjects():
                 results['failed_assignments'] += 1
                 continue
 
-            assigned_subjects = []
-            for subject_id in data['subject_ids']:
-                try:
-                    subject = Subject.query.get(subject_id)
-                    if not subject:
-                        continue
-
-                    # Check if already assigned
-                    existing = StudentSubject.query.filter_by(
-                        student_id=student_id,
-                        subject_id=subject_id
-                    ).first()
-
-                    if existing:
-                        if not existing.is_active:
-                            existing.is_active = True
-                            existing.assigned_at = datetime.utcnow()
-                            existing.admin_id = request.current_admin.id
-                            assigned_subjects.append(subject.name)
-                    else:
-                        student_subject = StudentSubject(
-                            student_id=student_id,
-                            subject_id=subject_id,
-                            admin_id=request.current_admin.id
-                        )
-                        db.session.add(student_subject)
-                        assigned_subjects.append(subject.name)
-
-                except Exception as e:
-                    logger.error(f"Error assigning subject {subject_id} to student {student_id}: {str(e)}")
+            assigned_subjects = [subject_names[subject_id] for subject_id in assigned.get(student.id, [])]
 
             if assigned_subjects:
                 results['details'].append({
@@ -2532,8 +2571,23 @@ def bulk_assign_skills():
             'details': []
         }
 
+        # Validate once: one query each for the students and the skills
+        students = {
+            str(student.id): student for student in db.session.query(Student.id, Student.name, Student.email)
+            .filter(Student.id.in_(data['student_ids'])).all()
+        }
+        skill_names = dict(
+            db.session.query(Skill.id, Skill.name).filter(Skill.id.in_(data['skill_ids'])).all()
+        )
+
+        # Existing rows checked per chunk as a set; inserts are multi-row
+        assigned = BulkAssignmentService.assign_links(
+            StudentSkill, 'skill_id', request.current_admin.id,
+            [student.id for student in students.values()], list(skill_names)
+        )
+
         for student_id in data['student_ids']:
-            student = Student.query.get(student_id)
+            student = students.get(str(student_id))
             if not student:
                 results['details'].append({
                     'student_id': student_id,
@@ -2543,36 +2597,7 @@ def bulk_assign_skills():
                 results['failed_assignments'] += 1
                 continue
 
-            assigned_skills = []
-            for skill_id in data['skill_ids']:
-                try:
-                    skill = Skill.query.get(skill_id)
-                    if not skill:
-                        continue
-
-                    # Check if already assigned
-                    existing = StudentSkill.query.filter_by(
-                        student_id=student_id,
-                        skill_id=skill_id
-                    ).first()
-
-                    if existing:
-                        if not existing.is_active:
-                            existing.is_active = True
-                            existing.assigned_at = datetime.utcnow()
-                            existing.admin_id = request.current_admin.id
-                            assigned_skills.append(skill.name)
-                    else:
-                        student_skill = StudentSkill(
-                            student_id=student_id,
-                            skill_id=skill_id,
-                            admin_id=request.current_admin.id
-                        )
-                        db.session.add(student_skill)
-                        assigned_skills.append(skill.name)
-
-                except Exception as e:
-                    logger.error(f"Error assigning skill {skill_id} to student {student_id}: {str(e)}")
+            assigned_skills = [skill_names[skill_id] for skill_id in assigned.get(student.id, [])]
 
             if assigned_skills:
                 results['details'].append({
@@ -2760,7 +2785,8 @@ def get_student_tasks_with_scores():
             if task.status == 'completed' and (completion_data or score_breakdown):
                 raw_score = score_breakdown.get('raw_game_score') or completion_data.get('raw_score') or completion_data.get('score', 0)
                 max_score = score_breakdown.get('max_possible_score') or completion_data.get('max_score', 100)
-                percentage = score_breakdown.get('percentage_achieved') or completion_data.get('score_percentage')
+                # Rows not backfilled yet only have the score in completion_data
+                percentage = score_breakdown.get('percentage_achieved') or task.score_percentage or completion_data.get('score_percentage')
                 
                 # Calculate percentage if not stored
                 if not percentage and max_score > 0:
@@ -2771,7 +2797,7 @@ def get_student_tasks_with_scores():
                     'max_score': max_score,
                     'percentage': percentage,
                     'performance_level': get_performance_level(percentage) if percentage else None,
-                    'time_spent': completion_data.get('time_spent', 0),
+                    'time_spent': task.time_spent if task.time_spent is not None else completion_data.get('time_spent', 0),
                     'games_played': completion_data.get('performance_data', {}).get('gamesPlayed', 0)
                 }
             
@@ -2871,7 +2897,8 @@ def get_student_tasks_by_subject(subject_code):
             if task.status == 'completed' and (completion_data or score_breakdown):
                 raw_score = score_breakdown.get('raw_game_score') or completion_data.get('raw_score') or completion_data.get('score', 0)
                 max_score = score_breakdown.get('max_possible_score') or completion_data.get('max_score', 100)
-                percentage = score_breakdown.get('percentage_achieved') or completion_data.get('score_percentage')
+                # Rows not backfilled yet only have the score in completion_data
+                percentage = score_breakdown.get('percentage_achieved') or task.score_percentage or completion_data.get('score_percentage')
 
                 # Calculate percentage if not stored
                 if not percentage and max_score > 0:
@@ -2882,7 +2909,7 @@ def get_student_tasks_by_subject(subject_code):
                     'max_score': max_score,
                     'percentage': percentage,
                     'performance_level': get_performance_level(percentage) if percentage else None,
-                    'time_spent': completion_data.get('time_spent', 0),
+                    'time_spent': task.time_spent if task.time_spent is not None else completion_data.get('time_spent', 0),
                     'games_played': completion_data.get('performance_data', {}).get('gamesPlayed', 0)
                 }
 
@@ -2956,105 +2983,86 @@ def get_detailed_student_analytics():
         except jwt.InvalidTokenError:
             return jsonify({'error': 'Invalid token'}), 401
             
-        # Get completed tasks with score data
-        tasks = StudentTask.query.filter_by(
-            student_id=student_id, 
-            status='completed'
-        ).order_by(StudentTask.completed_at.desc()).all()
+        # Score aggregates straight from the typed score columns
+        completed_filter = (StudentTask.student_id == student_id) & (StudentTask.status == 'completed')
+        # A score without a max_score counts out of 100, as it always has here
+        pct = db.func.coalesce(
+            StudentTask.score_percentage,
+            case((StudentTask.max_score.is_(None), StudentTask.score), else_=None)
+        )
+        valid = pct > 0
+
+        def count_where(condition):
+            return db.func.coalesce(db.func.sum(case((condition, 1), else_=0)), 0)
+
+        (total_completed, valid_scores, average_pct, highest_pct, lowest_pct,
+         outstanding, excellent, great, good, fair, needs_practice) = db.session.query(
+            db.func.count(StudentTask.id),
+            count_where(valid),
+            db.func.avg(case((valid, pct), else_=None)),
+            db.func.max(case((valid, pct), else_=None)),
+            db.func.min(case((valid, pct), else_=None)),
+            count_where(valid & (pct >= 95)),
+            count_where(valid & (pct >= 90) & (pct < 95)),
+            count_where(valid & (pct >= 80) & (pct < 90)),
+            count_where(valid & (pct >= 70) & (pct < 80)),
+            count_where(valid & (pct >= 60) & (pct < 70)),
+            count_where(valid & (pct < 60))
+        ).filter(completed_filter).one()
         
         detailed_analytics = {
             'score_analytics': {
-                'total_tasks_completed': len(tasks),
-                'average_score_percentage': 0,
-                'highest_score_percentage': 0,
-                'lowest_score_percentage': 100 if len(tasks) > 0 else 0,
+                'total_tasks_completed': int(total_completed),
+                'average_score_percentage': round(float(average_pct), 1) if valid_scores else 0,
+                'highest_score_percentage': float(highest_pct) if valid_scores else 0,
+                'lowest_score_percentage': float(lowest_pct) if valid_scores else 0,
                 'score_distribution': {
-                    'outstanding': 0,  # 95%+
-                    'excellent': 0,    # 90-94%
-                    'great': 0,        # 80-89%
-                    'good': 0,         # 70-79%
-                    'fair': 0,         # 60-69%
-                    'needs_practice': 0 # <60%
+                    'outstanding': int(outstanding),  # 95%+
+                    'excellent': int(excellent),      # 90-94%
+                    'great': int(great),              # 80-89%
+                    'good': int(good),                # 70-79%
+                    'fair': int(fair),                # 60-69%
+                    'needs_practice': int(needs_practice)  # <60%
                 }
             },
             'recent_performances': [],
             'score_trend': []
         }
         
-        total_percentage = 0
-        valid_scores = 0
-        
-        for task in tasks:
-            try:
-                task_data = json.loads(task.task_data) if task.task_data else {}
-                completion_data = task_data.get('completion_data', {})
-                
-                raw_score = completion_data.get('raw_score', 0) or completion_data.get('score', 0)
-                max_score = completion_data.get('max_score', 100)
-                percentage = completion_data.get('score_percentage', 0)
-                
-                # Calculate percentage if not stored
-                if not percentage and max_score > 0 and raw_score > 0:
-                    percentage = round((raw_score / max_score) * 100, 1)
-                
-                if percentage > 0:
-                    total_percentage += percentage
-                    valid_scores += 1
-                    
-                    # Update min/max
-                    detailed_analytics['score_analytics']['highest_score_percentage'] = max(
-                        detailed_analytics['score_analytics']['highest_score_percentage'], 
-                        percentage
-                    )
-                    detailed_analytics['score_analytics']['lowest_score_percentage'] = min(
-                        detailed_analytics['score_analytics']['lowest_score_percentage'], 
-                        percentage
-                    )
-                    
-                    # Update distribution
-                    if percentage >= 95:
-                        detailed_analytics['score_analytics']['score_distribution']['outstanding'] += 1
-                    elif percentage >= 90:
-                        detailed_analytics['score_analytics']['score_distribution']['excellent'] += 1
-                    elif percentage >= 80:
-                        detailed_analytics['score_analytics']['score_distribution']['great'] += 1
-                    elif percentage >= 70:
-                        detailed_analytics['score_analytics']['score_distribution']['good'] += 1
-                    elif percentage >= 60:
-                        detailed_analytics['score_analytics']['score_distribution']['fair'] += 1
-                    else:
-                        detailed_analytics['score_analytics']['score_distribution']['needs_practice'] += 1
-                
-                # Add to recent performances (last 10)
-                if len(detailed_analytics['recent_performances']) < 10:
-                    detailed_analytics['recent_performances'].append({
-                        'task_title': task.task_title,
-                        'task_type': task.task_type,
-                        'raw_score': raw_score,
-                        'max_score': max_score,
-                        'percentage': percentage,
-                        'performance_level': get_performance_level(percentage),
-                        'completed_at': task.completed_at.isoformat() if task.completed_at else None,
-                        'time_spent': completion_data.get('time_spent', 0)
-                    })
-                
-                # Add to score trend (last 15 for chart)
-                if len(detailed_analytics['score_trend']) < 15:
-                    detailed_analytics['score_trend'].append({
-                        'task_title': task.task_title[:15] + '...' if len(task.task_title) > 15 else task.task_title,
-                        'percentage': percentage,
-                        'completed_at': task.completed_at.isoformat() if task.completed_at else None
-                    })
-                    
-            except Exception as task_error:
-                logger.warning(f"Error processing task {task.id} for analytics: {task_error}")
-                continue
-        
-        # Calculate average
-        if valid_scores > 0:
-            detailed_analytics['score_analytics']['average_score_percentage'] = round(total_percentage / valid_scores, 1)
-        else:
-            detailed_analytics['score_analytics']['lowest_score_percentage'] = 0
+        # Only the most recent completions are materialized (15 for the trend chart)
+        recent_tasks = db.session.query(
+            StudentTask.task_title,
+            StudentTask.task_type,
+            StudentTask.score,
+            StudentTask.max_score,
+            pct.label('score_percentage'),
+            StudentTask.time_spent,
+            StudentTask.completed_at
+        ).filter(completed_filter).order_by(StudentTask.completed_at.desc()).limit(15).all()
+        
+        for task in recent_tasks:
+            percentage = task.score_percentage or 0
+            completed_at = task.completed_at.isoformat() if task.completed_at else None
+            
+            # Add to recent performances (last 10)
+            if len(detailed_analytics['recent_performances']) < 10:
+                detailed_analytics['recent_performances'].append({
+                    'task_title': task.task_title,
+                    'task_type': task.task_type,
+                    'raw_score': task.score or 0,
+                    'max_score': task.max_score if task.max_score is not None else 100,
+                    'percentage': percentage,
+                    'performance_level': get_performance_level(percentage),
+                    'completed_at': completed_at,
+                    'time_spent': task.time_spent or 0
+                })
+            
+            # Add to score trend (last 15 for chart)
+            detailed_analytics['score_trend'].append({
+                'task_title': task.task_title[:15] + '...' if len(task.task_title) > 15 else task.task_title,
+                'percentage': percentage,
+                'completed_at': completed_at
+            })
         
         # Reverse trend to show oldest first
         detailed_analytics['score_trend'].reverse()
@@ -3091,84 +3099,63 @@ def get_basic_student_analytics():
         except jwt.InvalidTokenError:
             return jsonify({'error': 'Invalid token'}), 401
             
-        # Get all tasks for this student using existing query
-        tasks = StudentTask.query.filter_by(student_id=student_id).all()
+        # Status counts and score sums from the typed score columns
+        is_completed = StudentTask.status == 'completed'
+        with_data = is_completed & StudentTask.score.isnot(None)
+
+        def sum_where(condition, value=1):
+            return db.func.coalesce(db.func.sum(case((condition, value), else_=0)), 0)
+
+        total_tasks, completed_count, pending_count, total_time, total_score, total_max_score = db.session.query(
+            db.func.count(StudentTask.id),
+            sum_where(is_completed),
+            sum_where(StudentTask.status == 'pending'),
+            sum_where(with_data, db.func.coalesce(StudentTask.time_spent, 0)),
+            sum_where(with_data, db.func.coalesce(StudentTask.score, 0)),
+            sum_where(with_data, db.func.coalesce(StudentTask.max_score, 100))
+        ).filter(StudentTask.student_id == student_id).one()
+        
+        task_type_label = db.func.coalesce(StudentTask.task_type, 'unknown')
+        task_types = db.session.query(task_type_label, db.func.count(StudentTask.id)).filter(
+            StudentTask.student_id == student_id
+        ).group_by(task_type_label).all()
         
         # Initialize analytics data
         analytics = {
-            'total_tasks': len(tasks),
-            'completed_tasks': 0,
-            'pending_tasks': 0,
+            'total_tasks': int(total_tasks),
+            'completed_tasks': int(completed_count),
+            'pending_tasks': int(pending_count),
             'avg_time_spent': 0,
             'avg_score': 0,
-            'task_types': {},
+            'task_types': {task_type: int(count) for task_type, count in task_types},
             'recent_submissions': []
         }
         
-        # Process each task
-        total_time = 0
-        total_score = 0
-        total_max_score = 0
-        completed_count = 0
-        
-        for task in tasks:
-            # Count by status
-            if task.status == 'completed':
-                analytics['completed_tasks'] += 1
-                completed_count += 1
-                
-                # Parse task data
-                task_data = {}
-                completion_data = {}
-                try:
-                    if task.task_data:
-                        task_data = json.loads(task.task_data)
-                        completion_data = task_data.get('completion_data', {})
-                except json.JSONDecodeError:
-                    pass
-                
-                # Add to recent submissions
-                analytics['recent_submissions'].append({
-                    'task_title': task.task_title,
-                    'task_type': task.task_type,
-                    'status': task.status,
-                    'completed_at': task.completed_at.isoformat() if task.completed_at else None,
-                    'completion_data': completion_data,
-                    'points_reward': task.points_reward,
-                    'acard_credit': float(task.acard_credit) if task.acard_credit else 0
-                })
-                
-                # Process completion data for averages
-                if completion_data:
-                    time_spent = completion_data.get('time_spent', 0)
-                    score = completion_data.get('score', 0)
-                    max_score = completion_data.get('max_score', 100)
-                    
-                    total_time += time_spent
-                    total_score += score
-                    total_max_score += max_score
-                    
-            elif task.status == 'pending':
-                analytics['pending_tasks'] += 1
-            
-            # Count task types
-            task_type = task.task_type or 'unknown'
-            analytics['task_types'][task_type] = analytics['task_types'].get(task_type, 0) + 1
-        
         # Calculate averages
         if completed_count > 0:
-            analytics['avg_time_spent'] = int(total_time / completed_count)
-            if total_max_score > 0:
-                analytics['avg_score'] = int((total_score / total_max_score) * 100)
-        
-        # Sort recent submissions by completion date (most recent first)
-        analytics['recent_submissions'].sort(
-            key=lambda x: x['completed_at'] or '0000-01-01T00:00:00', 
-            reverse=True
-        )
+            analytics['avg_time_spent'] = int(float(total_time) / int(completed_count))
+            if float(total_max_score) > 0:
+                analytics['avg_score'] = int((float(total_score) / float(total_max_score)) * 100)
+        
+        # Last 10 submissions, most recent first - only these rows decode task_data
+        recent_tasks = StudentTask.query.filter(
+            StudentTask.student_id == student_id,
+            is_completed
+        ).order_by(
+            StudentTask.completed_at.is_(None),
+            StudentTask.completed_at.desc()
+        ).limit(10).all()
         
-        # Limit recent submissions to last 10
-        analytics['recent_submissions'] = analytics['recent_submissions'][:10]
+        for task in recent_tasks:
+            analytics['recent_submissions'].append({
+                'task_title': task.task_title,
+                'task_type': task.task_type,
+                'status': task.status,
+                'completed_at': task.completed_at.isoformat() if task.completed_at else None,
+                'completion_data': task.completion_data,
+                'points_reward': task.points_reward,
+                'acard_credit': float(task.acard_credit) if task.acard_credit else 0
+            })
         
         logger.info(f"Basic analytics for student {student_id}: {analytics['total_tasks']} tasks, {analytics['completed_tasks']} completed")
         
@@ -3316,26 +3303,13 @@ def submit_task_completion(task_id):
             current_points = getattr(student, 'total_points', 0) or 0
             student.total_points = current_points + task.points_reward
         
-        # Credit A-Card
+        # Credit A-Card (atomic increment plus ledger row)
         if task.acard_credit > 0:
-            current_balance = float(getattr(student, 'acard_balance', 0) or 0)
-            new_balance = current_balance + float(task.acard_credit)
-            student.acard_balance = new_balance
-            
-            # Create transaction record if ACardTransaction exists
-            try:
-                transaction = ACardTransaction(
-                    student_id=student_id,
-                    task_id=task.id,
-                    transaction_type='task_reward',
-                    amount=float(task.acard_credit),
-                    description=f'Reward for: {task.task_title} ({score_percentage}%)',
-                    balance_after=new_balance
-                )
-                db.session.add(transaction)
-            except NameError:
-                # ACardTransaction model doesn't exist yet
-                logger.info(f"A-Card credited: ₳{task.acard_credit} (transaction model not available)")
+            ACardLedger.credit(
+                student_id, float(task.acard_credit), 'task_reward',
+                f'Reward for: {task.task_title} ({score_percentage}%)',
+                task_id=task.id
+            )
         
         db.session.commit()
         
@@ -3956,56 +3930,66 @@ def assign_social_media_tasks():
             except Exception as e:
                 logger.warning(f"⚠️ Invalid due date: {e}")
         
-        # Create tasks
-        assigned_tasks = []
-        for student in students:
-            task = SocialMediaTask(
-                student_id=student.id,
-                admin_id=request.current_admin.id,
-                task_type=data['task_type'],
-                skill_category=skill_category,
-                task_title=data['task_title'],
-                task_description=data.get('task_description', ''),
-                week_number=data.get('week_number'),
-                day_number=data.get('day_number'),
-                lesson_type=data.get('lesson_type', 'lesson'),
-                video_url=data.get('video_url'),
-                zoom_passcode=data.get('zoom_passcode'),
-                duration=data.get('duration'),
-                points_reward=data.get('points_reward', 0),
-                access_code=data.get('access_code'),
-                due_date=due_date,
-                task_data=json.dumps(data.get('task_data', {})),
-                status='pending'
-            )
-            
-            db.session.add(task)
-            db.session.flush()
-            
-            logger.info(f"✅ Task {task.id} created for {student.full_name}")
-            
-            assigned_tasks.append({
-                'task_id': task.id,
-                'student_id': student.id,
-                'student_name': student.full_name,
-                'task_title': task.task_title
-            })
-        
-        db.session.commit()
-        
-        logger.info(f"🎉 Successfully assigned {len(assigned_tasks)} tasks!")
+        # Create tasks with chunked multi-row inserts
+        outcome = BulkAssignmentService.assign_tasks(
+            request.current_admin.id,
+            [(student.id, student.full_name) for student in students],
+            [{
+                'task_type': data['task_type'],
+                'skill_category': skill_category,
+                'task_title': data['task_title'],
+                'task_description': data.get('task_description', ''),
+                'week_number': data.get('week_number'),
+                'day_number': data.get('day_number'),
+                'lesson_type': data.get('lesson_type', 'lesson'),
+                'video_url': data.get('video_url'),
+                'zoom_passcode': data.get('zoom_passcode'),
+                'duration': data.get('duration'),
+                'points_reward': data.get('points_reward', 0),
+                'access_code': data.get('access_code'),
+                'due_date': due_date,
+                'task_data': data.get('task_data', {})
+            }],
+            model=SocialMediaTask,
+            skip_existing=not data.get('allow_duplicates', False)
+        )
+        # Chunks before a failed one are already committed; report both sides
+        for failure in outcome['failed']:
+            logger.error(f"❌ Error creating task for student {failure['student_id']}: {failure['error']}")
+        
+        assigned_tasks = [{
+            'task_id': assignment['task_id'],
+            'student_id': assignment['student_id'],
+            'student_name': assignment['student_name'],
+            'task_title': assignment['task_title']
+        } for assignment in outcome['assignments']]
+        
+        if outcome['failed']:
+            logger.warning(f"⚠️ Assigned {len(assigned_tasks)} tasks, {len(outcome['failed'])} failed")
+        else:
+            logger.info(f"🎉 Successfully assigned {len(assigned_tasks)} tasks!")
         
         return jsonify({
-            'success': True,
-            'message': f'Successfully assigned {len(assigned_tasks)} tasks',
+            'success': not outcome['failed'],
+            'message': f'Successfully assigned {len(assigned_tasks)} tasks' + (
+                f", {len(outcome['failed'])} failed (send the request again to retry them)" if outcome['failed'] else ''
+            ),
             'assigned_tasks': assigned_tasks,
+            'failed_tasks': [{
+                'student_id': failure['student_id'],
+                'student_name': failure['student_name'],
+                'error': failure['error']
+            } for failure in outcome['failed']],
+            'failed_chunks': [chunk for chunk in outcome['chunks'] if chunk.get('status') == 'failed'],
+            'skipped_existing': len(outcome['skipped']),
+            'batch_id': outcome['batch_id'],
             'details': {
                 'admin': request.current_admin.name,
                 'skill_category': skill_category,
                 'task_title': data['task_title'],
                 'students_count': len(assigned_tasks)
             }
-        }), 201
+        }), 500 if outcome['failed'] and not assigned_tasks else 201
         
     except Exception as e:
         db.session.rollback()
@@ -4624,80 +4608,24 @@ def complete_social_media_task(task_id):
         }), 500
     
 @app.route('/api/social-media/scoreboard', methods=['GET'])
+@query_budget(max_queries=3)
+@replica_reads
 def get_social_media_scoreboard():
     """
     Get scoreboard of all social media students
+    Aggregated in one grouped query; served from a short-lived snapshot unless ?fresh=1
     """
     try:
-        students = SocialMediaStudent.query.all()
-        
-        scoreboard = []
-        
-        for student in students:
-            # Count total tasks
-            total_tasks = SocialMediaTask.query.filter_by(
-                student_id=student.id
-            ).count()
-            
-            # Count completed tasks
-            completed_tasks = SocialMediaTask.query.filter_by(
-                student_id=student.id,
-                status='completed'
-            ).count()
-            
-            # Calculate overall progress
-            overall_progress = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
-            
-            # FIXED: Get unique time spent per week (not summing duplicates)
-            # Get distinct weeks and their time
-            weekly_times = db.session.query(
-                SocialMediaProgress.week_number,
-                SocialMediaProgress.time_spent_minutes
-            ).filter_by(
-                student_id=student.id
-            ).distinct().all()
-            
-            # Sum the time from distinct weeks
-            total_time_spent = sum(week.time_spent_minutes or 0 for week in weekly_times)
-            
-            # Calculate average quiz score
-            tasks_with_scores = SocialMediaTask.query.filter(
-                SocialMediaTask.student_id == student.id,
-                SocialMediaTask.quiz_score.isnot(None),
-                SocialMediaTask.quiz_max_score.isnot(None),
-                SocialMediaTask.quiz_max_score > 0
-            ).all()
-            
-            if tasks_with_scores:
-                total_percentage = sum(
-                    (task.quiz_score / task.quiz_max_score * 100) 
-                    for task in tasks_with_scores
-                )
-                average_score = total_percentage / len(tasks_with_scores)
-            else:
-                average_score = 0
-            
-            scoreboard.append({
-                'id': student.id,
-                'name': student.full_name,
-                'email': student.email,
-                'category': student.category or 'General',
-                'lessons_completed': completed_tasks,
-                'total_lessons': total_tasks,
-                'overall_progress': round(overall_progress, 1),
-                'time_spent': int(total_time_spent),
-                'average_score': round(average_score, 1)
-            })
-        
-        # Sort by overall progress (descending)
-        scoreboard.sort(key=lambda x: x['overall_progress'], reverse=True)
+        use_cache = request.args.get('fresh', '').lower() not in ('1', 'true', 'yes')
+        scoreboard, generated_at = SocialMediaScoreboardService.get_scoreboard(use_cache=use_cache)
         
         logger.info(f"Scoreboard generated with {len(scoreboard)} students")
         
         return jsonify({
             'success': True,
             'scoreboard': scoreboard,
-            'total_students': len(scoreboard)
+            'total_students': len(scoreboard),
+            'generated_at': datetime.utcfromtimestamp(generated_at).isoformat()
         }), 200
         
     except Exception as e:
@@ -5230,324 +5158,18 @@ def admin_refresh_token():
 
 
 @app.route('/api/admin/analytics/comprehensive', methods=['GET'])
+@query_budget(max_queries=15)
 @admin_required
+@replica_reads
 def get_admin_comprehensive_analytics():
-    """Get comprehensive analytics for all students' tasks"""
+    """
+    Get comprehensive analytics for all students' tasks
+    Each section is a grouped SQL aggregate (see services/analytics_service.py)
+    """
     try:
-        # Get query parameters for filtering
-        school_filter = request.args.get('school', '')
-        grade_filter = request.args.get('grade', '')
-        date_from = request.args.get('date_from', '')
-        date_to = request.args.get('date_to', '')
-        
-        # Build base query
-        tasks_query = StudentTask.query.join(Student)
-        
-        # Apply filters
-        if school_filter:
-            tasks_query = tasks_query.filter(Student.school_name.ilike(f'%{school_filter}%'))
-        
-        if grade_filter:
-            tasks_query = tasks_query.filter(Student.grade_level == grade_filter)
-        
-        if date_from:
-            try:
-                from_date = datetime.fromisoformat(date_from)
-                tasks_query = tasks_query.filter(StudentTask.assigned_at >= from_date)
-            except ValueError:
-                pass
-        
-        if date_to:
-            try:
-                to_date = datetime.fromisoformat(date_to)
-                tasks_query = tasks_query.filter(StudentTask.assigned_at <= to_date)
-            except ValueError:
-                pass
-        
-        # Get all filtered tasks
-        all_tasks = tasks_query.all()
-        
-        # Initialize analytics data
-        analytics = {
-            'overview': {
-                'total_tasks': len(all_tasks),
-                'total_students': len(set(task.student_id for task in all_tasks)),
-                'completed_tasks': 0,
-                'pending_tasks': 0,
-                'in_progress_tasks': 0,
-                'avg_time_spent': 0,
-                'avg_score': 0,
-                'total_points_awarded': 0,
-                'total_acard_distributed': 0
-            },
-            'task_types': {},
-            'grade_performance': {},
-            'school_performance': {},
-            'recent_submissions': [],
-            'top_performers': [],
-            'completion_trends': [],
-            'time_analysis': {
-                'avg_time_by_type': {},
-                'fastest_completions': [],
-                'longest_completions': []
-            },
-            'score_distribution': {
-                'excellent': 0,  # 90-100%
-                'good': 0,       # 70-89%
-                'fair': 0,       # 50-69%
-                'needs_improvement': 0  # <50%
-            }
-        }
-        
-        # Process each task
-        total_time = 0
-        total_score = 0
-        total_max_score = 0
-        completed_count = 0
-        time_by_type = {}
-        submissions_for_sorting = []
-        
-        for task in all_tasks:
-            student = task.student
-            
-            # Count by status
-            if task.status == 'completed':
-                analytics['overview']['completed_tasks'] += 1
-                completed_count += 1
-                
-                # Process task data
-                task_data = json.loads(task.task_data) if task.task_data else {}
-                completion_data = task_data.get('completion_data', {})
-                
-                # Add to submissions for sorting
-                submissions_for_sorting.append({
-                    'id': task.id,
-                    'task_title': task.task_title,
-                    'task_type': task.task_type,
-                    'student_name': student.name,
-                    'student_grade': getattr(student, 'grade_level', 'N/A'),
-                    'school_name': getattr(student, 'school_name', 'N/A'),
-                    'status': task.status,
-                    'completed_at': task.completed_at.isoformat() if task.completed_at else None,
-                    'completion_data': completion_data,
-                    'points_reward': task.points_reward,
-                    'acard_credit': float(task.acard_credit or 0)
-                })
-                
-                # Calculate totals
-                analytics['overview']['total_points_awarded'] += task.points_reward or 0
-                analytics['overview']['total_acard_distributed'] += float(task.acard_credit or 0)
-                
-                # Process completion data
-                if completion_data:
-                    time_spent = completion_data.get('time_spent', 0)
-                    score = completion_data.get('score', 0)
-                    max_score = completion_data.get('max_score', 100)
-                    
-                    total_time += time_spent
-                    total_score += score
-                    total_max_score += max_score
-                    
-                    # Time analysis by type
-                    task_type = task.task_type
-                    if task_type not in time_by_type:
-                        time_by_type[task_type] = {'total_time': 0, 'count': 0}
-                    time_by_type[task_type]['total_time'] += time_spent
-                    time_by_type[task_type]['count'] += 1
-                    
-                    # Score distribution
-                    if max_score > 0:
-                        score_percentage = (score / max_score) * 100
-                        if score_percentage >= 90:
-                            analytics['score_distribution']['excellent'] += 1
-                        elif score_percentage >= 70:
-                            analytics['score_distribution']['good'] += 1
-                        elif score_percentage >= 50:
-                            analytics['score_distribution']['fair'] += 1
-                        else:
-                            analytics['score_distribution']['needs_improvement'] += 1
-                
-            elif task.status == 'pending':
-                analytics['overview']['pending_tasks'] += 1
-            elif task.status == 'in_progress':
-                analytics['overview']['in_progress_tasks'] += 1
-            
-            # Count task types
-            task_type = task.task_type
-            if task_type not in analytics['task_types']:
-                analytics['task_types'][task_type] = {
-                    'total': 0,
-                    'completed': 0,
-                    'pending': 0,
-                    'avg_score': 0,
-                    'avg_time': 0
-                }
-            
-            analytics['task_types'][task_type]['total'] += 1
-            if task.status == 'completed':
-                analytics['task_types'][task_type]['completed'] += 1
-            elif task.status == 'pending':
-                analytics['task_types'][task_type]['pending'] += 1
-            
-            # Grade performance analysis
-            grade = getattr(student, 'grade_level', 'Unknown')
-            if grade not in analytics['grade_performance']:
-                analytics['grade_performance'][grade] = {
-                    'total_tasks': 0,
-                    'completed_tasks': 0,
-                    'avg_score': 0,
-                    'student_count': 0
-                }
-            
-            analytics['grade_performance'][grade]['total_tasks'] += 1
-            if task.status == 'completed':
-                analytics['grade_performance'][grade]['completed_tasks'] += 1
-            
-            # School performance analysis
-            school = getattr(student, 'school_name', 'Unknown')
-            if school not in analytics['school_performance']:
-                analytics['school_performance'][school] = {
-                    'total_tasks': 0,
-                    'completed_tasks': 0,
-                    'avg_score': 0,
-                    'student_count': 0
-                }
-            
-            analytics['school_performance'][school]['total_tasks'] += 1
-            if task.status == 'completed':
-                analytics['school_performance'][school]['completed_tasks'] += 1
-        
-        # Calculate averages
-        if completed_count > 0:
-            analytics['overview']['avg_time_spent'] = total_time / completed_count
-            if total_max_score > 0:
-                analytics['overview']['avg_score'] = (total_score / total_max_score) * 100
-        
-        # Calculate average time by task type
-        for task_type, data in time_by_type.items():
-            if data['count'] > 0:
-                analytics['time_analysis']['avg_time_by_type'][task_type] = data['total_time'] / data['count']
-        
-        # Sort recent submissions by completion date
-        submissions_for_sorting.sort(
-            key=lambda x: x['completed_at'] or '0000-01-01T00:00:00', 
-            reverse=True
-        )
-        analytics['recent_submissions'] = submissions_for_sorting[:20]  # Last 20 submissions
-        
-        # Generate top performers (students with highest avg scores)
-        student_performances = {}
-        for submission in submissions_for_sorting:
-            student_name = submission['student_name']
-            if student_name not in student_performances:
-                student_performances[student_name] = {
-                    'name': student_name,
-                    'grade': submission['student_grade'],
-                    'school': submission['school_name'],
-                    'total_tasks': 0,
-                    'completed_tasks': 0,
-                    'total_score': 0,
-                    'total_max_score': 0,
-                    'avg_score': 0
-                }
-            
-            perf = student_performances[student_name]
-            perf['total_tasks'] += 1
-            
-            if submission['completion_data']:
-                perf['completed_tasks'] += 1
-                perf['total_score'] += submission['completion_data'].get('score', 0)
-                perf['total_max_score'] += submission['completion_data'].get('max_score', 100)
-        
-        # Calculate avg scores for top performers
-        for student_name, perf in student_performances.items():
-            if perf['total_max_score'] > 0:
-                perf['avg_score'] = (perf['total_score'] / perf['total_max_score']) * 100
-        
-        # Sort by avg score and take top 10
-        top_performers = sorted(
-            student_performances.values(), 
-            key=lambda x: x['avg_score'], 
-            reverse=True
-        )[:10]
-        
-        analytics['top_performers'] = top_performers
-        
-        # Generate completion trends (last 7 days)
-        from datetime import timedelta
-        today = datetime.utcnow().date()
-        trends = []
-        
-        for i in range(6, -1, -1):  # Last 7 days
-            date = today - timedelta(days=i)
-            date_start = datetime.combine(date, datetime.min.time())
-            date_end = datetime.combine(date, datetime.max.time())
-            
-            day_completed = sum(1 for task in all_tasks 
-                              if task.status == 'completed' and task.completed_at and 
-                              date_start <= task.completed_at <= date_end)
-            
-            trends.append({
-                'date': date.isoformat(),
-                'completed_tasks': day_completed
-            })
-        
-        analytics['completion_trends'] = trends
-        
-        # Calculate fastest and longest completions
-        completed_with_time = [
-            {
-                'task_title': sub['task_title'],
-                'student_name': sub['student_name'],
-                'time_spent': sub['completion_data'].get('time_spent', 0)
-            }
-            for sub in submissions_for_sorting 
-            if sub['completion_data'] and sub['completion_data'].get('time_spent', 0) > 0
-        ]
-        
-        analytics['time_analysis']['fastest_completions'] = sorted(
-            completed_with_time, 
-            key=lambda x: x['time_spent']
-        )[:5]
-        
-        analytics['time_analysis']['longest_completions'] = sorted(
-            completed_with_time, 
-            key=lambda x: x['time_spent'], 
-            reverse=True
-        )[:5]
-        
-        # Calculate grade and school averages
-        student_grades = {}
-        student_schools = {}
-        
-        for submission in submissions_for_sorting:
-            if submission['completion_data']:
-                grade = submission['student_grade']
-                school = submission['school_name']
-                score = submission['completion_data'].get('score', 0)
-                max_score = submission['completion_data'].get('max_score', 100)
-                
-                if max_score > 0:
-                    score_pct = (score / max_score) * 100
-                    
-                    # Grade averages
-                    if grade not in student_grades:
-                        student_grades[grade] = []
-                    student_grades[grade].append(score_pct)
-                    
-                    # School averages
-                    if school not in student_schools:
-                        student_schools[school] = []
-                    student_schools[school].append(score_pct)
-        
-        # Calculate final averages
-        for grade, scores in student_grades.items():
-            if grade in analytics['grade_performance'] and scores:
-                analytics['grade_performance'][grade]['avg_score'] = sum(scores) / len(scores)
-        
-        for school, scores in student_schools.items():
-            if school in analytics['school_performance'] and scores:
-                analytics['school_performance'][school]['avg_score'] = sum(scores) / len(scores)
+        # Filters: school, grade, date_from, date_to
+        engine = TaskAnalyticsEngine.from_request_args(request.args)
+        analytics = engine.comprehensive()
         
         return jsonify(analytics), 200
         
@@ -6189,103 +5811,73 @@ def bulk_assign_tasks():
                     'error': f'You do not have permission to assign tasks to: {", ".join(invalid_students)}'
                 }), 403
         
-        successful_assignments = []
+        # One template per task: due date and task_data are the same for every student
+        batch_time = datetime.now().isoformat()
+        templates = []
         failed_assignments = []
+        for task_index, task_data in enumerate(tasks_data):
+            frontend_task_type = task_data['task_type']
+            try:
+                due_date = parse_due_date(task_data.get('due_date'))
+            except ValueError as e:
+                logger.error(f"Date parsing error for task {task_index+1}: {str(e)}")
+                failed_assignments.extend({
+                    'student_id': student.id,
+                    'student_name': student.name,
+                    'task_index': task_index + 1,
+                    'error': f'Invalid due date format: {str(e)}'
+                } for student in students)
+                continue
+            
+            enhanced_task_data = dict(task_data.get('task_data') or {})
+            
+            # Flag based on admin role
+            if request.current_admin.role == 'super_admin':
+                enhanced_task_data['assigned_by_super_admin'] = True
+            else:
+                enhanced_task_data['assigned_by_grade_admin'] = True
+            
+            enhanced_task_data['assigned_by_admin_id'] = request.current_admin.id
+            enhanced_task_data['bulk_assignment'] = True
+            enhanced_task_data['bulk_assignment_batch'] = batch_time
+            
+            # Store original task type for reference
+            enhanced_task_data['original_task_type'] = frontend_task_type
+            
+            templates.append({
+                'task_index': task_index + 1,
+                'task_type': task_type_mapping.get(frontend_task_type, frontend_task_type),
+                'task_title': task_data['task_title'],
+                'task_description': task_data['task_description'],
+                'task_data': enhanced_task_data,
+                'points_reward': task_data.get('points_reward', 0),
+                'acard_credit': task_data.get('acard_credit', 0.0),
+                'due_date': due_date
+            })
         
-        # Process each task for each student
-        for student in students:
-            for task_index, task_data in enumerate(tasks_data):
-                try:
-                    # Map frontend task type to database constraint
-                    frontend_task_type = task_data['task_type']
-                    db_task_type = task_type_mapping.get(frontend_task_type, frontend_task_type)
-                    
-                    # Parse due date
-                    due_date = None
-                    if task_data.get('due_date'):
-                        try:
-                            due_date_str = task_data['due_date']
-                            if 'T' in due_date_str and 'Z' not in due_date_str and '+' not in due_date_str:
-                                due_date = datetime.fromisoformat(due_date_str)
-                            else:
-                                due_date = datetime.fromisoformat(due_date_str.replace('Z', '+00:00'))
-                            
-                            if due_date.hour == 0 and due_date.minute == 0:
-                                due_date = due_date.replace(hour=23, minute=59, second=59)
-                        except ValueError as e:
-                            logger.error(f"Date parsing error for task {task_index+1}: {str(e)}")
-                            failed_assignments.append({
-                                'student_id': student.id,
-                                'student_name': student.name,
-                                'task_index': task_index + 1,
-                                'error': f'Invalid due date format: {str(e)}'
-                            })
-                            continue
-                    
-                    # Prepare enhanced task data
-                    enhanced_task_data = task_data.get('task_data', {})
-                    
-                    # Flag based on admin role
-                    if request.current_admin.role == 'super_admin':
-                        enhanced_task_data['assigned_by_super_admin'] = True
-                    else:
-                        enhanced_task_data['assigned_by_grade_admin'] = True
-                    
-                    enhanced_task_data['assigned_by_admin_id'] = request.current_admin.id
-                    enhanced_task_data['bulk_assignment'] = True
-                    enhanced_task_data['bulk_assignment_batch'] = datetime.now().isoformat()
-                    
-                    # Store original task type for reference
-                    enhanced_task_data['original_task_type'] = frontend_task_type
-                    
-                    # Create the task
-                    task = StudentTask(
-                        student_id=student.id,
-                        admin_id=request.current_admin.id,
-                        task_type=db_task_type,
-                        task_title=task_data['task_title'],
-                        task_description=task_data['task_description'],
-                        task_data=json.dumps(enhanced_task_data),
-                        points_reward=task_data.get('points_reward', 0),
-                        acard_credit=task_data.get('acard_credit', 0.0),
-                        due_date=due_date,
-                        status='pending'
-                    )
-                    
-                    db.session.add(task)
-                    db.session.flush()  # Get the task ID
-                    
-                    successful_assignments.append({
-                        'student_id': student.id,
-                        'student_name': student.name,
-                        'task_id': task.id,
-                        'task_title': task_data['task_title'],
-                        'task_index': task_index + 1,
-                        'task_type_used': db_task_type,
-                        'original_task_type': frontend_task_type,
-                        'points_reward': task_data.get('points_reward', 0),
-                        'acard_credit': task_data.get('acard_credit', 0.0),
-                        'due_date': due_date.isoformat() if due_date else None
-                    })
-                    
-                    logger.info(f"Bulk assignment: Admin {request.current_admin.id} created task {task.id} "
-                              f"'{task_data['task_title']}' for student {student.id} ({student.name})")
-                
-                except Exception as task_error:
-                    logger.error(f"Error creating task {task_index+1} for student {student.id}: {str(task_error)}")
-                    failed_assignments.append({
-                        'student_id': student.id,
-                        'student_name': student.name,
-                        'task_index': task_index + 1,
-                        'task_title': task_data.get('task_title', 'Unknown'),
-                        'error': str(task_error)
-                    })
-                    continue
-        
-        # Commit all successful assignments
-        db.session.commit()
+        # Set-based insert of students x templates, committed chunk by chunk
+        outcome = BulkAssignmentService.assign_tasks(
+            request.current_admin.id,
+            [(student.id, student.name) for student in students],
+            templates,
+            notify=data.get('notify_students', True),
+            skip_existing=not data.get('allow_duplicates', False)
+        )
+        failed_assignments.extend(outcome['failed'])
         
-        # Prepare response
+        templates_by_index = {template['task_index']: template for template in templates}
+        successful_assignments = []
+        for assignment in outcome['assignments']:
+            template = templates_by_index[assignment['task_index']]
+            successful_assignments.append(dict(
+                assignment,
+                task_type_used=template['task_type'],
+                original_task_type=template['task_data']['original_task_type'],
+                points_reward=template['points_reward'],
+                acard_credit=template['acard_credit']
+            ))
+        
+        # Prepare response (each chunk was committed by the service)
         response_data = {
             'message': f'Bulk assignment completed',
             'total_assignments': len(successful_assignments),
@@ -6295,6 +5887,9 @@ def bulk_assign_tasks():
             'students_count': len(students),
             'assigned_by': request.current_admin.role,
             'assignments': successful_assignments,
+            'skipped_existing': len(outcome['skipped']),
+            'batch_id': outcome['batch_id'],
+            'chunks': outcome['chunks'],
             'success': True
         }
         
@@ -6446,51 +6041,43 @@ def assign_task():
 
         logger.info(f"Final task data: {task_data}")
 
-        assigned_tasks = []
-
-        # Create tasks for each student
+        # Look the students up in one query instead of one per id
+        students = db.session.query(Student.id, Student.name).filter(Student.id.in_(student_ids)).all()
+        found_ids = {str(student.id) for student in students}
         for student_id in student_ids:
-            student = Student.query.get(student_id)
-            if not student:
+            if str(student_id) not in found_ids:
                 logger.warning(f"Student with ID {student_id} not found, skipping")
-                continue
 
-            try:
-                task = StudentTask(
-                    student_id=student_id,
-                    admin_id=request.current_admin.id,  # This ensures proper ownership tracking
-                    task_type=db_task_type,
-                    task_title=data['task_title'],
-                    task_description=data['task_description'],
-                    task_data=json.dumps(task_data),
-                    points_reward=data.get('points_reward', 0),
-                    acard_credit=data.get('acard_credit', 0.0),
-                    due_date=due_date,
-                    status='pending'
-                )
-                
-                db.session.add(task)
-                db.session.flush()
-                
-                logger.info(f"Admin {request.current_admin.id} ({request.current_admin.role}) created task {task.id} for student {student_id}")
-                
-                assigned_tasks.append({
-                    'student_id': student_id,
-                    'student_name': student.name,
-                    'task_id': task.id,
-                    'task_type_used': db_task_type,
-                    'original_task_type': frontend_task_type,
-                    'external_url': external_url,
-                    'due_date': due_date.isoformat() if due_date else None,
-                    'link_type': link_type,
-                    'assigned_by': request.current_admin.role
-                })
-                
-            except Exception as task_error:
-                logger.error(f"Error creating task for student {student_id}: {str(task_error)}")
-                continue
+        outcome = BulkAssignmentService.assign_tasks(
+            request.current_admin.id,
+            [(student.id, student.name) for student in students],
+            [{
+                'task_type': db_task_type,
+                'task_title': data['task_title'],
+                'task_description': data['task_description'],
+                'task_data': task_data,
+                'points_reward': data.get('points_reward', 0),
+                'acard_credit': data.get('acard_credit', 0.0),
+                'due_date': due_date
+            }],
+            notify=data.get('notify_students', True),
+            skip_existing=not data.get('allow_duplicates', False)
+        )
+        for failure in outcome['failed']:
+            logger.error(f"Error creating task for student {failure['student_id']}: {failure['error']}")
+
+        assigned_tasks = [{
+            'student_id': assignment['student_id'],
+            'student_name': assignment['student_name'],
+            'task_id': assignment['task_id'],
+            'task_type_used': db_task_type,
+            'original_task_type': frontend_task_type,
+            'external_url': external_url,
+            'due_date': assignment['due_date'],
+            'link_type': link_type,
+            'assigned_by': request.current_admin.role
+        } for assignment in outcome['assignments']]
         
-        db.session.commit()
         logger.info(f"Successfully assigned {len(assigned_tasks)} tasks by {request.current_admin.role}")
         
         return jsonify({
@@ -6498,6 +6085,7 @@ def assign_task():
             'assigned_tasks': assigned_tasks,
             'task_type_mapping': f"{frontend_task_type} -> {db_task_type}",
             'assigned_by': request.current_admin.role,
+            'skipped_existing': len(outcome['skipped']),
             'success': True
         }), 201
         
@@ -6601,18 +6189,16 @@ def submit_withdrawal_request():
         # Save withdrawal request
         db.session.add(withdrawal)
         
-        # Deduct amount from student balance (hold it)
-        student.acard_balance = current_balance - amount
-        
-        # Create transaction record for the hold
-        hold_transaction = ACardTransaction(
-            student_id=student_id,
-            transaction_type='withdrawal_hold',
-            amount=-amount,
-            description=f'Hold for {request_type} withdrawal request',
-            balance_after=student.acard_balance
-        )
-        db.session.add(hold_transaction)
+        # Deduct amount from student balance (hold it). The row is locked and
+        # re-checked, so two concurrent requests cannot spend the same balance.
+        try:
+            hold = ACardLedger.debit(
+                student_id, amount, 'withdrawal_hold',
+                f'Hold for {request_type} withdrawal request'
+            )
+        except InsufficientBalance:
+            db.session.rollback()
+            return jsonify({'error': 'Insufficient balance'}), 400
         
         db.session.commit()
         
@@ -6623,7 +6209,7 @@ def submit_withdrawal_request():
             'message': f'{request_type.title()} withdrawal request submitted successfully',
             'request_id': withdrawal.id,
             'status': 'pending',
-            'new_balance': float(student.acard_balance)
+            'new_balance': hold.balance_after
         }), 201
         
     except ValueError as ve:
@@ -6788,6 +6374,14 @@ def approve_withdrawal(withdrawal_id):
         data = request.get_json() or {}
         admin_notes = data.get('admin_notes', '')
         
+        # Claim the pending request atomically so concurrent clicks cannot process it twice
+        claimed = WithdrawalRequest.query.filter_by(id=withdrawal_id, status='pending').update(
+            {'status': 'approved'}, synchronize_session=False
+        )
+        if not claimed:
+            db.session.rollback()
+            return jsonify({'error': 'Withdrawal request was already processed'}), 409
+        
         # Update withdrawal status
         withdrawal.status = 'approved'
         withdrawal.admin_id = request.current_admin.id
@@ -6834,6 +6428,14 @@ def reject_withdrawal(withdrawal_id):
         data = request.get_json() or {}
         admin_notes = data.get('admin_notes', 'Withdrawal request rejected')
         
+        # Claim the pending request atomically so concurrent clicks cannot process it twice
+        claimed = WithdrawalRequest.query.filter_by(id=withdrawal_id, status='pending').update(
+            {'status': 'rejected'}, synchronize_session=False
+        )
+        if not claimed:
+            db.session.rollback()
+            return jsonify({'error': 'Withdrawal request was already processed'}), 409
+        
         # Update withdrawal status
         withdrawal.status = 'rejected'
         withdrawal.admin_id = request.current_admin.id
@@ -6841,21 +6443,12 @@ def reject_withdrawal(withdrawal_id):
         withdrawal.admin_notes = admin_notes
         
         # Refund the amount back to student balance
-        student = withdrawal.student
-        current_balance = float(student.acard_balance or 0)
         refund_amount = float(withdrawal.amount)
-        student.acard_balance = current_balance + refund_amount
-        
-        # Create refund transaction
-        refund_transaction = ACardTransaction(
-            student_id=withdrawal.student_id,
-            admin_id=request.current_admin.id,
-            transaction_type='manual_credit',
-            amount=refund_amount,
-            description=f'Refund for rejected {withdrawal.request_type} withdrawal',
-            balance_after=student.acard_balance
+        refund = ACardLedger.credit(
+            withdrawal.student_id, refund_amount, 'manual_credit',
+            f'Refund for rejected {withdrawal.request_type} withdrawal',
+            admin_id=request.current_admin.id
         )
-        db.session.add(refund_transaction)
         
         db.session.commit()
         
@@ -6866,7 +6459,8 @@ def reject_withdrawal(withdrawal_id):
             'message': 'Withdrawal request rejected and amount refunded',
             'withdrawal_id': withdrawal.id,
             'status': 'rejected',
-            'refunded_amount': refund_amount
+            'refunded_amount': refund_amount,
+            'new_balance': refund.balance_after if refund else None
         }), 200
         
     except Exception as e:
@@ -7261,44 +6855,20 @@ def credit_acard():
         if amount <= 0:
             return jsonify({'error': 'Amount must be positive'}), 400
             
-        credited_students = []
-        
-        for student_id in student_ids:
-            try:
-                student = Student.query.get(student_id)
-                if not student:
-                    continue
-                    
-                # Get current balance (handle None case)
-                current_balance = float(student.acard_balance or 0)
-                new_balance = current_balance + amount
-                
-                # Update student balance
-                student.acard_balance = new_balance
-                
-                # Create transaction record
-                transaction = ACardTransaction(
-                    student_id=student_id,
-                    admin_id=request.current_admin.id,
-                    transaction_type='manual_credit',
-                    amount=amount,
-                    description=description,
-                    balance_after=new_balance
-                )
-                db.session.add(transaction)
-                
-                credited_students.append({
-                    'student_id': student_id,
-                    'student_name': student.name,
-                    'new_balance': new_balance
-                })
-                
-            except Exception as e:
-                logger.error(f"Error crediting student {student_id}: {str(e)}")
-                continue
-                
+        # One atomic UPDATE for every student plus one multi-row ledger INSERT
+        postings = ACardLedger.post(
+            student_ids, amount, 'manual_credit', description,
+            admin_id=request.current_admin.id
+        )
+        names = dict(db.session.query(Student.id, Student.name).filter(Student.id.in_(list(postings))).all())
         db.session.commit()
         
+        credited_students = [{
+            'student_id': student_id,
+            'student_name': names.get(student_id),
+            'new_balance': posting.balance_after
+        } for student_id, posting in postings.items()]
+        
         return jsonify({
             'message': f'A-Card credited for {len(credited_students)} students',
             'credited_students': credited_students
@@ -7372,6 +6942,37 @@ def get_acard_transactions():
         logger.error(f"Get A-Card transactions error: {str(e)}")
         return jsonify({'error': 'Failed to fetch transactions'}), 500
 
+# Get A-Card balance history (served from daily balance snapshots)
+@app.route('/api/admin/acard/balance-history', methods=['GET'])
+@admin_required
+def get_acard_balance_history():
+    """Daily A-Card balances for one student, plus the balance at a given moment (?as_of=)"""
+    try:
+        student_id = request.args.get('student_id', type=int)
+        days = min(request.args.get('days', 30, type=int), 366)
+        if not student_id:
+            return jsonify({'error': 'student_id is required'}), 400
+        
+        response_data = {
+            'student_id': student_id,
+            'days': days,
+            'history': ACardLedger.balance_history(student_id, days)
+        }
+        
+        if request.args.get('as_of'):
+            try:
+                as_of = datetime.fromisoformat(request.args['as_of'])
+            except ValueError:
+                return jsonify({'error': 'as_of must be an ISO datetime'}), 400
+            response_data['as_of'] = as_of.isoformat()
+            response_data['balance_at'] = ACardLedger.balance_at(student_id, as_of)
+        
+        return jsonify(response_data), 200
+        
+    except Exception as e:
+        logger.error(f"Get A-Card balance history error: {str(e)}")
+        return jsonify({'error': 'Failed to fetch balance history'}), 500
+
 # Application startup
 if __name__ == '__main__':
     with app.app_context():
@@ -7422,23 +7023,14 @@ def admin_complete_task(task_id):
             current_points = getattr(student, 'total_points', 0) or 0
             student.total_points = current_points + task.points_reward
         
-        # Credit A-Card
+        # Credit A-Card (atomic increment plus ledger row)
         if task.acard_credit > 0:
-            current_balance = float(getattr(student, 'acard_balance', 0) or 0)
-            new_balance = current_balance + float(task.acard_credit)
-            student.acard_balance = new_balance
-            
-            # Create transaction record
-            transaction = ACardTransaction(
-                student_id=task.student_id,
+            ACardLedger.credit(
+                task.student_id, float(task.acard_credit), 'admin_completion',
+                f'Admin completed task: {task.task_title}',
                 admin_id=request.current_admin.id,
-                task_id=task.id,
-                transaction_type='admin_completion',
-                amount=float(task.acard_credit),
-                description=f'Admin completed task: {task.task_title}',
-                balance_after=new_balance
+                task_id=task.id
             )
-            db.session.add(transaction)
         
         db.session.commit()
         
@@ -7492,7 +7084,7 @@ def super_admin_required(f):
                 logger.error("DEBUG - No admin_id in token")
                 return jsonify({'error': 'Invalid token'}), 401
             
-            admin = Admin.query.get(admin_id)
+            admin = get_principal('admin', admin_id)
             logger.info(f"DEBUG - Found admin: {admin}")
             
             if not admin:
@@ -8032,140 +7624,117 @@ def assign_grade_admin_task():
             # Process bulk assignment
             batch_id = datetime.now().isoformat()
             
+            students = db.session.query(Student.id, Student.name).filter(Student.id.in_(student_ids)).all()
+            found_ids = {str(student.id) for student in students}
             for student_id in student_ids:
-                student = Student.query.get(student_id)
-                if not student:
+                if str(student_id) not in found_ids:
                     failed_assignments.append({
                         'student_id': student_id,
                         'error': 'Student not found'
                     })
+            
+            def fail_for_every_student(task_index, task_data, error):
+                failed_assignments.extend({
+                    'student_id': student.id,
+                    'student_name': student.name,
+                    'task_index': task_index + 1,
+                    'task_title': task_data.get('task_title', 'Unknown'),
+                    'error': error
+                } for student in students)
+            
+            # Validate each task once; the result applies to every student
+            templates = []
+            max_acard_per_task = admin_assignment.max_acard_amount or 0
+            for task_index, task_data in enumerate(tasks_data):
+                # Check A-Card limit
+                acard_credit = float(task_data.get('acard_credit', 0))
+                if acard_credit > max_acard_per_task:
+                    fail_for_every_student(task_index, task_data, f'A-Card credit {acard_credit} exceeds limit of {max_acard_per_task}')
                     continue
                 
-                for task_index, task_data in enumerate(tasks_data):
-                    try:
-                        # Check A-Card limit
-                        acard_credit = float(task_data.get('acard_credit', 0))
-                        max_acard_per_task = admin_assignment.max_acard_amount or 0
-                        
-                        if acard_credit > max_acard_per_task:
-                            failed_assignments.append({
-                                'student_id': student_id,
-                                'student_name': student.name,
-                                'task_index': task_index + 1,
-                                'task_title': task_data.get('task_title', 'Unknown'),
-                                'error': f'A-Card credit {acard_credit} exceeds limit of {max_acard_per_task}'
-                            })
-                            continue
-                        
-                        # Parse due date
-                        due_date = None
-                        if task_data.get('due_date'):
-                            try:
-                                due_date_str = task_data['due_date']
-                                if 'T' in due_date_str and 'Z' not in due_date_str and '+' not in due_date_str:
-                                    due_date = datetime.fromisoformat(due_date_str)
-                                else:
-                                    due_date = datetime.fromisoformat(due_date_str.replace('Z', '+00:00'))
-                                
-                                if due_date.hour == 0 and due_date.minute == 0:
-                                    due_date = due_date.replace(hour=23, minute=59, second=59)
-                            except ValueError as e:
-                                failed_assignments.append({
-                                    'student_id': student_id,
-                                    'student_name': student.name,
-                                    'task_index': task_index + 1,
-                                    'error': f'Invalid due date: {str(e)}'
-                                })
-                                continue
-                        
-                        # Prepare task data
-                        enhanced_task_data = task_data.get('task_data', {})
-                        resource_id = enhanced_task_data.get('resource_id')
-                        
-                        if resource_id:
-                            # Validate resource access
-                            if resource_id not in available_resource_ids:
-                                failed_assignments.append({
-                                    'student_id': student_id,
-                                    'student_name': student.name,
-                                    'task_index': task_index + 1,
-                                    'error': 'Resource not assigned to you'
-                                })
-                                continue
-                            
-                            resource = admin_resources_dict[resource_id]
-                            enhanced_task_data.update({
-                                'resource_id': resource.id,
-                                'resource_type': resource.resource_type,
-                                'resource_title': resource.resource_title,
-                                'subject_category': resource.subject_category
-                            })
-                            
-                            # Set up resource links
-                            if resource.resource_type == 'internal_file' and resource.task_file:
-                                enhanced_task_data.update({
-                                    'task_file': resource.task_file,
-                                    'external_url': f'https://deciph.ai.deciphersacad.online/{resource.task_file}',
-                                    'link_type': 'internal',
-                                    'is_external': True
-                                })
-                            elif resource.resource_url:
-                                enhanced_task_data.update({
-                                    'external_url': resource.resource_url,
-                                    'link_type': 'external',
-                                    'is_external': True
-                                })
-                        
-                        # Add bulk assignment metadata
+                # Parse due date
+                try:
+                    due_date = parse_due_date(task_data.get('due_date'))
+                except ValueError as e:
+                    fail_for_every_student(task_index, task_data, f'Invalid due date: {str(e)}')
+                    continue
+                
+                # Prepare task data
+                enhanced_task_data = dict(task_data.get('task_data') or {})
+                resource_id = enhanced_task_data.get('resource_id')
+                resource = None
+                
+                if resource_id:
+                    # Validate resource access
+                    if resource_id not in available_resource_ids:
+                        fail_for_every_student(task_index, task_data, 'Resource not assigned to you')
+                        continue
+                    
+                    resource = admin_resources_dict[resource_id]
+                    enhanced_task_data.update({
+                        'resource_id': resource.id,
+                        'resource_type': resource.resource_type,
+                        'resource_title': resource.resource_title,
+                        'subject_category': resource.subject_category
+                    })
+                    
+                    # Set up resource links
+                    if resource.resource_type == 'internal_file' and resource.task_file:
                         enhanced_task_data.update({
-                            'assigned_by_grade_admin': True,
-                            'grade_section': admin_assignment.grade_section,
-                            'bulk_assignment': True,
-                            'bulk_assignment_batch': batch_id,
-                            'assigned_by_admin_id': request.current_admin.id
-                        })
-                        
-                        # Determine task type
-                        frontend_task_type = task_data.get('task_type', 'mathematics')
-                        db_task_type = task_type_mapping.get(frontend_task_type, frontend_task_type)
-                        
-                        # Create task
-                        task = StudentTask(
-                            student_id=student_id,
-                            admin_id=request.current_admin.id,
-                            task_type=db_task_type,
-                            task_title=task_data['task_title'],
-                            task_description=task_data['task_description'],
-                            task_data=json.dumps(enhanced_task_data),
-                            points_reward=task_data.get('points_reward', 0),
-                            acard_credit=acard_credit,
-                            due_date=due_date,
-                            status='pending'
-                        )
-                        
-                        db.session.add(task)
-                        db.session.flush()
-                        
-                        successful_assignments.append({
-                            'student_id': student_id,
-                            'student_name': student.name,
-                            'task_id': task.id,
-                            'task_title': task_data['task_title'],
-                            'task_index': task_index + 1,
-                            'resource_used': resource.resource_title if resource_id else None,
-                            'external_url': enhanced_task_data.get('external_url'),
-                            'due_date': due_date.isoformat() if due_date else None
+                            'task_file': resource.task_file,
+                            'external_url': f'https://deciph.ai.deciphersacad.online/{resource.task_file}',
+                            'link_type': 'internal',
+                            'is_external': True
                         })
-                        
-                    except Exception as task_error:
-                        logger.error(f"Error creating bulk task: {str(task_error)}")
-                        failed_assignments.append({
-                            'student_id': student_id,
-                            'student_name': student.name,
-                            'task_index': task_index + 1,
-                            'task_title': task_data.get('task_title', 'Unknown'),
-                            'error': str(task_error)
+                    elif resource.resource_url:
+                        enhanced_task_data.update({
+                            'external_url': resource.resource_url,
+                            'link_type': 'external',
+                            'is_external': True
                         })
+                
+                # Add bulk assignment metadata
+                enhanced_task_data.update({
+                    'assigned_by_grade_admin': True,
+                    'grade_section': admin_assignment.grade_section,
+                    'bulk_assignment': True,
+                    'bulk_assignment_batch': batch_id,
+                    'assigned_by_admin_id': request.current_admin.id
+                })
+                
+                # Determine task type
+                frontend_task_type = task_data.get('task_type', 'mathematics')
+                
+                templates.append({
+                    'task_index': task_index + 1,
+                    'task_type': task_type_mapping.get(frontend_task_type, frontend_task_type),
+                    'task_title': task_data['task_title'],
+                    'task_description': task_data['task_description'],
+                    'task_data': enhanced_task_data,
+                    'points_reward': task_data.get('points_reward', 0),
+                    'acard_credit': acard_credit,
+                    'due_date': due_date,
+                    'resource_used': resource.resource_title if resource else None
+                })
+            
+            resource_used = {template['task_index']: template.pop('resource_used') for template in templates}
+            external_urls = {template['task_index']: template['task_data'].get('external_url') for template in templates}
+            
+            outcome = BulkAssignmentService.assign_tasks(
+                request.current_admin.id,
+                [(student.id, student.name) for student in students],
+                templates,
+                notify=data.get('notify_students', True),
+                skip_existing=not data.get('allow_duplicates', False)
+            )
+            failed_assignments.extend(outcome['failed'])
+            
+            for assignment in outcome['assignments']:
+                successful_assignments.append(dict(
+                    assignment,
+                    resource_used=resource_used[assignment['task_index']],
+                    external_url=external_urls[assignment['task_index']]
+                ))
         else:
             # Process single assignment (existing logic)
             resource_id = data.get('resource_id')
@@ -8262,52 +7831,48 @@ def assign_grade_admin_task():
                 db_task_type = task_type_mapping.get(data.get('task_type', 'mathematics'), 'math')
             
             # Create tasks for each student
+            students = db.session.query(Student.id, Student.name).filter(Student.id.in_(student_ids)).all()
+            found_ids = {str(student.id) for student in students}
             for student_id in student_ids:
-                student = Student.query.get(student_id)
-                if not student:
+                if str(student_id) not in found_ids:
                     failed_assignments.append({
                         'student_id': student_id,
                         'error': 'Student not found'
                     })
-                    continue
-                
-                try:
-                    task = StudentTask(
-                        student_id=student_id,
-                        admin_id=request.current_admin.id,
-                        task_type=db_task_type,
-                        task_title=data['task_title'],
-                        task_description=data['task_description'],
-                        task_data=json.dumps(task_data),
-                        points_reward=data.get('points_reward', 0),
-                        acard_credit=acard_credit,
-                        due_date=due_date,
-                        status='pending'
-                    )
-                    
-                    db.session.add(task)
-                    db.session.flush()
-                    
-                    successful_assignments.append({
-                        'student_id': student_id,
-                        'student_name': student.name,
-                        'task_id': task.id,
-                        'resource_used': resource_used_title or 'Direct Assignment',
-                        'external_url': task_data.get('external_url'),
-                        'due_date': due_date.isoformat() if due_date else None
-                    })
-                    
-                except Exception as task_error:
-                    logger.error(f"Error creating single resource task: {str(task_error)}")
-                    failed_assignments.append({
-                        'student_id': student_id,
-                        'error': str(task_error)
-                    })
-        
-        # Commit all successful assignments
-        db.session.commit()
+            
+            outcome = BulkAssignmentService.assign_tasks(
+                request.current_admin.id,
+                [(student.id, student.name) for student in students],
+                [{
+                    'task_type': db_task_type,
+                    'task_title': data['task_title'],
+                    'task_description': data['task_description'],
+                    'task_data': task_data,
+                    'points_reward': data.get('points_reward', 0),
+                    'acard_credit': acard_credit,
+                    'due_date': due_date
+                }],
+                notify=data.get('notify_students', True),
+                skip_existing=not data.get('allow_duplicates', False)
+            )
+            for failure in outcome['failed']:
+                logger.error(f"Error creating single resource task: {failure['error']}")
+                failed_assignments.append({
+                    'student_id': failure['student_id'],
+                    'error': failure['error']
+                })
+            
+            for assignment in outcome['assignments']:
+                successful_assignments.append({
+                    'student_id': assignment['student_id'],
+                    'student_name': assignment['student_name'],
+                    'task_id': assignment['task_id'],
+                    'resource_used': resource_used_title or 'Direct Assignment',
+                    'external_url': task_data.get('external_url'),
+                    'due_date': assignment['due_date']
+                })
         
-        # Prepare response
+        # Prepare response (each chunk was committed by the service)
         assignment_type = 'bulk' if is_bulk else 'single'
         
         response_data = {
@@ -8318,6 +7883,7 @@ def assign_grade_admin_task():
             'assignment_type': assignment_type,
             'assigned_tasks': successful_assignments,
             'grade_section': admin_assignment.grade_section,
+            'skipped_existing': len(outcome['skipped']),
             'success': True
         }
         
@@ -9474,6 +9040,9 @@ def bulk_update_tutor_status():
         
         db.session.commit()
         
+        # The bulk UPDATE bypasses the session listeners that keep the index current
+        tutor_search_index.refresh_keys(tutor_ids)
+        
         # Send notifications to affected tutors
         try:
             tutors = Tutor.query.filter(Tutor.id.in_(tutor_ids)).all()
@@ -9495,6 +9064,30 @@ def bulk_update_tutor_status():
         logger.error(f"Error in bulk update: {str(e)}")
         return jsonify({'error': 'Failed to update applications'}), 500
 
+# Columns of the tutor application export (?columns= picks a subset by key)
+TUTOR_APPLICATION_EXPORT_COLUMNS = [
+    export_column('id', 'ID'),
+    export_column('first_name'),
+    export_column('last_name'),
+    export_column('email'),
+    export_column('phone'),
+    export_column('country'),
+    export_column('date_of_birth', 'Date of Birth', formatted_date('date_of_birth', '%Y-%m-%d'), ['date_of_birth']),
+    export_column('timezone'),
+    export_column('education_level'),
+    export_column('teaching_experience'),
+    export_column('subjects', value=lambda row: ', '.join(row.subjects) if row.subjects else '', fields=['subjects']),
+    export_column('application_status'),
+    export_column('email_verified', value=yes_no('email_verified'), fields=['email_verified']),
+    export_column('resume_uploaded', value=yes_no('resume_filename'), fields=['resume_filename']),
+    export_column('assessment_completed', value=yes_no('assessment_completed'), fields=['assessment_completed']),
+    export_column('assessment_score', value=lambda row: row.assessment_score or '', fields=['assessment_score']),
+    export_column('onboarding_completed', value=yes_no('onboarding_completed'), fields=['onboarding_completed']),
+    export_column('bio_preview', value=lambda row: row.bio[:100] + '...' if len(row.bio) > 100 else row.bio, fields=['bio']),
+    export_column('applied_date', value=formatted_date('created_at'), fields=['created_at']),
+    export_column('last_updated', value=formatted_date('updated_at'), fields=['updated_at']),
+]
+
 # Export tutor applications to CSV
 @app.route('/api/admin/tutor-applications/export', methods=['GET'])
 @admin_required
@@ -9507,66 +9100,21 @@ def export_tutor_applications():
         if status_filter:
             query = query.filter(Tutor.application_status == status_filter)
         
-        tutors = query.order_by(Tutor.created_at.desc()).all()
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        headers = [
-            'ID', 'First Name', 'Last Name', 'Email', 'Phone', 'Country',
-            'Date of Birth', 'Timezone', 'Education Level', 'Teaching Experience',
-            'Subjects', 'Application Status', 'Email Verified', 'Resume Uploaded',
-            'Assessment Completed', 'Assessment Score', 'Onboarding Completed',
-            'Bio Preview', 'Applied Date', 'Last Updated'
-        ]
-        writer.writerow(headers)
-        
-        # Write data rows
-        for tutor in tutors:
-            row = [
-                tutor.id,
-                tutor.first_name,
-                tutor.last_name,
-                tutor.email,
-                tutor.phone,
-                tutor.country,
-                tutor.date_of_birth.strftime('%Y-%m-%d') if tutor.date_of_birth else '',
-                tutor.timezone,
-                tutor.education_level,
-                tutor.teaching_experience or '',
-                ', '.join(tutor.subjects) if tutor.subjects else '',
-                tutor.application_status,
-                'Yes' if tutor.email_verified else 'No',
-                'Yes' if tutor.resume_filename else 'No',
-                'Yes' if tutor.assessment_completed else 'No',
-                tutor.assessment_score or '',
-                'Yes' if tutor.onboarding_completed else 'No',
-                tutor.bio[:100] + '...' if len(tutor.bio) > 100 else tutor.bio,
-                tutor.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                tutor.updated_at.strftime('%Y-%m-%d %H:%M:%S') if tutor.updated_at else ''
-            ]
-            writer.writerow(row)
-        
-        # Prepare file for download
-        output.seek(0)
-        
-        # Create a BytesIO object for the response
-        csv_data = output.getvalue()
-        output.close()
-        
         # Create filename with timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'tutor_applications_{timestamp}.csv'
         
-        # Return CSV file
-        return app.response_class(
-            csv_data,
-            mimetype='text/csv',
-            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        # Rows are streamed straight from the cursor to the client
+        return stream_export(
+            query.order_by(Tutor.created_at.desc()),
+            TUTOR_APPLICATION_EXPORT_COLUMNS,
+            f'tutor_applications_{timestamp}',
+            source=Tutor,
+            fmt=request.args.get('format', 'csv'),
+            requested_columns=request.args.get('columns')
         )
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error exporting tutor applications: {str(e)}")
         return jsonify({'error': 'Failed to export data'}), 500
@@ -9574,6 +9122,7 @@ def export_tutor_applications():
 # Get tutor application analytics
 @app.route('/api/admin/tutor-analytics', methods=['GET'])
 @admin_required
+@replica_reads
 def get_tutor_analytics():
     try:
         # Applications by month (last 12 months)
@@ -9984,6 +9533,15 @@ def get_search_suggestions():
         if len(query) < 2:
             return jsonify({'suggestions': []}), 200
         
+        # Served from the in-memory index; best matches (exact / prefix) first
+        if tutor_search_index.ready:
+            suggestions = []
+            for hit in tutor_search_index.search(query, limit=8):
+                for suggestion in (hit.payload['name'], hit.payload['email']):
+                    if suggestion not in suggestions:
+                        suggestions.append(suggestion)
+            return jsonify({'suggestions': suggestions[:8]}), 200
+        
         # Search in names and emails
         search_term = f"%{query}%"
         suggestions = db.session.query(
@@ -10015,6 +9573,15 @@ def get_search_suggestions():
         logger.error(f"Error fetching search suggestions: {str(e)}")
         return jsonify({'suggestions': []}), 200
 
+SELECTED_TUTOR_EXPORT_COLUMNS = [
+    export_column('id', 'ID'),
+    export_column('name', value=lambda row: f"{row.first_name} {row.last_name}", fields=['first_name', 'last_name']),
+    export_column('email'),
+    export_column('subjects', value=lambda row: ', '.join(row.subjects) if row.subjects else '', fields=['subjects']),
+    export_column('status', value='application_status'),
+    export_column('applied_date', value=formatted_date('created_at', '%Y-%m-%d'), fields=['created_at']),
+]
+
 # Batch operations for efficiency
 @app.route('/api/admin/tutors/batch-export', methods=['POST'])
 @admin_required
@@ -10027,37 +9594,17 @@ def batch_export_tutors():
         if not tutor_ids:
             return jsonify({'error': 'No tutor IDs provided'}), 400
         
-        tutors = Tutor.query.filter(Tutor.id.in_(tutor_ids)).all()
-        
-        # Create CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Headers
-        headers = ['ID', 'Name', 'Email', 'Subjects', 'Status', 'Applied Date']
-        writer.writerow(headers)
-        
-        # Data
-        for tutor in tutors:
-            writer.writerow([
-                tutor.id,
-                f"{tutor.first_name} {tutor.last_name}",
-                tutor.email,
-                ', '.join(tutor.subjects) if tutor.subjects else '',
-                tutor.application_status,
-                tutor.created_at.strftime('%Y-%m-%d')
-            ])
-        
-        output.seek(0)
-        csv_data = output.getvalue()
-        output.close()
-        
-        return app.response_class(
-            csv_data,
-            mimetype='text/csv',
-            headers={'Content-Disposition': 'attachment; filename=selected_tutors.csv'}
+        return stream_export(
+            Tutor.query.filter(Tutor.id.in_(tutor_ids)),
+            SELECTED_TUTOR_EXPORT_COLUMNS,
+            'selected_tutors',
+            source=Tutor,
+            fmt=data.get('format', 'csv'),
+            requested_columns=data.get('columns')
         )
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in batch export: {str(e)}")
         return jsonify({'error': 'Failed to export tutors'}), 500
@@ -10565,80 +10112,57 @@ def get_student_balance():
         return jsonify({'error': 'Failed to fetch balance'}), 500
 
 @app.route('/api/student/scoreboard', methods=['GET'])
+@query_budget(max_queries=6)
+@replica_reads
 def get_student_scoreboard():
     """
     Get scoreboard of all registered quiz-mas students with their task completion scores
-    This shows all students who registered via quiz-mas and their performance
+    Served from the materialized student_leaderboard table, or grouped from student_tasks
+    until 'flask rebuild-leaderboard' has built it (see services/leaderboard_service.py)
+
+    Query params:
+        page, per_page: optional pagination; omit per_page to get the whole board
+        student_id: optional, adds that student's rank as 'my_rank'
     """
     try:
-        # Get all active students
-        students = Student.query.filter_by(is_active=True).all()
-
-        scoreboard = []
-
-        for student in students:
-            # Get all tasks for this student
-            tasks = StudentTask.query.filter_by(student_id=student.id).all()
-
-            total_tasks = len(tasks)
-            completed_tasks = [t for t in tasks if t.status == 'completed']
-            completed_count = len(completed_tasks)
+        page = max(request.args.get('page', 1, type=int) or 1, 1)
+        per_page = request.args.get('per_page', type=int)
+        if per_page is not None:
+            per_page = min(max(per_page, 1), 500)
 
-            # Calculate average score from completed tasks
-            total_score = 0
-            scored_tasks = 0
+        scoreboard, total_students = LeaderboardService.get_page(page=page, per_page=per_page)
 
-            for task in completed_tasks:
-                try:
-                    task_data = json.loads(task.task_data) if task.task_data else {}
-                    completion_data = task_data.get('completion_data', {})
-
-                    # Get score percentage
-                    if 'score_percentage' in completion_data:
-                        total_score += completion_data['score_percentage']
-                        scored_tasks += 1
-                    elif 'score' in completion_data and 'max_score' in completion_data:
-                        score = completion_data['score']
-                        max_score = completion_data['max_score']
-                        if max_score > 0:
-                            percentage = (score / max_score) * 100
-                            total_score += percentage
-                            scored_tasks += 1
-                except:
-                    continue
-
-            average_score = round(total_score / scored_tasks, 1) if scored_tasks > 0 else 0
-            overall_progress = round((completed_count / total_tasks * 100), 1) if total_tasks > 0 else 0
+        response = {
+            'success': True,
+            'scoreboard': scoreboard,
+            'total_students': total_students
+        }
 
-            scoreboard.append({
-                'id': student.id,
-                'name': student.name,
-                'email': student.email,
-                'grade_level': student.grade_level,
-                'school_name': student.school_name,
-                'total_points': student.total_points or 0,
-                'current_level': student.current_level or 1,
-                'acard_balance': float(student.acard_balance or 0),
-                'tasks_completed': completed_count,
-                'total_tasks': total_tasks,
-                'average_score': average_score,
-                'overall_progress': overall_progress
-            })
+        if per_page:
+            response['pagination'] = {
+                'page': page,
+                'per_page': per_page,
+                'pages': (total_students + per_page - 1) // per_page,
+                'has_next': page * per_page < total_students,
+                'has_prev': page > 1
+            }
 
-        # Sort by total points (descending), then by average score
-        scoreboard.sort(key=lambda x: (x['total_points'], x['average_score']), reverse=True)
+        # Optional "my rank" lookup from the query string or a student token
+        my_student_id = request.args.get('student_id', type=int)
+        auth_header = request.headers.get('Authorization')
+        if my_student_id is None and auth_header and auth_header.startswith('Bearer '):
+            try:
+                payload = jwt.decode(auth_header.split(' ')[1], JWT_SECRET_KEY, algorithms=['HS256'])
+                my_student_id = payload.get('sub') or payload.get('student_id')
+            except jwt.InvalidTokenError:
+                my_student_id = None
 
-        # Add rank to each student
-        for idx, student_data in enumerate(scoreboard, 1):
-            student_data['rank'] = idx
+        if my_student_id is not None and str(my_student_id).isdigit():
+            response['my_rank'] = LeaderboardService.get_rank(int(my_student_id))
 
-        logger.info(f"Scoreboard generated with {len(scoreboard)} students")
+        logger.info(f"Scoreboard page {page} served with {len(scoreboard)} of {total_students} students")
 
-        return jsonify({
-            'success': True,
-            'scoreboard': scoreboard,
-            'total_students': len(scoreboard)
-        }), 200
+        return jsonify(response), 200
 
     except Exception as e:
         logger.error(f"Error fetching student scoreboard: {str(e)}")
@@ -11581,6 +11105,37 @@ def check_subscription_status(current_user):
         return jsonify({'error': 'Failed to check subscription status', 'details': str(e)}), 500
 
 # Admin routes for managing subscriptions
+def _filtered_subscribers_query():
+    """BlogSubscription query with the admin list's source/status/date filters applied"""
+    source = request.args.get('source', 'all')
+    status = request.args.get('status', 'all')
+    date_filter = request.args.get('date', 'all')
+    
+    query = BlogSubscription.query
+    
+    if source != 'all':
+        query = query.filter_by(source=source)
+    
+    if status == 'active':
+        query = query.filter_by(is_active=True)
+    elif status == 'inactive':
+        query = query.filter_by(is_active=False)
+    
+    if date_filter == 'today':
+        today = datetime.utcnow().date()
+        query = query.filter(func.date(BlogSubscription.subscription_date) == today)
+    elif date_filter == 'week':
+        week_ago = datetime.utcnow() - timedelta(days=7)
+        query = query.filter(BlogSubscription.subscription_date >= week_ago)
+    elif date_filter == 'month':
+        month_ago = datetime.utcnow() - timedelta(days=30)
+        query = query.filter(BlogSubscription.subscription_date >= month_ago)
+    elif date_filter == 'year':
+        year_ago = datetime.utcnow() - timedelta(days=365)
+        query = query.filter(BlogSubscription.subscription_date >= year_ago)
+    
+    return query
+
 @app.route('/api/admin/subscribers', methods=['GET'])
 @token_required
 def admin_get_subscribers(current_user):
@@ -11592,37 +11147,11 @@ def admin_get_subscribers(current_user):
             return jsonify({'error': 'Unauthorized access'}), 403
         
         # Get query parameters
-        source = request.args.get('source', 'all')
-        status = request.args.get('status', 'all')
-        date_filter = request.args.get('date', 'all')
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         
-        # Build query
-        query = BlogSubscription.query
-        
-        # Apply filters
-        if source != 'all':
-            query = query.filter_by(source=source)
-        
-        if status == 'active':
-            query = query.filter_by(is_active=True)
-        elif status == 'inactive':
-            query = query.filter_by(is_active=False)
-        
-        # Apply date filter
-        if date_filter == 'today':
-            today = datetime.utcnow().date()
-            query = query.filter(func.date(BlogSubscription.subscription_date) == today)
-        elif date_filter == 'week':
-            week_ago = datetime.utcnow() - timedelta(days=7)
-            query = query.filter(BlogSubscription.subscription_date >= week_ago)
-        elif date_filter == 'month':
-            month_ago = datetime.utcnow() - timedelta(days=30)
-            query = query.filter(BlogSubscription.subscription_date >= month_ago)
-        elif date_filter == 'year':
-            year_ago = datetime.utcnow() - timedelta(days=365)
-            query = query.filter(BlogSubscription.subscription_date >= year_ago)
+        # Build query with the source/status/date filters
+        query = _filtered_subscribers_query()
         
         # Get total count (for pagination)
         total = query.count()
@@ -11648,6 +11177,39 @@ def admin_get_subscribers(current_user):
         logger.error(f"Admin subscribers error: {str(e)}")
         return jsonify({'error': 'Failed to fetch subscribers', 'details': str(e)}), 500
 
+SUBSCRIBER_EXPORT_COLUMNS = [
+    export_column('id', 'ID'),
+    export_column('name'),
+    export_column('email'),
+    export_column('source'),
+    export_column('is_active', 'Active', yes_no('is_active'), ['is_active']),
+    export_column('subscription_date', value=formatted_date('subscription_date'), fields=['subscription_date']),
+]
+
+@app.route('/api/admin/subscribers/export', methods=['GET'])
+@token_required
+def admin_export_subscribers(current_user):
+    """Stream subscribers as CSV/XLSX with the same filters as the list (admin only)"""
+    try:
+        if not hasattr(current_user, 'is_admin') or not current_user.is_admin:
+            return jsonify({'error': 'Unauthorized access'}), 403
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return stream_export(
+            _filtered_subscribers_query().order_by(BlogSubscription.subscription_date.desc()),
+            SUBSCRIBER_EXPORT_COLUMNS,
+            f'subscribers_{timestamp}',
+            source=BlogSubscription,
+            fmt=request.args.get('format', 'csv'),
+            requested_columns=request.args.get('columns')
+        )
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Subscriber export error: {str(e)}")
+        return jsonify({'error': 'Failed to export subscribers'}), 500
+
 @app.route('/api/admin/subscribers/stats', methods=['GET'])
 @token_required
 def admin_get_subscription_stats(current_user):
@@ -12062,6 +11624,32 @@ def send_course_interest_email(lead):
 
 
 
+def _filtered_course_interest_query():
+    """CourseInterestLead query with the leads list's status/course/date filters applied"""
+    status = request.args.get('status', 'all')
+    course = request.args.get('course', 'all')
+    date_filter = request.args.get('date', 'all')
+    
+    query = CourseInterestLead.query
+    
+    if status != 'all':
+        query = query.filter_by(status=status)
+    
+    if course != 'all':
+        query = query.filter_by(course_selected=course)
+    
+    if date_filter == 'today':
+        today = datetime.utcnow().date()
+        query = query.filter(func.date(CourseInterestLead.created_at) == today)
+    elif date_filter == 'week':
+        week_ago = datetime.utcnow() - timedelta(days=7)
+        query = query.filter(CourseInterestLead.created_at >= week_ago)
+    elif date_filter == 'month':
+        month_ago = datetime.utcnow() - timedelta(days=30)
+        query = query.filter(CourseInterestLead.created_at >= month_ago)
+    
+    return query
+
 @app.route('/api/course-interest/leads', methods=['GET'])
 @token_required  
 def get_course_interest_leads(current_user):
@@ -12072,32 +11660,11 @@ def get_course_interest_leads(current_user):
             return jsonify({'error': 'Unauthorized access'}), 403
         
         # Get query parameters
-        status = request.args.get('status', 'all')
-        course = request.args.get('course', 'all')
-        date_filter = request.args.get('date', 'all')
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         
-        # Build query
-        query = CourseInterestLead.query
-        
-        # Apply filters
-        if status != 'all':
-            query = query.filter_by(status=status)
-        
-        if course != 'all':
-            query = query.filter_by(course_selected=course)
-        
-        # Apply date filter
-        if date_filter == 'today':
-            today = datetime.utcnow().date()
-            query = query.filter(func.date(CourseInterestLead.created_at) == today)
-        elif date_filter == 'week':
-            week_ago = datetime.utcnow() - timedelta(days=7)
-            query = query.filter(CourseInterestLead.created_at >= week_ago)
-        elif date_filter == 'month':
-            month_ago = datetime.utcnow() - timedelta(days=30)
-            query = query.filter(CourseInterestLead.created_at >= month_ago)
+        # Build query with the status/course/date filters
+        query = _filtered_course_interest_query()
         
         # Get total count
         total = query.count()
@@ -12122,6 +11689,45 @@ def get_course_interest_leads(current_user):
         logger.error(f"Error fetching course interest leads: {str(e)}")
         return jsonify({'error': 'Failed to fetch leads', 'details': str(e)}), 500
 
+COURSE_INTEREST_EXPORT_COLUMNS = [
+    export_column('id', 'ID'),
+    export_column('full_name'),
+    export_column('email'),
+    export_column('course_selected'),
+    export_column('cohort_date'),
+    export_column('career_goals'),
+    export_column('status'),
+    export_column('source'),
+    export_column('utm_source', 'UTM Source'),
+    export_column('utm_medium', 'UTM Medium'),
+    export_column('utm_campaign', 'UTM Campaign'),
+    export_column('created_at', value=formatted_date('created_at'), fields=['created_at']),
+]
+
+@app.route('/api/course-interest/leads/export', methods=['GET'])
+@token_required
+def export_course_interest_leads(current_user):
+    """Stream course interest leads as CSV/XLSX with the same filters as the list (admin only)"""
+    try:
+        if not hasattr(current_user, 'is_admin') or not current_user.is_admin:
+            return jsonify({'error': 'Unauthorized access'}), 403
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return stream_export(
+            _filtered_course_interest_query().order_by(CourseInterestLead.created_at.desc()),
+            COURSE_INTEREST_EXPORT_COLUMNS,
+            f'course_interest_leads_{timestamp}',
+            source=CourseInterestLead,
+            fmt=request.args.get('format', 'csv'),
+            requested_columns=request.args.get('columns')
+        )
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error exporting course interest leads: {str(e)}")
+        return jsonify({'error': 'Failed to export leads'}), 500
+
 @app.route('/api/course-interest/stats', methods=['GET'])
 @token_required
 def get_course_interest_stats(current_user):
@@ -12515,6 +12121,50 @@ def get_webinar_registrations(current_user):
         logger.error(f"Error fetching webinar registrations: {str(e)}")
         return jsonify({'error': 'Failed to fetch registrations', 'details': str(e)}), 500
 
+WEBINAR_REGISTRATION_EXPORT_COLUMNS = [
+    export_column('id', 'ID'),
+    export_column('parent_name'),
+    export_column('parent_type'),
+    export_column('email'),
+    export_column('phone_number'),
+    export_column('kids_ages'),
+    export_column('challenges'),
+    export_column('expectations'),
+    export_column('webinar_date'),
+    export_column('webinar_time'),
+    export_column('created_at', 'Registered At', formatted_date('created_at'), ['created_at']),
+]
+
+@app.route('/api/webinar-registration/export', methods=['GET'])
+@token_required
+def export_webinar_registrations(current_user):
+    """Stream webinar registrations as CSV/XLSX (admin only)"""
+    try:
+        if not hasattr(current_user, 'is_admin') or not current_user.is_admin:
+            return jsonify({'error': 'Unauthorized access'}), 403
+        
+        webinar_date = request.args.get('webinar_date', '2025-08-08')
+        parent_type = request.args.get('parent_type', 'all')
+        
+        query = WebinarRegistration.query.filter_by(webinar_date=webinar_date)
+        if parent_type != 'all':
+            query = query.filter_by(parent_type=parent_type)
+        
+        return stream_export(
+            query.order_by(WebinarRegistration.created_at.desc()),
+            WEBINAR_REGISTRATION_EXPORT_COLUMNS,
+            f'webinar_registrations_{webinar_date}',
+            source=WebinarRegistration,
+            fmt=request.args.get('format', 'csv'),
+            requested_columns=request.args.get('columns')
+        )
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error exporting webinar registrations: {str(e)}")
+        return jsonify({'error': 'Failed to export registrations'}), 500
+
 @app.route('/api/webinar-registration/stats', methods=['GET'])
 @token_required
 def get_webinar_stats(current_user):
@@ -13724,7 +13374,10 @@ Just return the explanations in the JSON format above, with no additional text b
         # Call Claude API - using anthropic directly like the other endpoints
         try:
             # This is the fix: using anthropic directly instead of client
-            response = anthropic_client.messages.create(
+            response = cached_message(
+                anthropic_client,
+                'generate_explanations',
+                validate=has_json_object,
                 model="claude-3-haiku-20240307",
                 max_tokens=4000,
                 temperature=0.7,
@@ -14043,12 +13696,11 @@ UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-def get_db_connection():
-    """Create and return database connection"""
+def get_story_db_connection():
+    """Check out a connection from the shared MySQL pool (close() returns it)"""
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
-    except Error as e:
+        return get_pool(MYSQL_POOL).connect()
+    except Exception as e:
         logger.error(f"Database connection error: {e}")
         return None
 
@@ -14120,7 +13772,7 @@ def storyadmin():
 def get_stories():
     """Get all stories with overview data"""
     try:
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -14171,7 +13823,7 @@ def create_story():
         if len(data['chapters']) != 3:
             return jsonify({'error': 'Exactly 3 chapters are required'}), 400
         
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -14281,7 +13933,7 @@ def create_story():
 def delete_story(story_id):
     """Delete a story and all related data"""
     try:
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -14357,7 +14009,7 @@ def upload_image():
 def view_story(url_slug):
     """Serve the interactive story to readers"""
     try:
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return "Database connection failed", 500
         
@@ -15366,7 +15018,7 @@ def fallback_evaluation(student_answer, expected_answer, question):
 def log_ai_evaluation(request_data, response_data, processing_time, success, error_message=None):
     """Log AI evaluation for analytics and debugging"""
     try:
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return
         
@@ -15404,7 +15056,7 @@ def log_ai_evaluation(request_data, response_data, processing_time, success, err
 def get_stories_analytics():
     """Get analytics data for all stories"""
     try:
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -15460,7 +15112,7 @@ def get_stories_analytics():
 def get_story_analytics(story_id):
     """Get detailed analytics for a specific story"""
     try:
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -15540,7 +15192,7 @@ def start_story_attempt(story_id):
     try:
         data = request.get_json() or {}
         
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -15587,7 +15239,7 @@ def submit_answer(attempt_id):
         if not all(key in data for key in ['question_id', 'answer']):
             return jsonify({'error': 'Missing required fields'}), 400
         
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -15647,7 +15299,7 @@ def evaluate_and_store_answer(answer_id, answer_text, question):
         
         # This would call the same evaluation logic as the API endpoint
         # For now, we'll store a placeholder evaluation
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return
         
@@ -15685,7 +15337,7 @@ def complete_story_attempt(attempt_id):
     try:
         data = request.get_json() or {}
         
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -15760,7 +15412,7 @@ def too_large(error):
 def get_story(story_id):
     """Get a specific story with all details"""
     try:
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -16351,44 +16003,44 @@ Generate exactly {num_questions} questions."""
         return jsonify({'error': str(e)}), 500
 
 
-# S3-backed persistent worksheet store with in-memory cache
-_worksheet_store = {}
-
-import threading
-_worksheet_lock = threading.Lock()
+# S3-backed persistent worksheet store with a bounded in-memory cache
+from services.worksheet_cache import NOT_CACHED, worksheet_cache
+# Background (write-behind) uploads of worksheet JSON to S3
+from services.worksheet_persister import worksheet_persister
+# Deterministic grading of worksheet answers ahead of the AI
+from services.answer_grader import grade_answer, lenient_match, local_feedback, overall_feedback
 
 def _get_s3_worksheet_key(worksheet_id):
     """Get the S3 key for a worksheet JSON file."""
     return f"worksheets/{worksheet_id}.json"
 
-def _persist_worksheet(key, data):
-    """Store a worksheet in memory cache and upload to S3."""
-    with _worksheet_lock:
-        _worksheet_store[key] = data
+def _persist_worksheet(key, data, pin=False):
+    """Store a worksheet in memory cache and queue its upload to S3.
+
+    The cached copy stays pinned until the upload lands; pin keeps it
+    resident for good (e.g. the database insert failed).
+    """
+    json_bytes = json.dumps(data).encode('utf-8')
+
+    # Pinned first, so the worksheet is readable before S3 has it
+    worksheet_cache.put(key, data, size=len(json_bytes), pinned=True)
+
+    on_durable = None
+    if not pin:
+        on_durable = lambda: worksheet_cache.unpin(key, data, len(json_bytes))
 
     # Upload to S3 for persistent storage across pods/restarts
-    try:
-        s3_bucket = os.getenv('S3_BUCKET_NAME')
-        if 's3_client' in globals() and s3_client and s3_bucket:
-            import io
-            json_bytes = json.dumps(data).encode('utf-8')
-            s3_client.put_object(
-                Bucket=s3_bucket,
-                Key=_get_s3_worksheet_key(key),
-                Body=json_bytes,
-                ContentType='application/json'
-            )
-            logging.info(f"Worksheet {key} saved to S3 bucket {s3_bucket}")
-        else:
-            logging.warning(f"S3 not available, worksheet {key} stored in memory only")
-    except Exception as e:
-        logging.error(f"Error saving worksheet {key} to S3: {e}")
+    if worksheet_persister.submit(key, json_bytes, on_durable=on_durable):
+        logging.info(f"Worksheet {key} queued for S3 upload")
+    else:
+        logging.warning(f"S3 not available, worksheet {key} stored in memory only")
 
 def _load_worksheet(key):
     """Load a worksheet by key: check memory cache first, then S3."""
-    # Check memory cache
-    if key in _worksheet_store:
-        return _worksheet_store[key]
+    # Check memory cache (None means S3 recently reported no such worksheet)
+    data = worksheet_cache.get(key)
+    if data is not NOT_CACHED:
+        return data
 
     # Try loading from S3
     try:
@@ -16398,16 +16050,18 @@ def _load_worksheet(key):
                 Bucket=s3_bucket,
                 Key=_get_s3_worksheet_key(key)
             )
-            data = json.loads(response['Body'].read().decode('utf-8'))
+            body = response['Body'].read()
+            data = json.loads(body.decode('utf-8'))
             # Cache in memory for fast subsequent reads
-            _worksheet_store[key] = data
+            worksheet_cache.put(key, data, size=len(body))
             logging.info(f"Worksheet {key} loaded from S3")
             return data
     except Exception as e:
         # ClientError with 404/NoSuchKey means worksheet doesn't exist
-        error_code = getattr(getattr(e, 'response', {}), 'get', lambda *a: None) and \
-                     e.response.get('Error', {}).get('Code', '') if hasattr(e, 'response') else ''
-        if error_code != 'NoSuchKey' and error_code != '404':
+        error_code = e.response.get('Error', {}).get('Code', '') if isinstance(getattr(e, 'response', None), dict) else ''
+        if error_code in ('NoSuchKey', '404'):
+            worksheet_cache.put_missing(key)
+        else:
             logging.error(f"Error loading worksheet {key} from S3: {e}")
 
     return None
@@ -16560,7 +16214,7 @@ def create_worksheet():
             'createdAt': data.get('createdAt', datetime.utcnow().isoformat()),
             'tutorId': tutor_id,  # Store as integer
             'status': 'active'
-        })
+        }, pin=not db_insert_success)
 
         # Build shareable link
         base_url = request.host_url.rstrip('/')
@@ -16572,6 +16226,7 @@ def create_worksheet():
             'message': 'Worksheet created successfully',
             'worksheet_id': store_key,
             'shareable_link': shareable_link,
+            'durability': worksheet_persister.status(store_key)['state'],
             'success': True
         }), 201
 
@@ -16579,231 +16234,185 @@ def create_worksheet():
         logging.error(f"❌ Create worksheet error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/student/submit-worksheet', methods=['POST'])
-def submit_worksheet():
-    """Submit completed worksheet answers for AI-powered evaluation."""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-
-        worksheet_id = data.get('worksheet_id')
-        answers = data.get('answers', {})
-        questions = data.get('questions', [])
-        subject = data.get('subject', 'general')
-        title = data.get('title', 'Worksheet')
-        time_taken = data.get('time_taken', 0)
-
-        if not questions or not answers:
-            return jsonify({'error': 'Questions and answers are required'}), 400
-
-        # Build evaluation context
-        evaluation_results = []
-        total_points = 0
-        earned_points = 0
-
-        # Calculate actual total possible points from the questions
-        actual_total_possible = sum(q.get('points', 10) for q in questions)
-        num_questions = len(questions)
+def _evaluate_answers_with_ai(questions, answers, title, subject, graded=()):
+    """Grade the answers the local grader could not settle in one batched prompt.
 
-        try:
-            # Use AI for context-aware answer validation
-            if anthropic_client:
-                eval_prompt = f"""You are a warm, encouraging educational tutor evaluating a student's worksheet titled "{title}" (Subject: {subject}).
-
-This worksheet has exactly {num_questions} question(s) with a total of {actual_total_possible} possible points.
+    `graded` holds the results already settled locally, so the overall
+    feedback can speak to the whole worksheet. Returns
+    ({str(questionNumber): result dict} for the questions the AI graded, overall feedback).
+    """
+    eval_prompt = f"""You are a warm, encouraging educational tutor evaluating answers from a student's worksheet titled "{title}" (Subject: {subject}).
 
 For each question below, compare the student's answer to the expected answer. Be context-aware:
 - Accept answers that are semantically equivalent even if worded differently
-- Accept reasonable abbreviations and alternate formats (e.g., "$46" and "46 dollars" are equivalent)
-- For math: accept equivalent numerical forms (e.g., "1,180" and "1180")
+- Accept reasonable abbreviations and alternate formats
 - Be lenient with capitalization and minor spelling if meaning is clear
 - For descriptive/analytical questions, evaluate if the student demonstrates understanding
 
 FEEDBACK GUIDELINES (VERY IMPORTANT):
-- When the student gets the answer CORRECT: Write a brief, dynamic, positive feedback message that celebrates their understanding. Vary your responses — do NOT just say the answer is "semantically equivalent" or "matches the expected answer." Instead, acknowledge what the student understood well. Examples: "Great job! You clearly understand the role of the nucleus.", "Excellent! You nailed the key differences between cell types.", "Well done — your explanation shows strong understanding of this concept."
-- When the student gets the answer WRONG: Provide a brief, encouraging correction. First, gently note what was incorrect. Then, clearly explain the correct answer in a helpful way. End with encouragement. Examples: "Not quite — the nucleus is the control center of the cell, not the mitochondria. The nucleus contains genetic material and directs cell activities. Keep studying, you're making progress!", "Close, but the answer is eukaryotic, not prokaryotic. Eukaryotic cells have a membrane-bound nucleus. You'll get it next time!"
+- When the student gets the answer CORRECT: Write a brief, dynamic, positive feedback message that acknowledges what the student understood well. Vary your responses.
+- When the student gets the answer WRONG: Gently note what was incorrect, clearly explain the correct answer, and end with encouragement.
 - NEVER use phrases like "semantically equivalent", "matches the expected answer", or "correctly identifies". Write like a supportive teacher, not a grading machine.
 - Keep each feedback to 1-2 sentences for correct answers, and 2-3 sentences for incorrect answers.
 
 Questions and Answers:
 """
-                for q in questions:
-                    q_num = q.get('questionNumber', 0)
-                    student_answer = answers.get(f'q{q_num}', '')
-                    eval_prompt += f"""
+    for q in questions:
+        q_num = q.get('questionNumber', 0)
+        eval_prompt += f"""
 Question {q_num}: {q.get('questionText', 'Answer question ' + str(q_num))}
 Expected Answer: {q.get('expectedAnswer', '')}
-Student Answer: {student_answer}
+Student Answer: {answers.get(f'q{q_num}', '')}
 Points: {q.get('points', 10)}
 Question Type: {q.get('questionType', 'factual')}
 ---"""
 
-                eval_prompt += f"""
+    if graded:
+        eval_prompt += """
 
-IMPORTANT: There are exactly {num_questions} question(s) and the total possible points is exactly {actual_total_possible}. The "totalPossible" field MUST equal {actual_total_possible}.
+These other questions on the worksheet were already graded; do not return results for them, but take them into account in the overall feedback:
+"""
+        for result in graded:
+            outcome = 'correct' if result['isCorrect'] else 'incorrect'
+            eval_prompt += f"\nQuestion {result['questionNumber']}: {outcome} ({result['pointsAwarded']} points)"
 
-Return ONLY this JSON structure with no other text:
-{{
+    eval_prompt += """
+
+Return ONLY this JSON structure with no other text, one result per question above:
+{
   "results": [
-    {{
-      "questionNumber": 1,
-      "isCorrect": true,
-      "pointsAwarded": 10,
-      "feedback": "Dynamic, encouraging feedback following the FEEDBACK GUIDELINES above",
-      "expectedAnswer": "the expected answer",
-      "studentAnswer": "what student wrote"
-    }}
+    {"questionNumber": 1, "isCorrect": true, "pointsAwarded": 10, "feedback": "..."}
   ],
-  "totalScore": <sum of pointsAwarded for correct answers>,
-  "totalPossible": {actual_total_possible},
-  "overallFeedback": "A warm, personalized overall assessment. If the student did well, celebrate their achievement. If they struggled, encourage them and suggest reviewing the material. Be specific about what they did well or need to work on."
-}}"""
+  "overallFeedback": "A warm, personalized overall assessment of the whole worksheet. If the student did well, celebrate their achievement. If they struggled, encourage them and suggest reviewing the material. Be specific about what they did well or need to work on."
+}"""
+
+    response = anthropic_client.messages.create(
+        model="claude-3-haiku-20240307",
+        max_tokens=min(3000, 400 + 250 * len(questions)),
+        temperature=0.4,
+        messages=[{"role": "user", "content": eval_prompt}]
+    )
 
-                response = anthropic_client.messages.create(
-                    model="claude-3-haiku-20240307",
-                    max_tokens=3000,
-                    temperature=0.4,
-                    messages=[{"role": "user", "content": eval_prompt}]
-                )
+    content = response.content[0].text
+    json_start = content.find('{')
+    json_end = content.rfind('}') + 1
+    if json_start < 0 or json_end <= json_start:
+        raise ValueError('AI returned no JSON')
+
+    evaluation = json.loads(content[json_start:json_end])
+    results = {
+        str(result.get('questionNumber')): result
+        for result in evaluation.get('results', [])
+        if isinstance(result, dict)
+    }
+    overall = evaluation.get('overallFeedback')
+    return results, overall if isinstance(overall, str) else ''
 
-                content = response.content[0].text
-                json_start = content.find('{')
-                json_end = content.rfind('}') + 1
 
-                if json_start >= 0 and json_end > json_start:
-                    ai_result = json.loads(content[json_start:json_end])
-
-                    # Enforce correct totalPossible based on actual questions
-                    ai_total_possible = ai_result.get('totalPossible', actual_total_possible)
-                    ai_total_score = ai_result.get('totalScore', 0)
-                    # Clamp to actual values to prevent AI hallucinating wrong totals
-                    if ai_total_possible != actual_total_possible:
-                        ai_total_possible = actual_total_possible
-                    if ai_total_score > actual_total_possible:
-                        ai_total_score = actual_total_possible
-
-                    # Save submission to database for dashboard/performance tracking
-                    try:
-                        submission_id = str(uuid.uuid4())[:12]
-                        student_name = data.get('student_name', 'Anonymous Student')
-                        db.session.execute(text("""
-                            INSERT INTO worksheet_submissions (
-                                id, worksheet_id, student_name, answers, evaluation_results,
-                                final_score, total_points, time_taken_seconds,
-                                extra_time_used, auto_submitted, completed, submitted_at, created_at
-                            ) VALUES (
-                                :id, :worksheet_id, :student_name, :answers, :evaluation_results,
-                                :final_score, :total_points, :time_taken_seconds,
-                                :extra_time_used, :auto_submitted, :completed, :submitted_at, :created_at
-                            )
-                        """), {
-                            'id': submission_id,
-                            'worksheet_id': worksheet_id,
-                            'student_name': student_name,
-                            'answers': json.dumps(answers),
-                            'evaluation_results': json.dumps(ai_result.get('results', [])),
-                            'final_score': ai_total_score,
-                            'total_points': ai_total_possible,
-                            'time_taken_seconds': time_taken,
-                            'extra_time_used': data.get('extra_time_used', False),
-                            'auto_submitted': data.get('auto_submitted', False),
-                            'completed': True,
-                            'submitted_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
-                            'created_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-                        })
-                        db.session.commit()
-                        logging.info(f"✅ Worksheet submission {submission_id} saved for worksheet {worksheet_id}")
-                    except Exception as save_err:
-                        db.session.rollback()
-                        logging.error(f"⚠️ Failed to save worksheet submission: {str(save_err)}")
+@app.route('/api/student/submit-worksheet', methods=['POST'])
+def submit_worksheet():
+    """Submit completed worksheet answers for AI-powered evaluation."""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
 
-                    return jsonify({
-                        'success': True,
-                        'results': ai_result.get('results', []),
-                        'totalScore': ai_total_score,
-                        'totalPossible': ai_total_possible,
-                        'overallFeedback': ai_result.get('overallFeedback', ''),
-                        'evaluatedByAI': True,
-                        'submissionId': submission_id if 'submission_id' in dir() else None
-                    }), 200
+        worksheet_id = data.get('worksheet_id')
+        answers = data.get('answers', {})
+        questions = data.get('questions', [])
+        subject = data.get('subject', 'general')
+        title = data.get('title', 'Worksheet')
+        time_taken = data.get('time_taken', 0)
 
-        except Exception as ai_error:
-            logging.error(f"AI evaluation error: {str(ai_error)}")
-
-        # Fallback: basic string comparison evaluation
-        import random
-        positive_messages = [
-            "Well done! You got this one right.",
-            "Great work! That's the correct answer.",
-            "Excellent! You clearly understand this concept.",
-            "Nice job! You nailed it.",
-            "Spot on! Keep up the great work.",
-            "That's right! You're doing really well.",
-            "Perfect answer! You've got a solid grasp on this.",
-            "Correct! Your understanding is showing through.",
-        ]
-        encouraging_messages = [
-            "Don't worry — review this topic and you'll get it next time!",
-            "Keep practicing, you're making progress!",
-            "Almost there — a little more study and you'll master this!",
-            "No worries! Every mistake is a learning opportunity.",
-            "Keep going — understanding comes with practice!",
-        ]
+        if not questions or not answers:
+            return jsonify({'error': 'Questions and answers are required'}), 400
 
-        results = []
-        for q in questions:
+        # Grade what can be settled deterministically; only the rest goes to the AI
+        results = [None] * len(questions)
+        pending = []
+        for index, q in enumerate(questions):
             q_num = q.get('questionNumber', 0)
-            student_answer = answers.get(f'q{q_num}', '').strip().lower()
-            expected_answer = q.get('expectedAnswer', '').strip().lower()
-            points = q.get('points', 10)
-            total_points += points
-
-            # Flexible matching
-            is_correct = (
-                student_answer == expected_answer or
-                student_answer in expected_answer or
-                expected_answer in student_answer or
-                student_answer.replace(',', '').replace('$', '').replace(' ', '') ==
-                expected_answer.replace(',', '').replace('$', '').replace(' ', '')
-            )
+            student_answer = answers.get(f'q{q_num}', '')
+            grade = grade_answer(q, student_answer)
+            if grade.correct is None:
+                pending.append(index)
+                continue
 
-            points_awarded = points if is_correct else 0
-            earned_points += points_awarded
+            points = q.get('points', 10)
+            results[index] = {
+                'questionNumber': q_num,
+                'isCorrect': grade.correct,
+                'pointsAwarded': points if grade.correct else 0,
+                'feedback': local_feedback(q, grade.correct),
+                'expectedAnswer': q.get('expectedAnswer', ''),
+                'studentAnswer': student_answer
+            }
 
-            if is_correct:
-                feedback = random.choice(positive_messages)
-            else:
-                correct_ans = q.get('expectedAnswer', '')
-                encouragement = random.choice(encouraging_messages)
-                feedback = f'The correct answer is: {correct_ans}. {encouragement}'
+        evaluated_by_ai = False
+        ai_overall_feedback = ''
+        if pending:
+            try:
+                # Use AI for context-aware validation of the ambiguous / descriptive answers
+                if anthropic_client:
+                    ai_results, ai_overall_feedback = _evaluate_answers_with_ai(
+                        [questions[index] for index in pending], answers, title, subject,
+                        graded=[result for result in results if result is not None]
+                    )
+                    for index in pending:
+                        q = questions[index]
+                        q_num = q.get('questionNumber', 0)
+                        ai_result = ai_results.get(str(q_num))
+                        if not ai_result:
+                            continue
+                        points = q.get('points', 10)
+                        is_correct = bool(ai_result.get('isCorrect'))
+                        try:
+                            points_awarded = float(ai_result.get('pointsAwarded', points if is_correct else 0))
+                        except (TypeError, ValueError):
+                            points_awarded = points if is_correct else 0
+                        # Clamp to the question's points to prevent the AI hallucinating scores
+                        points_awarded = max(0, min(points, points_awarded))
+                        if points_awarded == int(points_awarded):
+                            points_awarded = int(points_awarded)
+                        results[index] = {
+                            'questionNumber': q_num,
+                            'isCorrect': is_correct,
+                            'pointsAwarded': points_awarded,
+                            'feedback': ai_result.get('feedback') or local_feedback(q, is_correct),
+                            'expectedAnswer': q.get('expectedAnswer', ''),
+                            'studentAnswer': answers.get(f'q{q_num}', '')
+                        }
+                        evaluated_by_ai = True
+            except Exception as ai_error:
+                logging.error(f"AI evaluation error: {str(ai_error)}")
 
-            results.append({
+        # Fallback: basic string comparison for anything the AI did not grade
+        for index in pending:
+            if results[index] is not None:
+                continue
+            q = questions[index]
+            q_num = q.get('questionNumber', 0)
+            student_answer = answers.get(f'q{q_num}', '')
+            is_correct = lenient_match(q.get('expectedAnswer', ''), student_answer)
+            points = q.get('points', 10)
+            results[index] = {
                 'questionNumber': q_num,
                 'isCorrect': is_correct,
-                'pointsAwarded': points_awarded,
-                'feedback': feedback,
+                'pointsAwarded': points if is_correct else 0,
+                'feedback': local_feedback(q, is_correct),
                 'expectedAnswer': q.get('expectedAnswer', ''),
-                'studentAnswer': answers.get(f'q{q_num}', '')
-            })
+                'studentAnswer': student_answer
+            }
 
-        # Generate dynamic overall feedback
-        percentage = (earned_points / total_points * 100) if total_points > 0 else 0
-        if percentage == 100:
-            overall_msg = f"Outstanding! You scored {earned_points}/{total_points} — a perfect score! You've demonstrated excellent understanding of the material."
-        elif percentage >= 80:
-            overall_msg = f"Great job! You scored {earned_points}/{total_points}. You have a strong grasp of the material. Review the questions you missed to aim for a perfect score!"
-        elif percentage >= 60:
-            overall_msg = f"Good effort! You scored {earned_points}/{total_points}. You're on the right track — revisit the topics you missed and you'll improve in no time."
-        elif percentage >= 40:
-            overall_msg = f"You scored {earned_points}/{total_points}. Don't be discouraged — review the material and try again. Every attempt helps you learn!"
-        else:
-            overall_msg = f"You scored {earned_points}/{total_points}. This is a great opportunity to review the material. Take your time studying the topics and give it another go — you've got this!"
+        total_points = sum(q.get('points', 10) for q in questions)
+        earned_points = sum(result['pointsAwarded'] for result in results)
+        # The AI's personalized assessment when it graded answers; the canned message otherwise
+        overall_msg = (ai_overall_feedback.strip() if evaluated_by_ai else '') or overall_feedback(earned_points, total_points)
 
         # Save submission to database for dashboard/performance tracking
-        fallback_submission_id = None
+        submission_id = None
         try:
-            fallback_submission_id = str(uuid.uuid4())[:12]
+            submission_id = str(uuid.uuid4())[:12]
             student_name = data.get('student_name', 'Anonymous Student')
             db.session.execute(text("""
                 INSERT INTO worksheet_submissions (
@@ -16816,7 +16425,7 @@ Return ONLY this JSON structure with no other text:
                     :extra_time_used, :auto_submitted, :completed, :submitted_at, :created_at
                 )
             """), {
-                'id': fallback_submission_id,
+                'id': submission_id,
                 'worksheet_id': worksheet_id,
                 'student_name': student_name,
                 'answers': json.dumps(answers),
@@ -16831,9 +16440,11 @@ Return ONLY this JSON structure with no other text:
                 'created_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
             })
             db.session.commit()
-            logging.info(f"✅ Worksheet submission {fallback_submission_id} saved (fallback eval)")
+            logging.info(f"✅ Worksheet submission {submission_id} saved for worksheet {worksheet_id} "
+                         f"({len(questions) - len(pending)}/{len(questions)} graded locally)")
         except Exception as save_err:
             db.session.rollback()
+            submission_id = None
             logging.error(f"⚠️ Failed to save worksheet submission: {str(save_err)}")
 
         return jsonify({
@@ -16842,8 +16453,9 @@ Return ONLY this JSON structure with no other text:
             'totalScore': earned_points,
             'totalPossible': total_points,
             'overallFeedback': overall_msg,
-            'evaluatedByAI': False,
-            'submissionId': fallback_submission_id
+            'evaluatedByAI': evaluated_by_ai,
+            'gradedLocally': len(questions) - len(pending),
+            'submissionId': submission_id
         }), 200
 
     except Exception as e:
@@ -16910,6 +16522,7 @@ def get_worksheet_scores(worksheet_id):
 
 
 @app.route('/api/worksheet-performance', methods=['GET'])
+@replica_reads
 def get_worksheet_performance():
     """Get worksheet performance metrics for dashboards (mirrors /api/quiz-performance format)."""
     try:
@@ -17269,9 +16882,9 @@ def get_tutor_worksheets():
         # 2. Also check memory/S3 store for worksheets not found in database
         # This catches worksheets where the DB insert may have failed
         try:
-            store_worksheets = dict(_worksheet_store)
+            store_worksheets = worksheet_cache.items()
             memory_added = 0
-            for ws_id, ws_data in store_worksheets.items():
+            for ws_id, ws_data in store_worksheets:
                 if ws_id in db_worksheet_ids:
                     continue  # Already in DB results, skip duplicate
 
@@ -17419,8 +17032,7 @@ def delete_worksheet(worksheet_id):
         db.session.commit()
 
         # Also remove from cache
-        if worksheet_id in _worksheet_store:
-            del _worksheet_store[worksheet_id]
+        worksheet_cache.invalidate(worksheet_id)
 
         return jsonify({'success': True, 'message': 'Worksheet archived'}), 200
 
@@ -17430,6 +17042,16 @@ def delete_worksheet(worksheet_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/tutor/worksheet/<worksheet_id>/durability', methods=['GET'])
+def get_worksheet_durability(worksheet_id):
+    """Whether this pod's latest copy of a worksheet has reached S3."""
+    return jsonify({
+        'success': True,
+        'worksheet_id': worksheet_id,
+        'durability': worksheet_persister.status(worksheet_id)
+    }), 200
+
+
 # Internal endpoint to get worksheet with answers (for evaluation)
 @app.route('/api/internal/worksheet-answers/<worksheet_id>', methods=['GET'])
 def get_worksheet_answers(worksheet_id):
@@ -17543,7 +17165,7 @@ def update_story(story_id):
     try:
         data = request.get_json()
         
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -17762,7 +17384,7 @@ def enhanced_update_story(story_id):
         if len(data['questions']) == 0:
             return jsonify({'error': 'At least one question is required'}), 400
         
-        connection = get_db_connection()
+        connection = get_story_db_connection()
         if not connection:
             return jsonify({'error': 'Database connection failed'}), 500
         
@@ -17943,6 +17565,33 @@ def serve_xwhy_creator():
     """Serve the X-Why-Creator main page"""
     return send_from_directory('.', 'xwhy-creator.html')
 
+def xwhy_question_complete(q):
+    """A question with two options and a two-option 'correct' and 'incorrect' follow-up"""
+    return bool(
+        q.get('options') and
+        len(q.get('options', [])) == 2 and
+        q.get('followUp') and
+        q.get('followUp', {}).get('correct') and
+        q.get('followUp', {}).get('correct', {}).get('options') and
+        len(q.get('followUp', {}).get('correct', {}).get('options', [])) == 2 and
+        q.get('followUp', {}).get('incorrect') and
+        q.get('followUp', {}).get('incorrect', {}).get('options') and
+        len(q.get('followUp', {}).get('incorrect', {}).get('options', [])) == 2
+    )
+
+def xwhy_questions_complete(text):
+    """Cache validate(): only responses whose questions are all complete are stored"""
+    json_match = re.search(r'({[\s\S]*})', text)
+    if not json_match:
+        return False
+    try:
+        questions = json.loads(json_match.group(1)).get('questions')
+    except (ValueError, AttributeError):
+        return False
+    return bool(questions) and isinstance(questions, list) and all(
+        isinstance(q, dict) and xwhy_question_complete(q) for q in questions
+    )
+
 # API endpoint for generating questions
 @app.route('/api/xwhy-creator/generate-questions', methods=['POST'])
 def xwhy_generate_questions():
@@ -17959,7 +17608,10 @@ def xwhy_generate_questions():
         prompt = build_prompt_for_topic(topic, grace_mode)
         
         # Call Claude API
-        response = anthropic_client.messages.create(
+        response = cached_message(
+            anthropic_client,
+            'xwhy_generate_questions',
+            validate=xwhy_questions_complete,
             model="claude-3-haiku-20240307",
             max_tokens=4000,
             temperature=0.7,
@@ -17999,18 +17651,7 @@ def xwhy_generate_questions():
         
         # If we have incomplete questions, we'll regenerate them
         questions = questions_data.get('questions', [])
-        has_incomplete_questions = any(
-            not q.get('options') or 
-            len(q.get('options', [])) != 2 or 
-            not q.get('followUp') or
-            not q.get('followUp', {}).get('correct') or
-            not q.get('followUp', {}).get('correct', {}).get('options') or
-            len(q.get('followUp', {}).get('correct', {}).get('options', [])) != 2 or
-            not q.get('followUp', {}).get('incorrect') or
-            not q.get('followUp', {}).get('incorrect', {}).get('options') or
-            len(q.get('followUp', {}).get('incorrect', {}).get('options', [])) != 2
-            for q in questions
-        )
+        has_incomplete_questions = any(not xwhy_question_complete(q) for q in questions)
         
         if has_incomplete_questions:
             logger.warning('Detected incomplete questions. Requesting a new generation with stronger instructions')
@@ -18032,7 +17673,10 @@ The game WILL BREAK if any of these elements are missing. Please provide a fully
 """
             
             # Make another API call with enhanced prompt
-            retry_response = anthropic_client.messages.create(
+            retry_response = cached_message(
+                anthropic_client,
+                'xwhy_generate_questions',
+                validate=xwhy_questions_complete,
                 model="claude-3-haiku-20240307",
                 max_tokens=4000,
                 temperature=0.7,
@@ -18050,18 +17694,7 @@ The game WILL BREAK if any of these elements are missing. Please provide a fully
                 
                 # Validate the retry response
                 retry_questions = retry_data.get('questions', [])
-                retry_valid = all(
-                    q.get('options') and 
-                    len(q.get('options', [])) == 2 and 
-                    q.get('followUp') and
-                    q.get('followUp', {}).get('correct') and
-                    q.get('followUp', {}).get('correct', {}).get('options') and
-                    len(q.get('followUp', {}).get('correct', {}).get('options', [])) == 2 and
-                    q.get('followUp', {}).get('incorrect') and
-                    q.get('followUp', {}).get('incorrect', {}).get('options') and
-                    len(q.get('followUp', {}).get('incorrect', {}).get('options', [])) == 2
-                    for q in retry_questions
-                )
+                retry_valid = all(xwhy_question_complete(q) for q in retry_questions)
                 
                 if retry_valid and retry_questions:
                     logger.info("Retry generated valid questions")
@@ -18336,20 +17969,8 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
         cursor.execute("PRAGMA foreign_keys=ON")
         cursor.close()
 
-@event.listens_for(Pool, "checkout")
-def receive_checkout(dbapi_connection, connection_record, connection_proxy):
-    """Test connection on checkout"""
-    try:
-        cursor = dbapi_connection.cursor()
-        cursor.execute("SELECT 1")
-        cursor.close()
-    except Exception as e:
-        # Connection is stale, invalidate it
-        logging.warning(f"Database connection test failed: {e}")
-        raise
-
 # Improved database reconnection helper
-def get_db_connection():
+def ensure_db_session_connection():
     """Get a fresh database connection with retry logic"""
     max_retries = 3
     for attempt in range(max_retries):
@@ -22695,7 +22316,10 @@ Return your response as a JSON array of objects, each with:
 
         # Call Claude API
         try:
-            response = anthropic_client.messages.create(
+            response = cached_message(
+                anthropic_client,
+                'generate_geometry_explanations',
+                validate=has_json_object,
                 model="claude-3-haiku-20240307",
                 max_tokens=3000,
                 temperature=0.3,
@@ -26575,6 +26199,56 @@ def homework_ai_chat():
         logger.error(f"Homework AI chat error: {str(e)}")
         return jsonify({'error': 'Chat service error', 'details': str(e)}), 500
 
+@app.route('/api/homework-ai/chat/stream', methods=['POST', 'OPTIONS'])
+def homework_ai_chat_stream():
+    """
+    Streaming variant of homework_ai_chat (server-sent events)
+    Formatted text arrives in delta events as the model writes it; the done
+    event carries the same payload homework_ai_chat returns
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    data = request.get_json(silent=True) or {}
+    if not data.get('message'):
+        return jsonify({'error': 'Message is required'}), 400
+    if not anthropic_client:
+        return jsonify({'error': 'AI service temporarily unavailable'}), 503
+
+    message = data['message']
+    student_grade = data.get('grade_level', 'high school')
+    conversation_history = data.get('conversation_history', [])
+    session_id = data.get('session_id', f"session_{datetime.now().timestamp()}")
+
+    prompt = build_chat_prompt(message, student_grade, conversation_history)
+
+    def events():
+        formatter = IncrementalFormatter(format_ai_response)
+        with anthropic_client.messages.stream(
+            model="claude-3-haiku-20240307",
+            max_tokens=1500,
+            temperature=0.7,
+            messages=[{"role": "user", "content": prompt}]
+        ) as stream:
+            for chunk in stream.text_stream:
+                delta = formatter.feed(chunk)
+                if delta:
+                    yield 'delta', {'text': delta}
+
+        delta, formatted_response = formatter.finish()
+        if delta:
+            yield 'delta', {'text': delta}
+        logger.info(f"Streamed homework AI response: {len(formatter.raw)} characters")
+
+        yield 'done', {
+            'response': formatted_response,
+            'session_id': session_id,
+            'timestamp': datetime.now().isoformat(),
+            'should_quiz': should_generate_quiz(message, conversation_history)
+        }
+
+    return sse_response(events(), error_message='AI service temporarily unavailable')
+
 def build_chat_prompt(message, grade_level, conversation_history):
     """Build context-aware prompt for the AI"""
     
@@ -26960,7 +26634,7 @@ def learn_earn_mode():
 
         # Use Anthropic API to generate educational statement with keyword
         try:
-            client = Anthropic(api_key=ANTHROPIC_API_KEY)
+            client = anthropic_client
 
             prompt = f"""You are an educational AI helping students learn. Create a brief educational statement about "{topic}" that is appropriate for {grade_level} level.
 
@@ -26981,7 +26655,10 @@ Format your response as JSON:
 
 Remember: The keyword must be validatable - it should be a specific term that the student can identify from the statement."""
 
-            message = client.messages.create(
+            message = cached_message(
+                client,
+                'learn_earn',
+                validate=has_json_object,
                 model="claude-3-5-sonnet-20241022",
                 max_tokens=500,
                 temperature=0.7,
@@ -27071,32 +26748,17 @@ def validate_keyword():
 
         if is_correct and student_id:
             try:
-                # Get student from database
-                student = Student.query.get(student_id)
-
-                if student:
-                    # Award points and a-cards
-                    points_to_award = 5
-                    acards_to_award = 5.00
-
-                    # Update student points
-                    student.total_points = (student.total_points or 0) + points_to_award
-
-                    # Update student a-card balance
-                    old_balance = float(student.acard_balance or 0)
-                    new_balance = old_balance + acards_to_award
-                    student.acard_balance = new_balance
-
-                    # Create a-card transaction record
-                    transaction = ACardTransaction(
-                        student_id=student_id,
-                        transaction_type='learn_earn_reward',
-                        amount=acards_to_award,
-                        description=f'Learn and Earn reward - correct keyword answer',
-                        balance_after=new_balance
-                    )
+                # Award points and a-cards
+                points_to_award = 5
+                acards_to_award = 5.00
+
+                posting = ACardLedger.credit(
+                    student_id, acards_to_award, 'learn_earn_reward',
+                    'Learn and Earn reward - correct keyword answer',
+                    points=points_to_award
+                )
 
-                    db.session.add(transaction)
+                if posting:
                     db.session.commit()
 
                     logger.info(f"Awarded {points_to_award} points and {acards_to_award} a-cards to student {student_id}")
@@ -27106,8 +26768,8 @@ def validate_keyword():
                         'correct_keyword': correct_keyword,
                         'points_earned': points_to_award,
                         'acards_earned': acards_to_award,
-                        'new_points_total': student.total_points,
-                        'new_acard_balance': float(new_balance),
+                        'new_points_total': posting.total_points,
+                        'new_acard_balance': posting.balance_after,
                         'message': 'Congratulations! You earned rewards!'
                     }), 200
                 else:
@@ -27189,7 +26851,7 @@ def learn_earn_enhanced():
 
         # Use Anthropic API to generate expanded educational statement
         try:
-            client = Anthropic(api_key=ANTHROPIC_API_KEY)
+            client = anthropic_client
 
             prompt = f"""Create an expanded educational statement about "{topic}" using this method:
 
@@ -27218,7 +26880,12 @@ Now create a similar expanded statement for: {topic}
 
 Provide ONLY the statement text, nothing else."""
 
-            message = client.messages.create(
+            # Only statements within the word range are worth caching
+            in_range = lambda text: min_words <= len(text.split()) <= max_words
+            message = cached_message(
+                client,
+                'learn_earn_enhanced',
+                validate=in_range,
                 model="claude-3-5-sonnet-20241022",
                 max_tokens=300,
                 temperature=temperature,
@@ -27237,7 +26904,10 @@ Provide ONLY the statement text, nothing else."""
                 logger.warning(f"Statement word count {word_count} not in range {min_words}-{max_words}, regenerating...")
                 # Try once more with stricter instruction
                 prompt_strict = f"{prompt}\n\nIMPORTANT: Your response must be between {min_words}-{max_words} words. Current attempt had {word_count} words."
-                message = client.messages.create(
+                message = cached_message(
+                    client,
+                    'learn_earn_enhanced',
+                    validate=in_range,
                     model="claude-3-5-sonnet-20241022",
                     max_tokens=300,
                     temperature=temperature - 0.1,
@@ -27304,7 +26974,7 @@ def evaluate_summary():
 
         # Use Anthropic API to evaluate the summary
         try:
-            client = Anthropic(api_key=ANTHROPIC_API_KEY)
+            client = anthropic_client
 
             prompt = f"""You are an educational AI evaluating a student's comprehension.
 
@@ -27436,28 +27106,13 @@ def award_learn_earn():
             }), 200
 
         try:
-            # Get student from database
-            student = Student.query.get(student_id)
-
-            if student:
-                # Update student points
-                student.total_points = (student.total_points or 0) + points
-
-                # Update student a-card balance
-                old_balance = float(student.acard_balance or 0)
-                new_balance = old_balance + acard
-                student.acard_balance = new_balance
-
-                # Create a-card transaction record
-                transaction = ACardTransaction(
-                    student_id=student_id,
-                    transaction_type='learn_earn_summary',
-                    amount=acard,
-                    description=f'Learn and Earn - {topic} summary',
-                    balance_after=new_balance
-                )
+            # Points and balance move in one atomic UPDATE, so concurrent awards cannot overwrite each other
+            posting = ACardLedger.credit(
+                student_id, acard, 'learn_earn_summary', f'Learn and Earn - {topic} summary',
+                points=points
+            )
 
-                db.session.add(transaction)
+            if posting:
                 db.session.commit()
 
                 logger.info(f"Awarded {points} points and {acard} a-cards to student {student_id} for {topic}")
@@ -27466,8 +27121,8 @@ def award_learn_earn():
                     'success': True,
                     'points_awarded': points,
                     'acard_awarded': acard,
-                    'new_points_total': student.total_points,
-                    'new_acard_balance': float(new_balance),
+                    'new_points_total': posting.total_points,
+                    'new_acard_balance': posting.balance_after,
                     'message': 'Rewards awarded successfully!'
                 }), 200
             else:
@@ -28214,7 +27869,26 @@ def get_students_for_messaging():
         if school_filter:
             query = query.filter(Student.school_name.ilike(f'%{school_filter}%'))
         
-        if search_query:
+        hits = None
+        if search_query and student_search_index.ready:
+            # Matching ids come from the in-memory name/email index instead of an ILIKE scan
+            school_term = school_filter.lower()
+            hits = student_search_index.search(
+                search_query,
+                limit=SEARCH_INDEX_MAX_IDS + 1,
+                where=lambda payload: (
+                    (not grade_filter or payload['grade_level'] == grade_filter)
+                    and (not school_term or school_term in (payload['school_name'] or '').lower())
+                )
+            )
+            if not hits:
+                return jsonify({'students': [], 'total_count': 0}), 200
+            # Too many for an IN (...) list; let the database match them instead
+            if len(hits) > SEARCH_INDEX_MAX_IDS:
+                hits = None
+            else:
+                query = query.filter(Student.id.in_([hit.key for hit in hits]))
+        if search_query and hits is None:
             query = query.filter(
                 db.or_(
                     Student.name.ilike(f'%{search_query}%'),
@@ -30591,7 +30265,7 @@ class DynamicStepAIGenerator:
     """
     
     def __init__(self):
-        anthropic_client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+        self.anthropic_client = ai_gateway.wrap(anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY')))
     
     async def generate_solution_steps(self, problem_text, topic, grade_level, subject, 
                                     problem_analysis, include_verification=True, 
@@ -31770,6 +31444,60 @@ def get_all_quiz_scores(current_user):
         logger.error(traceback.format_exc())
         return jsonify({"error": str(e)}), 500
 
+# Quiz score export fields come from the submission joined to its quiz
+QUIZ_SCORE_EXPORT_FIELDS = {
+    'id': QuizSubmission.id,
+    'quiz_id': QuizSubmission.quiz_id,
+    'quiz_title': Quiz.title,
+    'student_name': QuizSubmission.student_name,
+    'score': QuizSubmission.score,
+    'max_score': QuizSubmission.max_score,
+    'time_taken': QuizSubmission.time_taken,
+    'submitted_at': QuizSubmission.submitted_at,
+}
+
+QUIZ_SCORE_EXPORT_COLUMNS = [
+    export_column('id', 'ID'),
+    export_column('quiz_id', 'Quiz ID'),
+    export_column('quiz_title'),
+    export_column('student_name'),
+    export_column('score'),
+    export_column('max_score'),
+    export_column('percentage', value=lambda row: round((row.score / row.max_score * 100) if row.max_score and row.score is not None else 0, 1),
+                  fields=['score', 'max_score']),
+    export_column('time_taken', 'Time Taken (s)'),
+    export_column('submitted_at', value=formatted_date('submitted_at'), fields=['submitted_at']),
+]
+
+@app.route('/api/quiz-scores/export', methods=['GET'])
+@token_required
+def export_quiz_scores(current_user):
+    """Stream every submission to the current user's quizzes as CSV/XLSX"""
+    try:
+        query = db.session.query(QuizSubmission).join(
+            Quiz, Quiz.id == QuizSubmission.quiz_id
+        ).filter(Quiz.user_id == current_user.id)
+        
+        quiz_id = request.args.get('quiz_id')
+        if quiz_id:
+            query = query.filter(QuizSubmission.quiz_id == quiz_id)
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return stream_export(
+            query.order_by(QuizSubmission.submitted_at.desc()),
+            QUIZ_SCORE_EXPORT_COLUMNS,
+            f'quiz_scores_{timestamp}',
+            source=QUIZ_SCORE_EXPORT_FIELDS,
+            fmt=request.args.get('format', 'csv'),
+            requested_columns=request.args.get('columns')
+        )
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error exporting quiz scores: {str(e)}")
+        return jsonify({"error": "Failed to export quiz scores"}), 500
+
 @app.route('/api/quiz-scores/<quiz_id>/<submission_id>', methods=['DELETE'])
 @token_required
 def delete_quiz_submission(current_user, quiz_id, submission_id):
@@ -31801,6 +31529,7 @@ def delete_quiz_submission(current_user, quiz_id, submission_id):
 
 @app.route('/api/quiz-performance', methods=['GET'])
 @token_required
+@replica_reads
 def get_performance_metrics(current_user):
     """Get performance metrics for user's quizzes"""
     try:
@@ -32509,6 +32238,7 @@ s3_client = boto3.client(
     aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
     region_name=S3_REGION
 )
+worksheet_persister.configure(s3_client, S3_BUCKET)
 
 @app.route('/api/get-quiz-embed/<quiz_id>', methods=['GET'])
 def get_quiz_embed(quiz_id):
@@ -32634,7 +32364,7 @@ def submit_geometry_quiz_score_fixed():
                 return jsonify({"error": f"Missing required field: {field}"}), 400
         
         # Ensure database connection is healthy
-        if not get_db_connection():
+        if not ensure_db_session_connection():
             return jsonify({"error": "Database connection failed"}), 500
         
         # Verify the geometry quiz exists
@@ -32727,7 +32457,7 @@ def get_all_geometry_quiz_scores_fixed():
     """Get geometry quiz scores with improved error handling"""
     try:
         # Ensure database connection
-        if not get_db_connection():
+        if not ensure_db_session_connection():
             return jsonify({"error": "Database connection failed"}), 500
             
         quiz_id = request.args.get('quiz_id')
@@ -32804,6 +32534,12 @@ def check_database_health():
             return jsonify({
                 "status": "healthy",
                 "database": "connected",
+                "raw_pools": pool_metrics(),
+                "sqlalchemy_pool": pool_telemetry(db.engine),
+                "read_replica": replica_status(),
+                "worksheet_cache": worksheet_cache.stats(),
+                "worksheet_persister": worksheet_persister.stats(),
+                "llm_cache": llm_cache.stats(),
                 "timestamp": datetime.utcnow().isoformat()
             }), 200
         else:
@@ -32819,6 +32555,63 @@ def check_database_health():
             "error": str(e)
         }), 503
     
+@app.route('/api/health/ai', methods=['GET'])
+def check_ai_health():
+    """AI gateway slot use, per-endpoint call/token/latency counters and response cache hit rates"""
+    return jsonify({
+        "gateway": ai_gateway.stats(),
+        "llm_cache": llm_cache.stats(),
+        "jobs": job_queue.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }), 200
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_generation_job(job_id):
+    """Status of a background generation job; its HTTP status and JSON body once finished"""
+    job = job_queue.get(job_id, job_user_id())
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_generation_job(job_id):
+    """Cancel a queued job; a running job finishes but its result is discarded"""
+    job = job_queue.cancel(job_id, job_user_id())
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job['status'] != 'cancelled':
+        return jsonify({"error": f"Job already {job['status']}", "job": job}), 409
+    return jsonify(job), 200
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def generation_job_events(job_id):
+    """Server-sent `status` events for a job, then `done` with its result"""
+    return sse_response(job_queue.events(job_id, job_user_id()), error_message='Failed to follow the job')
+
+
+@app.route('/api/jobs', methods=['GET'])
+@token_required
+def list_generation_jobs(current_user):
+    """The user's most recent background generation jobs"""
+    return jsonify({"jobs": job_queue.recent(current_user.id)}), 200
+
+
+@app.errorhandler(AIGatewayBusy)
+def handle_ai_gateway_busy(e):
+    """Endpoints that let AIGatewayBusy escape answer 503 instead of 500"""
+    return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+
+@app.after_request
+def answer_ai_gateway_busy(response):
+    """Routes that catch Exception turn AIGatewayBusy into a 500; answer 503 for them too"""
+    feature = g.get('ai_gateway_busy')
+    if feature and response.status_code == 500:
+        return make_response(handle_ai_gateway_busy(AIGatewayBusy(feature)))
+    return response
+
 @app.route('/user/quizzes')
 @token_required
 def get_user_quizzes(current_user):
@@ -33183,7 +32976,7 @@ def submit_feedback():
         if not all([player_name, player_email, final_score, rating, favorite_stage, feedback]):
             return jsonify({'error': 'Missing required fields'}), 400
         
-        conn = get_db_connection()
+        conn = get_anagram_db_connection()
         cursor = conn.cursor()
         cursor.execute(
             'INSERT INTO game_feedback (player_name, player_email, final_score, rating, favorite_stage, feedback) VALUES (?, ?, ?, ?, ?, ?)',
@@ -33832,7 +33625,7 @@ def create_anagram_table():
 
     # Only run on first request
     try:
-        conn = get_db_connection()
+        conn = get_anagram_db_connection()
         if conn:
             cursor = conn.cursor()
             cursor.execute('''
@@ -33870,7 +33663,7 @@ def submit_anagram_score():
         return jsonify({'error': 'Missing required fields'}), 400
     
     try:
-        conn = get_db_connection()
+        conn = get_anagram_db_connection()
         cursor = conn.cursor()
         cursor.execute(
             'INSERT INTO anagram_scores (name, email, score) VALUES (?, ?, ?)',
@@ -33886,7 +33679,7 @@ def submit_anagram_score():
 @app.route('/api/anagram-game/scores', methods=['GET'])
 def get_anagram_scores():
     try:
-        conn = get_db_connection()
+        conn = get_anagram_db_connection()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         cursor.execute('SELECT name, score, date FROM anagram_scores ORDER BY score DESC')
@@ -33896,10 +33689,14 @@ def get_anagram_scores():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def get_db_connection():
-    conn = sqlite3.connect('database.db')  # or whatever your database file is named
-    conn.row_factory = sqlite3.Row
-    return conn
+# Anagram and game feedback scores live in a local SQLite file
+ANAGRAM_POOL = 'anagram'
+configure_pool(ANAGRAM_POOL, sqlite_connection_factory('database.db'))
+
+
+def get_anagram_db_connection():
+    """Check out a pooled connection to the local scores database (close() returns it)"""
+    return get_pool(ANAGRAM_POOL).connect()
 
 
 @app.route('/<filename>')
@@ -34570,21 +34367,10 @@ def serve_quizmaspage():
         logger.error(f"Error serving quizmas.html: {str(e)}")
         return "Error: Could not load Quizmas page", 500
 
-@app.route('/api/quizmas-chat', methods=['POST'])
-def quizmas_chat():
-    """Handles Quizmas-specific chatbot inquiries with full event knowledge"""
-    try:
-        data = request.get_json()
-        if not data or 'message' not in data:
-            return jsonify({"error": "Missing 'message' field in request"}), 400
-
-        message = data.get('message', '')
-        history = data.get('history', [])
-
-        logger.debug(f"Quizmas chat request: {message[:50]}...")
-
-        # Quizmas event information context
-        quizmas_context = """
+def build_quizmas_context(message, history):
+    """Event knowledge, the last few messages and the new message as one Cohere prompt"""
+    # Quizmas event information context
+    quizmas_context = """
 You are an intelligent assistant for the Quizmas 2025 event by Decipher Academy.
 QUIZMAS EVENT DETAILS:
 - Event Name: Quiz-Mas Competition 2025
@@ -34638,24 +34424,44 @@ If asked about registration process, explain both the free nomination option and
 If asked about costs, clarify the ₦10,000 fee for general slots and the 20% school commission.
 """
 
-        # Build conversation context
-        conversation_context = quizmas_context + "\n\nConversation History:\n"
-        for msg in history[-4:]:  # Last 4 messages
-            role = "User" if msg['type'] == 'user' else "Assistant"
-            conversation_context += f"{role}: {msg['content']}\n"
+    # Build conversation context
+    conversation_context = quizmas_context + "\n\nConversation History:\n"
+    for msg in history[-4:]:  # Last 4 messages
+        role = "User" if msg['type'] == 'user' else "Assistant"
+        conversation_context += f"{role}: {msg['content']}\n"
 
-        conversation_context += f"\nUser: {message}\nAssistant:"
+    conversation_context += f"\nUser: {message}\nAssistant:"
+    return conversation_context
 
-        # Call Cohere API
-        response = co.chat(
-            message=conversation_context,
-            model="command",
-            temperature=0.7,
-            max_tokens=500
-        )
+@app.route('/api/quizmas-chat', methods=['POST'])
+def quizmas_chat():
+    """Handles Quizmas-specific chatbot inquiries with full event knowledge"""
+    try:
+        data = request.get_json()
+        if not data or 'message' not in data:
+            return jsonify({"error": "Missing 'message' field in request"}), 400
+
+        message = data.get('message', '')
+        history = data.get('history', [])
+
+        logger.debug(f"Quizmas chat request: {message[:50]}...")
+
+        conversation_context = build_quizmas_context(message, history)
+
+        # Call Cohere API (identical questions are answered from the cache)
+        def ask_cohere():
+            response = co.chat(
+                message=conversation_context,
+                model="command",
+                temperature=0.7,
+                max_tokens=500
+            )
+            return getattr(response, 'text', None)
+
+        reply = cached_text('quizmas_chat', 'cohere', 'command', 0.7, 500, conversation_context, ask_cohere)
 
-        if hasattr(response, 'text'):
-            return jsonify({'response': response.text}), 200
+        if reply:
+            return jsonify({'response': reply}), 200
         else:
             logger.error("No text in Cohere response")
             return jsonify({"error": "No response generated"}), 500
@@ -34665,6 +34471,44 @@ If asked about costs, clarify the ₦10,000 fee for general slots and the 20% sc
         return jsonify({"error": f"Failed to process request: {str(e)}"}), 500
 
 
+@app.route('/api/quizmas-chat/stream', methods=['POST'])
+def quizmas_chat_stream():
+    """Streaming variant of quizmas_chat: delta events as Cohere writes, then done with the full reply"""
+    data = request.get_json(silent=True)
+    if not data or 'message' not in data:
+        return jsonify({"error": "Missing 'message' field in request"}), 400
+
+    conversation_context = build_quizmas_context(data.get('message', ''), data.get('history', []))
+
+    def cohere_chunks():
+        stream = co.chat(
+            message=conversation_context,
+            model="command",
+            temperature=0.7,
+            max_tokens=500,
+            stream=True
+        )
+        for stream_event in stream:
+            if getattr(stream_event, 'event_type', None) == 'text-generation':
+                yield stream_event.text
+
+    def events():
+        chunks = []
+        # A cached reply (from either variant) arrives as a single delta
+        for chunk in cached_text_stream('quizmas_chat', 'cohere', 'command', 0.7, 500, conversation_context, cohere_chunks):
+            chunks.append(chunk)
+            yield 'delta', {'text': chunk}
+
+        reply = ''.join(chunks)
+        if not reply:
+            logger.error("No text in Cohere response")
+            yield 'error', {'error': 'No response generated'}
+            return
+        yield 'done', {'response': reply}
+
+    return sse_response(events(), error_message='Failed to process request')
+
+
 @app.route('/api/quizmas-game', methods=['POST'])
 def save_quizmas_game_result():
     """Save Quiz-mas 2025 Prize Spinner Game Results (Upsert)"""
@@ -10,6 +10,7 @@ from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text
 from sqlalchemy.types import Float
+from sqlalchemy import event, func, inspect as sa_inspect
 from flask import current_app
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -129,6 +130,10 @@ class QuizSubmission(db.Model):
     time_taken = db.Column(db.Integer)  # In seconds
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_quiz_submissions_quiz_submitted', 'quiz_id', 'submitted_at'),
+    )
+
 # User Feedback Model
 class UserFeedback(db.Model):
     __tablename__ = 'user_feedback'
@@ -791,6 +796,17 @@ class StudentTask(db.Model):
     due_date = db.Column(db.DateTime)
     assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
+
+    # Typed copies of task_data.completion_data, kept in sync whenever task_data is assigned
+    score = db.Column(db.Float, nullable=True)  # NULL means no completion data
+    max_score = db.Column(db.Float, nullable=True)  # NULL when completion_data has no max_score
+    score_percentage = db.Column(db.Float, nullable=True, index=True)
+    time_spent = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_student_tasks_student_status', 'student_id', 'status'),
+        db.Index('ix_student_tasks_student_due', 'student_id', 'due_date'),
+    )
     
     # Relationships
     student = db.relationship('Student', backref=db.backref('tasks', lazy=True))
@@ -851,8 +867,44 @@ class StudentTask(db.Model):
         data = self.task_data_dict
         return data.get('scheduled_day')
     
+    @staticmethod
+    def extract_score_fields(task_data):
+        """
+        Pull the typed score columns out of a task_data JSON string or dict.
+        All values are None when there is no completion data; max_score stays
+        None when completion_data has none, and score_percentage is only set
+        from a stored percentage or a score with a positive max_score.
+        """
+        fields = {'score': None, 'max_score': None, 'score_percentage': None, 'time_spent': None}
+        if not task_data:
+            return fields
+        try:
+            data = json.loads(task_data) if isinstance(task_data, str) else task_data
+            completion_data = data.get('completion_data') or {}
+            if not isinstance(completion_data, dict) or not completion_data:
+                return fields
+
+            score = float(completion_data.get('score') or 0)
+            fields['score'] = score
+            fields['time_spent'] = int(completion_data.get('time_spent') or 0)
+            if completion_data.get('max_score') is not None:
+                fields['max_score'] = float(completion_data['max_score'])
+
+            if completion_data.get('score_percentage') is not None:
+                fields['score_percentage'] = float(completion_data['score_percentage'])
+            elif 'score' in completion_data and (fields['max_score'] or 0) > 0:
+                fields['score_percentage'] = round((score / fields['max_score']) * 100, 1)
+        except (ValueError, TypeError, AttributeError):
+            pass
+        return fields
+
+    def sync_score_columns(self, task_data):
+        """Copy completion scores from a task_data value into the typed columns"""
+        for key, value in self.extract_score_fields(task_data).items():
+            setattr(self, key, value)
+
     def update_task_data(self, new_data):
-        """Update task_data with new information"""
+        """Update task_data with new information (score columns follow via sync_score_columns)"""
         current_data = self.task_data_dict
         current_data.update(new_data)
         self.task_data = json.dumps(current_data)
@@ -890,6 +942,44 @@ class StudentTask(db.Model):
         }
 
 
+@event.listens_for(StudentTask.task_data, 'set')
+def _sync_student_task_scores(target, value, oldvalue, initiator):
+    """Keep the typed score columns in step with every task_data assignment"""
+    target.sync_score_columns(value)
+
+
+class StudentLeaderboard(db.Model):
+    """Materialized per-student scoreboard row, maintained incrementally on task writes"""
+    __tablename__ = 'student_leaderboard'
+
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'), primary_key=True)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    total_points = db.Column(db.Integer, default=0, nullable=False)  # Mirrors students.total_points
+    total_tasks = db.Column(db.Integer, default=0, nullable=False)
+    completed_tasks = db.Column(db.Integer, default=0, nullable=False)
+    scored_tasks = db.Column(db.Integer, default=0, nullable=False)
+    score_sum = db.Column(db.Float, default=0.0, nullable=False)  # Sum of score percentages
+    average_score = db.Column(db.Float, default=0.0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Ranking order of the scoreboard: points first, then average score
+    __table_args__ = (
+        db.Index('ix_leaderboard_rank', 'is_active', 'total_points', 'average_score', 'student_id'),
+    )
+
+    def __repr__(self):
+        return f'<StudentLeaderboard {self.student_id} points={self.total_points}>'
+
+    def recalculate_average(self):
+        """Refresh average_score from the running score sum"""
+        self.average_score = round(self.score_sum / self.scored_tasks, 1) if self.scored_tasks > 0 else 0.0
+
+    @property
+    def overall_progress(self):
+        """Completed tasks as a percentage of assigned tasks"""
+        return round((self.completed_tasks / self.total_tasks * 100), 1) if self.total_tasks > 0 else 0
+
+
 class StudentPost(db.Model):
     """Student post model for timeline/social features"""
     __tablename__ = 'student_posts'
@@ -902,6 +992,16 @@ class StudentPost(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Denormalized active like/comment counts, kept current by the PostLike/PostComment
+    # listeners below. NULL for posts created before the columns existed until
+    # 'flask backfill-post-counters' runs; serializers count those on the fly.
+    likes_count = db.Column(db.Integer, nullable=True, default=0)
+    comments_count = db.Column(db.Integer, nullable=True, default=0)
+
+    __table_args__ = (
+        db.Index('ix_student_posts_active_created', 'is_active', 'created_at', 'id'),
+    )
+
     # Relationships
     student = db.relationship('Student', backref=db.backref('posts', lazy='dynamic'))
     media = db.relationship('PostMedia', backref='post', lazy='dynamic')
@@ -913,32 +1013,89 @@ class StudentPost(db.Model):
 
     def to_dict(self, current_student_id=None):
         """Convert post to dictionary with optional current student context"""
-        # Get active likes and comments counts
-        active_likes = [like for like in self.likes if like.is_active]
-        active_comments = [comment for comment in self.comments if comment.is_active]
+        return StudentPost.serialize_many([self], current_student_id=current_student_id)[0]
 
-        # Check if current student has liked this post
-        has_liked = False
-        if current_student_id:
-            has_liked = any(like.student_id == current_student_id and like.is_active for like in self.likes)
+    def count_active_likes(self):
+        """Active like count straight from post_likes"""
+        return PostLike.query.filter_by(post_id=self.id, is_active=True).count()
 
-        return {
-            'id': self.id,
-            'student_id': self.student_id,
-            'student_name': self.student.name if self.student else 'Unknown',
-            'student_username': self.student.username if self.student else None,
-            'student_profile_picture': self.student.profile_picture_url if self.student else None,
-            'content': self.content,
-            'post_type': self.post_type,
-            'media': [m.to_dict() for m in self.media if m.is_active],
-            'likes_count': len(active_likes),
-            'comments_count': len(active_comments),
-            'has_liked': has_liked,
-            'is_active': self.is_active,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+    @staticmethod
+    def _active_counts(model, post_ids):
+        """{post_id: active row count} for PostLike or PostComment in one grouped query"""
+        if not post_ids:
+            return {}
+        rows = db.session.query(model.post_id, func.count(model.id)).filter(
+            model.post_id.in_(post_ids),
+            model.is_active == True
+        ).group_by(model.post_id).all()
+        return dict(rows)
+
+    @staticmethod
+    def serialize_many(posts, current_student_id=None):
+        """
+        Serialize a page of posts like to_dict, using a fixed number of queries
+        (authors, media, viewer likes, and grouped counts for posts without
+        denormalized counters) instead of several per post.
+        """
+        posts = list(posts)
+        if not posts:
+            return []
+        post_ids = [post.id for post in posts]
+
+        authors = {
+            row.id: row for row in db.session.query(
+                Student.id, Student.name, Student.username, Student.profile_picture_url
+            ).filter(Student.id.in_({post.student_id for post in posts})).all()
         }
 
+        media_by_post = {}
+        for media in PostMedia.query.filter(
+            PostMedia.post_id.in_(post_ids),
+            PostMedia.is_active == True
+        ).order_by(PostMedia.id).all():
+            media_by_post.setdefault(media.post_id, []).append(media.to_dict())
+
+        uncounted = [post.id for post in posts if post.likes_count is None or post.comments_count is None]
+        like_counts = StudentPost._active_counts(PostLike, uncounted)
+        comment_counts = StudentPost._active_counts(PostComment, uncounted)
+
+        liked_ids = set()
+        if current_student_id:
+            liked_ids = {
+                post_id for (post_id,) in db.session.query(PostLike.post_id).filter(
+                    PostLike.post_id.in_(post_ids),
+                    PostLike.student_id == current_student_id,
+                    PostLike.is_active == True
+                ).all()
+            }
+
+        results = []
+        for post in posts:
+            author = authors.get(post.student_id)
+            likes_count = post.likes_count
+            comments_count = post.comments_count
+            if likes_count is None or comments_count is None:
+                likes_count = like_counts.get(post.id, 0)
+                comments_count = comment_counts.get(post.id, 0)
+
+            results.append({
+                'id': post.id,
+                'student_id': post.student_id,
+                'student_name': author.name if author else 'Unknown',
+                'student_username': author.username if author else None,
+                'student_profile_picture': author.profile_picture_url if author else None,
+                'content': post.content,
+                'post_type': post.post_type,
+                'media': media_by_post.get(post.id, []),
+                'likes_count': likes_count,
+                'comments_count': comments_count,
+                'has_liked': post.id in liked_ids,
+                'is_active': post.is_active,
+                'created_at': post.created_at.isoformat() if post.created_at else None,
+                'updated_at': post.updated_at.isoformat() if post.updated_at else None
+            })
+        return results
+
 
 class PostMedia(db.Model):
     """Media attachments for student posts"""
@@ -1033,6 +1190,45 @@ class PostComment(db.Model):
         }
 
 
+def _adjust_post_counter(connection, post_id, counter, delta):
+    """Atomically shift a denormalized counter; posts not yet backfilled (NULL) are left alone"""
+    table = StudentPost.__table__
+    column = table.c[counter]
+    connection.execute(
+        table.update()
+        .where(table.c.id == post_id, column.isnot(None))
+        # Counter maintenance is not an edit of the post, so keep updated_at as is
+        .values({column: column + delta, table.c.updated_at: table.c.updated_at})
+    )
+
+
+def _register_post_counter(model, counter):
+    # Load the previous is_active on assignment so after_update can tell real flips apart
+    @event.listens_for(model.is_active, 'set', active_history=True)
+    def _track_is_active(target, value, oldvalue, initiator):
+        pass
+
+    @event.listens_for(model, 'after_insert')
+    def _counted_insert(mapper, connection, target):
+        if target.is_active:
+            _adjust_post_counter(connection, target.post_id, counter, 1)
+
+    @event.listens_for(model, 'after_update')
+    def _counted_update(mapper, connection, target):
+        history = sa_inspect(target).attrs.is_active.history
+        if history.has_changes() and bool(target.is_active) != bool(history.deleted and history.deleted[0]):
+            _adjust_post_counter(connection, target.post_id, counter, 1 if target.is_active else -1)
+
+    @event.listens_for(model, 'after_delete')
+    def _counted_delete(mapper, connection, target):
+        if target.is_active:
+            _adjust_post_counter(connection, target.post_id, counter, -1)
+
+
+_register_post_counter(PostLike, 'likes_count')
+_register_post_counter(PostComment, 'comments_count')
+
+
 class PortfolioItem(db.Model):
     """Portfolio items for certificates, awards, achievements"""
     __tablename__ = 'portfolio_items'
@@ -1261,6 +1457,10 @@ class ACardTransaction(db.Model):
     balance_after = db.Column(db.Numeric(10, 2), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_acard_transactions_student_created', 'student_id', 'created_at'),
+    )
+
     # Relationships
     student = db.relationship('Student', backref=db.backref('acard_transactions', lazy=True))
     admin = db.relationship('Admin', backref=db.backref('acard_actions', lazy=True))
@@ -1285,6 +1485,34 @@ class ACardTransaction(db.Model):
             'task_title': self.task.task_title if self.task else None
         }
 
+
+class ACardBalanceSnapshot(db.Model):
+    """Periodic per-student A-Card balance; history reads start here instead of replaying every transaction"""
+    __tablename__ = 'acard_balance_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    snapshot_date = db.Column(db.Date, nullable=False)
+    balance = db.Column(db.Numeric(10, 2), nullable=False)
+    last_transaction_id = db.Column(db.Integer, nullable=True)  # Highest acard_transactions.id included in balance
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'snapshot_date', name='uq_acard_snapshot_student_date'),
+    )
+
+    def __repr__(self):
+        return f'<ACardBalanceSnapshot {self.student_id} {self.snapshot_date} {self.balance}>'
+
+    def to_dict(self):
+        return {
+            'student_id': self.student_id,
+            'snapshot_date': self.snapshot_date.isoformat(),
+            'balance': float(self.balance),
+            'last_transaction_id': self.last_transaction_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
 class LearnEarnConfig(db.Model):
     """Learn and Earn AI configuration model - supports grade/subject/skill specific configs"""
     __tablename__ = 'learn_earn_config'
@@ -1729,6 +1957,7 @@ __all__ = [
     'Student', 
     'StudentTask',
     'ACardTransaction',
+    'ACardBalanceSnapshot',
     'TaskNotification',
     'StudentLevel',
     'TaskTemplate',
@@ -2564,7 +2793,10 @@ class LessonPlanSection(db.Model):
 
 class PublishedLessonPlan(db.Model):
     __tablename__ = 'published_lesson_plans'
-    __table_args__ = {'extend_existing': True}  # Add this line
+    __table_args__ = (
+        db.Index('ix_published_lesson_plans_slug_active', 'public_url_slug', 'is_active'),
+        {'extend_existing': True}
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     lesson_plan_id = db.Column(db.String(36), db.ForeignKey('math_lesson_plans.id'), nullable=False)
@@ -2881,6 +3113,93 @@ class Commission(db.Model):
         }
 
 
+class CommissionRunCheckpoint(db.Model):
+    """Progress of one monthly recurring-commission run, committed with each chunk so a rerun resumes"""
+    __tablename__ = 'commission_run_checkpoints'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    run_key = db.Column(db.String(20), unique=True, nullable=False)  # e.g. '2025-03'
+    status = db.Column(db.String(20), default='running')  # running, completed, failed
+
+    as_of = db.Column(db.DateTime, nullable=False)  # Due months are computed against this, also on resume
+    last_referral_id = db.Column(db.String(36))  # Highest referrals.id fully processed
+
+    processed = db.Column(db.Integer, default=0)
+    skipped = db.Column(db.Integer, default=0)
+    chunks = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'run_key': self.run_key,
+            'status': self.status,
+            'as_of': self.as_of.isoformat() if self.as_of else None,
+            'last_referral_id': self.last_referral_id,
+            'processed': self.processed,
+            'skipped': self.skipped,
+            'chunks': self.chunks,
+            'last_error': self.last_error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+
+class GenerationJob(db.Model):
+    """A generation request queued to run in the background (services/job_queue.py)"""
+    __tablename__ = 'generation_jobs'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), nullable=True)  # Submitting user; NULL for public endpoints
+    endpoint = db.Column(db.String(120), nullable=False)  # Flask endpoint the request is replayed against
+    path = db.Column(db.String(500), nullable=False)
+    query_string = db.Column(db.String(1000))
+    payload = db.Column(db.Text(16777215))  # JSON request body (MEDIUMTEXT on MySQL)
+    authorization = db.Column(db.Text)  # Authorization header to replay with; cleared when the job ends
+
+    priority = db.Column(db.Integer, nullable=False, default=5)  # Lower runs first
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed, cancelled
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(120))  # host:pid of the process running it
+    lease_expires_at = db.Column(db.DateTime)  # A running job past its lease is claimed again
+
+    result_status = db.Column(db.Integer)  # HTTP status the endpoint answered with
+    result = db.Column(db.Text(16777215))  # Response body; lesson plans can pass 64 KB
+    error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_generation_jobs_status_priority', 'status', 'priority', 'created_at'),
+        db.Index('ix_generation_jobs_user_created', 'user_id', 'created_at'),
+    )
+
+    def to_dict(self, include_result=True):
+        data = {
+            'job_id': self.id,
+            'endpoint': self.endpoint,
+            'status': self.status,
+            'priority': self.priority,
+            'attempts': self.attempts,
+            'result_status': self.result_status,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if include_result:
+            try:
+                data['result'] = json.loads(self.result) if self.result else None
+            except ValueError:
+                data['result'] = self.result
+        return data
+
+
 class Payout(db.Model):
     __tablename__ = 'payouts'
     
@@ -2948,6 +3267,10 @@ class AffiliateClick(db.Model):
     is_duplicate = db.Column(db.Boolean, default=False)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_affiliate_clicks_affiliate_created', 'affiliate_id', 'created_at'),
+    )
     
     def to_dict(self):
         return {
@@ -2958,6 +3281,44 @@ class AffiliateClick(db.Model):
             'country': self.country,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+class AffiliateClickWindow(db.Model):
+    """Hourly click count per affiliate and IP; the fraud check sums the buckets inside its window"""
+    __tablename__ = 'affiliate_click_windows'
+
+    id = db.Column(db.Integer, primary_key=True)
+    affiliate_id = db.Column(db.String(36), nullable=False)
+    ip_address = db.Column(db.String(50), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)  # Start of the UTC hour
+    click_count = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('affiliate_id', 'ip_address', 'bucket_start', name='uq_affiliate_click_window'),
+        db.Index('ix_affiliate_click_windows_bucket', 'bucket_start'),
+    )
+
+    def __repr__(self):
+        return f'<AffiliateClickWindow {self.affiliate_id} {self.ip_address} {self.bucket_start} {self.click_count}>'
+
+
+class AffiliateReferralDomain(db.Model):
+    """Referral count per affiliate and referred email domain, for the self-referral check"""
+    __tablename__ = 'affiliate_referral_domains'
+
+    id = db.Column(db.Integer, primary_key=True)
+    affiliate_id = db.Column(db.String(36), nullable=False)
+    email_domain = db.Column(db.String(255), nullable=False)  # Lower-cased part after '@'
+    referral_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('affiliate_id', 'email_domain', name='uq_affiliate_referral_domain'),
+    )
+
+    def __repr__(self):
+        return f'<AffiliateReferralDomain {self.affiliate_id} {self.email_domain} {self.referral_count}>'
+
 # Add these models to your existing models.py
 
 class Message(db.Model):
@@ -2977,6 +3338,10 @@ class Message(db.Model):
     broadcast_group_id = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     read_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_messages_recipient_inbox', 'recipient_id', 'recipient_type', 'is_read', 'created_at'),
+    )
     
     def to_dict(self):
         return {
@@ -3155,6 +3520,10 @@ class SocialMediaTask(db.Model):
     started_at = db.Column(db.DateTime, nullable=True)
     completed_at = db.Column(db.DateTime, nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_social_media_tasks_student_status', 'student_id', 'status'),
+    )
+
     # REMOVE THIS LINE - the relationship is already defined in SocialMediaStudent
     # student = db.relationship('SocialMediaStudent', backref='tasks')
     
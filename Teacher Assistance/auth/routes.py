@@ -8,6 +8,7 @@ from auth.models import db, Student, StudentPost, PostMedia, PostLike, PostComme
 from services.s3_upload_service import s3_service
 from datetime import datetime
 from sqlalchemy import desc
+from services.keyset_pagination import InvalidCursor, cursor_param, keyset_page
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/student/profile')
 
@@ -334,7 +335,7 @@ def get_my_posts():
 
         return jsonify({
             'success': True,
-            'posts': [post.to_dict(current_student_id=student_id) for post in posts.items],
+            'posts': StudentPost.serialize_many(posts.items, current_student_id=student_id),
             'total': posts.total,
             'pages': posts.pages,
             'current_page': posts.page
@@ -366,7 +367,7 @@ def get_student_posts(student_id):
 
         return jsonify({
             'success': True,
-            'posts': [post.to_dict(current_student_id=current_student_id) for post in posts.items],
+            'posts': StudentPost.serialize_many(posts.items, current_student_id=current_student_id),
             'total': posts.total,
             'pages': posts.pages,
             'current_page': posts.page
@@ -390,10 +391,23 @@ def get_timeline():
         # Get pagination params
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
+        before = cursor_param(request.args, 'before')
 
-        posts = StudentPost.query.filter_by(
-            is_active=True
-        ).order_by(desc(StudentPost.created_at)).paginate(
+        query = StudentPost.query.filter_by(is_active=True)
+
+        # Keyset mode (?before=<cursor>): no COUNT(*), no OFFSET
+        if before is not None:
+            posts, next_cursor = keyset_page(
+                query, StudentPost.created_at, StudentPost.id, before, per_page
+            )
+            return jsonify({
+                'success': True,
+                'posts': StudentPost.serialize_many(posts, current_student_id=current_student_id),
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None
+            }), 200
+
+        posts = query.order_by(desc(StudentPost.created_at)).paginate(
             page=page,
             per_page=per_page,
             error_out=False
@@ -401,12 +415,14 @@ def get_timeline():
 
         return jsonify({
             'success': True,
-            'posts': [post.to_dict(current_student_id=current_student_id) for post in posts.items],
+            'posts': StudentPost.serialize_many(posts.items, current_student_id=current_student_id),
             'total': posts.total,
             'pages': posts.pages,
             'current_page': posts.page
         }), 200
 
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -451,7 +467,7 @@ def like_post(post_id):
         return jsonify({
             'success': True,
             'message': 'Post liked successfully',
-            'likes_count': len([l for l in post.likes if l.is_active])
+            'likes_count': post.count_active_likes()
         }), 200
 
     except Exception as e:
@@ -484,7 +500,7 @@ def unlike_post(post_id):
         return jsonify({
             'success': True,
             'message': 'Post unliked successfully',
-            'likes_count': len([l for l in post.likes if l.is_active])
+            'likes_count': post.count_active_likes()
         }), 200
 
     except Exception as e:
@@ -10,6 +10,8 @@ import re
 from datetime import datetime
 from extensions import db
 from anthropic import Anthropic
+from services.ai_gateway import ai_gateway
+from services.sse_stream import sse_response
 import io
 
 # Initialize logging
@@ -21,7 +23,7 @@ lesson_plan_bp = Blueprint('lesson_plan_routes', __name__)
 
 # Initialize Anthropic client
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
-anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY) if ANTHROPIC_API_KEY else None
+anthropic_client = ai_gateway.wrap(Anthropic(api_key=ANTHROPIC_API_KEY)) if ANTHROPIC_API_KEY else None
 
 
 # Helper functions
@@ -182,6 +184,198 @@ def format_structured_content_html(structured_content):
             structured_content[section] = f"<ol>{items_html}</ol>"
 
 
+# Section headings of the lesson plan responses, in the order a line is tested against them
+CORE_SECTIONS = (
+    ("OBJECTIVES", "objectives"),
+    ("INTRODUCTION", "introduction"),
+    ("MAIN CONTENT", "main_content"),
+)
+SUPPLEMENTARY_SECTIONS = (
+    ("QUOTE", "quote"),
+    ("DID YOU KNOW", "did_you_know"),
+    ("REAL-WORLD", "real_world"),
+    ("FUN FACTS", "fun_facts"),
+    ("RIDDLE", "riddle"),
+    ("MATERIALS", "materials"),
+    ("ASSESSMENT", "assessment"),
+    ("DIFFERENTIATION", "differentiation"),
+    ("CLOSURE", "closure"),
+    ("STUDENT SUMMARY", "student_summary"),
+)
+
+# Lesson plan key a parsed section is stored under, where it differs from the section name
+LESSON_SECTION_KEYS = {
+    "main_content": "main_content_structured",
+    "real_world": "real_world_connection",
+}
+
+# Text sections wrapped in paragraph markup
+LESSON_HTML_SECTIONS = ("introduction", "did_you_know", "real_world_connection",
+                        "assessment", "differentiation", "closure", "student_summary")
+
+
+class SectionSplitter:
+    """
+    Splits generated text into headed sections line by line. A line with a
+    heading starts that section and is dropped; text before the first
+    heading is ignored. The text can be fed in chunks as it streams in:
+    feed() returns the sections completed so far as (name, text) pairs.
+    """
+
+    def __init__(self, headings):
+        self.headings = headings
+        self.sections = {}
+        self.current = None
+        self.received = 0
+        self._partial = ""
+
+    def feed(self, chunk):
+        self.received += len(chunk)
+        lines = (self._partial + chunk).split('\n')
+        self._partial = lines.pop()
+        return self._add_lines(lines)
+
+    def finish(self):
+        """Sections completed by the end of the text, the last one included"""
+        completed = self._add_lines([self._partial])
+        self._partial = ""
+        if self.current is not None:
+            completed.append((self.current, self.sections[self.current]))
+        return completed
+
+    def _add_lines(self, lines):
+        completed = []
+        for line in lines:
+            heading = next((name for marker, name in self.headings if marker in line.upper()), None)
+            if heading is not None:
+                if self.current is not None and heading != self.current:
+                    completed.append((self.current, self.sections[self.current]))
+                self.current = heading
+                self.sections.setdefault(heading, "")
+                continue
+
+            if self.current is not None:
+                self.sections[self.current] += line + "\n"
+        return completed
+
+
+def build_core_sections(sections):
+    """Objectives list, introduction and structured main content from the core sections"""
+    objectives_section = sections.get("objectives", "")
+
+    # Parse objectives into a list
+    objectives_list = []
+    for line in objectives_section.split('\n'):
+        line = line.strip()
+        if line.startswith('-') or line.startswith('*') or line.startswith('"'):
+            objectives_list.append(line[1:].strip())
+        elif line.startswith('SWBAT') or line.startswith('Students will'):
+            objectives_list.append(line)
+
+    if not objectives_list:
+        objectives_list = [objectives_section.strip()]
+
+    return {
+        "objectives": objectives_list,
+        "introduction": sections.get("introduction", ""),
+        "main_content_structured": parse_main_content(sections.get("main_content", ""))
+    }
+
+
+def build_supplementary_sections(sections):
+    """Quote, facts, riddle, materials and the teacher-facing texts from the supplementary sections"""
+    fun_facts_text = sections.get("fun_facts", "")
+    materials_text = sections.get("materials", "")
+
+    # Parse fun facts into list
+    fun_facts_list = []
+    for line in fun_facts_text.split('\n'):
+        line = line.strip()
+        if line.startswith('-') or line.startswith('*') or line.startswith('"') or re.match(r'^\d+\.', line):
+            fact = re.sub(r'^[\d\.\-\*\"\s]+', '', line).strip()
+            if fact:
+                fun_facts_list.append(fact)
+
+    if not fun_facts_list:
+        fun_facts_list = [fun_facts_text.strip()]
+
+    # Parse materials
+    materials_list = []
+    for line in materials_text.split('\n'):
+        line = line.strip()
+        if line.startswith('-') or line.startswith('*') or line.startswith('"'):
+            materials_list.append(line[1:].strip())
+
+    if not materials_list:
+        materials_list = ["Required materials for this lesson"]
+
+    return {
+        "quote": sections.get("quote", "").strip(),
+        "did_you_know": sections.get("did_you_know", "").strip(),
+        "real_world_connection": sections.get("real_world", "").strip(),
+        "materials": materials_list,
+        "fun_facts": fun_facts_list,
+        "riddle": {"question": sections.get("riddle", "").strip(), "answer": ""},
+        "assessment": sections.get("assessment", "").strip(),
+        "differentiation": sections.get("differentiation", "").strip(),
+        "closure": sections.get("closure", "").strip(),
+        "student_summary": sections.get("student_summary", "").strip()
+    }
+
+
+def format_lesson_sections_html(lesson_plan_data):
+    """Paragraph markup for the text sections and the structured main content, in place"""
+    for section in LESSON_HTML_SECTIONS:
+        if section in lesson_plan_data and lesson_plan_data[section]:
+            text = lesson_plan_data[section]
+            text = text.replace("\n\n", "</p><p>")
+            text = f"<p>{text}</p>"
+            lesson_plan_data[section] = text
+
+    if "main_content_structured" in lesson_plan_data:
+        format_structured_content_html(lesson_plan_data["main_content_structured"])
+
+
+def lesson_section_events(completed, build):
+    """('section', ...) events, formatted as in the final lesson plan, for completed sections"""
+    for name, text in completed:
+        key = LESSON_SECTION_KEYS.get(name, name)
+        content = {key: build({name: text})[key]}
+        format_lesson_sections_html(content)
+        yield 'section', {'name': key, 'content': content[key]}
+
+
+def complete_text(prompt, max_tokens=4000):
+    """Claude's response to `prompt` as a single chunk"""
+    response = anthropic_client.messages.create(
+        model="claude-3-haiku-20240307",
+        max_tokens=max_tokens,
+        temperature=0.7,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    yield response.content[0].text
+
+
+def stream_text(prompt, max_tokens=4000):
+    """Claude's response to `prompt` in chunks, as it is written"""
+    with anthropic_client.messages.stream(
+        model="claude-3-haiku-20240307",
+        max_tokens=max_tokens,
+        temperature=0.7,
+        messages=[{"role": "user", "content": prompt}]
+    ) as stream:
+        yield from stream.text_stream
+
+
+def final_payload(events):
+    """The 'done' payload of a lesson plan event generator, run to the end"""
+    payload = None
+    for event, data in events:
+        if event == 'done':
+            payload = data
+    return payload
+
+
 # Static page routes
 @lesson_plan_bp.route('/lesson-plan')
 def serve_lesson_plan():
@@ -256,36 +450,9 @@ def generate_lesson_content():
     return _generate_lesson_content()
 
 
-@lesson_plan_bp.route('/api/generate-lesson-plan', methods=['POST'])
-def generate_lesson_plan():
-    """Generate a complete lesson plan"""
-    from app import token_required as app_token_required
-
-    @app_token_required
-    def _generate_lesson_plan(current_user):
-        try:
-            data = request.get_json()
-
-            subject = data.get('subject', '')
-            topic = data.get('topic', '')
-            grade_level = data.get('grade_level', '')
-            duration = data.get('duration', '45')
-            add_evaluation = data.get('add_evaluation', False)
-            add_homework = data.get('add_homework', False)
-
-            if not all([subject, topic, grade_level]):
-                return jsonify({'error': 'Missing required fields: subject, topic, and grade_level are required'}), 400
-
-            # Check if Anthropic client is initialized
-            if not anthropic_client:
-                logger.error("Anthropic client is not initialized. ANTHROPIC_API_KEY may not be set.")
-                return jsonify({'error': 'AI service is not configured. Please contact the administrator.'}), 503
-
-            lesson_plan_id = str(uuid.uuid4())
-            grade_level_text = get_grade_level_text(grade_level)
-
-            # Core prompt
-            core_prompt = f"""
+def lesson_plan_prompts(subject, topic, grade_level_text, duration):
+    """Prompts for the core content and the supplementary content of a lesson plan"""
+    core_prompt = f"""
 Create an engaging, detailed lesson plan on "{topic}" for {grade_level_text} students in {subject}. Duration: {duration} minutes.
 
 Please create an INFORMATIONAL CONTENT LESSON with the following structured format:
@@ -310,59 +477,7 @@ Include:
 Format ALL content as student-facing material, not as teacher instructions.
 """
 
-            try:
-                core_response = anthropic_client.messages.create(
-                    model="claude-3-haiku-20240307",
-                    max_tokens=4000,
-                    temperature=0.7,
-                    messages=[{"role": "user", "content": core_prompt}]
-                )
-
-                core_content = core_response.content[0].text
-                logger.info(f"Generated core content: {len(core_content)} characters")
-
-                # Parse sections
-                objectives_section = ""
-                introduction_section = ""
-                main_content_section = ""
-
-                current_section = None
-                lines = core_content.split('\n')
-
-                for line in lines:
-                    if "OBJECTIVES" in line.upper():
-                        current_section = "objectives"
-                        continue
-                    elif "INTRODUCTION" in line.upper():
-                        current_section = "introduction"
-                        continue
-                    elif "MAIN CONTENT" in line.upper():
-                        current_section = "main_content"
-                        continue
-
-                    if current_section == "objectives":
-                        objectives_section += line + "\n"
-                    elif current_section == "introduction":
-                        introduction_section += line + "\n"
-                    elif current_section == "main_content":
-                        main_content_section += line + "\n"
-
-                # Parse objectives into a list
-                objectives_list = []
-                for line in objectives_section.split('\n'):
-                    line = line.strip()
-                    if line.startswith('-') or line.startswith('*') or line.startswith('"'):
-                        objectives_list.append(line[1:].strip())
-                    elif line.startswith('SWBAT') or line.startswith('Students will'):
-                        objectives_list.append(line)
-
-                if not objectives_list:
-                    objectives_list = [objectives_section.strip()]
-
-                main_content_structured = parse_main_content(main_content_section)
-
-                # Generate supplementary content
-                fun_prompt = f"""
+    fun_prompt = f"""
 Create engaging supplementary content for a lesson on "{topic}" for {grade_level_text} students.
 
 Generate:
@@ -379,176 +494,120 @@ Generate:
 
 Format each section with its heading.
 """
+    return core_prompt, fun_prompt
 
-                fun_response = anthropic_client.messages.create(
-                    model="claude-3-haiku-20240307",
-                    max_tokens=4000,
-                    temperature=0.7,
-                    messages=[{"role": "user", "content": fun_prompt}]
-                )
 
-                fun_content = fun_response.content[0].text
-                logger.info(f"Generated fun content: {len(fun_content)} characters")
-
-                # Parse fun content
-                quote = ""
-                did_you_know = ""
-                real_world = ""
-                fun_facts_text = ""
-                riddle_text = ""
-                materials_text = ""
-                assessment_text = ""
-                differentiation_text = ""
-                closure_text = ""
-                student_summary = ""
-
-                current_section = None
-                lines = fun_content.split('\n')
-
-                for line in lines:
-                    if "QUOTE" in line.upper():
-                        current_section = "quote"
-                        continue
-                    elif "DID YOU KNOW" in line.upper():
-                        current_section = "did_you_know"
-                        continue
-                    elif "REAL-WORLD" in line.upper():
-                        current_section = "real_world"
-                        continue
-                    elif "FUN FACTS" in line.upper():
-                        current_section = "fun_facts"
-                        continue
-                    elif "RIDDLE" in line.upper():
-                        current_section = "riddle"
-                        continue
-                    elif "MATERIALS" in line.upper():
-                        current_section = "materials"
-                        continue
-                    elif "ASSESSMENT" in line.upper():
-                        current_section = "assessment"
-                        continue
-                    elif "DIFFERENTIATION" in line.upper():
-                        current_section = "differentiation"
-                        continue
-                    elif "CLOSURE" in line.upper():
-                        current_section = "closure"
-                        continue
-                    elif "STUDENT SUMMARY" in line.upper():
-                        current_section = "student_summary"
-                        continue
-
-                    if current_section == "quote":
-                        quote += line + "\n"
-                    elif current_section == "did_you_know":
-                        did_you_know += line + "\n"
-                    elif current_section == "real_world":
-                        real_world += line + "\n"
-                    elif current_section == "fun_facts":
-                        fun_facts_text += line + "\n"
-                    elif current_section == "riddle":
-                        riddle_text += line + "\n"
-                    elif current_section == "materials":
-                        materials_text += line + "\n"
-                    elif current_section == "assessment":
-                        assessment_text += line + "\n"
-                    elif current_section == "differentiation":
-                        differentiation_text += line + "\n"
-                    elif current_section == "closure":
-                        closure_text += line + "\n"
-                    elif current_section == "student_summary":
-                        student_summary += line + "\n"
-
-                # Parse fun facts into list
-                fun_facts_list = []
-                for line in fun_facts_text.split('\n'):
-                    line = line.strip()
-                    if line.startswith('-') or line.startswith('*') or line.startswith('"') or re.match(r'^\d+\.', line):
-                        fact = re.sub(r'^[\d\.\-\*\"\s]+', '', line).strip()
-                        if fact:
-                            fun_facts_list.append(fact)
-
-                if not fun_facts_list:
-                    fun_facts_list = [fun_facts_text.strip()]
-
-                # Parse materials
-                materials_list = []
-                for line in materials_text.split('\n'):
-                    line = line.strip()
-                    if line.startswith('-') or line.startswith('*') or line.startswith('"'):
-                        materials_list.append(line[1:].strip())
-
-                if not materials_list:
-                    materials_list = ["Required materials for this lesson"]
-
-                # Parse riddle
-                riddle = {"question": riddle_text.strip(), "answer": ""}
-
-                # Construct the lesson plan
-                lesson_plan_data = {
-                    "title": f"{subject}: {topic} - Lesson Plan",
-                    "grade_level": grade_level_text,
-                    "duration": f"{duration} minutes",
-                    "objectives": objectives_list,
-                    "introduction": introduction_section,
-                    "quote": quote.strip(),
-                    "main_content_structured": main_content_structured,
-                    "did_you_know": did_you_know.strip(),
-                    "real_world_connection": real_world.strip(),
-                    "materials": materials_list,
-                    "fun_facts": fun_facts_list,
-                    "riddle": riddle,
-                    "assessment": assessment_text.strip(),
-                    "differentiation": differentiation_text.strip(),
-                    "closure": closure_text.strip(),
-                    "student_summary": student_summary.strip()
-                }
+def lesson_plan_events(subject, topic, grade_level_text, duration, add_evaluation, add_homework,
+                       lesson_plan_id, complete):
+    """
+    Generate a lesson plan, yielding ('section', ...) as each part of it is
+    parsed and finally ('done', response payload). complete(prompt,
+    max_tokens) yields Claude's text: complete_text or stream_text.
+    """
+    core_prompt, fun_prompt = lesson_plan_prompts(subject, topic, grade_level_text, duration)
+
+    # Parse sections
+    splitter = SectionSplitter(CORE_SECTIONS)
+    for chunk in complete(core_prompt, 4000):
+        yield from lesson_section_events(splitter.feed(chunk), build_core_sections)
+    yield from lesson_section_events(splitter.finish(), build_core_sections)
+    logger.info(f"Generated core content: {splitter.received} characters")
+    core = build_core_sections(splitter.sections)
+
+    # Generate supplementary content
+    splitter = SectionSplitter(SUPPLEMENTARY_SECTIONS)
+    for chunk in complete(fun_prompt, 4000):
+        yield from lesson_section_events(splitter.feed(chunk), build_supplementary_sections)
+    yield from lesson_section_events(splitter.finish(), build_supplementary_sections)
+    logger.info(f"Generated fun content: {splitter.received} characters")
+    fun = build_supplementary_sections(splitter.sections)
+
+    # Construct the lesson plan
+    lesson_plan_data = {
+        "title": f"{subject}: {topic} - Lesson Plan",
+        "grade_level": grade_level_text,
+        "duration": f"{duration} minutes",
+        "objectives": core["objectives"],
+        "introduction": core["introduction"],
+        "quote": fun["quote"],
+        "main_content_structured": core["main_content_structured"],
+        "did_you_know": fun["did_you_know"],
+        "real_world_connection": fun["real_world_connection"],
+        "materials": fun["materials"],
+        "fun_facts": fun["fun_facts"],
+        "riddle": fun["riddle"],
+        "assessment": fun["assessment"],
+        "differentiation": fun["differentiation"],
+        "closure": fun["closure"],
+        "student_summary": fun["student_summary"]
+    }
 
-                # Add evaluation if requested
-                if add_evaluation:
-                    eval_prompt = f"""
+    # Add evaluation if requested
+    if add_evaluation:
+        eval_prompt = f"""
 Create 5-7 assessment questions for a lesson on "{topic}" for {grade_level_text} students.
 Include a mix of question types.
 """
-                    eval_response = anthropic_client.messages.create(
-                        model="claude-3-haiku-20240307",
-                        max_tokens=1000,
-                        temperature=0.7,
-                        messages=[{"role": "user", "content": eval_prompt}]
-                    )
-
-                    lesson_plan_data["evaluation_test"] = [eval_response.content[0].text]
-
-                # Add homework if requested
-                if add_homework:
-                    homework_prompt = f"""
+        lesson_plan_data["evaluation_test"] = ["".join(complete(eval_prompt, 1000))]
+        yield 'section', {'name': 'evaluation_test', 'content': lesson_plan_data["evaluation_test"]}
+
+    # Add homework if requested
+    if add_homework:
+        homework_prompt = f"""
 Create a meaningful homework assignment for a lesson on "{topic}" for {grade_level_text} students.
 """
-                    homework_response = anthropic_client.messages.create(
-                        model="claude-3-haiku-20240307",
-                        max_tokens=1000,
-                        temperature=0.7,
-                        messages=[{"role": "user", "content": homework_prompt}]
-                    )
-
-                    lesson_plan_data["homework"] = homework_response.content[0].text
-
-                # Format HTML for text sections
-                for section in ["introduction", "did_you_know", "real_world_connection",
-                              "assessment", "differentiation", "closure", "student_summary"]:
-                    if section in lesson_plan_data and lesson_plan_data[section]:
-                        text = lesson_plan_data[section]
-                        text = text.replace("\n\n", "</p><p>")
-                        text = f"<p>{text}</p>"
-                        lesson_plan_data[section] = text
-
-                format_structured_content_html(lesson_plan_data["main_content_structured"])
+        lesson_plan_data["homework"] = "".join(complete(homework_prompt, 1000))
+        yield 'section', {'name': 'homework', 'content': lesson_plan_data["homework"]}
 
-                return jsonify({
-                    'message': 'Lesson plan created successfully',
-                    'lesson_plan_id': lesson_plan_id,
-                    'lesson_plan': lesson_plan_data,
-                    'validation_passed': True
-                }), 201
+    # Format HTML for text sections
+    format_lesson_sections_html(lesson_plan_data)
+
+    yield 'done', {
+        'message': 'Lesson plan created successfully',
+        'lesson_plan_id': lesson_plan_id,
+        'lesson_plan': lesson_plan_data,
+        'validation_passed': True
+    }
+
+
+def lesson_plan_response(stream):
+    """Response of the generate-lesson-plan routes: JSON, or server-sent events when `stream`"""
+    from app import token_required as app_token_required
+
+    @app_token_required
+    def _generate_lesson_plan(current_user):
+        try:
+            data = request.get_json()
+
+            subject = data.get('subject', '')
+            topic = data.get('topic', '')
+            grade_level = data.get('grade_level', '')
+            duration = data.get('duration', '45')
+            add_evaluation = data.get('add_evaluation', False)
+            add_homework = data.get('add_homework', False)
+
+            if not all([subject, topic, grade_level]):
+                return jsonify({'error': 'Missing required fields: subject, topic, and grade_level are required'}), 400
+
+            # Check if Anthropic client is initialized
+            if not anthropic_client:
+                logger.error("Anthropic client is not initialized. ANTHROPIC_API_KEY may not be set.")
+                return jsonify({'error': 'AI service is not configured. Please contact the administrator.'}), 503
+
+            lesson_plan_id = str(uuid.uuid4())
+            grade_level_text = get_grade_level_text(grade_level)
+
+            if stream:
+                return sse_response(
+                    lesson_plan_events(subject, topic, grade_level_text, duration, add_evaluation, add_homework,
+                                       lesson_plan_id, stream_text),
+                    error_message='Failed to generate lesson plan with Claude API'
+                )
+
+            try:
+                events = lesson_plan_events(subject, topic, grade_level_text, duration, add_evaluation, add_homework,
+                                            lesson_plan_id, complete_text)
+                return jsonify(final_payload(events)), 201
 
             except Exception as claude_error:
                 logger.error(f"Claude API error: {str(claude_error)}")
@@ -561,6 +620,18 @@ Create a meaningful homework assignment for a lesson on "{topic}" for {grade_lev
     return _generate_lesson_plan()
 
 
+@lesson_plan_bp.route('/api/generate-lesson-plan', methods=['POST'])
+def generate_lesson_plan():
+    """Generate a complete lesson plan"""
+    return lesson_plan_response(stream=False)
+
+
+@lesson_plan_bp.route('/api/generate-lesson-plan/stream', methods=['POST'])
+def generate_lesson_plan_stream():
+    """Generate a lesson plan as server-sent events: a section event per part as it is written, then done"""
+    return lesson_plan_response(stream=True)
+
+
 @lesson_plan_bp.route('/api/generate-lesson-section', methods=['POST'])
 def generate_lesson_section():
     """Generate a specific section of a lesson plan"""
@@ -1053,32 +1124,129 @@ def extract_worked_examples(text):
         return extract_numbered_items(text)
 
 
+# Section titles a STEM lesson response may use, including the AI's variations
+STEM_SECTION_HEADERS = [
+    'LEARNING OBJECTIVES', 'OBJECTIVES',
+    'INSPIRATIONAL QUOTE', 'QUOTE',
+    'KEY FORMULAS', 'KEY CONCEPTS', 'FORMULAS',
+    'STEP-BY-STEP',
+    'LESSON NOTES',
+    'WORKED EXAMPLES', 'EXAMPLES',
+    'PRACTICE PROBLEMS', 'PRACTICE',
+    'REAL-WORLD APPLICATIONS', 'REAL WORLD APPLICATIONS', 'APPLICATIONS',
+    'ASSESSMENT METHODS', 'ASSESSMENT',
+    'FUN FACTS',
+    'VISUAL AIDS',
+    'GRAPHS AND VISUAL AIDS',
+]
+
+# Sections of a STEM lesson response start on lines like "5. LESSON NOTES"
+STEM_HEADER_PATTERN = '|'.join(re.escape(h) for h in STEM_SECTION_HEADERS)
+STEM_SECTION_SPLIT = rf'\n(?=\d+\.\s*(?:{STEM_HEADER_PATTERN}))'
+
+
+def parse_stem_section(section):
+    """Lesson data parsed from one section of a STEM lesson response ({} if it is not recognised)"""
+    section_upper = section.upper()
+
+    # Parse lesson notes - check FIRST to avoid matching "APPLICATIONS" in notes text
+    if 'LESSON NOTES' in section_upper:
+        notes_text = re.sub(r'^\d+\.\s*LESSON NOTES\s*(?:\([^)]*\))?\s*[:\s]*', '', section, flags=re.IGNORECASE)
+        return {'lesson_notes': notes_text.strip()}
+
+    # Parse objectives
+    elif 'LEARNING OBJECTIVES' in section_upper or (
+        'OBJECTIVES' in section_upper and 'LEARNING' in section_upper[:50].upper()
+    ):
+        objectives = extract_list_items(section)
+        return {'objectives': objectives}
+
+    # Parse quote
+    elif 'INSPIRATIONAL QUOTE' in section_upper or (
+        'QUOTE' in section_upper and len(section) < 500
+    ):
+        quote_text = re.sub(r'^\d+\.\s*INSPIRATIONAL QUOTE[:\s]*', '', section, flags=re.IGNORECASE)
+        return {'quote': quote_text.strip().strip('"').strip("'")}
+
+    # Parse key formulas/concepts
+    elif 'KEY FORMULAS' in section_upper or 'KEY CONCEPTS' in section_upper:
+        formulas = extract_formulas(section)
+        return {'key_formulas': formulas}
+
+    # Parse step-by-step method
+    elif 'STEP-BY-STEP' in section_upper:
+        steps = extract_numbered_items(section)
+        return {'step_by_step': steps}
+
+    # Parse worked examples
+    elif 'WORKED EXAMPLES' in section_upper or (
+        'EXAMPLES' in section_upper and 'WORKED' in section_upper[:50]
+    ):
+        examples = extract_worked_examples(section)
+        return {'worked_examples': examples}
+
+    # Parse practice problems
+    elif 'PRACTICE PROBLEMS' in section_upper or (
+        'PRACTICE' in section_upper and 'PROBLEM' in section_upper
+    ):
+        problems = extract_numbered_items(section)
+        return {'practice_problems': problems}
+
+    # Parse real-world applications
+    elif 'REAL-WORLD' in section_upper or 'REAL WORLD' in section_upper:
+        applications_text = re.sub(
+            r'^\d+\.\s*REAL[- ]WORLD APPLICATIONS\s*(?:\([^)]*\))?\s*[:\s]*',
+            '', section, flags=re.IGNORECASE
+        )
+        return {'real_world_applications': applications_text.strip()}
+
+    # Parse assessment
+    elif 'ASSESSMENT' in section_upper:
+        assessment_text = re.sub(r'^\d+\.\s*ASSESSMENT\s*(?:METHODS)?\s*[:\s]*', '', section, flags=re.IGNORECASE)
+        return {'assessment': assessment_text.strip()}
+
+    # Parse fun facts
+    elif 'FUN FACTS' in section_upper:
+        facts = extract_list_items(section)
+        return {'fun_facts': facts}
+
+    # Parse visual aids
+    elif 'VISUAL AIDS' in section_upper:
+        aids = extract_list_items(section)
+        return {'visual_aids': aids}
+
+    return {}
+
+
+class StemSectionStream:
+    """
+    Parses a STEM lesson response as it streams in. A section is complete
+    once the next numbered header has arrived; feed() returns the lesson
+    data parsed from the sections the chunk completed.
+    """
+
+    def __init__(self):
+        self.content = ""
+        self._start = 0
+
+    def feed(self, chunk):
+        self.content += chunk
+        pieces = re.split(STEM_SECTION_SPLIT, self.content[self._start:], flags=re.IGNORECASE)
+        parsed = {}
+        for piece in pieces[:-1]:
+            # re.split drops the newline in front of each header
+            self._start += len(piece) + 1
+            if piece.strip():
+                parsed.update(parse_stem_section(piece.strip()))
+        return parsed
+
+
 def parse_stem_lesson_content(content, topic, subject, features):
     """Parse the generated content into structured lesson plan data"""
     lesson_data = {}
 
-    # More robust section splitting - match numbered sections like "1. TITLE" or "## TITLE"
-    # Also handle cases where the AI might use different numbering
-    section_headers = [
-        'LEARNING OBJECTIVES', 'OBJECTIVES',
-        'INSPIRATIONAL QUOTE', 'QUOTE',
-        'KEY FORMULAS', 'KEY CONCEPTS', 'FORMULAS',
-        'STEP-BY-STEP',
-        'LESSON NOTES',
-        'WORKED EXAMPLES', 'EXAMPLES',
-        'PRACTICE PROBLEMS', 'PRACTICE',
-        'REAL-WORLD APPLICATIONS', 'REAL WORLD APPLICATIONS', 'APPLICATIONS',
-        'ASSESSMENT METHODS', 'ASSESSMENT',
-        'FUN FACTS',
-        'VISUAL AIDS',
-        'GRAPHS AND VISUAL AIDS',
-    ]
-
-    # Build a regex pattern that splits on any of the known section headers
-    # Match lines like "5. LESSON NOTES" or "LESSON NOTES:" or "## LESSON NOTES"
-    header_pattern = '|'.join(re.escape(h) for h in section_headers)
-    split_pattern = rf'\n(?=\d+\.\s*(?:{header_pattern}))'
-    sections = re.split(split_pattern, content, flags=re.IGNORECASE)
+    # Split on the known section headers, matching lines like "5. LESSON NOTES"
+    sections = re.split(STEM_SECTION_SPLIT, content, flags=re.IGNORECASE)
 
     # If splitting produced very few sections, try alternative split
     if len(sections) < 4:
@@ -1087,7 +1255,7 @@ def parse_stem_lesson_content(content, topic, subject, features):
 
     # If still too few sections, try to split on common patterns
     if len(sections) < 4:
-        alt_pattern = rf'\n(?=(?:{header_pattern})\s*[:\n])'
+        alt_pattern = rf'\n(?=(?:{STEM_HEADER_PATTERN})\s*[:\n])'
         sections = re.split(alt_pattern, content, flags=re.IGNORECASE)
 
     for section in sections:
@@ -1095,73 +1263,7 @@ def parse_stem_lesson_content(content, topic, subject, features):
         if not section:
             continue
 
-        section_upper = section.upper()
-
-        # Parse lesson notes - check FIRST to avoid matching "APPLICATIONS" in notes text
-        if 'LESSON NOTES' in section_upper:
-            notes_text = re.sub(r'^\d+\.\s*LESSON NOTES\s*(?:\([^)]*\))?\s*[:\s]*', '', section, flags=re.IGNORECASE)
-            lesson_data['lesson_notes'] = notes_text.strip()
-
-        # Parse objectives
-        elif 'LEARNING OBJECTIVES' in section_upper or (
-            'OBJECTIVES' in section_upper and 'LEARNING' in section_upper[:50].upper()
-        ):
-            objectives = extract_list_items(section)
-            lesson_data['objectives'] = objectives
-
-        # Parse quote
-        elif 'INSPIRATIONAL QUOTE' in section_upper or (
-            'QUOTE' in section_upper and len(section) < 500
-        ):
-            quote_text = re.sub(r'^\d+\.\s*INSPIRATIONAL QUOTE[:\s]*', '', section, flags=re.IGNORECASE)
-            lesson_data['quote'] = quote_text.strip().strip('"').strip("'")
-
-        # Parse key formulas/concepts
-        elif 'KEY FORMULAS' in section_upper or 'KEY CONCEPTS' in section_upper:
-            formulas = extract_formulas(section)
-            lesson_data['key_formulas'] = formulas
-
-        # Parse step-by-step method
-        elif 'STEP-BY-STEP' in section_upper:
-            steps = extract_numbered_items(section)
-            lesson_data['step_by_step'] = steps
-
-        # Parse worked examples
-        elif 'WORKED EXAMPLES' in section_upper or (
-            'EXAMPLES' in section_upper and 'WORKED' in section_upper[:50]
-        ):
-            examples = extract_worked_examples(section)
-            lesson_data['worked_examples'] = examples
-
-        # Parse practice problems
-        elif 'PRACTICE PROBLEMS' in section_upper or (
-            'PRACTICE' in section_upper and 'PROBLEM' in section_upper
-        ):
-            problems = extract_numbered_items(section)
-            lesson_data['practice_problems'] = problems
-
-        # Parse real-world applications
-        elif 'REAL-WORLD' in section_upper or 'REAL WORLD' in section_upper:
-            applications_text = re.sub(
-                r'^\d+\.\s*REAL[- ]WORLD APPLICATIONS\s*(?:\([^)]*\))?\s*[:\s]*',
-                '', section, flags=re.IGNORECASE
-            )
-            lesson_data['real_world_applications'] = applications_text.strip()
-
-        # Parse assessment
-        elif 'ASSESSMENT' in section_upper:
-            assessment_text = re.sub(r'^\d+\.\s*ASSESSMENT\s*(?:METHODS)?\s*[:\s]*', '', section, flags=re.IGNORECASE)
-            lesson_data['assessment'] = assessment_text.strip()
-
-        # Parse fun facts
-        elif 'FUN FACTS' in section_upper:
-            facts = extract_list_items(section)
-            lesson_data['fun_facts'] = facts
-
-        # Parse visual aids
-        elif 'VISUAL AIDS' in section_upper:
-            aids = extract_list_items(section)
-            lesson_data['visual_aids'] = aids
+        lesson_data.update(parse_stem_section(section))
 
     # Safety check: if lesson_notes is still empty, try to extract it from any section
     # that may have gotten merged with real_world_applications
@@ -1969,53 +2071,10 @@ def update_lesson_youtube():
     return _update_youtube()
 
 
-@lesson_plan_bp.route('/api/generate-math-lesson-plan', methods=['POST'])
-def generate_stem_lesson_plan():
-    """Generate comprehensive STEM lesson plans (Math, Physics, Chemistry, Biology, General)"""
-    from app import token_required as app_token_required
-    from auth.models import MathLessonPlanModel
-
-    @app_token_required
-    def _generate_stem_lesson_plan(current_user):
-        try:
-            data = request.get_json()
-
-            # Extract data from request
-            subject = data.get('subject', 'mathematics')
-            topic = data.get('topic', '')
-            grade_level = data.get('grade_level', '')
-            duration = data.get('duration', '50')
-            difficulty = data.get('difficulty', 'intermediate')
-            objectives = data.get('objectives', '')
-            features = data.get('features', {})
-
-            # Validate required fields
-            if not all([topic, grade_level]):
-                return jsonify({'error': 'Missing required fields: topic and grade_level are required'}), 400
-
-            # Check if Anthropic client is initialized
-            if not anthropic_client:
-                logger.error("Anthropic client is not initialized. ANTHROPIC_API_KEY may not be set.")
-                return jsonify({'error': 'AI service is not configured. Please contact the administrator.'}), 503
-
-            # Create a lesson plan ID
-            lesson_plan_id = str(uuid.uuid4())
-
-            # Get grade level text
-            grade_level_text = get_grade_level_text(grade_level)
-
-            # Get subject display name
-            subject_names = {
-                'mathematics': 'Mathematics',
-                'physics': 'Physics',
-                'chemistry': 'Chemistry',
-                'biology': 'Biology',
-                'general': 'General Science'
-            }
-            subject_display = subject_names.get(subject, subject.title())
-
-            # Build comprehensive STEM-focused prompt
-            core_prompt = f"""
+def stem_lesson_prompt(subject, subject_display, topic, grade_level_text, duration, difficulty):
+    """Prompt for a STEM lesson plan"""
+    # Build comprehensive STEM-focused prompt
+    core_prompt = f"""
 Create a comprehensive {subject_display} lesson plan on "{topic}" for {grade_level_text} students. Duration: {duration} minutes. Difficulty: {difficulty}.
 
 IMPORTANT: This is a {subject_display.upper()} lesson plan that should focus on:
@@ -2109,8 +2168,8 @@ Include 2-3 interesting facts related to {topic}.
 IMPORTANT: Each section MUST start with its number and title on a new line (e.g., "1. LEARNING OBJECTIVES", "5. LESSON NOTES", "6. WORKED EXAMPLES", etc.). Do NOT merge sections together.
 """
 
-            # Graphs and visual aids are handled programmatically, not by AI
-            core_prompt += f"""
+    # Graphs and visual aids are handled programmatically, not by AI
+    core_prompt += f"""
 
 CONTENT REQUIREMENTS:
 - Use precise scientific language and notation
@@ -2123,40 +2182,40 @@ CONTENT REQUIREMENTS:
 SUBJECT-SPECIFIC GUIDELINES:
 """
 
-            # Add subject-specific guidelines
-            if subject == 'mathematics':
-                core_prompt += """
+    # Add subject-specific guidelines
+    if subject == 'mathematics':
+        core_prompt += """
 - Focus on mathematical reasoning, proof techniques, and problem-solving strategies
 - Include multiple solution methods where applicable
 - Emphasize mathematical connections and patterns
 - Use mathematical modeling for real-world problems
 """
-            elif subject == 'physics':
-                core_prompt += """
+    elif subject == 'physics':
+        core_prompt += """
 - Include fundamental physics principles and laws
 - Show dimensional analysis and unit conversions
 - Emphasize experimental verification and measurement
 - Connect mathematical equations to physical phenomena
 - Include vector analysis where applicable
 """
-            elif subject == 'chemistry':
-                core_prompt += """
+    elif subject == 'chemistry':
+        core_prompt += """
 - Include chemical equations and stoichiometry
 - Show molecular and ionic calculations
 - Emphasize laboratory safety and experimental procedures
 - Use periodic table properties and trends
 - Include concentration calculations and reaction rates
 """
-            elif subject == 'biology':
-                core_prompt += """
+    elif subject == 'biology':
+        core_prompt += """
 - Include biological processes and mechanisms
 - Show quantitative analysis of biological data
 - Emphasize experimental design and data interpretation
 - Use diagrams of biological structures
 - Include ecological and evolutionary concepts where applicable
 """
-            elif subject == 'general':
-                core_prompt += """
+    elif subject == 'general':
+        core_prompt += """
 - Include data analysis and interpretation
 - Show calculations with real-world data
 - Emphasize scientific method and critical thinking
@@ -2164,7 +2223,7 @@ SUBJECT-SPECIFIC GUIDELINES:
 - Include cross-disciplinary connections
 """
 
-            core_prompt += f"""
+    core_prompt += f"""
 
 FORMATTING REQUIREMENTS:
 - Use clear headings for each section
@@ -2176,85 +2235,163 @@ FORMATTING REQUIREMENTS:
 
 The lesson should be practical, engaging, and rigorous for {grade_level_text} students.
 """
+    return core_prompt
 
-            try:
-                # Generate core content
-                core_response = anthropic_client.messages.create(
-                    model="claude-3-haiku-20240307",
-                    max_tokens=4000,
-                    temperature=0.7,
-                    messages=[{"role": "user", "content": core_prompt}]
-                )
 
-                core_content = core_response.content[0].text
-                logger.info(f"Generated STEM lesson content: {len(core_content)} characters")
-
-                # Parse the generated content into structured sections
-                lesson_data = parse_stem_lesson_content(core_content, topic, subject, features)
-
-                # Generate graphs if requested
-                if features.get('autoGraphs', True):
-                    lesson_data['graphs'] = generate_subject_graphs(topic, subject, grade_level)
-
-                # Generate interactive evaluation if requested
-                if features.get('interactiveEvaluation', False):
-                    try:
-                        evaluation_data = generate_interactive_evaluation(
-                            topic, subject, grade_level_text, difficulty,
-                            lesson_data, lesson_plan_id
-                        )
-                        if evaluation_data:
-                            lesson_data['interactive_evaluation'] = evaluation_data
-                            logger.info(f"Generated interactive evaluation for lesson plan {lesson_plan_id}")
-                    except Exception as eval_error:
-                        logger.error(f"Failed to generate interactive evaluation: {str(eval_error)}")
-                        # Don't fail the whole request if evaluation generation fails
-
-                # Search for a relevant YouTube video on the topic
-                try:
-                    youtube_data = search_youtube_video(topic, subject)
-                    if youtube_data:
-                        lesson_data['youtube_video'] = youtube_data
-                        logger.info(f"Found YouTube video for topic: {topic}")
-                except Exception as yt_error:
-                    logger.error(f"Failed to search YouTube video: {str(yt_error)}")
-
-                # Add metadata
-                lesson_data.update({
-                    'title': f"{topic} - {subject_display} Lesson Plan",
-                    'subject': subject,
-                    'grade_level': grade_level_text,
-                    'duration': f"{duration} minutes",
-                    'difficulty': difficulty,
-                    'topic': topic
-                })
+def stem_lesson_plan_events(current_user, lesson_plan_id, subject, subject_display, topic, grade_level,
+                            grade_level_text, duration, difficulty, objectives, features, complete):
+    """
+    Generate and save a STEM lesson plan, yielding ('section', ...) for each
+    section as soon as it is parsed and finally ('done', response payload).
+    complete(prompt, max_tokens) yields Claude's text: complete_text or
+    stream_text.
+    """
+    from auth.models import MathLessonPlanModel
 
-                # Store in database
-                stem_lesson_plan = MathLessonPlanModel(
-                    id=lesson_plan_id,
-                    user_id=current_user.id,
-                    title=lesson_data['title'],
-                    subject=subject,
-                    topic=topic,
-                    grade_level=grade_level,
-                    duration_minutes=int(duration) if duration.isdigit() else 50,
-                    difficulty_level=difficulty,
-                    objectives=objectives,
-                    content_json=json.dumps(lesson_data),
-                    features_enabled=json.dumps(features)
-                )
+    core_prompt = stem_lesson_prompt(subject, subject_display, topic, grade_level_text, duration, difficulty)
 
-                # Save to database
-                db.session.add(stem_lesson_plan)
-                db.session.commit()
+    # Generate core content
+    sections = StemSectionStream()
+    for chunk in complete(core_prompt, 4000):
+        for name, content in sections.feed(chunk).items():
+            yield 'section', {'name': name, 'content': content}
 
-                logger.info(f"Successfully created STEM lesson plan with ID: {lesson_plan_id}")
+    core_content = sections.content
+    logger.info(f"Generated STEM lesson content: {len(core_content)} characters")
 
-                return jsonify({
-                    'message': f'{subject_display} lesson plan created successfully',
-                    'lesson_plan_id': lesson_plan_id,
-                    'lesson_plan': lesson_data
-                }), 201
+    # Parse the generated content into structured sections
+    lesson_data = parse_stem_lesson_content(core_content, topic, subject, features)
+
+    # Generate graphs if requested
+    if features.get('autoGraphs', True):
+        lesson_data['graphs'] = generate_subject_graphs(topic, subject, grade_level)
+        yield 'section', {'name': 'graphs', 'content': lesson_data['graphs']}
+
+    # Generate interactive evaluation if requested
+    if features.get('interactiveEvaluation', False):
+        try:
+            evaluation_data = generate_interactive_evaluation(
+                topic, subject, grade_level_text, difficulty,
+                lesson_data, lesson_plan_id
+            )
+            if evaluation_data:
+                lesson_data['interactive_evaluation'] = evaluation_data
+                logger.info(f"Generated interactive evaluation for lesson plan {lesson_plan_id}")
+                yield 'section', {'name': 'interactive_evaluation', 'content': evaluation_data}
+        except Exception as eval_error:
+            logger.error(f"Failed to generate interactive evaluation: {str(eval_error)}")
+            # Don't fail the whole request if evaluation generation fails
+
+    # Search for a relevant YouTube video on the topic
+    try:
+        youtube_data = search_youtube_video(topic, subject)
+        if youtube_data:
+            lesson_data['youtube_video'] = youtube_data
+            logger.info(f"Found YouTube video for topic: {topic}")
+            yield 'section', {'name': 'youtube_video', 'content': youtube_data}
+    except Exception as yt_error:
+        logger.error(f"Failed to search YouTube video: {str(yt_error)}")
+
+    # Add metadata
+    lesson_data.update({
+        'title': f"{topic} - {subject_display} Lesson Plan",
+        'subject': subject,
+        'grade_level': grade_level_text,
+        'duration': f"{duration} minutes",
+        'difficulty': difficulty,
+        'topic': topic
+    })
+
+    # Store in database
+    stem_lesson_plan = MathLessonPlanModel(
+        id=lesson_plan_id,
+        user_id=current_user.id,
+        title=lesson_data['title'],
+        subject=subject,
+        topic=topic,
+        grade_level=grade_level,
+        duration_minutes=int(duration) if duration.isdigit() else 50,
+        difficulty_level=difficulty,
+        objectives=objectives,
+        content_json=json.dumps(lesson_data),
+        features_enabled=json.dumps(features)
+    )
+
+    # Save to database
+    try:
+        db.session.add(stem_lesson_plan)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logger.info(f"Successfully created STEM lesson plan with ID: {lesson_plan_id}")
+
+    yield 'done', {
+        'message': f'{subject_display} lesson plan created successfully',
+        'lesson_plan_id': lesson_plan_id,
+        'lesson_plan': lesson_data
+    }
+
+
+def stem_lesson_plan_response(stream):
+    """Response of the STEM lesson plan routes: JSON, or server-sent events when `stream`"""
+    from app import token_required as app_token_required
+
+    @app_token_required
+    def _generate_stem_lesson_plan(current_user):
+        try:
+            data = request.get_json()
+
+            # Extract data from request
+            subject = data.get('subject', 'mathematics')
+            topic = data.get('topic', '')
+            grade_level = data.get('grade_level', '')
+            duration = data.get('duration', '50')
+            difficulty = data.get('difficulty', 'intermediate')
+            objectives = data.get('objectives', '')
+            features = data.get('features', {})
+
+            # Validate required fields
+            if not all([topic, grade_level]):
+                return jsonify({'error': 'Missing required fields: topic and grade_level are required'}), 400
+
+            # Check if Anthropic client is initialized
+            if not anthropic_client:
+                logger.error("Anthropic client is not initialized. ANTHROPIC_API_KEY may not be set.")
+                return jsonify({'error': 'AI service is not configured. Please contact the administrator.'}), 503
+
+            # Create a lesson plan ID
+            lesson_plan_id = str(uuid.uuid4())
+
+            # Get grade level text
+            grade_level_text = get_grade_level_text(grade_level)
+
+            # Get subject display name
+            subject_names = {
+                'mathematics': 'Mathematics',
+                'physics': 'Physics',
+                'chemistry': 'Chemistry',
+                'biology': 'Biology',
+                'general': 'General Science'
+            }
+            subject_display = subject_names.get(subject, subject.title())
+
+            lesson = dict(
+                current_user=current_user, lesson_plan_id=lesson_plan_id, subject=subject,
+                subject_display=subject_display, topic=topic, grade_level=grade_level,
+                grade_level_text=grade_level_text, duration=duration, difficulty=difficulty,
+                objectives=objectives, features=features
+            )
+
+            if stream:
+                return sse_response(
+                    stem_lesson_plan_events(complete=stream_text, **lesson),
+                    error_message='Failed to generate lesson plan with Claude API'
+                )
+
+            try:
+                return jsonify(final_payload(stem_lesson_plan_events(complete=complete_text, **lesson))), 201
 
             except Exception as claude_error:
                 logger.error(f"Claude API error: {str(claude_error)}")
@@ -2269,6 +2406,18 @@ The lesson should be practical, engaging, and rigorous for {grade_level_text} st
     return _generate_stem_lesson_plan()
 
 
+@lesson_plan_bp.route('/api/generate-math-lesson-plan', methods=['POST'])
+def generate_stem_lesson_plan():
+    """Generate comprehensive STEM lesson plans (Math, Physics, Chemistry, Biology, General)"""
+    return stem_lesson_plan_response(stream=False)
+
+
+@lesson_plan_bp.route('/api/generate-math-lesson-plan/stream', methods=['POST'])
+def generate_stem_lesson_plan_stream():
+    """Generate a STEM lesson plan as server-sent events: a section event per section as it is written, then done"""
+    return stem_lesson_plan_response(stream=True)
+
+
 @lesson_plan_bp.route('/api/generate-more-examples', methods=['POST'])
 def generate_more_examples():
     """Generate additional examples for existing lesson plan"""
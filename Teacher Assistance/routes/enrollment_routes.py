@@ -7,25 +7,25 @@ from datetime import datetime
 import hashlib
 import uuid
 import logging
-import mysql.connector
 from mysql.connector import Error
 
+from services.connection_pool import MYSQL_POOL, ensure_pool, mysql_connection_factory
+
 # Initialize logging
 logger = logging.getLogger(__name__)
 
 # Create blueprint
 enrollment_bp = Blueprint('enrollment', __name__, url_prefix='/api/enrollment')
 
-# Global database connection pool
+# Database configuration for the shared raw connection pool
 db_config = {}
 
 
 def get_db_connection():
-    """Create database connection from config"""
+    """Check out a connection from the shared MySQL pool (close() returns it)"""
     try:
-        connection = mysql.connector.connect(**db_config)
-        return connection
-    except Error as e:
+        return ensure_pool(MYSQL_POOL, mysql_connection_factory(db_config)).connect()
+    except Exception as e:
         logger.error(f"Database connection error: {e}")
         raise
 
@@ -9,6 +9,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from auth.models import db, Student, Admin, Message
 from datetime import datetime
 from sqlalchemy import or_, and_, desc
+from services.keyset_pagination import InvalidCursor, cursor_param, keyset_page
 import jwt as pyjwt
 import logging
 from functools import wraps
@@ -76,6 +77,35 @@ def super_admin_auth_required(f):
     return decorated
 
 
+def _paginate_messages(query, page, per_page, cursor_name, descending):
+    """
+    Page a Message query. With ?before=/?after= (cursor_name) the feed is keyset
+    paginated without a COUNT; otherwise classic page/per_page paging is used.
+    Returns (messages, pagination dict).
+    """
+    cursor = cursor_param(request.args, cursor_name)
+    if cursor is not None:
+        messages, next_cursor = keyset_page(
+            query, Message.created_at, Message.id, cursor, per_page, descending=descending
+        )
+        return messages, {
+            'per_page': per_page,
+            'next_cursor': next_cursor,
+            'has_next': next_cursor is not None
+        }
+
+    order = desc(Message.created_at) if descending else Message.created_at.asc()
+    paginated = query.order_by(order).paginate(page=page, per_page=per_page, error_out=False)
+    return paginated.items, {
+        'page': paginated.page,
+        'per_page': paginated.per_page,
+        'total': paginated.total,
+        'pages': paginated.pages,
+        'has_next': paginated.has_next,
+        'has_prev': paginated.has_prev
+    }
+
+
 # ============================================
 # Super-Admin Messaging Routes
 # ============================================
@@ -190,8 +220,7 @@ def admin_inbox():
         elif filter_read == 'read':
             query = query.filter_by(is_read=True)
 
-        query = query.order_by(desc(Message.created_at))
-        paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+        messages, pagination = _paginate_messages(query, page, per_page, 'before', descending=True)
 
         unread_count = Message.query.filter_by(
             recipient_id=admin.id,
@@ -201,18 +230,13 @@ def admin_inbox():
 
         return jsonify({
             'success': True,
-            'messages': [msg.to_dict() for msg in paginated.items],
+            'messages': [msg.to_dict() for msg in messages],
             'unread_count': unread_count,
-            'pagination': {
-                'page': paginated.page,
-                'per_page': paginated.per_page,
-                'total': paginated.total,
-                'pages': paginated.pages,
-                'has_next': paginated.has_next,
-                'has_prev': paginated.has_prev
-            }
+            'pagination': pagination
         }), 200
 
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error fetching admin inbox: {str(e)}")
         return jsonify({'error': 'Failed to fetch inbox'}), 500
@@ -280,9 +304,9 @@ def admin_conversation_with_student(student_id):
                     Message.recipient_type == 'super_admin'
                 )
             )
-        ).order_by(Message.created_at.asc())
+        )
 
-        paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+        messages, pagination = _paginate_messages(query, page, per_page, 'after', descending=False)
 
         # Mark unread messages from student as read
         unread_msgs = Message.query.filter(
@@ -306,17 +330,12 @@ def admin_conversation_with_student(student_id):
                 'username': student.username,
                 'grade_level': student.grade_level
             },
-            'messages': [msg.to_dict() for msg in paginated.items],
-            'pagination': {
-                'page': paginated.page,
-                'per_page': paginated.per_page,
-                'total': paginated.total,
-                'pages': paginated.pages,
-                'has_next': paginated.has_next,
-                'has_prev': paginated.has_prev
-            }
+            'messages': [msg.to_dict() for msg in messages],
+            'pagination': pagination
         }), 200
 
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error fetching admin conversation: {str(e)}")
@@ -418,8 +437,7 @@ def student_inbox():
         elif filter_read == 'read':
             query = query.filter_by(is_read=True)
 
-        query = query.order_by(desc(Message.created_at))
-        paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+        messages, pagination = _paginate_messages(query, page, per_page, 'before', descending=True)
 
         unread_count = Message.query.filter_by(
             recipient_id=student_id,
@@ -429,18 +447,13 @@ def student_inbox():
 
         return jsonify({
             'success': True,
-            'messages': [msg.to_dict() for msg in paginated.items],
+            'messages': [msg.to_dict() for msg in messages],
             'unread_count': unread_count,
-            'pagination': {
-                'page': paginated.page,
-                'per_page': paginated.per_page,
-                'total': paginated.total,
-                'pages': paginated.pages,
-                'has_next': paginated.has_next,
-                'has_prev': paginated.has_prev
-            }
+            'pagination': pagination
         }), 200
 
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error fetching student inbox: {str(e)}")
         return jsonify({'error': 'Failed to fetch inbox'}), 500
@@ -564,9 +577,9 @@ def student_conversation():
                     Message.sender_type == 'super_admin'
                 )
             )
-        ).order_by(Message.created_at.asc())
+        )
 
-        paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+        messages, pagination = _paginate_messages(query, page, per_page, 'after', descending=False)
 
         # Mark unread messages from admin as read
         unread_msgs = Message.query.filter(
@@ -582,17 +595,12 @@ def student_conversation():
 
         return jsonify({
             'success': True,
-            'messages': [msg.to_dict() for msg in paginated.items],
-            'pagination': {
-                'page': paginated.page,
-                'per_page': paginated.per_page,
-                'total': paginated.total,
-                'pages': paginated.pages,
-                'has_next': paginated.has_next,
-                'has_prev': paginated.has_prev
-            }
+            'messages': [msg.to_dict() for msg in messages],
+            'pagination': pagination
         }), 200
 
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error fetching student conversation: {str(e)}")
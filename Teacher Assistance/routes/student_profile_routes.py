@@ -373,7 +373,7 @@ def get_my_posts():
 
         return jsonify({
             'success': True,
-            'posts': [post.to_dict(current_student_id=student_id) for post in posts.items],
+            'posts': StudentPost.serialize_many(posts.items, current_student_id=student_id),
             'total': posts.total,
             'pages': posts.pages,
             'current_page': posts.page
@@ -405,7 +405,7 @@ def get_student_posts(student_id):
 
         return jsonify({
             'success': True,
-            'posts': [post.to_dict(current_student_id=current_student_id) for post in posts.items],
+            'posts': StudentPost.serialize_many(posts.items, current_student_id=current_student_id),
             'total': posts.total,
             'pages': posts.pages,
             'current_page': posts.page
@@ -440,7 +440,7 @@ def get_timeline():
 
         return jsonify({
             'success': True,
-            'posts': [post.to_dict(current_student_id=current_student_id) for post in posts.items],
+            'posts': StudentPost.serialize_many(posts.items, current_student_id=current_student_id),
             'total': posts.total,
             'pages': posts.pages,
             'current_page': posts.page
@@ -490,7 +490,7 @@ def like_post(post_id):
         return jsonify({
             'success': True,
             'message': 'Post liked successfully',
-            'likes_count': len([l for l in post.likes if l.is_active])
+            'likes_count': post.count_active_likes()
         }), 200
 
     except Exception as e:
@@ -523,7 +523,7 @@ def unlike_post(post_id):
         return jsonify({
             'success': True,
             'message': 'Post unliked successfully',
-            'likes_count': len([l for l in post.likes if l.is_active])
+            'likes_count': post.count_active_likes()
         }), 200
 
     except Exception as e:
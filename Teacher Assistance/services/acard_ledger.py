@@ -0,0 +1,250 @@
+"""
+A-Card Ledger
+Set-based credits and debits of student A-Card balances. One atomic
+UPDATE ... SET acard_balance = acard_balance + :amount covers every student
+in a posting, the ACardTransaction rows go in as one multi-row INSERT, and
+balance-after values come back in the same round-trip where the backend
+supports UPDATE ... RETURNING.
+
+Daily balance snapshots ('flask snapshot-acard-balances') let history
+queries start from the nearest snapshot instead of replaying the ledger.
+"""
+
+import logging
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import and_, delete, func, insert, literal, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from auth.models import ACardBalanceSnapshot, ACardTransaction, Student
+from extensions import db
+from services.leaderboard_service import LeaderboardService
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_CHUNK_SIZE = 1000
+
+Posting = namedtuple('Posting', ['balance_after', 'total_points'])
+
+
+class InsufficientBalance(ValueError):
+    """A debit would take one or more students below zero"""
+
+    def __init__(self, student_ids):
+        self.student_ids = student_ids
+        super().__init__(f"Insufficient A-Card balance for students: {student_ids}")
+
+
+class ACardLedger:
+    """Atomic, batched A-Card postings and balance history"""
+
+    # ------------------------------------------------------------------
+    # Postings
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def post(student_ids, amount, transaction_type, description, admin_id=None, task_id=None,
+             points=0, require_funds=False):
+        """
+        Add the same signed `amount` (and optionally `points`) to every
+        student's balance and record one ACardTransaction each.
+
+        Runs inside the caller's transaction; the caller commits. Unknown
+        student ids are ignored. With require_funds the rows are locked first
+        and InsufficientBalance is raised if any balance would go negative.
+
+        Returns {student_id: Posting(balance_after, total_points)}.
+        """
+        ids = list(dict.fromkeys(student_ids))
+        amount = Decimal(str(amount))
+        if not ids:
+            return {}
+
+        students = Student.__table__
+        # Pending ORM changes must land before the arithmetic runs
+        db.session.flush()
+
+        if require_funds and amount < 0:
+            current = db.session.execute(
+                select(students.c.id, students.c.acard_balance)
+                .where(students.c.id.in_(ids))
+                .with_for_update()
+            ).all()
+            short = [student_id for student_id, balance in current if Decimal(str(balance or 0)) + amount < 0]
+            if short:
+                raise InsufficientBalance(short)
+
+        values = {'acard_balance': func.coalesce(students.c.acard_balance, 0) + amount}
+        if points:
+            values['total_points'] = func.coalesce(students.c.total_points, 0) + points
+        statement = update(students).where(students.c.id.in_(ids)).values(**values)
+
+        if db.session.get_bind().dialect.update_returning:
+            rows = db.session.execute(
+                statement.returning(students.c.id, students.c.acard_balance, students.c.total_points)
+            ).all()
+        else:
+            db.session.execute(statement)
+            # The UPDATE holds these row locks until commit, so this read
+            # returns exactly the balances it produced
+            rows = db.session.execute(
+                select(students.c.id, students.c.acard_balance, students.c.total_points)
+                .where(students.c.id.in_(ids))
+            ).all()
+
+        postings = {
+            student_id: Posting(float(balance or 0), total_points or 0)
+            for student_id, balance, total_points in rows
+        }
+        if not postings:
+            return postings
+
+        now = datetime.utcnow()
+        db.session.execute(insert(ACardTransaction.__table__), [
+            {
+                'student_id': student_id,
+                'admin_id': admin_id,
+                'task_id': task_id,
+                'transaction_type': transaction_type,
+                'amount': amount,
+                'description': (description or '')[:200],
+                'balance_after': posting.balance_after,
+                'created_at': now
+            }
+            for student_id, posting in postings.items()
+        ])
+
+        if points:
+            LeaderboardService.record_points(db.session.connection(), {student_id: points for student_id in postings})
+
+        ACardLedger._sync_loaded_students(postings, points)
+        return postings
+
+    @staticmethod
+    def credit(student_id, amount, transaction_type, description, **kwargs):
+        """Single-student credit; returns the Posting or None if the student does not exist"""
+        return ACardLedger.post([student_id], abs(amount), transaction_type, description, **kwargs).get(student_id)
+
+    @staticmethod
+    def debit(student_id, amount, transaction_type, description, require_funds=True, **kwargs):
+        """Single-student debit (amount given as a positive number)"""
+        return ACardLedger.post(
+            [student_id], -abs(amount), transaction_type, description, require_funds=require_funds, **kwargs
+        ).get(student_id)
+
+    @staticmethod
+    def _sync_loaded_students(postings, points):
+        """Student rows already in the session would otherwise keep their old balance"""
+        for student_id, posting in postings.items():
+            student = db.session.identity_map.get(identity_key(Student, student_id))
+            if student is None:
+                continue
+            set_committed_value(student, 'acard_balance', Decimal(str(posting.balance_after)))
+            if points:
+                set_committed_value(student, 'total_points', posting.total_points)
+
+    # ------------------------------------------------------------------
+    # Snapshots and history
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def take_snapshot(snapshot_date=None, chunk_size=SNAPSHOT_CHUNK_SIZE):
+        """
+        Record every student's current balance for `snapshot_date` (today by
+        default) with INSERT ... SELECT in keyed chunks. Rerunning on the same
+        day replaces that day's snapshot.
+        """
+        snapshot_date = snapshot_date or date.today()
+        students = Student.__table__
+        transactions = ACardTransaction.__table__
+        snapshots = ACardBalanceSnapshot.__table__
+
+        # Balance and last transaction id come from the same statement, so
+        # each row is consistent even while postings continue
+        last_transaction = (
+            select(func.max(transactions.c.id))
+            .where(transactions.c.student_id == students.c.id)
+            .scalar_subquery()
+        )
+
+        last_id, count = 0, 0
+        while True:
+            ids = [row[0] for row in db.session.query(Student.id).filter(
+                Student.id > last_id
+            ).order_by(Student.id).limit(chunk_size).all()]
+            if not ids:
+                break
+            try:
+                db.session.execute(
+                    delete(snapshots).where(and_(
+                        snapshots.c.snapshot_date == snapshot_date,
+                        snapshots.c.student_id.in_(ids)
+                    ))
+                )
+                result = db.session.execute(
+                    insert(snapshots).from_select(
+                        ['student_id', 'snapshot_date', 'balance', 'last_transaction_id', 'created_at'],
+                        select(
+                            students.c.id,
+                            literal(snapshot_date, snapshots.c.snapshot_date.type),
+                            func.coalesce(students.c.acard_balance, 0),
+                            last_transaction,
+                            literal(datetime.utcnow(), snapshots.c.created_at.type)
+                        ).where(students.c.id.in_(ids))
+                    )
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            count += result.rowcount or 0
+            last_id = ids[-1]
+
+        logger.info(f"A-Card balance snapshot {snapshot_date}: {count} students")
+        return count
+
+    @staticmethod
+    def balance_at(student_id, when):
+        """
+        Balance as of `when`: the latest snapshot taken by then plus the
+        transactions after it, instead of a sum over the whole ledger.
+        """
+        snapshot = ACardBalanceSnapshot.query.filter(
+            ACardBalanceSnapshot.student_id == student_id,
+            ACardBalanceSnapshot.created_at <= when
+        ).order_by(ACardBalanceSnapshot.created_at.desc()).first()
+
+        query = db.session.query(func.coalesce(func.sum(ACardTransaction.amount), 0)).filter(
+            ACardTransaction.student_id == student_id,
+            ACardTransaction.created_at <= when
+        )
+        base = Decimal('0')
+        if snapshot is not None:
+            base = Decimal(str(snapshot.balance))
+            query = query.filter(ACardTransaction.id > (snapshot.last_transaction_id or 0))
+
+        return float(base + Decimal(str(query.scalar() or 0)))
+
+    @staticmethod
+    def balance_history(student_id, days=30):
+        """Daily balances from snapshots for the last `days` days, oldest first"""
+        since = date.today() - timedelta(days=days)
+        return [
+            snapshot.to_dict() for snapshot in ACardBalanceSnapshot.query.filter(
+                ACardBalanceSnapshot.student_id == student_id,
+                ACardBalanceSnapshot.snapshot_date >= since
+            ).order_by(ACardBalanceSnapshot.snapshot_date.asc()).all()
+        ]
+
+
+def register_acard_ledger(app):
+    """Register the balance snapshot CLI command (schedule it daily from cron)"""
+
+    @app.cli.command('snapshot-acard-balances')
+    def snapshot_acard_balances_command():
+        """Record today's A-Card balance for every student"""
+        count = ACardLedger.take_snapshot()
+        print(f"✅ Snapshot recorded for {count} students")
@@ -0,0 +1,406 @@
+"""
+AI Gateway
+Single path for every Anthropic messages.create / messages.stream call in
+the app.
+
+Clients are wrapped once where they are created (ai_gateway.wrap(client)),
+so existing call sites keep calling client.messages.create(...) and get:
+
+- a per-feature concurrency limit per worker process, so a burst of lesson
+  plans or worksheet evaluations cannot tie up every thread waiting on the
+  API; a call that cannot get a slot within AI_GATEWAY_QUEUE_TIMEOUT
+  raises AIGatewayBusy and notes it on flask.g (ai_gateway_busy), so the
+  request answers 503 even where a route catches the exception;
+- a request timeout per feature and jittered exponential retry on 429,
+  5xx / overloaded and connection errors (honouring Retry-After);
+- call, error, retry, token and latency accounting per Flask endpoint,
+  reported by stats() (/api/health/ai).
+
+client.messages.stream(...) is gated the same way: the slot is held from
+entering the stream to leaving it, and only opening the stream is retried
+(once text has been relayed a failure is the caller's to report).
+
+The feature is looked up from the Flask endpoint making the call.
+AI_GATEWAY_BACKEND=fake swaps Anthropic for FakeBackend, which answers
+after a simulated latency without network access, so the app can be load
+tested offline (ANTHROPIC_API_KEY can then be any placeholder); any object
+with create(client, **kwargs) and stream(client, **kwargs) can be plugged in
+with ai_gateway.set_backend().
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict, deque, namedtuple
+from types import SimpleNamespace
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+AI_GATEWAY_BACKEND = os.getenv('AI_GATEWAY_BACKEND', 'anthropic')
+AI_GATEWAY_MAX_RETRIES = int(os.getenv('AI_GATEWAY_MAX_RETRIES', '2'))
+AI_GATEWAY_QUEUE_TIMEOUT = float(os.getenv('AI_GATEWAY_QUEUE_TIMEOUT', '15'))
+AI_GATEWAY_RETRY_BASE = 1.0
+AI_GATEWAY_RETRY_CAP = 20.0
+AI_FAKE_LATENCY_MS = int(os.getenv('AI_FAKE_LATENCY_MS', '800'))
+# Characters per chunk and delay between chunks of a fake stream
+AI_FAKE_CHUNK_SIZE = 16
+AI_FAKE_CHUNK_DELAY = 0.005
+# Latency samples kept per endpoint for the percentiles
+LATENCY_SAMPLES = 512
+
+FeaturePolicy = namedtuple('FeaturePolicy', ['concurrency', 'timeout'])
+
+# Concurrent calls per worker process and request timeout (seconds) per feature
+AI_FEATURES = {
+    'lesson_plan': FeaturePolicy(3, 120),
+    'evaluation': FeaturePolicy(4, 45),
+    'chat': FeaturePolicy(6, 30),
+    'default': FeaturePolicy(8, 60),
+}
+
+# Flask endpoint (or blueprint name) -> feature; anything else goes by keyword
+AI_ENDPOINT_FEATURES = {
+    'lesson_plan_routes': 'lesson_plan',
+    'submit_worksheet': 'evaluation',
+    'homework_ai_chat': 'chat',
+    'get_clarification': 'chat',
+}
+AI_FEATURE_KEYWORDS = (
+    ('lesson', 'lesson_plan'),
+    ('evaluat', 'evaluation'),
+    ('chat', 'chat'),
+)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERRORS = {'APITimeoutError', 'APIConnectionError'}
+
+
+class AIGatewayBusy(RuntimeError):
+    """No slot for the feature freed up within the queue timeout"""
+
+    def __init__(self, feature):
+        self.feature = feature
+        super().__init__(f"AI service is busy ({feature}); please try again shortly")
+
+
+def feature_for(endpoint):
+    """Feature an endpoint's calls are limited under"""
+    if not endpoint:
+        return 'default'
+    if endpoint in AI_ENDPOINT_FEATURES:
+        return AI_ENDPOINT_FEATURES[endpoint]
+    blueprint = endpoint.split('.', 1)[0]
+    if blueprint in AI_ENDPOINT_FEATURES:
+        return AI_ENDPOINT_FEATURES[blueprint]
+    for keyword, feature in AI_FEATURE_KEYWORDS:
+        if keyword in endpoint:
+            return feature
+    return 'default'
+
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return 'background'
+
+
+def _is_retryable(error):
+    status = getattr(error, 'status_code', None)
+    return status in RETRYABLE_STATUS or type(error).__name__ in RETRYABLE_ERRORS
+
+
+def _retry_after(error):
+    """Seconds from a Retry-After header, if the error carries one"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+# ----------------------------------------------------------------------
+# Backends
+# ----------------------------------------------------------------------
+
+class AnthropicBackend:
+    """The real API through the wrapped client"""
+
+    name = 'anthropic'
+
+    def create(self, client, **kwargs):
+        return client.messages.create(**kwargs)
+
+    def stream(self, client, **kwargs):
+        return client.messages.stream(**kwargs)
+
+
+class FakeBackend:
+    """
+    Offline stand-in: sleeps for the simulated latency and answers with
+    responder(kwargs) (a fixed JSON body by default).
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency_ms=AI_FAKE_LATENCY_MS, responder=None):
+        self.latency_ms = latency_ms
+        self.responder = responder or (lambda kwargs: '{"fake": true}')
+
+    def create(self, client, **kwargs):
+        time.sleep(self.latency_ms * random.uniform(0.5, 1.5) / 1000.0)
+        text = self.responder(kwargs)
+        prompt = ''.join(str(message.get('content', '')) for message in kwargs.get('messages') or [])
+        return SimpleNamespace(
+            content=[SimpleNamespace(type='text', text=text)],
+            model=kwargs.get('model'),
+            stop_reason='end_turn',
+            usage=SimpleNamespace(input_tokens=len(prompt) // 4, output_tokens=len(text) // 4),
+            fake=True
+        )
+
+    def stream(self, client, **kwargs):
+        return _FakeStream(self.create(client, **kwargs))
+
+
+class _FakeStream:
+    """messages.stream() stand-in relaying a fake response in small chunks"""
+
+    def __init__(self, response):
+        self._response = response
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    @property
+    def text_stream(self):
+        text = self._response.content[0].text
+        for start in range(0, len(text), AI_FAKE_CHUNK_SIZE):
+            time.sleep(AI_FAKE_CHUNK_DELAY)
+            yield text[start:start + AI_FAKE_CHUNK_SIZE]
+
+    def get_final_message(self):
+        return self._response
+
+
+# ----------------------------------------------------------------------
+# Gateway
+# ----------------------------------------------------------------------
+
+class AIGateway:
+    """Concurrency limits, timeouts, retries and accounting around one backend"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or (FakeBackend() if AI_GATEWAY_BACKEND == 'fake' else AnthropicBackend())
+        self._lock = threading.Lock()
+        self._slots = {
+            feature: threading.BoundedSemaphore(policy.concurrency)
+            for feature, policy in AI_FEATURES.items()
+        }
+        self._in_use = Counter()
+        self._counters = defaultdict(Counter)
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+
+    def set_backend(self, backend):
+        self.backend = backend
+
+    def wrap(self, client):
+        """Route a client's messages.create / stream through the gateway (None stays None)"""
+        if client is None or isinstance(client, GatewayClient):
+            return client
+        if hasattr(client, 'with_options'):
+            # The gateway does the retrying; the SDK's own retries would multiply it
+            client = client.with_options(max_retries=0)
+        return GatewayClient(self, client)
+
+    def create(self, client, **kwargs):
+        endpoint, feature = self._route(kwargs)
+        response, started = self._attempt(endpoint, feature, lambda: self.backend.create(client, **kwargs))
+        self._release(feature)
+        self._record_success(endpoint, response, time.monotonic() - started)
+        return response
+
+    def stream(self, client, **kwargs):
+        """Context manager like client.messages.stream(**kwargs), gated by the gateway"""
+        return _GatewayStream(self, client, kwargs)
+
+    def _route(self, kwargs):
+        """(endpoint, feature) of the current call; sets the feature's timeout"""
+        endpoint = _current_endpoint()
+        feature = feature_for(endpoint)
+        policy = AI_FEATURES.get(feature, AI_FEATURES['default'])
+        if self.backend.name == 'anthropic':
+            kwargs.setdefault('timeout', policy.timeout)
+        return endpoint, feature
+
+    def _attempt(self, endpoint, feature, call):
+        """
+        call() holding a slot of `feature`, retried on transient errors.
+        Returns (result, started) with the slot still held.
+        """
+        attempt = 0
+        while True:
+            self._acquire(feature, endpoint)
+            started = time.monotonic()
+            try:
+                return call(), started
+            except Exception as e:
+                elapsed = time.monotonic() - started
+                self._release(feature)
+                retry = _is_retryable(e) and attempt < AI_GATEWAY_MAX_RETRIES
+                self._record_failure(endpoint, e, elapsed, retry)
+                if not retry:
+                    raise
+                attempt += 1
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(AI_GATEWAY_RETRY_CAP, AI_GATEWAY_RETRY_BASE * 2 ** (attempt - 1))
+                    delay *= random.uniform(0.5, 1.5)
+                delay = min(delay, AI_GATEWAY_RETRY_CAP)
+                logger.warning(f"⚠️ AI call from {endpoint} failed ({e}); retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def stats(self):
+        """Per-feature slot use and per-endpoint counters / latency percentiles"""
+        with self._lock:
+            endpoints = {}
+            for endpoint, counters in self._counters.items():
+                samples = sorted(self._latencies[endpoint])
+                latency = {}
+                if samples:
+                    latency = {
+                        'avg_ms': round(sum(samples) / len(samples)),
+                        'p50_ms': samples[len(samples) // 2],
+                        'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                        'max_ms': samples[-1]
+                    }
+                endpoints[endpoint] = dict(counters, feature=feature_for(endpoint), latency=latency)
+            return {
+                'backend': self.backend.name,
+                'features': {
+                    feature: {'limit': policy.concurrency, 'in_use': self._in_use[feature], 'timeout': policy.timeout}
+                    for feature, policy in AI_FEATURES.items()
+                },
+                'endpoints': endpoints
+            }
+
+    def _acquire(self, feature, endpoint):
+        slots = self._slots.get(feature, self._slots['default'])
+        if not slots.acquire(timeout=AI_GATEWAY_QUEUE_TIMEOUT):
+            with self._lock:
+                self._counters[endpoint]['rejected'] += 1
+            logger.error(f"❌ AI gateway busy: no {feature} slot for {endpoint} within {AI_GATEWAY_QUEUE_TIMEOUT}s")
+            if has_request_context():
+                g.ai_gateway_busy = feature
+            raise AIGatewayBusy(feature)
+        with self._lock:
+            self._in_use[feature] += 1
+
+    def _release(self, feature):
+        with self._lock:
+            self._in_use[feature] -= 1
+        self._slots.get(feature, self._slots['default']).release()
+
+    def _record_success(self, endpoint, response, elapsed):
+        usage = getattr(response, 'usage', None)
+        with self._lock:
+            counters = self._counters[endpoint]
+            counters['calls'] += 1
+            counters['input_tokens'] += getattr(usage, 'input_tokens', 0) or 0
+            counters['output_tokens'] += getattr(usage, 'output_tokens', 0) or 0
+            self._latencies[endpoint].append(round(elapsed * 1000))
+
+    def _count(self, endpoint, counter):
+        with self._lock:
+            self._counters[endpoint][counter] += 1
+
+    def _record_failure(self, endpoint, error, elapsed, retrying):
+        with self._lock:
+            counters = self._counters[endpoint]
+            counters['retries' if retrying else 'errors'] += 1
+            if type(error).__name__ == 'APITimeoutError':
+                counters['timeouts'] += 1
+            self._latencies[endpoint].append(round(elapsed * 1000))
+
+
+class _GatewayStream:
+    """
+    A stream opened through the gateway. Entering it takes a feature slot
+    and opens the backend stream (with retries); the slot is released when
+    the with-block exits, and usage is recorded from the final message.
+    """
+
+    def __init__(self, gateway, client, kwargs):
+        self._gateway = gateway
+        self._client = client
+        self._kwargs = kwargs
+        self._manager = None
+
+    def __enter__(self):
+        gateway = self._gateway
+        self._endpoint, self._feature = gateway._route(self._kwargs)
+
+        def open_stream():
+            manager = gateway.backend.stream(self._client, **self._kwargs)
+            return manager, manager.__enter__()
+
+        (self._manager, self._stream), self._started = gateway._attempt(self._endpoint, self._feature, open_stream)
+        return self._stream
+
+    def __exit__(self, exc_type, exc, tb):
+        gateway, endpoint = self._gateway, self._endpoint
+        response = None
+        try:
+            if exc_type is None:
+                response = self._stream.get_final_message()
+        finally:
+            try:
+                self._manager.__exit__(exc_type, exc, tb)
+            finally:
+                elapsed = time.monotonic() - self._started
+                gateway._release(self._feature)
+                gateway._count(endpoint, 'streams')
+                if response is not None:
+                    gateway._record_success(endpoint, response, elapsed)
+                elif exc_type is GeneratorExit:
+                    # The client went away mid-stream
+                    gateway._count(endpoint, 'cancelled')
+                elif exc is not None:
+                    gateway._record_failure(endpoint, exc, elapsed, False)
+        return False
+
+
+class GatewayClient:
+    """Wrapped client: messages.create / stream go through the gateway, everything else is the client's"""
+
+    def __init__(self, gateway, client):
+        self._gateway = gateway
+        self._client = client
+        self.messages = _GatewayMessages(gateway, client)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class _GatewayMessages:
+    def __init__(self, gateway, client):
+        self._gateway = gateway
+        self._client = client
+
+    def create(self, **kwargs):
+        return self._gateway.create(self._client, **kwargs)
+
+    def stream(self, **kwargs):
+        return self._gateway.stream(self._client, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._client.messages, name)
+
+
+ai_gateway = AIGateway()
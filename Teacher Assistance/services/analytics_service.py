@@ -0,0 +1,312 @@
+"""
+Task Analytics Engine
+Computes the admin comprehensive analytics with grouped SQL aggregates.
+Only the bounded top-N lists (recent submissions, top performers,
+fastest/longest completions) materialize individual rows.
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func
+
+from auth.models import Student, StudentTask
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+
+class TaskAnalyticsEngine:
+    """
+    SQL-side implementation of /api/admin/analytics/comprehensive.
+    The response shape matches the original per-row Python implementation.
+    """
+
+    RECENT_SUBMISSIONS_LIMIT = 20
+    TOP_PERFORMERS_LIMIT = 10
+    COMPLETION_EXTREMES_LIMIT = 5
+    TREND_DAYS = 7
+
+    def __init__(self, school=None, grade=None, date_from=None, date_to=None):
+        self.school = school
+        self.grade = grade
+        self.date_from = date_from
+        self.date_to = date_to
+
+        # Expressions shared by every section
+        self.is_completed = StudentTask.status == 'completed'
+        # Typed score columns: score is NULL exactly when there is no completion data,
+        # and a missing max_score counts as 100 like the task_data code did
+        self.has_completion = StudentTask.score.isnot(None)
+        self.completed_with_data = self.is_completed & self.has_completion
+        self.time_spent = func.coalesce(StudentTask.time_spent, 0)
+        self.score = func.coalesce(StudentTask.score, 0)
+        self.max_score = func.coalesce(StudentTask.max_score, 100)
+        self.score_pct = case(
+            (self.max_score > 0, self.score * 100 / self.max_score),
+            else_=None
+        )
+        self.scored = self.completed_with_data & (self.max_score > 0)
+
+    @classmethod
+    def from_request_args(cls, args):
+        """Build an engine from the endpoint's query string, ignoring bad dates like before"""
+        def parse_date(value):
+            if not value:
+                return None
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                return None
+
+        return cls(
+            school=args.get('school', '') or None,
+            grade=args.get('grade', '') or None,
+            date_from=parse_date(args.get('date_from', '')),
+            date_to=parse_date(args.get('date_to', ''))
+        )
+
+    def _filtered(self, *columns):
+        """session.query(*columns) over the filtered StudentTask ⋈ Student join"""
+        query = db.session.query(*columns).select_from(StudentTask).join(
+            Student, Student.id == StudentTask.student_id
+        )
+        if self.school:
+            query = query.filter(Student.school_name.ilike(f'%{self.school}%'))
+        if self.grade:
+            query = query.filter(Student.grade_level == self.grade)
+        if self.date_from:
+            query = query.filter(StudentTask.assigned_at >= self.date_from)
+        if self.date_to:
+            query = query.filter(StudentTask.assigned_at <= self.date_to)
+        return query
+
+    @staticmethod
+    def _sum_if(condition, value=1):
+        return func.coalesce(func.sum(case((condition, value), else_=0)), 0)
+
+    # ------------------------------------------------------------------
+    # Sections
+    # ------------------------------------------------------------------
+
+    def overview_and_distribution(self):
+        row = self._filtered(
+            func.count(StudentTask.id),
+            func.count(func.distinct(StudentTask.student_id)),
+            self._sum_if(self.is_completed),
+            self._sum_if(StudentTask.status == 'pending'),
+            self._sum_if(StudentTask.status == 'in_progress'),
+            self._sum_if(self.is_completed, func.coalesce(StudentTask.points_reward, 0)),
+            self._sum_if(self.is_completed, func.coalesce(StudentTask.acard_credit, 0)),
+            self._sum_if(self.completed_with_data, self.time_spent),
+            self._sum_if(self.completed_with_data, self.score),
+            self._sum_if(self.completed_with_data, self.max_score),
+            self._sum_if(self.scored & (self.score_pct >= 90)),
+            self._sum_if(self.scored & (self.score_pct >= 70) & (self.score_pct < 90)),
+            self._sum_if(self.scored & (self.score_pct >= 50) & (self.score_pct < 70)),
+            self._sum_if(self.scored & (self.score_pct < 50)),
+        ).one()
+
+        (total_tasks, total_students, completed, pending, in_progress, points, acard,
+         total_time, total_score, total_max_score, excellent, good, fair, needs_improvement) = row
+
+        completed = int(completed)
+        overview = {
+            'total_tasks': int(total_tasks),
+            'total_students': int(total_students),
+            'completed_tasks': completed,
+            'pending_tasks': int(pending),
+            'in_progress_tasks': int(in_progress),
+            'avg_time_spent': 0,
+            'avg_score': 0,
+            'total_points_awarded': int(points),
+            'total_acard_distributed': float(acard)
+        }
+        if completed > 0:
+            overview['avg_time_spent'] = float(total_time) / completed
+            if float(total_max_score) > 0:
+                overview['avg_score'] = (float(total_score) / float(total_max_score)) * 100
+
+        distribution = {
+            'excellent': int(excellent),
+            'good': int(good),
+            'fair': int(fair),
+            'needs_improvement': int(needs_improvement)
+        }
+        return overview, distribution
+
+    def task_types_and_time(self):
+        task_types = {}
+        avg_time_by_type = {}
+        rows = self._filtered(
+            StudentTask.task_type,
+            func.count(StudentTask.id),
+            self._sum_if(self.is_completed),
+            self._sum_if(StudentTask.status == 'pending'),
+            self._sum_if(self.completed_with_data, self.time_spent),
+            self._sum_if(self.completed_with_data),
+        ).group_by(StudentTask.task_type).all()
+
+        for task_type, total, completed, pending, time_total, time_count in rows:
+            task_types[task_type] = {
+                'total': int(total),
+                'completed': int(completed),
+                'pending': int(pending),
+                'avg_score': 0,
+                'avg_time': 0
+            }
+            if int(time_count) > 0:
+                avg_time_by_type[task_type] = float(time_total) / int(time_count)
+        return task_types, avg_time_by_type
+
+    def _performance_by(self, column):
+        performance = {}
+        rows = self._filtered(
+            column,
+            func.count(StudentTask.id),
+            self._sum_if(self.is_completed),
+            func.avg(case((self.scored, self.score_pct), else_=None)),
+        ).group_by(column).all()
+
+        for key, total, completed, avg_score in rows:
+            performance[key] = {
+                'total_tasks': int(total),
+                'completed_tasks': int(completed),
+                'avg_score': float(avg_score) if avg_score is not None else 0,
+                'student_count': 0
+            }
+        return performance
+
+    def grade_performance(self):
+        return self._performance_by(Student.grade_level)
+
+    def school_performance(self):
+        return self._performance_by(Student.school_name)
+
+    def recent_submissions(self):
+        rows = self._filtered(StudentTask, Student.name, Student.grade_level, Student.school_name).filter(
+            self.is_completed
+        ).order_by(
+            StudentTask.completed_at.is_(None),
+            StudentTask.completed_at.desc()
+        ).limit(self.RECENT_SUBMISSIONS_LIMIT).all()
+
+        submissions = []
+        for task, student_name, grade_level, school_name in rows:
+            try:
+                task_data = json.loads(task.task_data) if task.task_data else {}
+            except ValueError:
+                task_data = {}
+            submissions.append({
+                'id': task.id,
+                'task_title': task.task_title,
+                'task_type': task.task_type,
+                'student_name': student_name,
+                'student_grade': grade_level,
+                'school_name': school_name,
+                'status': task.status,
+                'completed_at': task.completed_at.isoformat() if task.completed_at else None,
+                'completion_data': task_data.get('completion_data', {}),
+                'points_reward': task.points_reward,
+                'acard_credit': float(task.acard_credit or 0)
+            })
+        return submissions
+
+    def top_performers(self):
+        total_score = self._sum_if(self.has_completion, self.score)
+        total_max_score = self._sum_if(self.has_completion, self.max_score)
+        avg_score = case(
+            (total_max_score > 0, total_score * 100 / total_max_score),
+            else_=0
+        )
+        rows = self._filtered(
+            Student.name,
+            func.max(Student.grade_level),
+            func.max(Student.school_name),
+            func.count(StudentTask.id),
+            self._sum_if(self.has_completion),
+            total_score,
+            total_max_score,
+            avg_score
+        ).filter(self.is_completed).group_by(Student.name).order_by(
+            avg_score.desc()
+        ).limit(self.TOP_PERFORMERS_LIMIT).all()
+
+        return [
+            {
+                'name': name,
+                'grade': grade,
+                'school': school,
+                'total_tasks': int(total),
+                'completed_tasks': int(with_data),
+                'total_score': float(score_sum),
+                'total_max_score': float(max_sum),
+                'avg_score': float(avg or 0)
+            }
+            for name, grade, school, total, with_data, score_sum, max_sum, avg in rows
+        ]
+
+    def completion_trends(self):
+        today = datetime.utcnow().date()
+        first_day = today - timedelta(days=self.TREND_DAYS - 1)
+        day = func.date(StudentTask.completed_at)
+
+        counts = {
+            str(completed_day): int(count)
+            for completed_day, count in self._filtered(day, func.count(StudentTask.id)).filter(
+                self.is_completed,
+                StudentTask.completed_at >= datetime.combine(first_day, datetime.min.time())
+            ).group_by(day).all()
+        }
+
+        trends = []
+        for i in range(self.TREND_DAYS - 1, -1, -1):
+            date = today - timedelta(days=i)
+            trends.append({
+                'date': date.isoformat(),
+                'completed_tasks': counts.get(date.isoformat(), 0)
+            })
+        return trends
+
+    def completion_extremes(self):
+        base = self._filtered(StudentTask.task_title, Student.name, self.time_spent).filter(
+            self.completed_with_data,
+            self.time_spent > 0
+        )
+
+        def shape(rows):
+            return [
+                {'task_title': title, 'student_name': name, 'time_spent': float(time_spent)}
+                for title, name, time_spent in rows
+            ]
+
+        fastest = shape(base.order_by(self.time_spent.asc()).limit(self.COMPLETION_EXTREMES_LIMIT).all())
+        longest = shape(base.order_by(self.time_spent.desc()).limit(self.COMPLETION_EXTREMES_LIMIT).all())
+        return fastest, longest
+
+    # ------------------------------------------------------------------
+    # Full report
+    # ------------------------------------------------------------------
+
+    def comprehensive(self):
+        """Assemble the full analytics payload"""
+        overview, distribution = self.overview_and_distribution()
+        task_types, avg_time_by_type = self.task_types_and_time()
+        fastest, longest = self.completion_extremes()
+
+        return {
+            'overview': overview,
+            'task_types': task_types,
+            'grade_performance': self.grade_performance(),
+            'school_performance': self.school_performance(),
+            'recent_submissions': self.recent_submissions(),
+            'top_performers': self.top_performers(),
+            'completion_trends': self.completion_trends(),
+            'time_analysis': {
+                'avg_time_by_type': avg_time_by_type,
+                'fastest_completions': fastest,
+                'longest_completions': longest
+            },
+            'score_distribution': distribution
+        }
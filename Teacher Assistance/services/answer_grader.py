@@ -0,0 +1,269 @@
+"""
+Answer Grader
+Deterministic first pass over worksheet answers, run before anything is
+sent to the model.
+
+It settles the answers that need no judgement:
+- multiple choice / true-false picks, matched by option letter or text;
+- normalized text matches (case, spacing, punctuation, leading article);
+- numbers, after stripping thousands separators, currency and known units,
+  within a small tolerance (or equal at the expected answer's precision).
+
+A number is only marked wrong when no reading of it could be right. Anything
+else (blank expected answers, wording differences, descriptive answers,
+unknown or conflicting units, a student value that may be a rounding of the
+expected one, and "1.000" style numbers that read as a thousand where a point
+groups digits) is left undecided for the AI.
+"""
+
+import math
+import random
+import re
+from collections import namedtuple
+from fractions import Fraction
+from itertools import product
+
+# correct: True / False when settled locally, None when the AI must decide
+Grade = namedtuple('Grade', ['correct', 'method'])
+
+# values: every reading of the number (two for "1.000"-style grouping)
+# places: decimals as written, None for fractions and exponents
+Quantity = namedtuple('Quantity', ['values', 'unit', 'places'])
+
+UNDECIDED = Grade(None, None)
+
+POSITIVE_FEEDBACK = [
+    "Well done! You got this one right.",
+    "Great work! That's the correct answer.",
+    "Excellent! You clearly understand this concept.",
+    "Nice job! You nailed it.",
+    "Spot on! Keep up the great work.",
+    "That's right! You're doing really well.",
+    "Perfect answer! You've got a solid grasp on this.",
+    "Correct! Your understanding is showing through.",
+]
+
+ENCOURAGING_FEEDBACK = [
+    "Don't worry — review this topic and you'll get it next time!",
+    "Keep practicing, you're making progress!",
+    "Almost there — a little more study and you'll master this!",
+    "No worries! Every mistake is a learning opportunity.",
+    "Keep going — understanding comes with practice!",
+]
+
+# Currency marks and words, mapped to one code so "$46" == "46 dollars"
+CURRENCIES = {
+    '$': 'usd', 'usd': 'usd', 'dollar': 'usd', 'dollars': 'usd',
+    '£': 'gbp', 'gbp': 'gbp', 'pound': 'gbp', 'pounds': 'gbp',
+    '€': 'eur', 'eur': 'eur', 'euro': 'eur', 'euros': 'eur',
+    '₦': 'ngn', 'ngn': 'ngn', 'naira': 'ngn',
+    '₹': 'inr', 'inr': 'inr', 'rupee': 'inr', 'rupees': 'inr',
+    '¥': 'jpy', 'jpy': 'jpy', 'yen': 'jpy',
+    'cent': 'cent', 'cents': 'cent', '¢': 'cent',
+}
+
+# Units a number may carry (optionally per-unit and squared / cubed); any other
+# trailing word makes the answer something the AI has to read
+UNITS = {
+    'mm', 'cm', 'm', 'km', 'in', 'inch', 'inches', 'ft', 'foot', 'feet', 'yd', 'yard', 'yards',
+    'mi', 'mile', 'miles', 'mg', 'g', 'kg', 'lb', 'lbs', 'oz', 't', 'ton', 'tons', 'tonne', 'tonnes',
+    'ml', 'l', 'litre', 'litres', 'liter', 'liters', 's', 'sec', 'secs', 'second', 'seconds',
+    'min', 'mins', 'minute', 'minutes', 'h', 'hr', 'hrs', 'hour', 'hours', 'day', 'days',
+    'week', 'weeks', 'month', 'months', 'year', 'years', 'mph', 'kph', '%', '°', '°c', '°f',
+    'degree', 'degrees', 'unit', 'units',
+}
+
+TRUE_WORDS = {'true', 't', 'yes', 'y'}
+FALSE_WORDS = {'false', 'f', 'no', 'n'}
+
+RELATIVE_TOLERANCE = 1e-6
+
+_NUMBER = re.compile(
+    r'^(?P<prefix>[^\d\s.+\-−]*)\s*'
+    r'(?P<number>[+\-−]?(?:\d{1,3}(?:,\d{3})+|\d+)?(?:\.\d+)?(?:e[+\-]?\d+)?(?:\s*/\s*\d+)?)\s*'
+    r'(?P<unit>[^\d].*)?$'
+)
+_UNIT = re.compile(r'(?P<base>[a-zµ°%]+)(?:/(?P<per>[a-z]+))?[²³23]?')
+# A point then exactly three digits: 1.000 is one, or a thousand where points group digits
+_POINT_GROUPED = re.compile(r'[+\-]?\d{1,3}\.\d{3}')
+_OPTION_KEY = re.compile(r'^\(?([a-z])[).:\-]?(?:\s+(.*))?$', re.IGNORECASE)
+_EDGE_PUNCTUATION = re.compile(r'^[\s"\'`“”‘’.,;:!?]+|[\s"\'`“”‘’.,;:!?]+$')
+_LEADING_ARTICLE = re.compile(r'^(?:the|a|an)\s+')
+
+
+def normalize_text(value):
+    """Lowercase, collapse spaces, drop edge punctuation and a leading article"""
+    text = ' '.join(str(value or '').lower().split())
+    text = _EDGE_PUNCTUATION.sub('', text)
+    return _LEADING_ARTICLE.sub('', text)
+
+
+def _known_unit(unit):
+    match = _UNIT.fullmatch(unit)
+    return bool(match) and match.group('base') in UNITS and (
+        not match.group('per') or match.group('per') in UNITS
+    )
+
+
+def parse_number(value):
+    """
+    Quantity for answers like "1,180", "$46", "46 dollars", "3/4", "1e2",
+    "12.5 cm" or "25%"; None when the answer is not a single quantity with a
+    known unit. The unit is '' when absent; currencies come back as their code.
+    """
+    text = ' '.join(str(value or '').strip().lower().split()).rstrip('.')
+    match = _NUMBER.match(text)
+    if not match or not re.search(r'\d', match.group('number')):
+        return None
+
+    prefix, unit = match.group('prefix').strip(), (match.group('unit') or '').strip()
+    if prefix and (unit or prefix not in CURRENCIES):
+        return None
+    unit = CURRENCIES.get(prefix or unit, prefix or unit)
+    if unit and unit not in CURRENCIES.values() and not _known_unit(unit):
+        # Not a unit we know: a phrase, an expression or notation we cannot read
+        return None
+
+    number = match.group('number').replace(',', '').replace('−', '-').replace(' ', '')
+    readings = [number]
+    if _POINT_GROUPED.fullmatch(number):
+        readings.append(number.replace('.', ''))
+    try:
+        values = tuple(float(Fraction(reading)) for reading in readings)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+    places = None
+    if '/' not in number and 'e' not in number:
+        decimals = re.search(r'\.(\d+)$', number)
+        places = len(decimals.group(1)) if decimals else 0
+    return Quantity(values, unit, places)
+
+
+def numbers_match(expected, student, expected_places=None, student_places=None):
+    """
+    True when equal within tolerance or equal once rounded to the expected
+    answer's decimals; None when the student's value could be the expected
+    one rounded to the decimals the student gave; otherwise False.
+    """
+    if math.isclose(expected, student, rel_tol=RELATIVE_TOLERANCE, abs_tol=1e-9):
+        return True
+    if expected_places and round(student, expected_places) == round(expected, expected_places):
+        return True
+    if student_places is not None and math.isclose(round(expected, student_places), student, abs_tol=1e-9):
+        return None
+    return False
+
+
+def _numeric_grade(expected, student):
+    """Grade two quantities; settled only when every reading of both agrees"""
+    if expected.unit and student.unit and expected.unit != student.unit:
+        # "5 cm" vs "0.05 m" needs a conversion the AI can judge
+        return UNDECIDED
+    verdicts = {
+        numbers_match(expected_value, student_value, expected.places, student.places)
+        for expected_value, student_value in product(expected.values, student.values)
+    }
+    if len(verdicts) != 1 or None in verdicts:
+        return UNDECIDED
+    return Grade(verdicts.pop(), 'numeric')
+
+
+def _option_index(value, options):
+    """Which option an answer names: its full text, its letter, or its text after the letter"""
+    text = normalize_text(value)
+    if not text:
+        return None
+    keyed = []
+    for index, option in enumerate(options):
+        option_text = normalize_text(option)
+        if text == option_text:
+            return index
+        key = _OPTION_KEY.match(option_text)
+        keyed.append((key.group(1), normalize_text(key.group(2) or '')) if key else (None, option_text))
+
+    key = _OPTION_KEY.match(text)
+    for index, (letter, body) in enumerate(keyed):
+        if key and not key.group(2) and letter == key.group(1):
+            return index
+        if body and text == body:
+            return index
+    return None
+
+
+def _boolean(value):
+    text = normalize_text(value)
+    if text in TRUE_WORDS:
+        return True
+    if text in FALSE_WORDS:
+        return False
+    return None
+
+
+def grade_answer(question, student_answer):
+    """Grade one answer locally; UNDECIDED when it needs the AI"""
+    expected = str(question.get('expectedAnswer') or '').strip()
+    student = str(student_answer or '').strip()
+    if not expected:
+        return UNDECIDED
+    if not student:
+        return Grade(False, 'blank')
+
+    answer_format = question.get('answer_format') or question.get('answerFormat') or 'input'
+    options = question.get('options') or []
+
+    if answer_format == 'true_false':
+        expected_value, student_value = _boolean(expected), _boolean(student)
+        if expected_value is not None and student_value is not None:
+            return Grade(expected_value == student_value, 'true_false')
+
+    if answer_format == 'multiple_choice' and options:
+        expected_index, student_index = _option_index(expected, options), _option_index(student, options)
+        if expected_index is not None and student_index is not None:
+            return Grade(expected_index == student_index, 'choice')
+
+    expected_text, student_text = normalize_text(expected), normalize_text(student)
+    if expected_text == student_text:
+        return Grade(True, 'exact')
+
+    expected_number, student_number = parse_number(expected), parse_number(student)
+    if expected_number and student_number:
+        return _numeric_grade(expected_number, student_number)
+
+    return UNDECIDED
+
+
+def local_feedback(question, correct):
+    """Short canned feedback for a locally graded answer"""
+    if correct:
+        return random.choice(POSITIVE_FEEDBACK)
+    return f"The correct answer is: {question.get('expectedAnswer', '')}. {random.choice(ENCOURAGING_FEEDBACK)}"
+
+
+def lenient_match(expected_answer, student_answer):
+    """Last-resort comparison for answers the AI could not grade"""
+    student = str(student_answer or '').strip().lower()
+    expected = str(expected_answer or '').strip().lower()
+    if not student or not expected:
+        return student == expected
+    return (
+        student == expected or
+        student in expected or
+        expected in student or
+        student.replace(',', '').replace('$', '').replace(' ', '') ==
+        expected.replace(',', '').replace('$', '').replace(' ', '')
+    )
+
+
+def overall_feedback(earned_points, total_points):
+    """Overall message for a score"""
+    percentage = (earned_points / total_points * 100) if total_points > 0 else 0
+    if percentage == 100:
+        return f"Outstanding! You scored {earned_points}/{total_points} — a perfect score! You've demonstrated excellent understanding of the material."
+    elif percentage >= 80:
+        return f"Great job! You scored {earned_points}/{total_points}. You have a strong grasp of the material. Review the questions you missed to aim for a perfect score!"
+    elif percentage >= 60:
+        return f"Good effort! You scored {earned_points}/{total_points}. You're on the right track — revisit the topics you missed and you'll improve in no time."
+    elif percentage >= 40:
+        return f"You scored {earned_points}/{total_points}. Don't be discouraged — review the material and try again. Every attempt helps you learn!"
+    return f"You scored {earned_points}/{total_points}. This is a great opportunity to review the material. Take your time studying the topics and give it another go — you've got this!"
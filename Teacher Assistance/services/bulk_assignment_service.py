@@ -0,0 +1,311 @@
+"""
+Bulk Assignment Service
+Set-based task, subject and skill assignment for whole grades: inputs are
+validated once by the caller, existing assignments are found with one query
+per chunk, rows go in as multi-row INSERTs, and every chunk commits on its
+own so no single transaction holds locks for the whole grade.
+"""
+
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import insert, select, text, update
+
+from auth.models import StudentTask, TaskNotification
+from extensions import db
+from services.leaderboard_service import LeaderboardService
+
+logger = logging.getLogger(__name__)
+
+# Students per INSERT/commit; a chunk inserts students x templates task rows
+BULK_ASSIGN_CHUNK_SIZE = int(os.getenv('BULK_ASSIGN_CHUNK_SIZE', '200'))
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def parse_due_date(value):
+    """
+    Parse a due date the way the assignment endpoints always have: datetime-local
+    or ISO input, pushed to the end of the day when no time was given.
+    Raises ValueError for unparseable input.
+    """
+    if not value:
+        return None
+    if 'T' in value and 'Z' not in value and '+' not in value:
+        due_date = datetime.fromisoformat(value)
+    else:
+        due_date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if due_date.hour == 0 and due_date.minute == 0:
+        due_date = due_date.replace(hour=23, minute=59, second=59)
+    return due_date
+
+
+def _due_key(due_date):
+    """Compare due dates the way the DATETIME column stores them"""
+    return due_date.replace(tzinfo=None, microsecond=0) if due_date else None
+
+
+def _same_key_runs(rows):
+    """Consecutive rows with the same columns; a multi-row VALUES needs one column list"""
+    run = []
+    for row in rows:
+        if run and row.keys() != run[0].keys():
+            yield run
+            run = []
+        run.append(row)
+    if run:
+        yield run
+
+
+class BulkAssignmentService:
+    """Chunked multi-row assignment of tasks and subject/skill links"""
+
+    # ------------------------------------------------------------------
+    # Inserts
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _insert_returning_ids(table, rows):
+        """
+        Multi-row INSERT of `rows`; returns the new ids in row order.
+
+        Dialects with ordered RETURNING (PostgreSQL, SQLite, MariaDB) hand the
+        ids back directly. MySQL has no RETURNING, but a multi-row INSERT with
+        a known row count gets consecutive auto-increment values (one
+        auto_increment_increment apart) and reports the first as lastrowid,
+        so the ids follow from lastrowid and the row count.
+        """
+        dialect = db.session.get_bind().dialect
+        if dialect.insert_executemany_returning_sort_by_parameter_order:
+            return list(db.session.execute(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+            ).scalars())
+
+        step = db.session.execute(text('SELECT @@auto_increment_increment')).scalar() or 1
+        ids = []
+        for run in _same_key_runs(rows):
+            result = db.session.execute(insert(table).values(run))
+            if result.rowcount != len(run) or not result.lastrowid:
+                raise RuntimeError(f"Could not read back ids of a {len(run)}-row insert into {table.name}")
+            ids.extend(result.lastrowid + offset * step for offset in range(len(run)))
+        return ids
+
+    @staticmethod
+    def _existing_task_keys(table, student_ids, templates):
+        """(student_id, title, type, due) of tasks these students already have, in one query"""
+        rows = db.session.execute(
+            select(table.c.student_id, table.c.task_title, table.c.task_type, table.c.due_date)
+            .where(
+                table.c.student_id.in_(student_ids),
+                table.c.task_title.in_({template['task_title'] for template in templates})
+            )
+        ).all()
+        return {
+            (student_id, title, task_type, _due_key(due_date))
+            for student_id, title, task_type, due_date in rows
+        }
+
+    # ------------------------------------------------------------------
+    # Tasks
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def assign_tasks(admin_id, students, templates, model=StudentTask, notify=True,
+                     skip_existing=True, chunk_size=BULK_ASSIGN_CHUNK_SIZE, on_progress=None):
+        """
+        Create one task per (student, template).
+
+        students:  [(student_id, student_name)], already validated by the caller
+        templates: dicts of task column values; 'task_data' is a dict and
+                   'task_index' (optional) is echoed back in the results
+        model:     StudentTask, or SocialMediaTask for the social media cohort
+        notify:    also insert an 'assignment' TaskNotification per StudentTask
+
+        With skip_existing a task identical to one the student already has
+        (same title, type and due date) is reported as skipped, so a request
+        that stopped half-way can simply be sent again.
+
+        Returns {'batch_id', 'assignments', 'skipped', 'failed', 'chunks'}.
+        """
+        table = model.__table__
+        batch_id = uuid.uuid4().hex
+        notify = notify and model is StudentTask
+
+        prepared = []
+        for position, template in enumerate(templates):
+            values = dict(template)
+            task_index = values.pop('task_index', position + 1)
+            task_data = dict(values.pop('task_data', None) or {})
+            values.update(
+                admin_id=admin_id,
+                task_data=json.dumps(task_data),
+                status='pending'
+            )
+            prepared.append((task_index, values))
+
+        result = {'batch_id': batch_id, 'assignments': [], 'skipped': [], 'failed': [], 'chunks': []}
+        student_chunks = list(chunked(list(students), max(1, chunk_size)))
+
+        for chunk_number, chunk in enumerate(student_chunks, 1):
+            chunk_ids = [student_id for student_id, _ in chunk]
+            progress = {'chunk': chunk_number, 'of': len(student_chunks), 'students': len(chunk), 'created': 0, 'skipped': 0}
+            try:
+                existing = BulkAssignmentService._existing_task_keys(table, chunk_ids, templates) if skip_existing else set()
+                now = datetime.utcnow()
+
+                rows, meta, skipped, created = [], [], [], []
+                for student_id, student_name in chunk:
+                    for task_index, values in prepared:
+                        key = (student_id, values['task_title'], values['task_type'], _due_key(values.get('due_date')))
+                        if key in existing:
+                            skipped.append({
+                                'student_id': student_id,
+                                'student_name': student_name,
+                                'task_index': task_index,
+                                'task_title': values['task_title']
+                            })
+                            continue
+                        rows.append(dict(values, student_id=student_id, assigned_at=now))
+                        meta.append((student_id, student_name, task_index))
+
+                if rows:
+                    task_ids = BulkAssignmentService._insert_returning_ids(table, rows)
+
+                    if notify:
+                        db.session.execute(insert(TaskNotification.__table__), [
+                            {
+                                'student_id': row['student_id'],
+                                'task_id': task_id,
+                                'notification_type': 'assignment',
+                                'title': 'New task assigned',
+                                'message': row['task_title'],
+                                'is_read': False,
+                                'created_at': now
+                            }
+                            for row, task_id in zip(rows, task_ids)
+                        ])
+
+                    if model is StudentTask:
+                        counts = defaultdict(int)
+                        for row in rows:
+                            counts[row['student_id']] += 1
+                        LeaderboardService.record_new_tasks(db.session.connection(), counts)
+
+                    for (student_id, student_name, task_index), row, task_id in zip(meta, rows, task_ids):
+                        created.append({
+                            'student_id': student_id,
+                            'student_name': student_name,
+                            'task_id': task_id,
+                            'task_index': task_index,
+                            'task_title': row['task_title'],
+                            'due_date': row['due_date'].isoformat() if row.get('due_date') else None
+                        })
+
+                db.session.commit()
+                result['assignments'].extend(created)
+                result['skipped'].extend(skipped)
+                progress.update(created=len(rows), skipped=len(skipped), status='committed')
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"❌ Bulk assignment {batch_id} chunk {chunk_number}/{len(student_chunks)} failed: {str(e)}")
+                # Later chunks are not attempted; resending the request fills them in
+                for failed_chunk in student_chunks[chunk_number - 1:]:
+                    for student_id, student_name in failed_chunk:
+                        for task_index, values in prepared:
+                            result['failed'].append({
+                                'student_id': student_id,
+                                'student_name': student_name,
+                                'task_index': task_index,
+                                'task_title': values['task_title'],
+                                'error': str(e)
+                            })
+                progress['status'] = 'failed'
+                progress['error'] = str(e)
+                result['chunks'].append(progress)
+                if on_progress:
+                    on_progress(progress)
+                break
+
+            logger.info(f"Bulk assignment {batch_id}: chunk {chunk_number}/{len(student_chunks)} "
+                        f"created {progress['created']}, skipped {progress['skipped']}")
+            result['chunks'].append(progress)
+            if on_progress:
+                on_progress(progress)
+
+        return result
+
+    # ------------------------------------------------------------------
+    # Subject / skill links
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def assign_links(link_model, item_column, admin_id, student_ids, item_ids,
+                     chunk_size=BULK_ASSIGN_CHUNK_SIZE):
+        """
+        Give every student every item for StudentSubject / StudentSkill style
+        tables (unique per student and item). Per chunk: one SELECT of existing
+        rows, one UPDATE reactivating inactive ones, one multi-row INSERT of the
+        rest, one commit.
+        Returns {student_id: [item_id, ...]} of newly assigned or reactivated items.
+        """
+        table = link_model.__table__
+        item_col = table.c[item_column]
+        assigned = defaultdict(list)
+        if not item_ids:
+            return assigned
+
+        student_chunks = list(chunked(list(student_ids), max(1, chunk_size)))
+        for chunk_number, chunk in enumerate(student_chunks, 1):
+            try:
+                existing = {
+                    (student_id, item_id): (row_id, is_active)
+                    for row_id, student_id, item_id, is_active in db.session.execute(
+                        select(table.c.id, table.c.student_id, item_col, table.c.is_active)
+                        .where(table.c.student_id.in_(chunk), item_col.in_(item_ids))
+                    ).all()
+                }
+
+                now = datetime.utcnow()
+                reactivate, rows = [], []
+                for student_id in chunk:
+                    for item_id in item_ids:
+                        current = existing.get((student_id, item_id))
+                        if current is None:
+                            rows.append({
+                                'student_id': student_id,
+                                item_column: item_id,
+                                'admin_id': admin_id,
+                                'assigned_at': now,
+                                'is_active': True
+                            })
+                        elif not current[1]:
+                            reactivate.append(current[0])
+                        else:
+                            continue
+                        assigned[student_id].append(item_id)
+
+                if reactivate:
+                    db.session.execute(
+                        update(table)
+                        .where(table.c.id.in_(reactivate))
+                        .values(is_active=True, assigned_at=now, admin_id=admin_id)
+                    )
+                if rows:
+                    db.session.execute(insert(table), rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.error(f"❌ Bulk {table.name} assignment failed at chunk {chunk_number}/{len(student_chunks)}")
+                raise
+
+            logger.info(f"Bulk {table.name}: chunk {chunk_number}/{len(student_chunks)} "
+                        f"inserted {len(rows)}, reactivated {len(reactivate)}")
+
+        return assigned
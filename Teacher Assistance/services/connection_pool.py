@@ -0,0 +1,300 @@
+"""
+Raw Connection Pool
+Bounded, health-checked pool for the code paths that use DB-API cursors
+directly (mysql.connector story/enrollment endpoints, sqlite3 game scores)
+instead of SQLAlchemy sessions.
+
+Usage:
+    configure_pool(MYSQL_POOL, mysql_connection_factory(DB_CONFIG))
+    connection = get_pool(MYSQL_POOL).connect()
+    ...
+    connection.close()   # returns the connection to the pool
+
+Pool sizing can be tuned with RAW_DB_POOL_SIZE, RAW_DB_POOL_TIMEOUT and
+RAW_DB_POOL_PING_AFTER (seconds a connection may sit idle before it is
+pinged on checkout).
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = int(os.getenv('RAW_DB_POOL_SIZE', '10'))
+DEFAULT_CHECKOUT_TIMEOUT = float(os.getenv('RAW_DB_POOL_TIMEOUT', '10'))
+DEFAULT_PING_AFTER = float(os.getenv('RAW_DB_POOL_PING_AFTER', '30'))
+
+# Pool shared by every mysql.connector code path (story builder, enrollment)
+MYSQL_POOL = 'mysql'
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection becomes free within the checkout timeout"""
+
+
+# ----------------------------------------------------------------------
+# Connection factories
+# ----------------------------------------------------------------------
+
+def mysql_connection_factory(config):
+    """Factory for mysql.connector connections built from a DB_CONFIG-style dict"""
+    import mysql.connector
+
+    def connect():
+        return mysql.connector.connect(**config)
+    return connect
+
+
+def sqlite_connection_factory(path, row_factory=sqlite3.Row):
+    """Factory for sqlite3 connections; usable as a local stand-in for MySQL"""
+    def connect():
+        # Pooled connections are handed to whichever request thread checks them out
+        connection = sqlite3.connect(path, check_same_thread=False)
+        connection.row_factory = row_factory
+        return connection
+    return connect
+
+
+def _ping(raw):
+    """Cheap liveness probe for either driver"""
+    if hasattr(raw, 'ping'):
+        raw.ping(reconnect=False)
+        return
+    cursor = raw.cursor()
+    try:
+        cursor.execute('SELECT 1')
+        cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+# ----------------------------------------------------------------------
+# Pool
+# ----------------------------------------------------------------------
+
+class PooledConnection:
+    """
+    Thin proxy around a DB-API connection. close() hands the connection
+    back to its pool; everything else is forwarded to the driver.
+    """
+
+    def __init__(self, pool, raw):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_raw', raw)
+
+    def __getattr__(self, name):
+        raw = object.__getattribute__(self, '_raw')
+        if raw is None:
+            raise AttributeError(f"{name} (connection already returned to pool)")
+        return getattr(raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        raw = self._raw
+        if raw is not None:
+            object.__setattr__(self, '_raw', None)
+            self._pool._release(raw)
+
+    def is_connected(self):
+        """False once returned to the pool, like a closed mysql.connector connection"""
+        raw = self._raw
+        if raw is None:
+            return False
+        return raw.is_connected() if hasattr(raw, 'is_connected') else True
+
+    def invalidate(self):
+        """Discard the underlying connection instead of reusing it"""
+        raw = self._raw
+        if raw is not None:
+            object.__setattr__(self, '_raw', None)
+            self._pool._release(raw, discard=True)
+
+    def __del__(self):
+        # Error paths that forget close() must not leak a pool slot
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    LIFO pool of at most `max_size` connections. Idle connections older than
+    `ping_after` seconds are pinged on checkout and replaced if dead.
+    """
+
+    def __init__(self, name, factory, max_size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_CHECKOUT_TIMEOUT, ping_after=DEFAULT_PING_AFTER):
+        self.name = name
+        self.factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_after = ping_after
+
+        self._idle = deque()            # (raw connection, returned_at)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'reused': 0,
+            'pings': 0,
+            'ping_failures': 0,
+            'discarded': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'connect_errors': 0,
+        }
+
+    def connect(self):
+        """Check out a live connection, waiting up to `timeout` seconds for a free slot"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['waits'] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise PoolExhausted(
+                    f"{self.name} pool exhausted ({self.max_size} connections in use)"
+                )
+
+        try:
+            raw = self._checkout_idle() or self._create()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+        return PooledConnection(self, raw)
+
+    def _checkout_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                raw, returned_at = self._idle.pop()
+
+            if time.monotonic() - returned_at < self.ping_after:
+                with self._lock:
+                    self._stats['reused'] += 1
+                return raw
+
+            try:
+                with self._lock:
+                    self._stats['pings'] += 1
+                _ping(raw)
+                with self._lock:
+                    self._stats['reused'] += 1
+                return raw
+            except Exception as e:
+                logger.warning(f"⚠️ {self.name} pool: dropping dead connection ({e})")
+                with self._lock:
+                    self._stats['ping_failures'] += 1
+                self._close_quietly(raw)
+
+    def _create(self):
+        try:
+            raw = self.factory()
+        except Exception:
+            with self._lock:
+                self._stats['connect_errors'] += 1
+            raise
+        with self._lock:
+            self._stats['created'] += 1
+        return raw
+
+    def _release(self, raw, discard=False):
+        if not discard:
+            # Never hand an open transaction to the next caller
+            try:
+                raw.rollback()
+            except Exception:
+                discard = True
+
+        with self._lock:
+            self._in_use -= 1
+            if discard:
+                self._stats['discarded'] += 1
+            else:
+                self._idle.append((raw, time.monotonic()))
+        if discard:
+            self._close_quietly(raw)
+        self._slots.release()
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def dispose(self):
+        """Close every idle connection (checked-out ones close when returned)"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for raw, _ in idle:
+            self._close_quietly(raw)
+
+    def metrics(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                max_size=self.max_size,
+                in_use=self._in_use,
+                idle=len(self._idle)
+            )
+
+
+# ----------------------------------------------------------------------
+# Registry
+# ----------------------------------------------------------------------
+
+_pools = {}
+_registry_lock = threading.Lock()
+
+
+def configure_pool(name, factory, **options):
+    """Create (or replace) the named pool"""
+    pool = ConnectionPool(name, factory, **options)
+    with _registry_lock:
+        previous = _pools.get(name)
+        _pools[name] = pool
+    if previous is not None:
+        previous.dispose()
+    logger.info(f"✅ Raw connection pool '{name}' ready (max {pool.max_size})")
+    return pool
+
+
+def ensure_pool(name, factory, **options):
+    """Return the named pool, configuring it first if needed"""
+    with _registry_lock:
+        pool = _pools.get(name)
+    return pool if pool is not None else configure_pool(name, factory, **options)
+
+
+def get_pool(name):
+    """Return the named pool; raises KeyError if it was never configured"""
+    return _pools[name]
+
+
+def pool_metrics():
+    """Metrics for every configured pool, keyed by pool name"""
+    with _registry_lock:
+        pools = list(_pools.values())
+    return {pool.name: pool.metrics() for pool in pools}
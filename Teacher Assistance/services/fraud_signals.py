@@ -0,0 +1,383 @@
+"""
+Affiliate Fraud Signals
+Incrementally maintained counters behind CommissionService.detect_fraud:
+hourly click buckets per affiliate and IP (a sliding 24-hour window is the sum
+of the last buckets) and referral counts per affiliate and email domain.
+
+A session flush listener updates both as AffiliateClick / Referral rows are
+written, so a fraud check reads a handful of counter rows instead of every
+recent click. The check runs after each trial signup and conversion
+commission. 'flask rebuild-fraud-counters' creates the tables and recomputes
+them with GROUP BY queries; 'flask prune-fraud-counters' drops buckets that
+left the window. Nothing touches the database on import.
+
+Until the tables exist the checks fall back to aggregate queries over
+affiliate_clicks and referrals, so detection never silently stops.
+"""
+
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, event, func, inspect, literal_column, select, update
+from sqlalchemy.exc import IntegrityError
+
+from auth.models import AffiliateClick, AffiliateClickWindow, AffiliateReferralDomain, Referral
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+CLICK_WINDOW_HOURS = 24
+MAX_CLICKS_PER_IP = 10          # per window
+MAX_SAME_DOMAIN_REFERRALS = 3   # referrals sharing the affiliate's own email domain
+
+REBUILD_CHUNK_SIZE = 1000
+
+# Seconds before a process that found no counter tables looks again
+READY_RECHECK_SECONDS = 60
+
+# Set once the counter tables exist; the flush listener is a no-op until then
+_fraud_signals_ready = False
+_ready_checked_at = None
+
+
+def hour_bucket(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def email_domain(email):
+    if not email or '@' not in email:
+        return None
+    return email.rsplit('@', 1)[1].strip().lower() or None
+
+
+def _window_start(now=None):
+    return hour_bucket((now or datetime.utcnow()) - timedelta(hours=CLICK_WINDOW_HOURS))
+
+
+def _raw_window_start(now=None):
+    """Window start for the fallback queries over affiliate_clicks"""
+    return (now or datetime.utcnow()) - timedelta(hours=CLICK_WINDOW_HOURS)
+
+
+def _previous_value(state, key):
+    """Value of an attribute as it was before the pending flush"""
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return state.attrs[key].value
+
+
+def _hour_bucket_sql(column, dialect_name):
+    if dialect_name == 'mysql':
+        return func.date_format(column, '%Y-%m-%d %H:00:00')
+    if dialect_name == 'postgresql':
+        return func.date_trunc('hour', column)
+    return func.strftime('%Y-%m-%d %H:00:00', column)
+
+
+def _email_domain_sql(column, dialect_name):
+    if dialect_name == 'mysql':
+        return func.lower(func.substring_index(column, '@', -1))
+    if dialect_name == 'postgresql':
+        return func.lower(func.split_part(column, '@', 2))
+    return func.lower(func.substr(column, func.instr(column, '@') + 1))
+
+
+def _as_datetime(value):
+    # MySQL / SQLite hand the GROUP BY bucket back as text
+    if isinstance(value, str):
+        return datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S')
+    return value
+
+
+class FraudSignalStore:
+    """Counter maintenance, threshold checks and rebuilds for affiliate fraud signals"""
+
+    # ------------------------------------------------------------------
+    # Incremental maintenance
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def collect_changes(session):
+        """
+        Counter deltas from the pending flush.
+        Returns ({(affiliate_id, ip, bucket): clicks}, {(affiliate_id, domain): delta}).
+        """
+        clicks = defaultdict(int)
+        domains = defaultdict(int)
+
+        for obj in session.new:
+            if isinstance(obj, AffiliateClick):
+                if obj.affiliate_id and obj.ip_address:
+                    bucket = hour_bucket(obj.created_at or datetime.utcnow())
+                    clicks[(obj.affiliate_id, obj.ip_address, bucket)] += 1
+            elif isinstance(obj, Referral):
+                domain = email_domain(obj.referred_email)
+                if obj.affiliate_id and domain:
+                    domains[(obj.affiliate_id, domain)] += 1
+
+        for obj in session.dirty:
+            if not isinstance(obj, Referral):
+                continue
+            state = inspect(obj)
+            if not (state.attrs.referred_email.history.has_changes()
+                    or state.attrs.affiliate_id.history.has_changes()):
+                continue
+            old = (_previous_value(state, 'affiliate_id'), email_domain(_previous_value(state, 'referred_email')))
+            new = (obj.affiliate_id, email_domain(obj.referred_email))
+            if old == new:
+                continue
+            if all(old):
+                domains[old] -= 1
+            if all(new):
+                domains[new] += 1
+
+        for obj in session.deleted:
+            if isinstance(obj, Referral):
+                state = inspect(obj)
+                key = (_previous_value(state, 'affiliate_id'), email_domain(_previous_value(state, 'referred_email')))
+                if all(key):
+                    domains[key] -= 1
+
+        return dict(clicks), {key: delta for key, delta in domains.items() if delta}
+
+    @staticmethod
+    def apply_changes(connection, clicks, domains):
+        """Apply deltas with atomic column arithmetic, creating missing counter rows on demand"""
+        windows = AffiliateClickWindow.__table__
+        for (affiliate_id, ip_address, bucket), count in clicks.items():
+            key = and_(
+                windows.c.affiliate_id == affiliate_id,
+                windows.c.ip_address == ip_address,
+                windows.c.bucket_start == bucket
+            )
+            FraudSignalStore._increment(
+                connection, windows, key, windows.c.click_count, count,
+                {'affiliate_id': affiliate_id, 'ip_address': ip_address, 'bucket_start': bucket}
+            )
+
+        referral_domains = AffiliateReferralDomain.__table__
+        for (affiliate_id, domain), delta in domains.items():
+            key = and_(
+                referral_domains.c.affiliate_id == affiliate_id,
+                referral_domains.c.email_domain == domain
+            )
+            FraudSignalStore._increment(
+                connection, referral_domains, key, referral_domains.c.referral_count, delta,
+                {'affiliate_id': affiliate_id, 'email_domain': domain, 'updated_at': datetime.utcnow()}
+            )
+
+    @staticmethod
+    def _increment(connection, table, key, counter, delta, row):
+        """UPDATE counter = counter + delta, inserting the row the first time it is seen"""
+        result = connection.execute(update(table).where(key).values({counter: counter + delta}))
+        if result.rowcount or delta < 0:
+            return
+        try:
+            with connection.begin_nested():
+                connection.execute(table.insert().values(dict(row, **{counter.name: delta})))
+        except IntegrityError:
+            # Another request created the row concurrently; add to it instead
+            connection.execute(update(table).where(key).values({counter: counter + delta}))
+
+    # ------------------------------------------------------------------
+    # Threshold checks
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def ip_click_count(affiliate_id, ip_address, now=None):
+        """Clicks from one IP for this affiliate inside the sliding window"""
+        if not FraudSignalStore.is_ready():
+            return db.session.query(func.count(AffiliateClick.id)).filter(
+                AffiliateClick.affiliate_id == affiliate_id,
+                AffiliateClick.ip_address == ip_address,
+                AffiliateClick.created_at >= _raw_window_start(now)
+            ).scalar()
+        return db.session.query(func.coalesce(func.sum(AffiliateClickWindow.click_count), 0)).filter(
+            AffiliateClickWindow.affiliate_id == affiliate_id,
+            AffiliateClickWindow.ip_address == ip_address,
+            AffiliateClickWindow.bucket_start >= _window_start(now)
+        ).scalar()
+
+    @staticmethod
+    def busiest_ip_over_threshold(affiliate_id, threshold=MAX_CLICKS_PER_IP, now=None):
+        """(ip, clicks) for an IP above `threshold` inside the window, or None"""
+        if not FraudSignalStore.is_ready():
+            total = func.count(AffiliateClick.id)
+            return db.session.query(AffiliateClick.ip_address, total).filter(
+                AffiliateClick.affiliate_id == affiliate_id,
+                AffiliateClick.created_at >= _raw_window_start(now)
+            ).group_by(AffiliateClick.ip_address).having(total > threshold).order_by(total.desc()).first()
+        total = func.sum(AffiliateClickWindow.click_count)
+        return db.session.query(AffiliateClickWindow.ip_address, total).filter(
+            AffiliateClickWindow.affiliate_id == affiliate_id,
+            AffiliateClickWindow.bucket_start >= _window_start(now)
+        ).group_by(AffiliateClickWindow.ip_address).having(total > threshold).order_by(total.desc()).first()
+
+    @staticmethod
+    def excessive_clicks(affiliate_id, ip_address=None, threshold=MAX_CLICKS_PER_IP):
+        """
+        True when an IP went over `threshold` clicks in the window. With the
+        IP of the click being handled only that IP's buckets are read.
+        """
+        if ip_address:
+            return FraudSignalStore.ip_click_count(affiliate_id, ip_address) > threshold
+        return FraudSignalStore.busiest_ip_over_threshold(affiliate_id, threshold) is not None
+
+    @staticmethod
+    def referral_domain_count(affiliate_id, email):
+        """Referrals of this affiliate whose email shares the domain of `email`"""
+        domain = email_domain(email)
+        if not domain:
+            return 0
+        if not FraudSignalStore.is_ready():
+            pattern = '%@' + domain.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            return db.session.query(func.count(Referral.id)).filter(
+                Referral.affiliate_id == affiliate_id,
+                func.lower(Referral.referred_email).like(pattern, escape='\\')
+            ).scalar()
+        return db.session.query(AffiliateReferralDomain.referral_count).filter_by(
+            affiliate_id=affiliate_id,
+            email_domain=domain
+        ).scalar() or 0
+
+    # ------------------------------------------------------------------
+    # Rebuild and pruning
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def rebuild(chunk_size=REBUILD_CHUNK_SIZE):
+        """
+        Recompute both counter tables from affiliate_clicks and referrals with
+        GROUP BY queries, creating the tables if needed. Used for the initial
+        backfill and to repair drift after raw SQL edits. Returns
+        (click buckets, domain rows).
+        """
+        AffiliateClickWindow.__table__.create(bind=db.engine, checkfirst=True)
+        AffiliateReferralDomain.__table__.create(bind=db.engine, checkfirst=True)
+        dialect_name = db.session.get_bind().dialect.name
+        clicks = AffiliateClick.__table__
+        referrals = Referral.__table__
+
+        bucket = _hour_bucket_sql(clicks.c.created_at, dialect_name).label('bucket')
+        click_rows = [
+            {'affiliate_id': affiliate_id, 'ip_address': ip_address,
+             'bucket_start': _as_datetime(bucket_start), 'click_count': count}
+            for affiliate_id, ip_address, bucket_start, count in db.session.execute(
+                select(clicks.c.affiliate_id, clicks.c.ip_address, bucket, func.count())
+                .where(clicks.c.created_at >= _window_start(), clicks.c.ip_address.isnot(None))
+                .group_by(clicks.c.affiliate_id, clicks.c.ip_address, literal_column('bucket'))
+            ).all()
+        ]
+
+        domain = _email_domain_sql(referrals.c.referred_email, dialect_name).label('domain')
+        now = datetime.utcnow()
+        domain_rows = [
+            {'affiliate_id': affiliate_id, 'email_domain': domain_name, 'referral_count': count, 'updated_at': now}
+            for affiliate_id, domain_name, count in db.session.execute(
+                select(referrals.c.affiliate_id, domain, func.count())
+                .where(referrals.c.referred_email.like('%@%'))
+                .group_by(referrals.c.affiliate_id, literal_column('domain'))
+            ).all()
+            if domain_name
+        ]
+
+        try:
+            for table, rows in ((AffiliateClickWindow.__table__, click_rows),
+                                (AffiliateReferralDomain.__table__, domain_rows)):
+                db.session.execute(table.delete())
+                for start in range(0, len(rows), chunk_size):
+                    db.session.execute(table.insert(), rows[start:start + chunk_size])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        global _fraud_signals_ready
+        _fraud_signals_ready = True
+        logger.info(f"Fraud counters rebuilt: {len(click_rows)} click buckets, {len(domain_rows)} referral domains")
+        return len(click_rows), len(domain_rows)
+
+    @staticmethod
+    def prune(now=None):
+        """Delete click buckets that have left the window"""
+        try:
+            result = db.session.execute(
+                delete(AffiliateClickWindow.__table__).where(
+                    AffiliateClickWindow.__table__.c.bucket_start < _window_start(now)
+                )
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return result.rowcount or 0
+
+    @staticmethod
+    def is_ready():
+        """
+        Whether both counter tables exist. Read-only: 'flask rebuild-fraud-counters'
+        creates them. Missing tables are looked for again after READY_RECHECK_SECONDS.
+        """
+        global _fraud_signals_ready, _ready_checked_at
+        if _fraud_signals_ready:
+            return True
+        if _ready_checked_at is not None and time.monotonic() - _ready_checked_at < READY_RECHECK_SECONDS:
+            return False
+        _ready_checked_at = time.monotonic()
+        try:
+            inspector = inspect(db.engine)
+            _fraud_signals_ready = all(
+                inspector.has_table(model.__tablename__)
+                for model in (AffiliateClickWindow, AffiliateReferralDomain)
+            )
+        except Exception as e:
+            logger.error(f"Fraud counter table check failed: {str(e)}")
+        if not _fraud_signals_ready:
+            logger.warning("⚠️ Fraud counter tables not found - run 'flask rebuild-fraud-counters'")
+        return _fraud_signals_ready
+
+
+def _after_flush(session, flush_context):
+    """Keep the fraud counters in step with AffiliateClick / Referral writes"""
+    try:
+        clicks, domains = FraudSignalStore.collect_changes(session)
+        if (clicks or domains) and FraudSignalStore.is_ready():
+            connection = session.connection()
+            with connection.begin_nested():
+                FraudSignalStore.apply_changes(connection, clicks, domains)
+    except Exception as e:
+        # Never fail the click or signup because of a counter; a rebuild repairs drift
+        logger.error(f"Fraud counter update failed: {str(e)}")
+
+
+def _track_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+def register_fraud_signals(app):
+    """Attach the flush listener and the rebuild / prune CLI commands (no database access on import)"""
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+
+        # Load the old value on assignment so a changed email can be taken off its old domain
+        for attribute in (Referral.affiliate_id, Referral.referred_email):
+            event.listen(attribute, 'set', _track_previous_value, active_history=True, retval=True)
+
+    @app.cli.command('rebuild-fraud-counters')
+    def rebuild_fraud_counters_command():
+        """Create (if needed) and recompute affiliate click windows and referral domain counts"""
+        buckets, domains = FraudSignalStore.rebuild()
+        print(f"✅ Fraud counters rebuilt: {buckets} click buckets, {domains} referral domains")
+
+    @app.cli.command('prune-fraud-counters')
+    def prune_fraud_counters_command():
+        """Drop click buckets older than the fraud window (schedule hourly or daily)"""
+        count = FraudSignalStore.prune()
+        print(f"✅ Pruned {count} expired click buckets")
+
+    logger.info("✅ Affiliate fraud signal listeners registered")
@@ -0,0 +1,256 @@
+"""
+Index Advisor
+Replays representative query shapes through EXPLAIN (MySQL) or
+EXPLAIN QUERY PLAN (SQLite) and reports full table scans.
+
+Shapes come from two places:
+- QUERY_SHAPES below: the hot filters of the main endpoints
+- an optional recording file written while the app runs with
+  QUERY_SHAPE_LOG=/path/to/shapes.jsonl (one distinct SELECT per line)
+
+Recorded shapes never hold the values a request bound: each parameter is
+stored as a placeholder of its type (0, '', ...), which is enough for
+EXPLAIN to plan the statement.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from datetime import date, datetime
+
+from sqlalchemy import event, text
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Representative SELECTs of the hot endpoints in app.py and routes/
+QUERY_SHAPES = [
+    {
+        'name': 'student task list',
+        'sql': 'SELECT id FROM student_tasks WHERE student_id = :student_id ORDER BY due_date',
+        'params': {'student_id': 1}
+    },
+    {
+        'name': 'student pending tasks',
+        'sql': "SELECT COUNT(*) FROM student_tasks WHERE student_id = :student_id AND status = 'pending'",
+        'params': {'student_id': 1}
+    },
+    {
+        'name': 'student completed scores',
+        'sql': "SELECT score_percentage FROM student_tasks WHERE student_id = :student_id AND status = 'completed'",
+        'params': {'student_id': 1}
+    },
+    {
+        'name': 'student inbox',
+        'sql': ("SELECT id FROM messages WHERE recipient_id = :recipient_id AND recipient_type = 'student' "
+                "AND is_read = 0 ORDER BY created_at DESC"),
+        'params': {'recipient_id': 1}
+    },
+    {
+        'name': 'quiz submissions',
+        'sql': 'SELECT id FROM quiz_submissions WHERE quiz_id = :quiz_id ORDER BY submitted_at DESC',
+        'params': {'quiz_id': 'x'}
+    },
+    {
+        'name': 'social media task progress',
+        'sql': "SELECT COUNT(*) FROM social_media_tasks WHERE student_id = :student_id AND status = 'completed'",
+        'params': {'student_id': 1}
+    },
+    {
+        'name': 'affiliate recent clicks',
+        'sql': 'SELECT ip_address FROM affiliate_clicks WHERE affiliate_id = :affiliate_id AND created_at >= :since',
+        'params': {'affiliate_id': 'x', 'since': '2000-01-01 00:00:00'}
+    },
+    {
+        'name': 'published lesson lookup',
+        'sql': 'SELECT id FROM published_lesson_plans WHERE public_url_slug = :slug AND is_active = 1',
+        'params': {'slug': 'x'}
+    },
+    {
+        'name': 'timeline keyset page',
+        'sql': ('SELECT id FROM student_posts WHERE is_active = 1 AND '
+                '(created_at < :created_at OR (created_at = :created_at AND id < :id)) '
+                'ORDER BY created_at DESC, id DESC LIMIT 21'),
+        'params': {'created_at': '2100-01-01 00:00:00', 'id': 0}
+    },
+    {
+        'name': 'scoreboard page',
+        'sql': ('SELECT student_id FROM student_leaderboard WHERE is_active = 1 '
+                'ORDER BY total_points DESC, average_score DESC, student_id DESC LIMIT 20'),
+        'params': {}
+    },
+]
+
+
+# ----------------------------------------------------------------------
+# Recording
+# ----------------------------------------------------------------------
+
+# Parameter type -> the value recorded in its place
+PLACEHOLDER_VALUES = (
+    (bool, False),
+    (int, 0),
+    (float, 0.0),
+    (datetime, '2000-01-01 00:00:00'),
+    (date, '2000-01-01'),
+)
+
+
+class QueryShapeRecorder:
+    """Appends each distinct SELECT statement (with typed placeholder parameters) to a JSON-lines file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._seen = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        self._seen.add(json.loads(line)['sql'])
+                    except (ValueError, KeyError):
+                        continue
+
+    @staticmethod
+    def _placeholders(value):
+        """`value` with every bound value replaced by a placeholder of its type"""
+        if isinstance(value, (list, tuple)):
+            return [QueryShapeRecorder._placeholders(v) for v in value]
+        if isinstance(value, dict):
+            return {k: QueryShapeRecorder._placeholders(v) for k, v in value.items()}
+        if value is None:
+            return None
+        for kind, placeholder in PLACEHOLDER_VALUES:
+            if isinstance(value, kind):
+                return placeholder
+        return ''
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith('SELECT'):
+            return
+        with self._lock:
+            if statement in self._seen:
+                return
+            self._seen.add(statement)
+            try:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps({
+                        'sql': statement,
+                        'params': self._placeholders(parameters),
+                        'dialect': conn.dialect.name
+                    }) + '\n')
+            except OSError as e:
+                logger.warning(f"Could not record query shape: {e}")
+
+
+def load_recorded_shapes(path, dialect_name):
+    """Read recorded shapes for the current dialect"""
+    shapes = []
+    if not path or not os.path.exists(path):
+        return shapes
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('dialect') != dialect_name:
+                continue
+            params = record.get('params')
+            shapes.append({
+                'name': f'recorded #{number}',
+                'sql': record['sql'],
+                'params': tuple(params) if isinstance(params, list) else (params or {}),
+                'raw': True
+            })
+    return shapes
+
+
+# ----------------------------------------------------------------------
+# EXPLAIN
+# ----------------------------------------------------------------------
+
+def _explain(connection, shape):
+    dialect = connection.dialect.name
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    if shape.get('raw'):
+        return connection.exec_driver_sql(prefix + shape['sql'], shape['params']).fetchall()
+    return connection.execute(text(prefix + shape['sql']), shape['params']).fetchall()
+
+
+def _findings_sqlite(rows):
+    findings = []
+    for row in rows:
+        detail = row[-1]
+        match = re.match(r'SCAN (?:TABLE )?(\w+)', detail)
+        if match and 'INDEX' not in detail:
+            findings.append(f'full table scan on {match.group(1)}')
+        elif 'USE TEMP B-TREE FOR ORDER BY' in detail:
+            findings.append('sort without index (temp b-tree)')
+    return findings
+
+
+def _findings_mysql(rows):
+    findings = []
+    for row in rows:
+        mapping = row._mapping
+        access = mapping.get('type')
+        table = mapping.get('table')
+        if access == 'ALL':
+            findings.append(f"full table scan on {table} (~{mapping.get('rows')} rows)")
+        elif access == 'index':
+            findings.append(f'full index scan on {table}')
+        if 'Using filesort' in (mapping.get('Extra') or ''):
+            findings.append(f'filesort on {table}')
+    return findings
+
+
+def run_advisor(shapes_path=None):
+    """
+    EXPLAIN every known query shape and return a list of
+    {'name', 'sql', 'findings', 'error'} dicts.
+    """
+    results = []
+    with db.engine.connect() as connection:
+        dialect = connection.dialect.name
+        analyse = _findings_sqlite if dialect == 'sqlite' else _findings_mysql
+        shapes = QUERY_SHAPES + load_recorded_shapes(shapes_path, dialect)
+
+        for shape in shapes:
+            result = {'name': shape['name'], 'sql': shape['sql'], 'findings': [], 'error': None}
+            try:
+                result['findings'] = analyse(_explain(connection, shape))
+            except Exception as e:
+                result['error'] = str(e).splitlines()[0]
+                connection.rollback()
+            results.append(result)
+    return results
+
+
+def register_index_advisor(app):
+    """Register the CLI command and, if QUERY_SHAPE_LOG is set, the shape recorder"""
+    shape_log = os.getenv('QUERY_SHAPE_LOG')
+    if shape_log:
+        recorder = QueryShapeRecorder(shape_log)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', recorder.before_cursor_execute)
+        logger.info(f"📝 Recording query shapes to {shape_log}")
+
+    @app.cli.command('index-advisor')
+    def index_advisor_command():
+        """EXPLAIN known and recorded query shapes and report full scans"""
+        results = run_advisor(shape_log)
+        flagged = 0
+        for result in results:
+            if result['error']:
+                print(f"⚠️  {result['name']}: could not explain ({result['error']})")
+            elif result['findings']:
+                flagged += 1
+                print(f"❌ {result['name']}: {'; '.join(result['findings'])}")
+                print(f"     {result['sql'][:200]}")
+            else:
+                print(f"✅ {result['name']}")
+        print(f"\n{flagged} of {len(results)} query shapes need attention")
@@ -0,0 +1,435 @@
+"""
+Job Queue
+Background execution for the slow generation endpoints (quiz, lesson plan
+and video question generation), so a request no longer holds a worker and
+the proxy connection for the tens of seconds the model takes.
+
+A POST to a registered endpoint with ?async=1 (or `Prefer: respond-async`)
+is answered at once with 202 and a job id. The request - path, query
+string, JSON body and Authorization header - is stored in generation_jobs,
+and JOB_WORKERS threads in each process claim queued jobs (highest priority
+class first, then oldest) and replay the request against the app. The
+endpoint therefore runs exactly as it does synchronously, authentication
+included; its status code and JSON body are stored for GET /api/jobs/<id>
+or the job's event stream. The stored header is cleared once the job ends.
+
+The user a token names (when it names one) owns the job: only requests
+with a token for that user can read or cancel it.
+
+Each endpoint has a default priority class; a client can demote its job
+with ?priority=low but not promote it.
+
+Cancelling a queued job means it never starts. A running job cannot be
+interrupted, so cancelling it only discards its result.
+
+A claimed job holds a lease its process renews while it runs. A job whose
+lease lapses (the process died) is claimed again, up to JOB_MAX_ATTEMPTS
+runs in all. Finished jobs are deleted after JOB_RETENTION_HOURS.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+from flask import jsonify, request
+from sqlalchemy import and_, delete, func, or_, select, update
+
+from auth.models import GenerationJob
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_ENABLED = os.getenv('JOB_QUEUE_ENABLED', '1') != '0'
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '5'))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '2'))
+JOB_RETENTION_HOURS = int(os.getenv('JOB_RETENTION_HOURS', '24'))
+JOB_EVENTS_TIMEOUT = float(os.getenv('JOB_EVENTS_TIMEOUT', '300'))
+# Seconds between database checks of a job with an open event stream
+JOB_EVENTS_POLL = 1.0
+# Queued rows read per claim attempt
+JOB_CLAIM_BATCH = 5
+JOB_PRUNE_EVERY = 3600
+
+# Priority class -> sort key (lower runs first)
+JOB_PRIORITY_CLASSES = {
+    'high': 0,
+    'normal': 5,
+    'low': 9,
+}
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (COMPLETED, FAILED, CANCELLED)
+
+# WSGI environ key marking a replayed request, which must run rather than be queued again
+REPLAY_ENVIRON_KEY = 'job_queue.job_id'
+
+# Query parameters that steer queueing and are not replayed
+CONTROL_PARAMS = ('async', 'priority')
+
+_Claim = namedtuple('_Claim', ['id', 'attempts', 'path', 'query_string', 'payload', 'authorization'])
+
+
+def wants_async():
+    """Whether the current request asked to run as a background job"""
+    return (request.args.get('async', '').lower() in ('1', 'true', 'yes')
+            or 'respond-async' in request.headers.get('Prefer', ''))
+
+
+class JobQueue:
+    """generation_jobs-backed queue of replayed requests with a worker pool per process"""
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = max(1, workers)
+        self.app = None
+        self.endpoints = {}
+        self.identify = lambda: None
+        self.worker_id = None
+        self._lock = threading.Lock()
+        self._work = threading.Condition()
+        self._finished = threading.Condition()
+        self._running = {}              # job id -> attempt, for jobs run by this process
+        self._pid = None
+        self.executed = 0
+        self.discarded = 0
+
+    def configure(self, app, endpoints, identify=None):
+        """
+        endpoints maps Flask endpoint -> default priority class. identify()
+        returns the user id the current request's token names, or None; it
+        only decides who owns a job, never whether one may be queued.
+        """
+        self.app = app
+        self.endpoints = dict(endpoints)
+        if identify is not None:
+            self.identify = identify
+
+    # ------------------------------------------------------------------
+    # Submitting, status and cancellation (request context)
+    # ------------------------------------------------------------------
+
+    def submit(self, endpoint, path, query_string, payload, user_id=None, priority='normal', authorization=None):
+        """Queue a request; returns the new job's dict"""
+        job = GenerationJob(
+            user_id=user_id,
+            endpoint=endpoint,
+            path=path,
+            query_string=query_string,
+            payload=json.dumps(payload),
+            authorization=authorization,
+            priority=JOB_PRIORITY_CLASSES.get(priority, JOB_PRIORITY_CLASSES['normal']),
+            status=QUEUED,
+            attempts=0
+        )
+        db.session.add(job)
+        db.session.commit()
+        logger.info(f"Queued {priority} job {job.id} for {endpoint}")
+
+        self._ensure_workers()
+        with self._work:
+            self._work.notify()
+        return job.to_dict(include_result=False)
+
+    def get(self, job_id, user_id=None, include_result=True):
+        """The job's dict, or None if it does not exist or belongs to another user"""
+        job = db.session.get(GenerationJob, job_id, populate_existing=True)
+        if job is None or (job.user_id and job.user_id != user_id):
+            return None
+        return job.to_dict(include_result=include_result)
+
+    def recent(self, user_id, limit=20):
+        """The user's latest jobs, without results"""
+        jobs = GenerationJob.query.filter_by(user_id=user_id).order_by(
+            GenerationJob.created_at.desc()
+        ).limit(limit).all()
+        return [job.to_dict(include_result=False) for job in jobs]
+
+    def cancel(self, job_id, user_id=None):
+        """
+        Cancel a queued or running job. Returns the job's dict afterwards (its
+        status tells whether it was still cancellable), or None if not found.
+        """
+        job = self.get(job_id, user_id, include_result=False)
+        if job is None or job['status'] in FINISHED:
+            return job
+
+        jobs = GenerationJob.__table__
+        db.session.execute(
+            update(jobs)
+            .where(jobs.c.id == job_id, jobs.c.status == job['status'], jobs.c.attempts == job['attempts'])
+            .values(status=CANCELLED, finished_at=datetime.utcnow(), lease_expires_at=None, authorization=None)
+        )
+        db.session.commit()
+        with self._finished:
+            self._finished.notify_all()
+        return self.get(job_id, user_id, include_result=False)
+
+    def events(self, job_id, user_id=None):
+        """
+        ('status', job) each time the job changes state, then ('done', job)
+        with its result once it has finished; for sse_response().
+        """
+        deadline = time.monotonic() + JOB_EVENTS_TIMEOUT
+        last_status = None
+        while True:
+            job = self.get(job_id, user_id, include_result=False)
+            # End the read transaction so the next check sees other processes' commits
+            db.session.rollback()
+            if job is None:
+                yield 'error', {'error': 'Job not found'}
+                return
+            if job['status'] in FINISHED:
+                yield 'done', self.get(job_id, user_id)
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield 'status', job
+            if time.monotonic() >= deadline:
+                # The client reconnects (or polls) for jobs that take longer
+                yield 'timeout', job
+                return
+            with self._finished:
+                self._finished.wait(JOB_EVENTS_POLL)
+
+    def stats(self):
+        """Job counts by status and priority, plus this process's workers"""
+        jobs = GenerationJob.__table__
+        counts = {}
+        for status, priority, count in db.session.execute(
+            select(jobs.c.status, jobs.c.priority, func.count()).group_by(jobs.c.status, jobs.c.priority)
+        ):
+            counts.setdefault(status, {})[priority] = count
+        with self._lock:
+            return {
+                'enabled': JOB_QUEUE_ENABLED,
+                'worker': self.worker_id,
+                'workers': self.workers,
+                'running_here': len(self._running),
+                'executed': self.executed,
+                'discarded': self.discarded,
+                'jobs': counts
+            }
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def _ensure_workers(self):
+        """Start this process's workers and lease keeper (threads do not survive a fork)"""
+        if not JOB_QUEUE_ENABLED or self.app is None:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.worker_id = f"{socket.gethostname()}:{self._pid}"
+            self._running = {}
+            threads = [
+                threading.Thread(target=self._run, name=f'generation-job-{index}', daemon=True)
+                for index in range(self.workers)
+            ]
+            threads.append(threading.Thread(target=self._keep_leases, name='generation-job-leases', daemon=True))
+        for thread in threads:
+            thread.start()
+        logger.info(f"✅ Job queue: {self.workers} workers started in {self.worker_id}")
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    claim = self._claim()
+            except Exception as e:
+                logger.error(f"❌ Job queue claim failed: {e}")
+                claim = None
+
+            if claim is None:
+                with self._work:
+                    self._work.wait(JOB_POLL_INTERVAL)
+                continue
+
+            with self._lock:
+                self._running[claim.id] = claim.attempts
+            try:
+                status_code, body, error = self._execute(claim)
+                self._finish(claim, status_code, body, error)
+            except Exception as e:
+                logger.error(f"❌ Job {claim.id} could not be recorded: {e}")
+            finally:
+                with self._lock:
+                    self._running.pop(claim.id, None)
+                with self._finished:
+                    self._finished.notify_all()
+
+    def _claim(self):
+        """Mark the next runnable job as this process's; None when there is none (app context)"""
+        jobs = GenerationJob.__table__
+        now = datetime.utcnow()
+        runnable = or_(
+            jobs.c.status == QUEUED,
+            and_(jobs.c.status == RUNNING, jobs.c.lease_expires_at < now)
+        )
+        candidates = db.session.execute(
+            select(jobs.c.id, jobs.c.attempts).where(runnable)
+            .order_by(jobs.c.priority, jobs.c.created_at)
+            .limit(JOB_CLAIM_BATCH)
+        ).all()
+
+        for job_id, attempts in candidates:
+            # attempts doubles as a version: only one process can move it on
+            unchanged = and_(jobs.c.id == job_id, jobs.c.attempts == attempts, runnable)
+            if attempts >= JOB_MAX_ATTEMPTS:
+                db.session.execute(update(jobs).where(unchanged).values(
+                    status=FAILED, finished_at=now, lease_expires_at=None, authorization=None,
+                    error='The worker running this job stopped before it finished'
+                ))
+                db.session.commit()
+                logger.error(f"❌ Job {job_id} abandoned after {attempts} lost runs")
+                continue
+
+            claimed = db.session.execute(update(jobs).where(unchanged).values(
+                status=RUNNING, attempts=attempts + 1, worker=self.worker_id, started_at=now,
+                lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS)
+            )).rowcount
+            db.session.commit()
+            if claimed:
+                row = db.session.execute(
+                    select(jobs.c.path, jobs.c.query_string, jobs.c.payload, jobs.c.authorization)
+                    .where(jobs.c.id == job_id)
+                ).one()
+                return _Claim(job_id, attempts + 1, *row)
+        return None
+
+    def _execute(self, claim):
+        """Replay the job's request; returns (status code, body, error)"""
+        headers = {'Content-Type': 'application/json'}
+        if claim.authorization:
+            headers['Authorization'] = claim.authorization
+
+        started = time.monotonic()
+        try:
+            with self.app.test_request_context(
+                claim.path,
+                method='POST',
+                query_string=claim.query_string or '',
+                data=claim.payload,
+                headers=headers,
+                environ_base={REPLAY_ENVIRON_KEY: claim.id}
+            ):
+                response = self.app.full_dispatch_request()
+                status_code, body, error = response.status_code, response.get_data(as_text=True), None
+        except Exception as e:
+            logger.error(f"❌ Job {claim.id} raised: {e}")
+            status_code, body, error = 500, None, str(e)
+
+        logger.info(f"Job {claim.id} ran in {time.monotonic() - started:.1f}s: HTTP {status_code}")
+        return status_code, body, error
+
+    def _finish(self, claim, status_code, body, error):
+        jobs = GenerationJob.__table__
+        with self.app.app_context():
+            recorded = db.session.execute(
+                update(jobs)
+                .where(jobs.c.id == claim.id, jobs.c.status == RUNNING,
+                       jobs.c.worker == self.worker_id, jobs.c.attempts == claim.attempts)
+                .values(
+                    status=COMPLETED if status_code < 400 else FAILED,
+                    result_status=status_code, result=body, error=error,
+                    finished_at=datetime.utcnow(), lease_expires_at=None, authorization=None
+                )
+            ).rowcount
+            db.session.commit()
+
+        with self._lock:
+            self.executed += 1
+            if not recorded:
+                self.discarded += 1
+        if not recorded:
+            logger.info(f"Job {claim.id} was cancelled or reclaimed while running; result discarded")
+
+    def _keep_leases(self):
+        """Renew the leases of the jobs running here; prune old finished jobs now and then"""
+        jobs = GenerationJob.__table__
+        last_prune = 0.0
+        while True:
+            time.sleep(JOB_LEASE_SECONDS / 3)
+            with self._lock:
+                running = list(self._running)
+            try:
+                with self.app.app_context():
+                    now = datetime.utcnow()
+                    if running:
+                        db.session.execute(
+                            update(jobs)
+                            .where(jobs.c.id.in_(running), jobs.c.status == RUNNING,
+                                   jobs.c.worker == self.worker_id)
+                            .values(lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS))
+                        )
+                    if time.monotonic() - last_prune >= JOB_PRUNE_EVERY:
+                        last_prune = time.monotonic()
+                        db.session.execute(delete(jobs).where(
+                            jobs.c.status.in_(FINISHED),
+                            jobs.c.finished_at < now - timedelta(hours=JOB_RETENTION_HOURS)
+                        ))
+                    db.session.commit()
+            except Exception as e:
+                logger.warning(f"⚠️ Job lease renewal failed: {e}")
+
+
+job_queue = JobQueue()
+
+
+def register_job_queue(app, endpoints, identify=None):
+    """
+    Serve `endpoints` (Flask endpoint -> default priority class) as
+    background jobs when a request asks for it, and start this process's
+    workers with its first request.
+    """
+    job_queue.configure(app, endpoints, identify)
+    if not JOB_QUEUE_ENABLED:
+        logger.info("Job queue disabled (JOB_QUEUE_ENABLED=0)")
+        return
+
+    @app.before_request
+    def _queue_generation_job():
+        job_queue._ensure_workers()
+        if (request.method != 'POST' or request.endpoint not in job_queue.endpoints
+                or REPLAY_ENVIRON_KEY in request.environ or not wants_async()):
+            return None
+
+        payload = request.get_json(silent=True)
+        if payload is None:
+            return jsonify({'error': 'Background jobs need a JSON request body'}), 400
+
+        # Clients may lower their job's priority class, never raise it
+        priority = job_queue.endpoints[request.endpoint]
+        requested = request.args.get('priority')
+        if requested in JOB_PRIORITY_CLASSES and JOB_PRIORITY_CLASSES[requested] > JOB_PRIORITY_CLASSES[priority]:
+            priority = requested
+
+        query_string = urlencode([
+            (key, value) for key, value in request.args.items(multi=True) if key not in CONTROL_PARAMS
+        ])
+        # The endpoint checks the credentials itself when the job is replayed
+        job = job_queue.submit(
+            request.endpoint, request.path, query_string, payload, job_queue.identify(), priority,
+            authorization=request.headers.get('Authorization')
+        )
+        job_id = job['job_id']
+        return jsonify(dict(
+            job,
+            status_url=f"/api/jobs/{job_id}",
+            events_url=f"/api/jobs/{job_id}/events"
+        )), 202, {'Location': f"/api/jobs/{job_id}"}
+
+    logger.info(f"✅ Job queue registered for {len(job_queue.endpoints)} endpoints")
@@ -0,0 +1,85 @@
+"""
+Keyset Pagination
+Cursor-based paging on (created_at, id) for feeds that only ever move
+forward (timeline, inboxes, conversation threads). Unlike .paginate()
+there is no COUNT(*) and no OFFSET, so deep pages cost the same as the first.
+
+Cursors are opaque to clients; the raw "<created_at>,<id>" form is accepted too.
+"""
+
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+MAX_PER_PAGE = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised when a before/after cursor cannot be decoded"""
+
+
+def encode_cursor(created_at, row_id):
+    raw = f"{created_at.isoformat()},{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """Return (created_at, id) from an opaque or raw "<created_at>,<id>" cursor"""
+    raw = value
+    if ',' not in value:
+        try:
+            raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        except (ValueError, UnicodeDecodeError):
+            raise InvalidCursor(f"Invalid cursor: {value}")
+    try:
+        created_at, row_id = raw.rsplit(',', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise InvalidCursor(f"Invalid cursor: {value}")
+
+
+def cursor_param(args, name):
+    """
+    The keyset cursor from the query string. Returns None when the client
+    asked for offset paging, '' for the first keyset page (e.g. ?before=).
+    """
+    if name not in args:
+        return None
+    return args.get(name, '').strip()
+
+
+def keyset_page(query, created_column, id_column, cursor, per_page, descending=True):
+    """
+    Fetch one page ordered by (created_column, id_column).
+    Descending feeds continue *before* the cursor, ascending ones *after* it.
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(or_(
+                created_column < created_at,
+                and_(created_column == created_at, id_column < row_id)
+            ))
+        else:
+            query = query.filter(or_(
+                created_column > created_at,
+                and_(created_column == created_at, id_column > row_id)
+            ))
+
+    if descending:
+        query = query.order_by(None).order_by(created_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(None).order_by(created_column.asc(), id_column.asc())
+
+    # One extra row tells us whether another page exists
+    rows = query.limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+    return items, next_cursor
@@ -0,0 +1,511 @@
+"""
+Student Leaderboard Service
+Maintains the materialized student_leaderboard table and serves scoreboard reads
+
+'flask rebuild-leaderboard' creates and fills the table (once per deploy that
+needs it, or to repair drift); importing the app only attaches the listeners.
+Until the table exists, reads group the same figures from student_tasks.
+
+Every path scores a task by its typed score_percentage column, which
+'flask migrate-schema' backfills and StudentTask keeps in step with task_data.
+"""
+
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import and_, case, event, func, inspect, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from auth.models import Student, StudentLeaderboard, StudentTask
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+REBUILD_CHUNK_SIZE = 1000
+
+# Seconds before a process that found no student_leaderboard table looks again
+READY_RECHECK_SECONDS = 60
+
+# Set once the table is known to exist; the flush listener is a no-op until then
+_leaderboard_ready = False
+_ready_checked_at = None
+
+
+def _task_contribution(status, score_percentage):
+    """Return (total, completed, scored, score_sum) contributed by one task"""
+    if status != 'completed':
+        return (1, 0, 0, 0.0)
+    if score_percentage is None:
+        return (1, 1, 0, 0.0)
+    return (1, 1, 1, float(score_percentage))
+
+
+def _previous_value(state, key):
+    """Value of an attribute as it was before the pending flush"""
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return state.attrs[key].value
+
+
+class LeaderboardService:
+    """Incremental maintenance and reads for the student scoreboard"""
+
+    # ------------------------------------------------------------------
+    # Incremental maintenance
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def collect_changes(session):
+        """
+        Work out per-student leaderboard deltas from the pending flush.
+        Returns (task_deltas, student_updates).
+        """
+        task_deltas = defaultdict(lambda: [0, 0, 0, 0.0])
+        student_updates = {}
+
+        def apply(student_id, contribution, sign):
+            if student_id is None:
+                return
+            delta = task_deltas[student_id]
+            for i, value in enumerate(contribution):
+                delta[i] += sign * value
+
+        for obj in session.new:
+            if isinstance(obj, StudentTask):
+                apply(obj.student_id, _task_contribution(obj.status, obj.score_percentage), 1)
+            elif isinstance(obj, Student):
+                student_updates[obj.id] = {
+                    'total_points': obj.total_points or 0,
+                    'is_active': obj.is_active if obj.is_active is not None else True
+                }
+
+        for obj in session.dirty:
+            if isinstance(obj, StudentTask):
+                state = inspect(obj)
+                if not any(state.attrs[key].history.has_changes()
+                           for key in ('student_id', 'status', 'score_percentage')):
+                    continue
+                apply(
+                    _previous_value(state, 'student_id'),
+                    _task_contribution(_previous_value(state, 'status'), _previous_value(state, 'score_percentage')),
+                    -1
+                )
+                apply(obj.student_id, _task_contribution(obj.status, obj.score_percentage), 1)
+            elif isinstance(obj, Student):
+                state = inspect(obj)
+                if any(state.attrs[key].history.has_changes() for key in ('total_points', 'is_active')):
+                    student_updates[obj.id] = {
+                        'total_points': obj.total_points or 0,
+                        'is_active': bool(obj.is_active)
+                    }
+
+        for obj in session.deleted:
+            if isinstance(obj, StudentTask):
+                state = inspect(obj)
+                apply(
+                    _previous_value(state, 'student_id'),
+                    _task_contribution(_previous_value(state, 'status'), _previous_value(state, 'score_percentage')),
+                    -1
+                )
+
+        task_deltas = {
+            sid: delta for sid, delta in task_deltas.items()
+            if any(delta)
+        }
+        return task_deltas, student_updates
+
+    @staticmethod
+    def apply_changes(connection, task_deltas, student_updates):
+        """Apply deltas with atomic column arithmetic, creating missing rows on demand"""
+        table = StudentLeaderboard.__table__
+        now = datetime.utcnow()
+
+        for student_id, (d_total, d_completed, d_scored, d_sum) in task_deltas.items():
+            # average_score is listed first: MySQL evaluates SET left to right
+            result = connection.execute(
+                update(table)
+                .where(table.c.student_id == student_id)
+                .ordered_values(
+                    (table.c.average_score, func.coalesce(func.round(
+                        (table.c.score_sum + d_sum) / func.nullif(table.c.scored_tasks + d_scored, 0), 1
+                    ), 0)),
+                    (table.c.total_tasks, table.c.total_tasks + d_total),
+                    (table.c.completed_tasks, table.c.completed_tasks + d_completed),
+                    (table.c.scored_tasks, table.c.scored_tasks + d_scored),
+                    (table.c.score_sum, table.c.score_sum + d_sum),
+                    (table.c.updated_at, now),
+                )
+            )
+            if result.rowcount == 0:
+                LeaderboardService._insert_from_source(connection, student_id)
+
+        for student_id, values in student_updates.items():
+            result = connection.execute(
+                update(table)
+                .where(table.c.student_id == student_id)
+                .values(updated_at=now, **values)
+            )
+            if result.rowcount == 0:
+                LeaderboardService._insert_from_source(connection, student_id)
+
+    @staticmethod
+    def record_new_tasks(connection, task_counts):
+        """
+        Count pending tasks created with multi-row INSERTs (which never reach the
+        flush listener): {student_id: number of new tasks}. One UPDATE per distinct
+        count instead of one per student.
+        """
+        if not task_counts or not LeaderboardService.is_ready():
+            return
+        table = StudentLeaderboard.__table__
+        by_count = defaultdict(list)
+        for student_id, count in task_counts.items():
+            if count:
+                by_count[count].append(student_id)
+
+        try:
+            with connection.begin_nested():
+                now = datetime.utcnow()
+                for count, student_ids in by_count.items():
+                    result = connection.execute(
+                        update(table)
+                        .where(table.c.student_id.in_(student_ids))
+                        .values(total_tasks=table.c.total_tasks + count, updated_at=now)
+                    )
+                    if result.rowcount < len(student_ids):
+                        present = set(connection.execute(
+                            select(table.c.student_id).where(table.c.student_id.in_(student_ids))
+                        ).scalars())
+                        for student_id in student_ids:
+                            if student_id not in present:
+                                LeaderboardService._insert_from_source(connection, student_id)
+        except Exception as e:
+            # Same policy as the flush listener: a rebuild repairs drift
+            logger.error(f"Leaderboard bulk update failed: {str(e)}")
+
+    @staticmethod
+    def record_points(connection, point_deltas):
+        """
+        Mirror total_points changes made with a set-based UPDATE on students
+        (the A-Card ledger): {student_id: points added}.
+        """
+        if not point_deltas or not LeaderboardService.is_ready():
+            return
+        table = StudentLeaderboard.__table__
+        by_delta = defaultdict(list)
+        for student_id, delta in point_deltas.items():
+            if delta:
+                by_delta[delta].append(student_id)
+
+        try:
+            with connection.begin_nested():
+                now = datetime.utcnow()
+                for delta, student_ids in by_delta.items():
+                    connection.execute(
+                        update(table)
+                        .where(table.c.student_id.in_(student_ids))
+                        .values(total_points=table.c.total_points + delta, updated_at=now)
+                    )
+        except Exception as e:
+            logger.error(f"Leaderboard points update failed: {str(e)}")
+
+    @staticmethod
+    def _insert_from_source(connection, student_id):
+        """
+        Build a missing leaderboard row from the student's tasks.
+        Runs after the ORM flush, so the source tables already reflect the change.
+        """
+        row = LeaderboardService._aggregate_student(connection, student_id)
+        if row is None:
+            return
+        try:
+            with connection.begin_nested():
+                connection.execute(StudentLeaderboard.__table__.insert().values(**row))
+        except IntegrityError:
+            # Another request created the row concurrently; its totals already include ours
+            logger.debug(f"Leaderboard row for student {student_id} created concurrently")
+
+    @staticmethod
+    def _aggregate_student(connection, student_id):
+        students = Student.__table__
+        tasks = StudentTask.__table__
+
+        student = connection.execute(
+            select(students.c.total_points, students.c.is_active)
+            .where(students.c.id == student_id)
+        ).first()
+        if student is None:
+            return None
+
+        row = LeaderboardService._empty_row(student_id, student.total_points, student.is_active)
+        task_rows = connection.execute(
+            select(tasks.c.status, tasks.c.score_percentage).where(tasks.c.student_id == student_id)
+        )
+        for status, score_percentage in task_rows:
+            LeaderboardService._accumulate(row, _task_contribution(status, score_percentage))
+        return LeaderboardService._finalize(row)
+
+    @staticmethod
+    def _empty_row(student_id, total_points, is_active):
+        return {
+            'student_id': student_id,
+            'is_active': bool(is_active) if is_active is not None else True,
+            'total_points': total_points or 0,
+            'total_tasks': 0,
+            'completed_tasks': 0,
+            'scored_tasks': 0,
+            'score_sum': 0.0,
+            'average_score': 0.0,
+            'updated_at': datetime.utcnow()
+        }
+
+    @staticmethod
+    def _accumulate(row, contribution):
+        total, completed, scored, score_sum = contribution
+        row['total_tasks'] += total
+        row['completed_tasks'] += completed
+        row['scored_tasks'] += scored
+        row['score_sum'] += score_sum
+
+    @staticmethod
+    def _finalize(row):
+        row['average_score'] = round(row['score_sum'] / row['scored_tasks'], 1) if row['scored_tasks'] > 0 else 0.0
+        return row
+
+    # ------------------------------------------------------------------
+    # Full rebuild
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def rebuild(chunk_size=REBUILD_CHUNK_SIZE):
+        """
+        Recompute the whole leaderboard from students and student_tasks,
+        creating the table if needed. Used for the initial backfill and to
+        repair drift after raw SQL edits.
+        """
+        StudentLeaderboard.__table__.create(bind=db.engine, checkfirst=True)
+        tasks = StudentTask.__table__
+
+        rows = {}
+        for student_id, total_points, is_active in db.session.query(
+            Student.id, Student.total_points, Student.is_active
+        ).yield_per(chunk_size):
+            rows[student_id] = LeaderboardService._empty_row(student_id, total_points, is_active)
+
+        for student_id, status, score_percentage in db.session.execute(
+            select(tasks.c.student_id, tasks.c.status, tasks.c.score_percentage).execution_options(yield_per=chunk_size)
+        ):
+            row = rows.get(student_id)
+            if row is not None:
+                LeaderboardService._accumulate(row, _task_contribution(status, score_percentage))
+
+        try:
+            db.session.execute(StudentLeaderboard.__table__.delete())
+            batch = []
+            for row in rows.values():
+                batch.append(LeaderboardService._finalize(row))
+                if len(batch) >= chunk_size:
+                    db.session.execute(StudentLeaderboard.__table__.insert(), batch)
+                    batch = []
+            if batch:
+                db.session.execute(StudentLeaderboard.__table__.insert(), batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        global _leaderboard_ready
+        _leaderboard_ready = True
+        logger.info(f"Leaderboard rebuilt for {len(rows)} students")
+        return len(rows)
+
+    @staticmethod
+    def is_ready():
+        """
+        Whether student_leaderboard exists. Read-only: 'flask rebuild-leaderboard'
+        creates it. A missing table is looked for again after READY_RECHECK_SECONDS.
+        """
+        global _leaderboard_ready, _ready_checked_at
+        if _leaderboard_ready:
+            return True
+        if _ready_checked_at is not None and time.monotonic() - _ready_checked_at < READY_RECHECK_SECONDS:
+            return False
+        _ready_checked_at = time.monotonic()
+        try:
+            _leaderboard_ready = inspect(db.engine).has_table(StudentLeaderboard.__tablename__)
+        except Exception as e:
+            logger.error(f"Leaderboard table check failed: {str(e)}")
+        if not _leaderboard_ready:
+            logger.warning("⚠️ student_leaderboard not found - scoreboard reads group student_tasks "
+                           "until 'flask rebuild-leaderboard' is run")
+        return _leaderboard_ready
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _board():
+        """student_leaderboard, or its columns grouped from students and student_tasks until it exists"""
+        if LeaderboardService.is_ready():
+            return StudentLeaderboard.__table__
+
+        students = Student.__table__
+        tasks = StudentTask.__table__
+        completed = tasks.c.status == 'completed'
+        scored = and_(completed, tasks.c.score_percentage.isnot(None))
+
+        def count_where(condition):
+            return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+        scored_tasks = count_where(scored)
+        score_sum = func.coalesce(func.sum(case((scored, tasks.c.score_percentage), else_=None)), 0.0)
+        return select(
+            students.c.id.label('student_id'),
+            func.coalesce(students.c.is_active, True).label('is_active'),
+            func.coalesce(students.c.total_points, 0).label('total_points'),
+            func.count(tasks.c.id).label('total_tasks'),
+            count_where(completed).label('completed_tasks'),
+            scored_tasks.label('scored_tasks'),
+            score_sum.label('score_sum'),
+            func.coalesce(func.round(score_sum / func.nullif(scored_tasks, 0), 1), 0.0).label('average_score')
+        ).select_from(
+            students.outerjoin(tasks, tasks.c.student_id == students.c.id)
+        ).group_by(students.c.id, students.c.is_active, students.c.total_points).subquery('board')
+
+    @staticmethod
+    def _ranking_order(board):
+        return (
+            board.c.total_points.desc(),
+            board.c.average_score.desc(),
+            board.c.student_id.desc()
+        )
+
+    @staticmethod
+    def get_page(page=1, per_page=None):
+        """
+        Return (entries, total_students) for one page of the ranked scoreboard.
+        per_page=None returns the whole board in a single ordered read.
+        """
+        board = LeaderboardService._board()
+        query = db.session.query(
+            board.c.student_id,
+            board.c.total_points,
+            board.c.completed_tasks,
+            board.c.total_tasks,
+            board.c.average_score,
+            Student.name,
+            Student.email,
+            Student.grade_level,
+            Student.school_name,
+            Student.current_level,
+            Student.acard_balance
+        ).join(
+            Student, Student.id == board.c.student_id
+        ).filter(
+            board.c.is_active.is_(True)
+        ).order_by(*LeaderboardService._ranking_order(board))
+
+        offset = 0
+        if per_page:
+            offset = (page - 1) * per_page
+            query = query.offset(offset).limit(per_page)
+
+        entries = []
+        for rank, entry in enumerate(query.all(), offset + 1):
+            completed_tasks, total_tasks = int(entry.completed_tasks), int(entry.total_tasks)
+            entries.append({
+                'id': entry.student_id,
+                'name': entry.name,
+                'email': entry.email,
+                'grade_level': entry.grade_level,
+                'school_name': entry.school_name,
+                'total_points': entry.total_points or 0,
+                'current_level': entry.current_level or 1,
+                'acard_balance': float(entry.acard_balance or 0),
+                'tasks_completed': completed_tasks,
+                'total_tasks': total_tasks,
+                'average_score': float(entry.average_score or 0),
+                'overall_progress': round((completed_tasks / total_tasks * 100), 1) if total_tasks > 0 else 0,
+                'rank': rank
+            })
+
+        if board is StudentLeaderboard.__table__:
+            total_students = db.session.query(func.count(board.c.student_id)).filter(
+                board.c.is_active.is_(True)
+            ).scalar() or 0
+        else:
+            total_students = db.session.query(func.count(Student.id)).filter(
+                func.coalesce(Student.is_active, True).is_(True)
+            ).scalar() or 0
+
+        return entries, total_students
+
+    @staticmethod
+    def get_rank(student_id):
+        """Return the 1-based rank of a student, or None if they are not on the board"""
+        board = LeaderboardService._board()
+        entry = db.session.query(board.c.student_id, board.c.total_points, board.c.average_score).filter(
+            board.c.student_id == student_id,
+            board.c.is_active.is_(True)
+        ).first()
+        if not entry:
+            return None
+
+        ahead = db.session.query(func.count(board.c.student_id)).filter(
+            board.c.is_active.is_(True),
+            or_(
+                board.c.total_points > entry.total_points,
+                and_(
+                    board.c.total_points == entry.total_points,
+                    board.c.average_score > entry.average_score
+                ),
+                and_(
+                    board.c.total_points == entry.total_points,
+                    board.c.average_score == entry.average_score,
+                    board.c.student_id > entry.student_id
+                )
+            )
+        ).scalar() or 0
+
+        return ahead + 1
+
+
+def _after_flush(session, flush_context):
+    """Keep student_leaderboard in step with StudentTask / Student writes"""
+    try:
+        task_deltas, student_updates = LeaderboardService.collect_changes(session)
+        if (task_deltas or student_updates) and LeaderboardService.is_ready():
+            connection = session.connection()
+            with connection.begin_nested():
+                LeaderboardService.apply_changes(connection, task_deltas, student_updates)
+    except Exception as e:
+        # Never fail the user's write because of the scoreboard; a rebuild repairs drift
+        logger.error(f"Leaderboard update failed: {str(e)}")
+
+
+def _track_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+def register_leaderboard(app):
+    """Attach the flush listener and the rebuild CLI command (no database access on import)"""
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+
+        # Load the old value on assignment so deltas can subtract it even for expired rows
+        for attribute in (StudentTask.student_id, StudentTask.status, StudentTask.score_percentage):
+            event.listen(attribute, 'set', _track_previous_value, active_history=True, retval=True)
+
+    @app.cli.command('rebuild-leaderboard')
+    def rebuild_leaderboard_command():
+        """Create (if needed) and recompute the materialized student leaderboard"""
+        count = LeaderboardService.rebuild()
+        print(f"✅ Leaderboard rebuilt for {count} students")
+
+    logger.info("✅ Student leaderboard listeners registered")
@@ -0,0 +1,356 @@
+"""
+LLM Response Cache
+Content-addressed cache of model responses for endpoints that keep sending
+the same prompt (explanations for common wrong answers, topic generators,
+event FAQ chat).
+
+A response is keyed on provider, model, temperature, max_tokens and a hash
+of the prompt with whitespace normalized. Lookups try an in-process LRU
+first, then a SQLite file on local disk that all workers on the host share
+and that survives restarts.
+
+Caching is opt-in per endpoint: only endpoints listed in LLM_CACHE_POLICIES
+are cached, each for its own TTL. Generative endpoints get short TTLs so
+students see fresh content once a cached response expires. Truncated
+responses (stop_reason max_tokens), responses the caller's validate()
+rejects and the AI gateway's fake-backend answers are never stored.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', '1') != '0'
+LLM_CACHE_MEMORY_SIZE = int(os.getenv('LLM_CACHE_MEMORY_SIZE', '1000'))
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'llm_response_cache.sqlite3'))
+LLM_CACHE_DISK_MAX_ROWS = int(os.getenv('LLM_CACHE_DISK_MAX_ROWS', '50000'))
+# Expired / surplus disk rows are pruned every this many stores
+LLM_CACHE_PRUNE_EVERY = 200
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# endpoint -> seconds a cached response is served; unlisted endpoints are never cached
+LLM_CACHE_POLICIES = {
+    'generate_explanations': 7 * DAY,
+    'generate_geometry_explanations': 7 * DAY,
+    'xwhy_generate_questions': 6 * HOUR,
+    'learn_earn': DAY,
+    'learn_earn_enhanced': DAY,
+    'quizmas_chat': DAY,
+}
+
+# messages.create arguments that are part of the key; calls using any other
+# argument (tools, stream, ...) bypass the cache
+KEYED_ARGUMENTS = {'model', 'max_tokens', 'temperature', 'system', 'messages'}
+
+CachedResponse = namedtuple('CachedResponse', ['text', 'tokens', 'expires_at'])
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _normalize(value):
+    """Prompt structure with every string's whitespace runs collapsed"""
+    if isinstance(value, str):
+        return _WHITESPACE.sub(' ', value).strip()
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def cache_key(provider, model, temperature, max_tokens, prompt):
+    """sha256 over the model settings and the normalized prompt (a string or messages structure)"""
+    material = json.dumps(
+        [provider, model, temperature, max_tokens, _normalize(prompt)],
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def has_json_object(text):
+    """validate() for endpoints that parse a JSON object out of the response"""
+    start, end = text.find('{'), text.rfind('}') + 1
+    if start < 0 or end <= start:
+        return False
+    try:
+        json.loads(text[start:end])
+        return True
+    except ValueError:
+        return False
+
+
+class LLMResponseCache:
+    """Two-tier (memory LRU + SQLite) response cache with per-endpoint counters"""
+
+    def __init__(self, path=LLM_CACHE_PATH, memory_size=LLM_CACHE_MEMORY_SIZE, disk_max_rows=LLM_CACHE_DISK_MAX_ROWS):
+        self.path = path
+        self.memory_size = memory_size
+        self.disk_max_rows = disk_max_rows
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._disk_enabled = bool(path)
+        self._stores = 0
+        self._stats = defaultdict(Counter)
+
+    # ------------------------------------------------------------------
+    # Lookups and stores
+    # ------------------------------------------------------------------
+
+    def lookup(self, endpoint, key):
+        """The live CachedResponse for `key`, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._memory.move_to_end(key)
+                self._count(endpoint, 'memory_hits', entry.tokens)
+                return entry
+            if entry is not None:
+                del self._memory[key]
+
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self._stats[endpoint]['misses'] += 1
+                return None
+            self._remember(key, entry)
+            self._count(endpoint, 'disk_hits', entry.tokens)
+        return entry
+
+    def store(self, endpoint, key, text, tokens, ttl):
+        entry = CachedResponse(text, tokens or 0, time.time() + ttl)
+        with self._lock:
+            self._remember(key, entry)
+            self._stats[endpoint]['stored'] += 1
+            self._stores += 1
+            prune = self._stores % LLM_CACHE_PRUNE_EVERY == 0
+        self._disk_put(endpoint, key, entry)
+        if prune:
+            self.prune()
+
+    def count(self, endpoint, counter):
+        with self._lock:
+            self._stats[endpoint][counter] += 1
+
+    def stats(self):
+        """Per-endpoint counters with hit rates, plus tier sizes"""
+        with self._lock:
+            endpoints = {}
+            for endpoint, counters in self._stats.items():
+                hits = counters['memory_hits'] + counters['disk_hits']
+                lookups = hits + counters['misses']
+                endpoints[endpoint] = dict(counters, hit_rate=round(hits / lookups, 3) if lookups else None)
+            return {
+                'enabled': LLM_CACHE_ENABLED,
+                'memory_entries': len(self._memory),
+                'disk': self.path if self._disk_enabled else None,
+                'endpoints': endpoints
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        connection = self._connection()
+        if connection is not None:
+            with connection:
+                connection.execute('DELETE FROM llm_responses')
+
+    def prune(self):
+        """Drop expired disk rows and the oldest beyond disk_max_rows"""
+        connection = self._connection()
+        if connection is None:
+            return
+        try:
+            with connection:
+                connection.execute('DELETE FROM llm_responses WHERE expires_at <= ?', (time.time(),))
+                connection.execute(
+                    'DELETE FROM llm_responses WHERE key IN ('
+                    ' SELECT key FROM llm_responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                    (self.disk_max_rows,)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ LLM cache prune failed: {e}")
+
+    # Callers hold self._lock
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _count(self, endpoint, counter, tokens):
+        self._stats[endpoint][counter] += 1
+        self._stats[endpoint]['tokens_saved'] += tokens
+
+    # ------------------------------------------------------------------
+    # Disk tier
+    # ------------------------------------------------------------------
+
+    def _connection(self):
+        """This thread's SQLite connection (reopened after a fork), or None if the disk tier is off"""
+        if not self._disk_enabled:
+            return None
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        try:
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            with connection:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS llm_responses ('
+                    ' key TEXT PRIMARY KEY, endpoint TEXT, response TEXT, tokens INTEGER,'
+                    ' created_at REAL, expires_at REAL)'
+                )
+                connection.execute('CREATE INDEX IF NOT EXISTS ix_llm_responses_expires ON llm_responses (expires_at)')
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ LLM cache disk tier disabled ({self.path}): {e}")
+            self._disk_enabled = False
+            return None
+        self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def _disk_get(self, key, now):
+        connection = self._connection()
+        if connection is None:
+            return None
+        try:
+            row = connection.execute(
+                'SELECT response, tokens, expires_at FROM llm_responses WHERE key = ? AND expires_at > ?',
+                (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ LLM cache read failed: {e}")
+            return None
+        return CachedResponse(*row) if row else None
+
+    def _disk_put(self, endpoint, key, entry):
+        connection = self._connection()
+        if connection is None:
+            return
+        try:
+            with connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO llm_responses (key, endpoint, response, tokens, created_at, expires_at)'
+                    ' VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, endpoint, entry.text, entry.tokens, time.time(), entry.expires_at)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ LLM cache write failed: {e}")
+
+
+llm_cache = LLMResponseCache()
+
+
+# ----------------------------------------------------------------------
+# Call-site helpers
+# ----------------------------------------------------------------------
+
+def _policy(endpoint):
+    return LLM_CACHE_POLICIES.get(endpoint) if LLM_CACHE_ENABLED else None
+
+
+def cached_message(client, endpoint, validate=None, **kwargs):
+    """
+    client.messages.create(**kwargs) through the cache. A cache hit returns
+    a stand-in with the same .content[0].text shape (and .cached = True).
+    validate(text) -> bool decides whether a fresh response may be stored.
+    """
+    ttl = _policy(endpoint)
+    if ttl is None or set(kwargs) - KEYED_ARGUMENTS:
+        llm_cache.count(endpoint, 'bypassed')
+        return client.messages.create(**kwargs)
+
+    key = cache_key(
+        'anthropic', kwargs.get('model'), kwargs.get('temperature'), kwargs.get('max_tokens'),
+        {'system': kwargs.get('system'), 'messages': kwargs.get('messages')}
+    )
+    entry = llm_cache.lookup(endpoint, key)
+    if entry is not None:
+        return SimpleNamespace(
+            content=[SimpleNamespace(type='text', text=entry.text)],
+            model=kwargs.get('model'),
+            stop_reason='end_turn',
+            usage=None,
+            cached=True
+        )
+
+    response = client.messages.create(**kwargs)
+    text = ''.join(getattr(block, 'text', '') for block in response.content)
+    if (getattr(response, 'stop_reason', None) == 'max_tokens' or getattr(response, 'fake', False)
+            or (validate is not None and not validate(text))):
+        llm_cache.count(endpoint, 'rejected')
+        return response
+
+    usage = getattr(response, 'usage', None)
+    tokens = (getattr(usage, 'input_tokens', 0) or 0) + (getattr(usage, 'output_tokens', 0) or 0)
+    llm_cache.store(endpoint, key, text, tokens, ttl)
+    return response
+
+
+def cached_text(endpoint, provider, model, temperature, max_tokens, prompt, produce, validate=None):
+    """
+    Text from produce() through the cache, for providers other than Anthropic.
+    `prompt` is whatever fully determines the request besides the settings.
+    """
+    ttl = _policy(endpoint)
+    if ttl is None:
+        llm_cache.count(endpoint, 'bypassed')
+        return produce()
+
+    key = cache_key(provider, model, temperature, max_tokens, prompt)
+    entry = llm_cache.lookup(endpoint, key)
+    if entry is not None:
+        return entry.text
+
+    text = produce()
+    if not text or (validate is not None and not validate(text)):
+        llm_cache.count(endpoint, 'rejected')
+        return text
+    llm_cache.store(endpoint, key, text, 0, ttl)
+    return text
+
+
+def cached_text_stream(endpoint, provider, model, temperature, max_tokens, prompt, produce_chunks, validate=None):
+    """
+    cached_text() for a streamed reply: yields the chunks of produce_chunks()
+    and stores the whole reply once the stream has run to the end. A cache
+    hit is yielded as one chunk. Shares keys with cached_text(), so either
+    variant of an endpoint can answer from the other's responses.
+    """
+    ttl = _policy(endpoint)
+    if ttl is None:
+        llm_cache.count(endpoint, 'bypassed')
+        yield from produce_chunks()
+        return
+
+    key = cache_key(provider, model, temperature, max_tokens, prompt)
+    entry = llm_cache.lookup(endpoint, key)
+    if entry is not None:
+        yield entry.text
+        return
+
+    chunks = []
+    for chunk in produce_chunks():
+        chunks.append(chunk)
+        yield chunk
+    text = ''.join(chunks)
+    if not text or (validate is not None and not validate(text)):
+        llm_cache.count(endpoint, 'rejected')
+        return
+    llm_cache.store(endpoint, key, text, 0, ttl)
@@ -0,0 +1,146 @@
+"""
+Pool Liveness
+One configurable liveness check for the SQLAlchemy engine pool, replacing
+pool_pre_ping plus the per-checkout SELECT 1 listeners, and the counters
+needed to size pool_size / max_overflow per gunicorn worker.
+
+DB_LIVENESS_MODE:
+    idle   - ping only connections idle longer than DB_PING_IDLE_SECONDS (default)
+    always - ping on every checkout (what pool_pre_ping did)
+    off    - never ping; rely on pool_recycle alone
+"""
+
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+LIVENESS_MODE = os.getenv('DB_LIVENESS_MODE', 'idle').lower()
+PING_IDLE_SECONDS = float(os.getenv('DB_PING_IDLE_SECONDS', '30'))
+
+_RETURNED_AT = 'liveness_returned_at'
+
+
+class PoolTelemetry:
+    """Process-wide pool counters (each gunicorn worker reports its own)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {
+                'checkouts': 0,
+                'connects': 0,
+                'pings': 0,
+                'ping_failures': 0,
+                'invalidations': 0,
+                'overflow_checkouts': 0,
+                'overflow_peak': 0,
+                'wait_seconds_total': 0.0,
+                'wait_seconds_max': 0.0,
+            }
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def record_wait(self, seconds, overflow):
+        with self._lock:
+            self.counters['wait_seconds_total'] += seconds
+            self.counters['wait_seconds_max'] = max(self.counters['wait_seconds_max'], seconds)
+            if overflow > 0:
+                self.counters['overflow_checkouts'] += 1
+                self.counters['overflow_peak'] = max(self.counters['overflow_peak'], overflow)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+telemetry = PoolTelemetry()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited and whether it used overflow"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        record = super()._do_get()
+        telemetry.record_wait(time.perf_counter() - started, self.overflow())
+        return record
+
+
+def install_liveness(engine, mode=LIVENESS_MODE, idle_seconds=PING_IDLE_SECONDS):
+    """Attach the liveness check and telemetry listeners to this engine's pool"""
+    pool = engine.pool
+    dialect = engine.dialect
+
+    @event.listens_for(pool, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        telemetry.incr('connects')
+        # A brand-new connection needs no ping on its first checkout
+        connection_record.info[_RETURNED_AT] = time.monotonic()
+
+    @event.listens_for(pool, 'checkin')
+    def _on_checkin(dbapi_connection, connection_record):
+        connection_record.info[_RETURNED_AT] = time.monotonic()
+
+    @event.listens_for(pool, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        telemetry.incr('checkouts')
+        if mode == 'off':
+            return
+        if mode == 'idle':
+            returned_at = connection_record.info.get(_RETURNED_AT)
+            if returned_at is not None and time.monotonic() - returned_at < idle_seconds:
+                return
+
+        telemetry.incr('pings')
+        try:
+            dialect.do_ping(dbapi_connection)
+        except Exception as e:
+            telemetry.incr('ping_failures')
+            logger.warning(f'💀 Dead connection detected: {e}')
+            # The pool discards this connection and retries with a fresh one
+            raise exc.DisconnectionError()
+
+    @event.listens_for(pool, 'invalidate')
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        telemetry.incr('invalidations')
+
+    @event.listens_for(pool, 'soft_invalidate')
+    def _on_soft_invalidate(dbapi_connection, connection_record, exception):
+        telemetry.incr('invalidations')
+
+    logger.info(f"✅ Pool liveness: mode={mode}, ping after {idle_seconds:.0f}s idle")
+
+
+def pool_telemetry(engine):
+    """Counters plus the pool's current occupancy for this worker"""
+    pool = engine.pool
+    data = telemetry.snapshot()
+    data['pid'] = os.getpid()
+    data['liveness_mode'] = LIVENESS_MODE
+    if isinstance(pool, QueuePool):
+        data.update(
+            pool_size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow()
+        )
+    return data
+
+
+def register_pool_liveness(app):
+    """Install the liveness strategy on the Flask-SQLAlchemy engine"""
+    with app.app_context():
+        install_liveness(db.engine)
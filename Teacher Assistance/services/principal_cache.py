@@ -0,0 +1,200 @@
+"""
+Principal Cache
+In-process TTL cache of authenticated principals (users, admins, students)
+so the auth decorators do not hit users/admins/students on every API call.
+
+Only identity and authorization fields are cached. Touching any other
+attribute, or assigning one, loads the live row for the request, so
+balances and other mutable columns are never served stale.
+
+Entries are dropped whenever the ORM writes the row (or a user's
+subscription), both at flush and again when the transaction commits or
+rolls back: until then other requests still read the old row and may cache
+it again. Entries expire after PRINCIPAL_CACHE_TTL seconds otherwise, which
+bounds staleness across gunicorn workers.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from auth.models import Admin, Student, Subscription, User
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_TTL = float(os.getenv('PRINCIPAL_CACHE_TTL', '30'))
+PRINCIPAL_CACHE_SIZE = int(os.getenv('PRINCIPAL_CACHE_SIZE', '5000'))
+
+# kind -> (model, columns served from the cache)
+PRINCIPAL_KINDS = {
+    'user': (User, ('id', 'name', 'email', 'country', 'is_active', 'trial_ends_at')),
+    'admin': (Admin, ('id', 'name', 'email', 'role', 'is_active')),
+    'student': (Student, ('id', 'name', 'email', 'username', 'grade_level', 'school_name', 'is_active')),
+}
+
+_UNLOADED = object()
+
+
+class Principal:
+    """
+    Request-scoped view of a cached principal. Cached fields are read from
+    the snapshot; anything else is forwarded to the live ORM instance.
+    """
+
+    __slots__ = ('kind', 'model', '_entry', '_instance')
+
+    def __init__(self, kind, model, entry):
+        object.__setattr__(self, 'kind', kind)
+        object.__setattr__(self, 'model', model)
+        object.__setattr__(self, '_entry', entry)
+        object.__setattr__(self, '_instance', None)
+
+    def instance(self):
+        """The live ORM row for this principal (loaded once per request)"""
+        if self._instance is None:
+            object.__setattr__(self, '_instance', db.session.get(self.model, self._entry['fields']['id']))
+        return self._instance
+
+    def __getattr__(self, name):
+        fields = self._entry['fields']
+        if self._instance is None and name in fields:
+            return fields[name]
+        return getattr(self.instance(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.instance(), name, value)
+
+    def __repr__(self):
+        return f"<Principal {self.kind} {self._entry['fields']['id']}>"
+
+    def has_active_subscription(self, now=None):
+        """Trial or active subscription still running (users only)"""
+        now = now or datetime.utcnow()
+        trial_ends_at = self._entry['fields'].get('trial_ends_at')
+        if trial_ends_at and trial_ends_at > now:
+            return True
+
+        if self._entry['subscription_ends_at'] is _UNLOADED:
+            row = db.session.query(Subscription.ends_at).filter_by(
+                user_id=self._entry['fields']['id'],
+                status='active'
+            ).first()
+            self._entry['subscription_ends_at'] = row[0] if row else None
+
+        ends_at = self._entry['subscription_ends_at']
+        return bool(ends_at and ends_at > now)
+
+
+class PrincipalCache:
+    """Bounded LRU of principal snapshots with per-entry expiry"""
+
+    def __init__(self, ttl=PRINCIPAL_CACHE_TTL, max_size=PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind, principal_id):
+        """Return a Principal for (kind, id), or None if the row does not exist"""
+        model, columns = PRINCIPAL_KINDS[kind]
+        key = (kind, str(principal_id))
+        now = time.monotonic()
+
+        if self.ttl > 0:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry['expires_at'] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return Principal(kind, model, entry)
+                self.misses += 1
+
+        row = db.session.query(*[getattr(model, column) for column in columns]).filter(
+            model.id == principal_id
+        ).first()
+        if row is None:
+            # Not cached: a freshly created account must work immediately
+            return None
+
+        entry = {
+            'fields': dict(zip(columns, row)),
+            'subscription_ends_at': _UNLOADED,
+            'expires_at': now + self.ttl
+        }
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return Principal(kind, model, entry)
+
+    def invalidate(self, kind, principal_id):
+        with self._lock:
+            self._entries.pop((kind, str(principal_id)), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'ttl': self.ttl}
+
+
+principal_cache = PrincipalCache()
+
+
+def get_principal(kind, principal_id):
+    return principal_cache.get(kind, principal_id)
+
+
+def invalidate_principal(kind, principal_id):
+    """Drop a cached principal; call after raw-SQL writes the ORM cannot see"""
+    principal_cache.invalidate(kind, principal_id)
+
+
+# ----------------------------------------------------------------------
+# Invalidation on ORM writes
+# ----------------------------------------------------------------------
+
+def _register_invalidation(model, kind, key_attr='id'):
+    def _invalidate(mapper, connection, target):
+        principal_id = getattr(target, key_attr)
+        if principal_id is None:
+            return
+        principal_cache.invalidate(kind, principal_id)
+        # Dropped again once the transaction ends (see _after_transaction)
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('principal_cache_pending', set()).add((kind, principal_id))
+
+    for event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, event_name, _invalidate)
+
+
+def _after_commit(session):
+    for kind, principal_id in session.info.pop('principal_cache_pending', ()):
+        principal_cache.invalidate(kind, principal_id)
+
+
+def _after_soft_rollback(session, previous_transaction):
+    # A read in this session after the flush may have cached rows that were never committed
+    if previous_transaction.parent is None:
+        _after_commit(session)
+
+
+for _kind, (_model, _columns) in PRINCIPAL_KINDS.items():
+    _register_invalidation(_model, _kind)
+_register_invalidation(Subscription, 'user', key_attr='user_id')
+event.listen(db.session, 'after_commit', _after_commit)
+event.listen(db.session, 'after_soft_rollback', _after_soft_rollback)
@@ -0,0 +1,236 @@
+"""
+Query Budget
+Opt-in per-request SQL instrumentation. Counts statements and DB time for
+each request, groups them by statement shape to spot N+1 loops, and logs a
+structured line (plus optional response headers) when an endpoint goes over
+its budget.
+
+Enable with QUERY_BUDGET_ENABLED=1. Defaults can be tuned with
+QUERY_BUDGET_MAX_QUERIES, QUERY_BUDGET_MAX_DB_MS, QUERY_BUDGET_REPEAT_THRESHOLD
+and QUERY_BUDGET_HEADERS=1; individual views can override them with
+@query_budget(max_queries=..., max_db_ms=...).
+
+For tests, count_queries() / assert_query_ceiling() work whether or not the
+middleware is enabled.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET_ENABLED = os.getenv('QUERY_BUDGET_ENABLED', '0') == '1'
+QUERY_BUDGET_MAX_QUERIES = int(os.getenv('QUERY_BUDGET_MAX_QUERIES', '30'))
+QUERY_BUDGET_MAX_DB_MS = float(os.getenv('QUERY_BUDGET_MAX_DB_MS', '500'))
+QUERY_BUDGET_REPEAT_THRESHOLD = int(os.getenv('QUERY_BUDGET_REPEAT_THRESHOLD', '5'))
+QUERY_BUDGET_HEADERS = os.getenv('QUERY_BUDGET_HEADERS', '0') == '1'
+
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|:\w+|%\(\w+\)s|__\[POSTCOMPILE_\w+\])\s*,?)+\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+_SELECT_LIST = re.compile(r'^SELECT .*? FROM ', re.IGNORECASE)
+
+
+def statement_shape(statement):
+    """Normalize a statement so per-row repeats of one query compare equal"""
+    shape = _IN_LIST.sub('IN (…)', statement)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def display_shape(shape, limit=300):
+    """Shorten a shape for logs: the column list is noise, the FROM/WHERE part is not"""
+    return _SELECT_LIST.sub('SELECT … FROM ', shape)[:limit]
+
+
+class QueryStats:
+    """Statements, DB time and shape counts collected for one unit of work"""
+
+    def __init__(self):
+        self.count = 0
+        self.db_ms = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, elapsed_ms):
+        self.count += 1
+        self.db_ms += elapsed_ms
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold=QUERY_BUDGET_REPEAT_THRESHOLD):
+        """[(shape, count)] for shapes issued at least `threshold` times (likely N+1)"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def summary(self, limit=5):
+        return '; '.join(f'{count}x {display_shape(shape, 160)}' for shape, count in self.shapes.most_common(limit))
+
+
+# Collectors that are not tied to a request (count_queries in tests)
+_active_collectors = []
+_collectors_lock = threading.Lock()
+
+
+def _current_collectors():
+    collectors = []
+    if has_request_context():
+        stats = g.get('query_stats')
+        if stats is not None:
+            collectors.append(stats)
+    if _active_collectors:
+        with _collectors_lock:
+            collectors.extend(_active_collectors)
+    return collectors
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_budget_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_budget_started')
+    if not started:
+        return
+    elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+    for stats in _current_collectors():
+        stats.record(statement, elapsed_ms)
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute does not fire for failed statements
+    started = exception_context.connection.info.get('query_budget_started') if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+_listeners_installed = False
+
+
+def _install_listeners():
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    # Engine-class listeners cover the primary and the read replica alike
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    _listeners_installed = True
+
+
+# ----------------------------------------------------------------------
+# Per-request middleware
+# ----------------------------------------------------------------------
+
+def query_budget(max_queries=None, max_db_ms=None):
+    """Override the default budget for one view"""
+    def decorator(view):
+        view._query_budget = {'max_queries': max_queries, 'max_db_ms': max_db_ms}
+        return view
+    return decorator
+
+
+def _budget_for(app):
+    view = app.view_functions.get(request.endpoint)
+    override = getattr(view, '_query_budget', None) or {}
+    max_queries = override.get('max_queries')
+    max_db_ms = override.get('max_db_ms')
+    return (
+        QUERY_BUDGET_MAX_QUERIES if max_queries is None else max_queries,
+        QUERY_BUDGET_MAX_DB_MS if max_db_ms is None else max_db_ms
+    )
+
+
+def register_query_budget(app):
+    """Install the per-request instrumentation when QUERY_BUDGET_ENABLED=1"""
+    if not QUERY_BUDGET_ENABLED:
+        return
+    _install_listeners()
+
+    @app.before_request
+    def _start_query_budget():
+        g.query_stats = QueryStats()
+
+    @app.after_request
+    def _check_query_budget(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+
+        max_queries, max_db_ms = _budget_for(app)
+        repeated = stats.repeated()
+        over_budget = stats.count > max_queries or stats.db_ms > max_db_ms
+
+        if over_budget or repeated:
+            logger.warning('query_budget ' + json.dumps({
+                'endpoint': request.endpoint,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': stats.count,
+                'db_ms': round(stats.db_ms, 1),
+                'max_queries': max_queries,
+                'max_db_ms': max_db_ms,
+                'repeated': [{'shape': display_shape(shape), 'count': count} for shape, count in repeated[:5]]
+            }, ensure_ascii=False))
+
+        if QUERY_BUDGET_HEADERS:
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['X-DB-Time-Ms'] = f'{stats.db_ms:.1f}'
+            if over_budget:
+                response.headers['X-Query-Budget'] = 'exceeded'
+            if repeated:
+                response.headers['X-Query-Repeats'] = str(sum(count for _, count in repeated))
+        return response
+
+    logger.info(f"✅ Query budget enabled: {QUERY_BUDGET_MAX_QUERIES} queries / {QUERY_BUDGET_MAX_DB_MS:.0f} ms per request")
+
+
+# ----------------------------------------------------------------------
+# Test helpers
+# ----------------------------------------------------------------------
+
+@contextmanager
+def count_queries():
+    """
+    Collect every SQLAlchemy statement issued inside the block:
+
+        with count_queries() as stats:
+            client.get('/api/student/scoreboard')
+        assert stats.count <= 5, stats.summary()
+    """
+    _install_listeners()
+    stats = QueryStats()
+    with _collectors_lock:
+        _active_collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        with _collectors_lock:
+            _active_collectors.remove(stats)
+
+
+def assert_query_ceiling(client, method, path, ceiling, repeat_threshold=None, **request_kwargs):
+    """
+    Issue one request through a Flask test client and fail if it runs more than
+    `ceiling` statements (or repeats one shape `repeat_threshold` times).
+    Returns the response for further assertions.
+    """
+    with count_queries() as stats:
+        response = client.open(path, method=method.upper(), **request_kwargs)
+
+    if stats.count > ceiling:
+        raise AssertionError(
+            f"{method.upper()} {path} ran {stats.count} queries (ceiling {ceiling}): {stats.summary()}"
+        )
+    if repeat_threshold is not None:
+        repeated = stats.repeated(repeat_threshold)
+        if repeated:
+            shape, count = repeated[0]
+            raise AssertionError(f"{method.upper()} {path} repeated a statement {count}x: {display_shape(shape, 200)}")
+    return response
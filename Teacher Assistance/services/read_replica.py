@@ -0,0 +1,201 @@
+"""
+Read Replica Routing
+Optional second database (MYSQL_REPLICA_URL) for heavy read-only endpoints.
+
+Views decorated with @replica_reads send their SELECTs to the replica while
+it is reachable and no further behind than REPLICA_MAX_LAG_SECONDS (or the
+decorator's max_lag). Everything else - writes, reads after a write in the
+same request, undecorated views - stays on the primary. If the replica
+fails mid-request the view is retried once against the primary.
+
+Any SQLAlchemy URL works, so two local SQLite files can stand in for
+primary and replica.
+"""
+
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_app_context
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '10'))
+
+
+class ReplicaRouter:
+    """Holds the replica engine and a cached view of its health and lag"""
+
+    def __init__(self):
+        self.engine = None
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._healthy = False
+        self._lag = None
+        self.stats = {'replica_reads': 0, 'primary_fallbacks': 0, 'replica_errors': 0}
+
+    @property
+    def enabled(self):
+        return self.engine is not None
+
+    def configure(self, url, **engine_options):
+        self.engine = create_engine(url, **engine_options)
+        self._checked_at = 0.0
+        logger.info(f"✅ Read replica configured: {self.engine.url.render_as_string(hide_password=True)}")
+
+    def _probe(self):
+        """Return replication lag in seconds (0 when the backend does not report it)"""
+        with self.engine.connect() as connection:
+            if connection.dialect.name != 'mysql':
+                connection.execute(text('SELECT 1'))
+                return 0.0
+            for statement in ('SHOW REPLICA STATUS', 'SHOW SLAVE STATUS'):
+                try:
+                    row = connection.execute(text(statement)).mappings().first()
+                    break
+                except OperationalError:
+                    continue
+            else:
+                row = None
+            if not row:
+                # Not configured as a replica (e.g. a plain read copy)
+                return 0.0
+            lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+            # NULL lag means replication is stopped
+            return float(lag) if lag is not None else float('inf')
+
+    def status(self, force=False):
+        """(healthy, lag) - re-probed at most every REPLICA_CHECK_INTERVAL seconds"""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._checked_at < REPLICA_CHECK_INTERVAL:
+                return self._healthy, self._lag
+            self._checked_at = now
+        try:
+            lag, healthy = self._probe(), True
+        except Exception as e:
+            logger.warning(f"⚠️ Read replica unavailable: {e}")
+            lag, healthy = None, False
+        with self._lock:
+            self._healthy, self._lag = healthy, lag
+        return healthy, lag
+
+    def mark_down(self):
+        with self._lock:
+            self._healthy = False
+            self._checked_at = time.monotonic()
+            self.stats['replica_errors'] += 1
+
+    def usable(self, max_lag):
+        healthy, lag = self.status()
+        return healthy and lag is not None and lag <= max_lag
+
+
+router = ReplicaRouter()
+
+
+def _route_select(orm_execute_state):
+    """do_orm_execute hook: point SELECTs at the replica inside @replica_reads views"""
+    if not has_app_context():
+        return
+    engine = g.get('replica_engine')
+    if engine is None:
+        return
+
+    session = orm_execute_state.session
+    locking = getattr(orm_execute_state.statement, '_for_update_arg', None) is not None
+    if not orm_execute_state.is_select or locking:
+        # Once the request writes, keep its reads on the primary too
+        g.replica_engine = None
+        return
+    if session.new or session.dirty or session.deleted:
+        g.replica_engine = None
+        return
+
+    orm_execute_state.bind_arguments['bind'] = engine
+    router.stats['replica_reads'] += 1
+
+
+def _pin_to_primary(session, flush_context):
+    """after_flush hook: the request has written, so its later reads must see that"""
+    if has_app_context() and g.get('replica_engine') is not None:
+        g.replica_engine = None
+
+
+def _flag_replica_error(exception_context):
+    """handle_error hook on the replica engine: remember the failure for the decorator"""
+    if has_app_context() and g.get('replica_engine') is not None:
+        g.replica_failed = True
+
+
+def replica_reads(f=None, max_lag=None):
+    """
+    Route this view's reads to the read replica when one is configured and
+    fresh enough. Use bare (@replica_reads) or with @replica_reads(max_lag=60).
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            tolerance = REPLICA_MAX_LAG_SECONDS if max_lag is None else max_lag
+            if not router.enabled or not router.usable(tolerance):
+                if router.enabled:
+                    router.stats['primary_fallbacks'] += 1
+                return view(*args, **kwargs)
+
+            g.replica_engine = router.engine
+            g.replica_failed = False
+            try:
+                response = view(*args, **kwargs)
+            except OperationalError:
+                if not g.get('replica_failed'):
+                    raise
+                response = None
+            finally:
+                g.replica_engine = None
+
+            # Views usually turn DB errors into a 500 themselves, so check the flag
+            if g.pop('replica_failed', False):
+                logger.warning("⚠️ Replica read failed, retrying on primary")
+                router.mark_down()
+                router.stats['primary_fallbacks'] += 1
+                db.session.rollback()
+                response = view(*args, **kwargs)
+            return response
+        return decorated
+
+    return decorator(f) if f is not None else decorator
+
+
+def replica_status():
+    """Health/lag snapshot for /api/health/database"""
+    if not router.enabled:
+        return {'enabled': False}
+    healthy, lag = router.status()
+    return dict(router.stats, enabled=True, healthy=healthy, lag_seconds=lag)
+
+
+def init_read_replica(app, url=None, **engine_options):
+    """Create the replica engine from MYSQL_REPLICA_URL (no-op when unset)"""
+    url = url or os.getenv('MYSQL_REPLICA_URL')
+    if not url:
+        return None
+
+    if url.startswith('mysql://'):
+        url = url.replace('mysql://', 'mysql+pymysql://', 1)
+    if not engine_options and url.startswith('mysql'):
+        engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        # Keep replica checkouts out of the primary pool's telemetry
+        engine_options.pop('poolclass', None)
+
+    router.configure(url, **engine_options)
+    event.listen(router.engine, 'handle_error', _flag_replica_error)
+    event.listen(db.session, 'do_orm_execute', _route_select)
+    event.listen(db.session, 'after_flush', _pin_to_primary)
+    return router
@@ -0,0 +1,306 @@
+"""
+Schema Migrations
+Idempotent, additive schema changes (db.create_all is disabled in app.py)
+and the data backfills that follow them, as CLI commands.
+
+Nothing here runs on import: 'flask migrate-schema' applies the DDL once per
+deploy, before the new workers start, so gunicorn workers never race each
+other on ALTER TABLE / CREATE INDEX. It also fills the typed task score
+columns, which the analytics read instead of task_data.
+"""
+
+import logging
+
+import click
+from sqlalchemy import bindparam, func, inspect, select, text
+
+from auth.models import (
+    ACardBalanceSnapshot, ACardTransaction, AffiliateClick, CommissionRunCheckpoint, GenerationJob, Message,
+    PostComment, PostLike, PublishedLessonPlan, QuizSubmission, SocialMediaTask, StudentPost, StudentTask
+)
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK_SIZE = 1000
+
+# (column name, DDL type) added to student_tasks for the typed score columns
+STUDENT_TASK_SCORE_COLUMNS = [
+    ('score', 'FLOAT NULL'),
+    ('max_score', 'FLOAT NULL'),
+    ('score_percentage', 'FLOAT NULL'),
+    ('time_spent', 'INTEGER NULL'),
+]
+
+# Denormalized counters on student_posts; NULL means "not backfilled yet"
+STUDENT_POST_COUNTER_COLUMNS = [
+    ('likes_count', 'INTEGER NULL'),
+    ('comments_count', 'INTEGER NULL'),
+]
+
+
+# Composite indexes for the hot filters; definitions live in __table_args__ on each model
+INDEX_PACK = [
+    (StudentTask, 'ix_student_tasks_student_status'),
+    (StudentTask, 'ix_student_tasks_student_due'),
+    (Message, 'ix_messages_recipient_inbox'),
+    (QuizSubmission, 'ix_quiz_submissions_quiz_submitted'),
+    (SocialMediaTask, 'ix_social_media_tasks_student_status'),
+    (AffiliateClick, 'ix_affiliate_clicks_affiliate_created'),
+    (PublishedLessonPlan, 'ix_published_lesson_plans_slug_active'),
+    (StudentPost, 'ix_student_posts_active_created'),
+    (ACardTransaction, 'ix_acard_transactions_student_created'),
+]
+
+
+def _existing_columns(table_name):
+    inspector = inspect(db.engine)
+    if table_name not in inspector.get_table_names():
+        return None
+    return {column['name'] for column in inspector.get_columns(table_name)}
+
+
+def _existing_indexes(table_name):
+    return {index['name'] for index in inspect(db.engine).get_indexes(table_name)}
+
+
+def ensure_student_task_score_columns():
+    """Add the typed score columns and their index to student_tasks if missing"""
+    columns = _existing_columns('student_tasks')
+    if columns is None:
+        logger.warning("⚠️ student_tasks table not found - skipping score column migration")
+        return False
+
+    added = []
+    with db.engine.begin() as connection:
+        for name, ddl in STUDENT_TASK_SCORE_COLUMNS:
+            if name not in columns:
+                connection.execute(text(f'ALTER TABLE student_tasks ADD COLUMN {name} {ddl}'))
+                added.append(name)
+
+    if 'ix_student_tasks_score_percentage' not in _existing_indexes('student_tasks'):
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                'CREATE INDEX ix_student_tasks_score_percentage ON student_tasks (score_percentage)'
+            ))
+
+    if added:
+        logger.info(f"✅ Added student_tasks columns: {', '.join(added)} (backfilled next)")
+    return True
+
+
+def ensure_student_post_counter_columns():
+    """Add the denormalized like/comment counters to student_posts if missing"""
+    columns = _existing_columns('student_posts')
+    if columns is None:
+        logger.warning("⚠️ student_posts table not found - skipping counter column migration")
+        return False
+
+    added = []
+    with db.engine.begin() as connection:
+        for name, ddl in STUDENT_POST_COUNTER_COLUMNS:
+            if name not in columns:
+                connection.execute(text(f'ALTER TABLE student_posts ADD COLUMN {name} {ddl}'))
+                added.append(name)
+
+    if added:
+        logger.info(f"✅ Added student_posts columns: {', '.join(added)} (run 'flask backfill-post-counters')")
+    return True
+
+
+def ensure_acard_snapshot_table():
+    """Create acard_balance_snapshots if missing"""
+    ACardBalanceSnapshot.__table__.create(bind=db.engine, checkfirst=True)
+    return True
+
+
+def ensure_commission_checkpoint_table():
+    """Create commission_run_checkpoints if missing"""
+    CommissionRunCheckpoint.__table__.create(bind=db.engine, checkfirst=True)
+    return True
+
+
+def backfill_missing_task_scores():
+    """Fill the typed score columns of rows written before they existed, so SQL aggregates see them"""
+    count = backfill_student_task_scores(only_missing=True)
+    if count:
+        logger.info(f"✅ Backfilled score columns on {count} tasks")
+    return True
+
+
+def ensure_generation_jobs_table():
+    """Create generation_jobs (and its indexes) if missing, or add its authorization column"""
+    columns = _existing_columns('generation_jobs')
+    if columns is None:
+        GenerationJob.__table__.create(bind=db.engine, checkfirst=True)
+    elif 'authorization' not in columns:
+        with db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE generation_jobs ADD COLUMN authorization TEXT NULL'))
+        logger.info("✅ Added generation_jobs column: authorization")
+    return True
+
+
+def ensure_index_pack():
+    """Create any missing composite index from INDEX_PACK"""
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    created = []
+
+    for model, index_name in INDEX_PACK:
+        table_name = model.__tablename__
+        if table_name not in tables:
+            logger.warning(f"⚠️ {table_name} table not found - skipping {index_name}")
+            continue
+        if index_name in {index['name'] for index in inspector.get_indexes(table_name)}:
+            continue
+
+        index = next(index for index in model.__table__.indexes if index.name == index_name)
+        index.create(bind=db.engine)
+        created.append(index_name)
+
+    if created:
+        logger.info(f"✅ Created indexes: {', '.join(created)}")
+    return created
+
+
+def backfill_student_task_scores(chunk_size=BACKFILL_CHUNK_SIZE, only_missing=True):
+    """
+    Populate the typed score columns from task_data in keyed chunks.
+    Commits once per chunk so it can be interrupted and rerun safely.
+    """
+    table = StudentTask.__table__
+    update_stmt = table.update().where(table.c.id == bindparam('task_id')).values(
+        score=bindparam('score'),
+        max_score=bindparam('max_score'),
+        score_percentage=bindparam('score_percentage'),
+        time_spent=bindparam('time_spent')
+    )
+
+    last_id = 0
+    updated = 0
+    while True:
+        query = db.session.query(StudentTask.id, StudentTask.task_data).filter(
+            StudentTask.id > last_id,
+            StudentTask.task_data.isnot(None)
+        )
+        if only_missing:
+            query = query.filter(StudentTask.score.is_(None))
+        rows = query.order_by(StudentTask.id).limit(chunk_size).all()
+        if not rows:
+            break
+
+        params = []
+        for task_id, task_data in rows:
+            fields = StudentTask.extract_score_fields(task_data)
+            if fields['score'] is None and only_missing:
+                continue
+            params.append(dict(task_id=task_id, **fields))
+
+        if params:
+            db.session.execute(update_stmt, params)
+        db.session.commit()
+
+        updated += len(params)
+        last_id = rows[-1][0]
+        logger.info(f"Backfilled task scores up to id {last_id} ({updated} rows updated)")
+
+    return updated
+
+
+def backfill_post_counters(chunk_size=BACKFILL_CHUNK_SIZE):
+    """
+    Fill NULL like/comment counters in id-keyed chunks. Each chunk is a single
+    UPDATE with correlated counts, so likes arriving meanwhile are not lost.
+    """
+    posts = StudentPost.__table__
+    likes = PostLike.__table__
+    comments = PostComment.__table__
+
+    like_count = select(func.count(likes.c.id)).where(
+        likes.c.post_id == posts.c.id, likes.c.is_active == True
+    ).scalar_subquery()
+    comment_count = select(func.count(comments.c.id)).where(
+        comments.c.post_id == posts.c.id, comments.c.is_active == True
+    ).scalar_subquery()
+
+    last_id = 0
+    updated = 0
+    while True:
+        ids = [row[0] for row in db.session.query(StudentPost.id).filter(
+            StudentPost.id > last_id,
+            (StudentPost.likes_count.is_(None)) | (StudentPost.comments_count.is_(None))
+        ).order_by(StudentPost.id).limit(chunk_size).all()]
+        if not ids:
+            break
+
+        db.session.execute(
+            posts.update()
+            .where(posts.c.id.in_(ids))
+            .values({
+                posts.c.likes_count: like_count,
+                posts.c.comments_count: comment_count,
+                posts.c.updated_at: posts.c.updated_at
+            })
+        )
+        db.session.commit()
+
+        updated += len(ids)
+        last_id = ids[-1]
+        logger.info(f"Backfilled post counters up to id {last_id} ({updated} posts)")
+
+    return updated
+
+
+# Applied in order by 'flask migrate-schema'; the index pack runs last so new tables have their columns.
+# Score reads cut over to the typed columns, so their backfill is part of the migration.
+SCHEMA_MIGRATIONS = [
+    ensure_student_task_score_columns,
+    backfill_missing_task_scores,
+    ensure_student_post_counter_columns,
+    ensure_acard_snapshot_table,
+    ensure_commission_checkpoint_table,
+    ensure_generation_jobs_table,
+    ensure_index_pack,
+]
+
+
+def apply_schema_migrations():
+    """Run every additive migration (app context); returns the names of those that failed"""
+    failed = []
+    for migration in SCHEMA_MIGRATIONS:
+        try:
+            migration()
+        except Exception as e:
+            logger.error(f"❌ Schema migration {migration.__name__} failed: {e}")
+            failed.append(migration.__name__)
+    return failed
+
+
+def register_schema_migrations(app):
+    """Register the schema migration and backfill CLI commands"""
+
+    @app.cli.command('migrate-schema')
+    def migrate_schema_command():
+        """Apply the additive schema migrations (run once per deploy, before starting workers)"""
+        failed = apply_schema_migrations()
+        if failed:
+            raise click.ClickException(f"Migrations failed: {', '.join(failed)}")
+        print(f"✅ Applied {len(SCHEMA_MIGRATIONS)} schema migrations")
+
+    @app.cli.command('backfill-task-scores')
+    @click.option('--all', 'recompute_all', is_flag=True, help='Recompute rows that already have scores')
+    def backfill_task_scores_command(recompute_all):
+        """Copy completion scores from student_tasks.task_data into typed columns"""
+        count = backfill_student_task_scores(only_missing=not recompute_all)
+        print(f"✅ Backfilled score columns on {count} tasks")
+
+        # Leaderboard aggregates read the typed columns, so refresh them too
+        from services.leaderboard_service import LeaderboardService
+        LeaderboardService.rebuild()
+        print("✅ Leaderboard rebuilt from backfilled scores")
+
+    @app.cli.command('backfill-post-counters')
+    def backfill_post_counters_command():
+        """Populate student_posts.likes_count / comments_count for older posts"""
+        count = backfill_post_counters()
+        print(f"✅ Backfilled like/comment counters on {count} posts")
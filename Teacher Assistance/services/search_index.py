@@ -0,0 +1,399 @@
+"""
+In-Process Search Index
+Prefix, bigram and trigram index over a few text fields of a model (tutor and student
+names / emails), so type-ahead lookups are answered from memory instead of
+an ILIKE '%q%' table scan per keystroke.
+
+Each index is loaded at startup and kept current three ways:
+- writes through the ORM in this process are applied when their transaction
+  commits (session listeners);
+- set-based updates call refresh_keys() with the ids they touched;
+- every SEARCH_INDEX_REFRESH_SECONDS a search first pulls rows added or
+  updated since the last look (covering other workers), and every
+  SEARCH_INDEX_RELOAD_SECONDS the index is rebuilt to drop deleted rows.
+
+Results are ranked: whole-field match, then field prefix, then word prefix,
+then substring, as ILIKE '%q%' would match them. A one-character query
+matches word prefixes only, not every record containing the letter.
+
+Callers that turn hits into an IN (...) filter cap them at
+SEARCH_INDEX_MAX_IDS and use SQL beyond that.
+"""
+
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from operator import itemgetter
+
+from sqlalchemy import event, inspect, or_
+
+from auth.models import Student, Tutor
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv('SEARCH_INDEX_REFRESH_SECONDS', '30'))
+SEARCH_INDEX_RELOAD_SECONDS = float(os.getenv('SEARCH_INDEX_RELOAD_SECONDS', '600'))
+SEARCH_INDEX_LOAD_CHUNK = 1000
+# Most hits a caller should pass to an IN (...) filter
+SEARCH_INDEX_MAX_IDS = int(os.getenv('SEARCH_INDEX_MAX_IDS', '1000'))
+
+PREFIX_LENGTH = 4  # word prefixes indexed up to this length; longer queries are verified
+
+_TOKEN_SPLIT = re.compile(r'[\s@._\-+]+')
+
+SearchHit = namedtuple('SearchHit', ['key', 'payload', 'rank'])
+
+
+def normalize(text):
+    return (text or '').strip().lower()
+
+
+def tokenize(text):
+    return [token for token in _TOKEN_SPLIT.split(text) if token]
+
+
+def trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def bigrams(token):
+    return {token[i:i + 2] for i in range(len(token) - 1)}
+
+
+class PrefixIndex:
+    """
+    Thread-safe in-memory index over records of a few texts each: a sorted
+    list of whole texts (field-prefix matches by bisection) plus word-prefix,
+    word-bigram and word-trigram postings (word-prefix and substring matches).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._records = {}                  # key -> (texts, joined text, payload)
+        self._sorted = []                   # (text, key) for every indexed text
+        self._prefixes = defaultdict(set)   # word prefix (<= PREFIX_LENGTH) -> keys
+        self._bigrams = defaultdict(set)    # bigram of a word -> keys
+        self._trigrams = defaultdict(set)   # trigram of a word -> keys
+
+    def __len__(self):
+        return len(self._records)
+
+    @staticmethod
+    def _postings(texts):
+        prefixes, pairs, grams = set(), set(), set()
+        for text in texts:
+            for token in tokenize(text):
+                prefixes.update(token[:length] for length in range(1, min(len(token), PREFIX_LENGTH) + 1))
+                pairs.update(bigrams(token))
+                grams.update(trigrams(token))
+        return prefixes, pairs, grams
+
+    def _link(self, key, texts, payload, keep_sorted=True):
+        texts = tuple(dict.fromkeys(normalize(text) for text in texts if text))
+        prefixes, pairs, grams = self._postings(texts)
+        self._records[key] = (texts, ' '.join(texts), payload)
+        for text in texts:
+            if keep_sorted:
+                insort(self._sorted, (text, key))
+            else:
+                self._sorted.append((text, key))
+        for prefix in prefixes:
+            self._prefixes[prefix].add(key)
+        for pair in pairs:
+            self._bigrams[pair].add(key)
+        for gram in grams:
+            self._trigrams[gram].add(key)
+
+    def _unlink(self, key):
+        record = self._records.pop(key, None)
+        if record is None:
+            return
+        for text in record[0]:
+            position = bisect_left(self._sorted, (text, key))
+            if position < len(self._sorted) and self._sorted[position] == (text, key):
+                del self._sorted[position]
+        prefixes, pairs, grams = self._postings(record[0])
+        for postings, terms in ((self._prefixes, prefixes), (self._bigrams, pairs), (self._trigrams, grams)):
+            for term in terms:
+                keys = postings.get(term)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del postings[term]
+
+    def upsert(self, key, texts, payload=None):
+        with self._lock:
+            self._unlink(key)
+            self._link(key, texts, payload)
+
+    def remove(self, key):
+        with self._lock:
+            self._unlink(key)
+
+    def replace(self, entries):
+        """Swap in a freshly built index: entries are (key, texts, payload)"""
+        fresh = PrefixIndex()
+        for key, texts, payload in entries:
+            fresh._unlink(key)
+            fresh._link(key, texts, payload, keep_sorted=False)
+        fresh._sorted.sort()
+        with self._lock:
+            self._records, self._sorted = fresh._records, fresh._sorted
+            self._prefixes, self._bigrams, self._trigrams = fresh._prefixes, fresh._bigrams, fresh._trigrams
+
+    def _has_word(self, key, term, joined):
+        """Does the record contain `term` (as a word prefix when it is one character)?"""
+        if len(term) < 2:
+            return key in self._prefixes.get(term, ())
+        return term in joined
+
+    def _candidates(self, term):
+        if len(term) < 2:
+            return self._prefixes.get(term, set())
+        if len(term) == 2:
+            return self._bigrams.get(term, set())
+        # Words never span separators, so any word containing `term` holds all its trigrams
+        postings = sorted((self._trigrams.get(gram, set()) for gram in trigrams(term)), key=len)
+        keys = set(postings[0])
+        for other in postings[1:]:
+            keys &= other
+            if not keys:
+                break
+        return keys
+
+    def search(self, query, limit=None, where=None):
+        """
+        Records containing every word of `query`, best ranked first:
+        0 whole text equals the query, 1 a text starts with it, 2 a word starts
+        with its first word, 3 substring. `where(payload)` filters records.
+        """
+        query = normalize(query)
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            hits, seen = [], set()
+
+            # Ranks 0 and 1 straight off the sorted texts; an exact match sorts first
+            position = bisect_left(self._sorted, (query,))
+            while position < len(self._sorted):
+                text, key = self._sorted[position]
+                if not text.startswith(query):
+                    break
+                position += 1
+                if key in seen:
+                    continue
+                seen.add(key)
+                payload = self._records[key][2]
+                if where is None or where(payload):
+                    hits.append(SearchHit(key, payload, 0 if text == query else 1))
+                    if limit and len(hits) >= limit:
+                        return hits
+
+            keys = None
+            for term in sorted(terms, key=len, reverse=True):
+                found = self._candidates(term)
+                keys = set(found) if keys is None else keys & found
+                if not keys:
+                    return hits
+
+            first_prefixes = self._prefixes.get(terms[0][:PREFIX_LENGTH], ())
+            ranked = []
+            for key in keys - seen:
+                texts, joined, payload = self._records[key]
+                # Candidates share prefixes / trigrams with each word; confirm the words themselves
+                if not all(self._has_word(key, term, joined) for term in terms):
+                    continue
+                if where is not None and not where(payload):
+                    continue
+                word_prefix = key in first_prefixes and (
+                    len(terms[0]) <= PREFIX_LENGTH or any(token.startswith(terms[0]) for token in tokenize(joined))
+                )
+                ranked.append((2 if word_prefix else 3, texts[0], key, payload))
+
+        remaining = limit - len(hits) if limit else None
+        ranked = heapq.nsmallest(remaining, ranked, key=itemgetter(0, 1, 2)) if remaining else sorted(ranked, key=itemgetter(0, 1, 2))
+        return hits + [SearchHit(key, payload, rank) for rank, _, key, payload in ranked]
+
+
+class ModelSearchIndex:
+    """A PrefixIndex kept in step with one model's rows"""
+
+    def __init__(self, name, model, columns, texts, payload, changed_column=None):
+        self.name = name
+        self.model = model
+        self.columns = columns              # attribute names read from each row
+        self.texts = texts                  # row -> texts to index
+        self.payload = payload              # row -> dict kept with the entry
+        self.changed_column = changed_column
+        self.index = PrefixIndex()
+        self.ready = False
+        self._max_id = None
+        self._changed_since = None
+        self._refreshed_at = 0.0
+        self._loaded_at = 0.0
+        self._refresh_lock = threading.Lock()
+
+    def _query(self):
+        return db.session.query(*(getattr(self.model, column).label(column) for column in self.columns))
+
+    def _entry(self, row):
+        return row.id, self.texts(row), self.payload(row)
+
+    def _watermarks(self, rows):
+        for row in rows:
+            if self._max_id is None or row.id > self._max_id:
+                self._max_id = row.id
+            if self.changed_column:
+                changed = getattr(row, self.changed_column)
+                if changed is not None and (self._changed_since is None or changed > self._changed_since):
+                    self._changed_since = changed
+
+    def load(self):
+        """(Re)build the whole index from the table"""
+        started = time.perf_counter()
+        rows = list(self._query().yield_per(SEARCH_INDEX_LOAD_CHUNK))
+        self._max_id, self._changed_since = None, None
+        self._watermarks(rows)
+        self.index.replace(self._entry(row) for row in rows)
+        self.ready = True
+        self._loaded_at = self._refreshed_at = time.monotonic()
+        logger.info(f"Search index '{self.name}' loaded {len(rows)} rows in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def refresh(self, force=False):
+        """Pick up rows written by other processes since the last look"""
+        now = time.monotonic()
+        if not force and now - self._refreshed_at < SEARCH_INDEX_REFRESH_SECONDS:
+            return
+        # One request refreshes; the others keep serving the current index
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if force or now - self._loaded_at >= SEARCH_INDEX_RELOAD_SECONDS:
+                self.load()
+                return
+            conditions = []
+            if self._max_id is not None:
+                conditions.append(self.model.id > self._max_id)
+            if self.changed_column and self._changed_since is not None:
+                # Small overlap so writes landing in the same second are not missed
+                conditions.append(getattr(self.model, self.changed_column) >= self._changed_since - timedelta(seconds=1))
+            if not conditions:
+                self.load()
+                return
+            rows = self._query().filter(or_(*conditions)).all()
+            self._watermarks(rows)
+            for row in rows:
+                self.index.upsert(*self._entry(row))
+            self._refreshed_at = now
+        except Exception as e:
+            logger.error(f"⚠️ Search index '{self.name}' refresh failed: {str(e)}")
+            self._refreshed_at = now
+        finally:
+            self._refresh_lock.release()
+
+    def refresh_keys(self, keys):
+        """Re-read specific rows, e.g. after a set-based UPDATE"""
+        if not self.ready or not keys:
+            return
+        keys = list(keys)
+        rows = self._query().filter(self.model.id.in_(keys)).all()
+        for row in rows:
+            self.index.upsert(*self._entry(row))
+        for missing in set(keys) - {row.id for row in rows}:
+            self.index.remove(missing)
+
+    def search(self, query, limit=None, where=None):
+        self.refresh()
+        return self.index.search(query, limit=limit, where=where)
+
+
+# ----------------------------------------------------------------------
+# Indexes
+# ----------------------------------------------------------------------
+
+tutor_search_index = ModelSearchIndex(
+    'tutors',
+    Tutor,
+    ['id', 'first_name', 'last_name', 'email', 'application_status', 'updated_at'],
+    texts=lambda row: [f"{row.first_name} {row.last_name}", row.email],
+    payload=lambda row: {
+        'name': f"{row.first_name} {row.last_name}",
+        'email': row.email,
+        'status': row.application_status
+    },
+    changed_column='updated_at'
+)
+
+# students has no updated_at: new signups arrive by id, edits elsewhere with the periodic reload
+student_search_index = ModelSearchIndex(
+    'students',
+    Student,
+    ['id', 'name', 'email', 'grade_level', 'school_name'],
+    texts=lambda row: [row.name, row.email],
+    payload=lambda row: {'grade_level': row.grade_level, 'school_name': row.school_name}
+)
+
+SEARCH_INDEXES = (tutor_search_index, student_search_index)
+_INDEX_BY_MODEL = {search_index.model: search_index for search_index in SEARCH_INDEXES}
+
+
+# ----------------------------------------------------------------------
+# Session listeners
+# ----------------------------------------------------------------------
+
+def _after_flush(session, flush_context):
+    """Snapshot indexed rows written in this flush; they are applied on commit"""
+    pending = None
+    for objects, deleted in ((session.new, False), (session.dirty, False), (session.deleted, True)):
+        for obj in objects:
+            search_index = _INDEX_BY_MODEL.get(type(obj))
+            if search_index is None or not search_index.ready:
+                continue
+            if not deleted and obj not in session.new:
+                state = inspect(obj)
+                if not any(state.attrs[column].history.has_changes() for column in search_index.columns):
+                    continue
+            if pending is None:
+                pending = session.info.setdefault('search_index_pending', [])
+            pending.append((search_index, obj.id, None if deleted else search_index._entry(obj)))
+
+
+def _after_commit(session):
+    for search_index, key, entry in session.info.pop('search_index_pending', []):
+        if entry is None:
+            search_index.index.remove(key)
+        else:
+            search_index.index.upsert(*entry)
+
+
+def _after_soft_rollback(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop('search_index_pending', None)
+
+
+def register_search_indexes(app):
+    """Load the indexes and attach the session listeners"""
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_soft_rollback', _after_soft_rollback)
+
+    with app.app_context():
+        for search_index in SEARCH_INDEXES:
+            try:
+                search_index.load()
+            except Exception as e:
+                # Callers fall back to SQL while an index is not ready
+                logger.error(f"⚠️ Search index '{search_index.name}' not loaded: {str(e)}")
+                db.session.rollback()
+
+    logger.info("✅ Search indexes registered")
@@ -0,0 +1,128 @@
+"""
+Social Media Scoreboard Service
+Computes the social media cohort scoreboard in one grouped query,
+with an optional short-lived in-process snapshot for polling clients
+"""
+
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import Float, case, cast, func, select
+
+from auth.models import SocialMediaProgress, SocialMediaStudent, SocialMediaTask
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Seconds a computed scoreboard may be served from memory (0 disables the snapshot)
+SCOREBOARD_CACHE_TTL = int(os.getenv('SOCIAL_SCOREBOARD_CACHE_TTL', '15'))
+
+
+class SocialMediaScoreboardService:
+    """Single round-trip aggregation for /api/social-media/scoreboard"""
+
+    _snapshot = None
+    _snapshot_at = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def build_query():
+        """
+        One SELECT that joins every student to their task and weekly-time aggregates.
+        Weekly time keeps the original "distinct (week, minutes)" semantics.
+        """
+        tasks = SocialMediaTask.__table__
+        progress = SocialMediaProgress.__table__
+        students = SocialMediaStudent.__table__
+
+        scored = (
+            tasks.c.quiz_score.isnot(None)
+            & tasks.c.quiz_max_score.isnot(None)
+            & (tasks.c.quiz_max_score > 0)
+        )
+        task_stats = select(
+            tasks.c.student_id.label('student_id'),
+            func.count(tasks.c.id).label('total_lessons'),
+            func.sum(case((tasks.c.status == 'completed', 1), else_=0)).label('lessons_completed'),
+            func.sum(case(
+                (scored, cast(tasks.c.quiz_score, Float) * 100 / tasks.c.quiz_max_score),
+                else_=0
+            )).label('score_total'),
+            func.sum(case((scored, 1), else_=0)).label('scored_count')
+        ).group_by(tasks.c.student_id).subquery('task_stats')
+
+        distinct_weeks = select(
+            progress.c.student_id,
+            progress.c.week_number,
+            progress.c.time_spent_minutes
+        ).distinct().subquery('distinct_weeks')
+
+        time_stats = select(
+            distinct_weeks.c.student_id.label('student_id'),
+            func.sum(func.coalesce(distinct_weeks.c.time_spent_minutes, 0)).label('time_spent')
+        ).group_by(distinct_weeks.c.student_id).subquery('time_stats')
+
+        total_lessons = func.coalesce(task_stats.c.total_lessons, 0)
+        lessons_completed = func.coalesce(task_stats.c.lessons_completed, 0)
+        overall_progress = case(
+            (total_lessons > 0, cast(lessons_completed, Float) * 100 / total_lessons),
+            else_=0
+        )
+
+        return select(
+            students.c.id,
+            students.c.full_name,
+            students.c.email,
+            students.c.category,
+            lessons_completed.label('lessons_completed'),
+            total_lessons.label('total_lessons'),
+            overall_progress.label('overall_progress'),
+            func.coalesce(time_stats.c.time_spent, 0).label('time_spent'),
+            func.coalesce(task_stats.c.score_total, 0).label('score_total'),
+            func.coalesce(task_stats.c.scored_count, 0).label('scored_count')
+        ).select_from(
+            students
+            .outerjoin(task_stats, task_stats.c.student_id == students.c.id)
+            .outerjoin(time_stats, time_stats.c.student_id == students.c.id)
+        ).order_by(overall_progress.desc(), students.c.id)
+
+    @staticmethod
+    def compute():
+        """Run the aggregation and shape rows like the original endpoint"""
+        scoreboard = []
+        for row in db.session.execute(SocialMediaScoreboardService.build_query()):
+            scored_count = int(row.scored_count or 0)
+            average_score = float(row.score_total) / scored_count if scored_count else 0
+            scoreboard.append({
+                'id': row.id,
+                'name': row.full_name,
+                'email': row.email,
+                'category': row.category or 'General',
+                'lessons_completed': int(row.lessons_completed or 0),
+                'total_lessons': int(row.total_lessons or 0),
+                'overall_progress': round(float(row.overall_progress or 0), 1),
+                'time_spent': int(row.time_spent or 0),
+                'average_score': round(average_score, 1)
+            })
+        return scoreboard
+
+    @classmethod
+    def get_scoreboard(cls, use_cache=True):
+        """
+        Return (scoreboard, generated_at). Within SCOREBOARD_CACHE_TTL seconds
+        the last snapshot is reused instead of querying again.
+        """
+        now = time.time()
+        if use_cache and SCOREBOARD_CACHE_TTL > 0:
+            with cls._lock:
+                if cls._snapshot is not None and now - cls._snapshot_at < SCOREBOARD_CACHE_TTL:
+                    return cls._snapshot, cls._snapshot_at
+
+        scoreboard = cls.compute()
+
+        with cls._lock:
+            cls._snapshot = scoreboard
+            cls._snapshot_at = now
+        return scoreboard, now
@@ -0,0 +1,121 @@
+"""
+SSE Stream
+Server-sent event responses for the streaming variants of the AI endpoints.
+
+An endpoint hands sse_response() a generator of (event, data) pairs; each
+pair goes out as an `event:` / `data: <json>` frame as soon as it is
+produced, through a response proxies are told not to buffer. The events
+the streaming endpoints send are:
+
+    delta     {"text": ...} formatted text to append to the reply so far
+    section   {"name": ..., "content": ...} a completed section of a document
+    done      the payload the non-streaming endpoint returns; clients replace
+              whatever they assembled from deltas / sections with it
+    error     {"error": ...}; nothing follows it
+
+The status line is sent before the model is called, so an exception raised
+by the generator (AIGatewayBusy included) is reported as an error event.
+
+IncrementalFormatter applies a formatter written for whole replies (e.g.
+format_ai_response) to a reply that is still streaming in.
+"""
+
+import json
+import logging
+
+from flask import Response, stream_with_context
+
+from services.ai_gateway import AIGatewayBusy
+
+logger = logging.getLogger(__name__)
+
+# Sent before the first event so clients and proxies see the stream open at once
+SSE_OPEN = ': stream open\n\n'
+
+# Bracket pairs whose contents formatters may strip (tone directions)
+HELD_PAIRS = (('(', ')'), ('[', ']'))
+
+
+def sse_event(event, data):
+    """One SSE frame with `data` encoded as JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(events, error_message='Failed to generate a response'):
+    """
+    Streamed text/event-stream response for a generator of (event, data)
+    pairs. An exception from the generator ends the stream with an error
+    event carrying `error_message` (or the gateway's busy message).
+    """
+    def generate():
+        yield SSE_OPEN
+        try:
+            for event, data in events:
+                yield sse_event(event, data)
+        except AIGatewayBusy as e:
+            yield sse_event('error', {'error': str(e), 'busy': True})
+        except Exception as e:
+            logger.error(f"❌ Event stream failed: {str(e)}")
+            yield sse_event('error', {'error': error_message})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+class IncrementalFormatter:
+    """
+    format_text() applied to a reply as it streams in.
+
+    feed(chunk) returns the formatted text to append so far. The opening
+    characters (where prefixes like "Assistant:" are stripped) and anything
+    after an unclosed '*', '(' or '[' are held back until they are settled,
+    so text the formatter would remove is never sent. finish() returns the
+    remainder and the complete formatted reply.
+    """
+
+    HOLD_LEADING = 12
+
+    def __init__(self, format_text):
+        self.format_text = format_text
+        self.raw = ''
+        self.sent = ''
+
+    def feed(self, chunk):
+        self.raw += chunk
+        settled = self._settled()
+        return self._advance(self.format_text(settled)) if settled else ''
+
+    def finish(self):
+        formatted = self.format_text(self.raw)
+        return self._advance(formatted), formatted
+
+    def _settled(self):
+        """The longest prefix of the raw text outside any unclosed group"""
+        if len(self.raw.lstrip()) < self.HOLD_LEADING:
+            return ''
+        text = self.raw
+        while True:
+            cut = len(text)
+            if text.count('*') % 2:
+                cut = text.rfind('*')
+            for opening, closing in HELD_PAIRS:
+                start = text.rfind(opening, 0, cut)
+                if start > text.rfind(closing, 0, cut):
+                    cut = start
+            if cut == len(text):
+                return text
+            text = text[:cut]
+
+    def _advance(self, formatted):
+        if not formatted.startswith(self.sent):
+            # Formatting rewrote text already sent; the done event corrects it
+            return ''
+        delta = formatted[len(self.sent):]
+        self.sent = formatted
+        return delta
@@ -0,0 +1,172 @@
+"""
+Worksheet Cache
+Bounded in-process cache in front of the S3 worksheet store.
+
+Entries are kept in LRU order and capped both by count and by the size of
+their JSON, and each expires after WORKSHEET_CACHE_TTL seconds so edits
+made through another pod are picked up. Worksheet ids S3 reports as
+missing are remembered for WORKSHEET_CACHE_NEGATIVE_TTL seconds, so a
+bogus or mistyped link does not cost an S3 GET per request.
+
+Worksheets that exist only in this process (not yet uploaded, S3
+unavailable, or the upload or database insert failed) are pinned: they are
+never evicted or expired while the cache is their only copy.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+WORKSHEET_CACHE_SIZE = int(os.getenv('WORKSHEET_CACHE_SIZE', '500'))
+WORKSHEET_CACHE_MAX_BYTES = int(os.getenv('WORKSHEET_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+WORKSHEET_CACHE_TTL = float(os.getenv('WORKSHEET_CACHE_TTL', '900'))
+WORKSHEET_CACHE_NEGATIVE_TTL = float(os.getenv('WORKSHEET_CACHE_NEGATIVE_TTL', '30'))
+
+# Returned by get() when the cache knows nothing about the key
+NOT_CACHED = object()
+
+# data is None for a negative entry; size is the JSON byte count
+_Entry = namedtuple('_Entry', ['data', 'size', 'expires_at'])
+
+
+class WorksheetCache:
+    """LRU of worksheet dicts bounded by entries and bytes, with TTL and negative entries"""
+
+    def __init__(self, max_entries=WORKSHEET_CACHE_SIZE, max_bytes=WORKSHEET_CACHE_MAX_BYTES,
+                 ttl=WORKSHEET_CACHE_TTL, negative_ttl=WORKSHEET_CACHE_NEGATIVE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._pinned = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        The cached worksheet, None if the key is known not to exist, or
+        NOT_CACHED when the caller has to go to S3.
+        """
+        with self._lock:
+            if key in self._pinned:
+                self.hits += 1
+                return self._pinned[key]
+
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return NOT_CACHED
+            if entry.expires_at <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return NOT_CACHED
+
+            self._entries.move_to_end(key)
+            if entry.data is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry.data
+
+    def put(self, key, data, size=None, pinned=False):
+        """
+        Cache a worksheet. `size` is its JSON length in bytes when the caller
+        already has it; pinned entries stay until invalidated.
+        """
+        if size is None:
+            size = len(json.dumps(data).encode('utf-8'))
+        with self._lock:
+            self._drop(key)
+            if pinned:
+                self._pinned[key] = data
+                return
+            if size > self.max_bytes:
+                logger.warning(f"⚠️ Worksheet {key} ({size} bytes) is larger than the cache; not cached")
+                return
+            self._store(key, _Entry(data, size, time.monotonic() + self.ttl))
+
+    def put_missing(self, key):
+        """Remember that S3 has no worksheet under `key`"""
+        if self.negative_ttl <= 0:
+            return
+        with self._lock:
+            if key in self._pinned:
+                return
+            self._drop(key)
+            self._store(key, _Entry(None, 0, time.monotonic() + self.negative_ttl))
+
+    def unpin(self, key, data, size):
+        """
+        Make the pinned worksheet an ordinary entry again once `data` has
+        another copy; a newer pinned version is left alone.
+        """
+        with self._lock:
+            if self._pinned.get(key) is not data:
+                return
+            del self._pinned[key]
+            if size <= self.max_bytes:
+                self._store(key, _Entry(data, size, time.monotonic() + self.ttl))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
+            self._bytes = 0
+
+    def items(self):
+        """Snapshot of the live (key, worksheet) pairs, pinned ones included"""
+        now = time.monotonic()
+        with self._lock:
+            cached = [
+                (key, entry.data) for key, entry in self._entries.items()
+                if entry.data is not None and entry.expires_at > now
+            ]
+            return list(self._pinned.items()) + cached
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'pinned': len(self._pinned),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    # Callers hold self._lock
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+    def _drop(self, key):
+        self._pinned.pop(key, None)
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+
+worksheet_cache = WorksheetCache()
@@ -0,0 +1,282 @@
+"""
+Worksheet Persister
+Write-behind S3 persistence for worksheet JSON.
+
+submit() records the latest body of a worksheet and returns immediately;
+a small pool of background threads uploads dirty worksheets to S3. Edits
+that arrive while a worksheet is still waiting are coalesced into a single
+upload of the newest body, and a worksheet is never uploaded by two
+threads at once, so S3 always ends up with the last version submitted.
+
+Failed uploads are retried with backoff up to WORKSHEET_S3_MAX_ATTEMPTS
+times. Pending uploads are flushed when the process exits, and status()
+reports where each worksheet stands:
+
+    pending   waiting for (or in the middle of) an upload
+    durable   the newest version submitted is in S3
+    failed    retries exhausted; the only copy is in memory
+
+The S3 client is anything with boto3's put_object(Bucket, Key, Body,
+ContentType), so a moto-backed or filesystem fake can stand in for it.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+WORKSHEET_S3_CONCURRENCY = int(os.getenv('WORKSHEET_S3_CONCURRENCY', '4'))
+WORKSHEET_S3_MAX_ATTEMPTS = int(os.getenv('WORKSHEET_S3_MAX_ATTEMPTS', '5'))
+WORKSHEET_S3_FLUSH_TIMEOUT = float(os.getenv('WORKSHEET_S3_FLUSH_TIMEOUT', '30'))
+# Statuses kept for worksheets that are no longer pending
+WORKSHEET_STATUS_HISTORY = 10000
+
+PENDING = 'pending'
+DURABLE = 'durable'
+FAILED = 'failed'
+
+
+class _Write:
+    """The newest unflushed body of one worksheet"""
+
+    __slots__ = ('body', 'version', 'on_durable', 'attempts', 'ready_at')
+
+    def __init__(self, body, version, on_durable):
+        self.body = body
+        self.version = version
+        self.on_durable = on_durable
+        self.attempts = 0
+        self.ready_at = 0.0
+
+
+class WriteBehindPersister:
+    """Coalescing, bounded-concurrency background uploader of worksheet JSON"""
+
+    def __init__(self, client=None, bucket=None, key_for=None, concurrency=WORKSHEET_S3_CONCURRENCY,
+                 max_attempts=WORKSHEET_S3_MAX_ATTEMPTS, content_type='application/json'):
+        self.client = client
+        self.bucket = bucket
+        self.key_for = key_for or (lambda key: key)
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.content_type = content_type
+        self._cond = threading.Condition()
+        self._pending = OrderedDict()       # key -> _Write, oldest first
+        self._inflight = set()
+        self._status = OrderedDict()        # key -> status dict, least recently touched first
+        self._versions = {}                 # key -> last version submitted (pending keys only)
+        self._workers = []
+        self._worker_pid = None
+        self._generation = 0
+        self._stopping = False
+        self.uploads = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failures = 0
+
+    def configure(self, client, bucket):
+        self.client = client
+        self.bucket = bucket
+
+    @property
+    def is_configured(self):
+        return bool(self.client and self.bucket)
+
+    # ------------------------------------------------------------------
+    # Submitting and status
+    # ------------------------------------------------------------------
+
+    def submit(self, key, body, on_durable=None):
+        """
+        Queue `body` (bytes) as the new content of `key`. on_durable() is
+        called from a worker once this version (or a newer one) is in S3.
+        Returns False without queueing when S3 is not configured.
+        """
+        if not self.is_configured:
+            return False
+
+        with self._cond:
+            self._ensure_workers()
+            version = self._versions.get(key, self._status.get(key, {}).get('version', 0)) + 1
+            self._versions[key] = version
+
+            write = self._pending.get(key)
+            if write is not None:
+                # Still waiting: replace its body rather than upload twice
+                write.body, write.version, write.on_durable = body, version, on_durable
+                write.attempts, write.ready_at = 0, 0.0
+                self.coalesced += 1
+            else:
+                self._pending[key] = _Write(body, version, on_durable)
+
+            self._set_status(key, PENDING, version)
+            self._cond.notify()
+        return True
+
+    def status(self, key):
+        """Durability of `key`: state, version, attempts, last_error, updated_at"""
+        with self._cond:
+            status = self._status.get(key)
+            return dict(status) if status else {'state': 'unknown'}
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pending': len(self._pending),
+                'in_flight': len(self._inflight),
+                'uploads': self.uploads,
+                'coalesced': self.coalesced,
+                'retries': self.retries,
+                'failures': self.failures
+            }
+
+    def flush(self, timeout=WORKSHEET_S3_FLUSH_TIMEOUT):
+        """Wait until nothing is pending or in flight; returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            # Uploads waiting out a retry backoff go now
+            for write in self._pending.values():
+                write.ready_at = 0.0
+            self._cond.notify_all()
+            while self._pending or self._inflight:
+                if not self._workers_alive():
+                    # Nothing would drain the queue (e.g. interpreter shutting down)
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return not (self._pending or self._inflight)
+
+    def shutdown(self, timeout=WORKSHEET_S3_FLUSH_TIMEOUT):
+        """Flush, then stop the workers"""
+        flushed = self.flush(timeout)
+        with self._cond:
+            left = list(self._pending) + list(self._inflight)
+            self._stopping = True
+            self._cond.notify_all()
+        if not flushed:
+            logger.error(f"❌ Worksheet persister stopped with {len(left)} uploads unflushed: {left[:20]}")
+        return flushed
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def _ensure_workers(self):
+        """Start the worker threads in this process (threads do not survive a fork)"""
+        if self._worker_pid == os.getpid() and not self._stopping and self._workers_alive():
+            return
+        if self._worker_pid != os.getpid():
+            self._inflight.clear()
+        # Workers of an earlier generation (stopped, or inherited) exit on their next take
+        self._generation += 1
+        self._worker_pid = os.getpid()
+        self._stopping = False
+        self._workers = [
+            threading.Thread(target=self._run, args=(self._generation,), name=f'worksheet-s3-{index}', daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _workers_alive(self):
+        return any(worker.is_alive() for worker in self._workers)
+
+    def _take(self, generation):
+        """Next ready key not already uploading, or None once stopped (caller holds the lock)"""
+        while True:
+            if self._stopping or generation != self._generation:
+                return None, None
+            now = time.monotonic()
+            wait = None
+            for key, write in self._pending.items():
+                if key in self._inflight:
+                    continue
+                if write.ready_at <= now:
+                    del self._pending[key]
+                    self._inflight.add(key)
+                    return key, write
+                wait = write.ready_at - now if wait is None else min(wait, write.ready_at - now)
+            self._cond.wait(wait)
+
+    def _run(self, generation):
+        while True:
+            with self._cond:
+                key, write = self._take(generation)
+            if key is None:
+                return
+
+            error = None
+            try:
+                self.client.put_object(
+                    Bucket=self.bucket,
+                    Key=self.key_for(key),
+                    Body=write.body,
+                    ContentType=self.content_type
+                )
+            except Exception as e:
+                error = e
+
+            callback = None
+            with self._cond:
+                self._inflight.discard(key)
+                newer = key in self._pending
+                if error is None:
+                    self.uploads += 1
+                    if not newer:
+                        self._versions.pop(key, None)
+                        self._set_status(key, DURABLE, write.version, write.attempts + 1)
+                        callback = write.on_durable
+                elif newer:
+                    # A newer body is already queued and supersedes this one
+                    pass
+                elif write.attempts + 1 < self.max_attempts:
+                    write.attempts += 1
+                    write.ready_at = time.monotonic() + min(2 ** write.attempts, 60)
+                    self._pending[key] = write
+                    self.retries += 1
+                    self._set_status(key, PENDING, write.version, write.attempts, str(error))
+                    logger.warning(f"⚠️ Worksheet {key} upload failed (attempt {write.attempts}), retrying: {error}")
+                else:
+                    self._versions.pop(key, None)
+                    self.failures += 1
+                    self._set_status(key, FAILED, write.version, write.attempts + 1, str(error))
+                    logger.error(f"❌ Worksheet {key} upload failed after {write.attempts + 1} attempts: {error}")
+                self._cond.notify_all()
+
+            if callback is not None:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"❌ Worksheet {key} durable callback failed: {e}")
+
+    def _set_status(self, key, state, version, attempts=0, last_error=None):
+        """Caller holds the lock"""
+        self._status[key] = {
+            'state': state,
+            'version': version,
+            'attempts': attempts,
+            'last_error': last_error,
+            'updated_at': datetime.utcnow().isoformat()
+        }
+        self._status.move_to_end(key)
+        while len(self._status) > WORKSHEET_STATUS_HISTORY:
+            oldest = next(iter(self._status))
+            if oldest in self._pending or oldest in self._inflight:
+                break
+            self._status.popitem(last=False)
+
+
+worksheet_persister = WriteBehindPersister(key_for=lambda key: f"worksheets/{key}.json")
+
+
+@atexit.register
+def _flush_on_exit():
+    if worksheet_persister._workers:
+        worksheet_persister.shutdown()
@@ -0,0 +1,74 @@
+import pytest
+
+from services.answer_grader import UNDECIDED, grade_answer, parse_number
+
+
+def grade(expected, student, **question):
+    return grade_answer(dict(question, expectedAnswer=expected), student)
+
+
+@pytest.mark.parametrize('expected, student', [
+    ('1,180', '1180'),
+    ('$46', '46 dollars'),
+    ('100', '1e2'),
+    ('3/4', '0.75'),
+    ('0.5', '1/2'),
+    ('7', '7.0'),
+    ('3.14', '3.14159'),
+    ('25%', '25'),
+    ('12.5 cm', '12.5'),
+    ('Paris', ' the paris. '),
+])
+def test_settles_equivalent_answers_as_correct(expected, student):
+    assert grade(expected, student).correct is True
+
+
+@pytest.mark.parametrize('expected, student', [
+    ('46', '47'),
+    ('100', '99'),
+    ('7', '6.9'),
+    ('1/3', '0.5'),
+    ('1', '1e2'),
+])
+def test_settles_clearly_different_numbers_as_wrong(expected, student):
+    assert grade(expected, student) == (False, 'numeric')
+
+
+@pytest.mark.parametrize('expected, student', [
+    # a rounding of the expected value at the student's precision
+    ('1/3', '0.33'),
+    ('3.14', '3.1'),
+    # "1.000" is one, or a thousand where a point groups digits
+    ('1.000', '1000'),
+    ('1000', '1.000'),
+    # units the grader cannot read or convert
+    ('46', '46 apples'),
+    ('100', '1 x 10^2'),
+    ('5 cm', '0.05 m'),
+])
+def test_leaves_unprovable_answers_to_the_ai(expected, student):
+    assert grade(expected, student) == UNDECIDED
+
+
+def test_blank_answer_is_wrong_and_blank_expected_is_undecided():
+    assert grade('4', '  ') == (False, 'blank')
+    assert grade('', '4') == UNDECIDED
+
+
+def test_multiple_choice_matches_letter_or_text():
+    question = {'answer_format': 'multiple_choice', 'options': ['A) Red', 'B) Blue']}
+    assert grade('B) Blue', 'b', **question) == (True, 'choice')
+    assert grade('B) Blue', 'red', **question) == (False, 'choice')
+
+
+def test_true_false_words():
+    assert grade('True', 'yes', answer_format='true_false') == (True, 'true_false')
+    assert grade('True', 'F', answer_format='true_false') == (False, 'true_false')
+
+
+def test_parse_number_readings():
+    assert parse_number('1e2').values == (100.0,)
+    assert parse_number('1.000').values == (1.0, 1000.0)
+    assert parse_number('$46').unit == 'usd'
+    assert parse_number('5 e2') is None
+    assert parse_number('5 apples') is None
@@ -0,0 +1,62 @@
+import pytest
+
+from services.connection_pool import ConnectionPool, PoolExhausted, sqlite_connection_factory
+
+
+class StubConnection:
+    """mysql.connector-like stub: is_connected() turns False once closed"""
+
+    def __init__(self):
+        self.open = True
+
+    def is_connected(self):
+        return self.open
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.open = False
+
+
+@pytest.fixture
+def pool():
+    return ConnectionPool('test', StubConnection, max_size=1, timeout=0.05)
+
+
+def test_close_then_is_connected_is_false(pool):
+    connection = pool.connect()
+    assert connection.is_connected()
+
+    connection.close()
+    # The story routes check is_connected() in `finally` after closing in the body
+    assert connection.is_connected() is False
+    if connection.is_connected():
+        connection.close()
+    assert pool.metrics()['in_use'] == 0
+
+
+def test_close_returns_connection_for_reuse(pool):
+    first = pool.connect()
+    with pytest.raises(PoolExhausted):
+        pool.connect()
+    first.close()
+
+    second = pool.connect()
+    assert second.is_connected()
+    assert pool.metrics()['created'] == 1 and pool.metrics()['reused'] == 1
+
+
+def test_released_connection_refuses_driver_calls(pool):
+    connection = pool.connect()
+    connection.close()
+    with pytest.raises(AttributeError, match='already returned to pool'):
+        connection.cursor()
+
+
+def test_sqlite_connection_reports_connected_until_closed(tmp_path):
+    pool = ConnectionPool('sqlite', sqlite_connection_factory(str(tmp_path / 'scores.db')))
+    connection = pool.connect()
+    assert connection.is_connected()
+    connection.close()
+    assert not connection.is_connected()
@@ -0,0 +1,102 @@
+import pytest
+from flask import Flask, jsonify
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from services import query_budget as qb
+from services.query_budget import assert_query_ceiling, count_queries, query_budget, statement_shape
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://', poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE students (id INTEGER PRIMARY KEY, name TEXT)'))
+        connection.execute(text('CREATE TABLE tasks (id INTEGER PRIMARY KEY, student_id INTEGER, points INTEGER)'))
+        connection.execute(text('INSERT INTO students (id, name) VALUES (1, "a"), (2, "b"), (3, "c"), (4, "d"), (5, "e"), (6, "f")'))
+        connection.execute(text('INSERT INTO tasks (student_id, points) VALUES (1, 5), (2, 3), (2, 4), (6, 1)'))
+    return engine
+
+
+@pytest.fixture
+def app(engine):
+    app = Flask(__name__)
+
+    @app.route('/per-row')
+    def per_row():
+        with engine.connect() as connection:
+            students = connection.execute(text('SELECT id, name FROM students')).all()
+            points = {
+                student.id: connection.execute(
+                    text('SELECT SUM(points) FROM tasks WHERE student_id = :id'), {'id': student.id}
+                ).scalar() or 0
+                for student in students
+            }
+        return jsonify(points)
+
+    @app.route('/batched')
+    @query_budget(max_queries=1)
+    def batched():
+        with engine.connect() as connection:
+            rows = connection.execute(text(
+                'SELECT students.id, COALESCE(SUM(tasks.points), 0) FROM students '
+                'LEFT JOIN tasks ON tasks.student_id = students.id GROUP BY students.id'
+            )).all()
+        return jsonify({student_id: points for student_id, points in rows})
+
+    return app
+
+
+def test_count_queries_groups_repeated_shapes(app):
+    with count_queries() as stats:
+        response = app.test_client().get('/per-row')
+
+    assert response.json['2'] == 7
+    assert stats.count == 7
+    assert stats.repeated(5) == [('SELECT SUM(points) FROM tasks WHERE student_id = ?', 6)]
+    assert stats.db_ms >= 0
+
+
+def test_assert_query_ceiling_passes_within_the_ceiling(app):
+    response = assert_query_ceiling(app.test_client(), 'get', '/batched', ceiling=1, repeat_threshold=2)
+    assert response.json == {'1': 5, '2': 7, '3': 0, '4': 0, '5': 0, '6': 1}
+
+
+def test_assert_query_ceiling_fails_over_the_ceiling(app):
+    with pytest.raises(AssertionError, match=r'ran 7 queries \(ceiling 3\)'):
+        assert_query_ceiling(app.test_client(), 'GET', '/per-row', ceiling=3)
+
+
+def test_assert_query_ceiling_flags_per_row_queries(app):
+    with pytest.raises(AssertionError, match='repeated a statement 6x'):
+        assert_query_ceiling(app.test_client(), 'GET', '/per-row', ceiling=10, repeat_threshold=5)
+
+
+def test_statement_shape_collapses_in_lists(engine):
+    with count_queries() as stats, engine.connect() as connection:
+        for ids in ([1], [1, 2, 3]):
+            connection.execute(
+                text('SELECT name FROM students WHERE id IN :ids').bindparams(bindparam('ids', expanding=True)),
+                {'ids': ids}
+            )
+    assert list(stats.shapes.values()) == [2]
+    assert statement_shape('SELECT 1\n  FROM t WHERE id IN (?, ?, ?)') == 'SELECT 1 FROM t WHERE id IN (…)'
+
+
+def test_middleware_reports_over_budget_requests(app, monkeypatch, caplog):
+    monkeypatch.setattr(qb, 'QUERY_BUDGET_ENABLED', True)
+    monkeypatch.setattr(qb, 'QUERY_BUDGET_HEADERS', True)
+    monkeypatch.setattr(qb, 'QUERY_BUDGET_MAX_QUERIES', 5)
+    qb.register_query_budget(app)
+    client = app.test_client()
+
+    response = client.get('/per-row')
+    assert response.headers['X-Query-Count'] == '7'
+    assert response.headers['X-Query-Budget'] == 'exceeded'
+    assert response.headers['X-Query-Repeats'] == '6'
+    assert any('"endpoint": "per_row"' in record.getMessage() for record in caplog.records)
+
+    # @query_budget(max_queries=1) holds the batched view to its own budget
+    response = client.get('/batched')
+    assert response.headers['X-Query-Count'] == '1'
+    assert 'X-Query-Budget' not in response.headers
@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+from services.worksheet_persister import DURABLE, FAILED, WriteBehindPersister
+
+
+class FakeS3:
+    """put_object stand-in: records bodies per key, fails the first `fail` calls, can hold uploads"""
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.objects = {}
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        with self._lock:
+            self.calls.append((Key, Body))
+            failing = self.fail > 0
+            self.fail -= 1
+        self.started.set()
+        self.release.wait(5)
+        if failing:
+            raise IOError('S3 unavailable')
+        with self._lock:
+            self.objects[Key] = Body
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def make_persister():
+    persisters = []
+
+    def make(client, **options):
+        persister = WriteBehindPersister(client, 'bucket', key_for=lambda key: f'worksheets/{key}.json', **options)
+        persisters.append(persister)
+        return persister
+
+    yield make
+    for persister in persisters:
+        persister.shutdown(timeout=1)
+
+
+def test_not_configured_does_not_queue():
+    assert WriteBehindPersister().submit('w1', b'{}') is False
+
+
+def test_edits_while_waiting_are_coalesced(make_persister):
+    s3 = FakeS3()
+    s3.release.clear()
+    persister = make_persister(s3, concurrency=1)
+    durable = []
+
+    persister.submit('w1', b'v1', on_durable=lambda: durable.append(1))
+    s3.started.wait(5)
+    # v1 is uploading; v2 and v3 wait behind it and collapse into one upload
+    persister.submit('w1', b'v2', on_durable=lambda: durable.append(2))
+    persister.submit('w1', b'v3', on_durable=lambda: durable.append(3))
+    s3.release.set()
+
+    assert persister.flush(timeout=5)
+    assert s3.calls == [('worksheets/w1.json', b'v1'), ('worksheets/w1.json', b'v3')]
+    assert s3.objects['worksheets/w1.json'] == b'v3'
+    assert durable == [3]
+    assert persister.status('w1')['state'] == DURABLE
+    assert persister.status('w1')['version'] == 3
+    assert persister.stats()['coalesced'] == 1
+
+
+def test_failed_upload_is_retried_until_durable(make_persister):
+    s3 = FakeS3(fail=1)
+    persister = make_persister(s3, max_attempts=3)
+
+    persister.submit('w1', b'body')
+    wait_for(lambda: persister.stats()['retries'] == 1)
+    status = persister.status('w1')
+    assert status['state'] == 'pending' and status['last_error'] == 'S3 unavailable'
+
+    # flush() skips the retry backoff
+    assert persister.flush(timeout=5)
+    status = persister.status('w1')
+    assert status['state'] == DURABLE and status['attempts'] == 2
+    assert s3.objects['worksheets/w1.json'] == b'body'
+
+
+def test_upload_fails_after_max_attempts(make_persister):
+    s3 = FakeS3(fail=10)
+    persister = make_persister(s3, max_attempts=2)
+    durable = []
+
+    persister.submit('w1', b'body', on_durable=lambda: durable.append(True))
+    wait_for(lambda: persister.stats()['retries'] == 1)
+    assert persister.flush(timeout=5)
+
+    status = persister.status('w1')
+    assert status['state'] == FAILED and status['attempts'] == 2
+    assert status['last_error'] == 'S3 unavailable'
+    assert len(s3.calls) == 2 and not s3.objects and not durable
+    assert persister.stats()['failures'] == 1
+
+
+def test_shutdown_flushes_pending_uploads(make_persister):
+    s3 = FakeS3()
+    s3.release.clear()
+    persister = make_persister(s3, concurrency=2)
+    for index in range(10):
+        persister.submit(f'w{index}', f'body {index}'.encode())
+
+    threading.Timer(0.1, s3.release.set).start()
+    assert persister.shutdown(timeout=5)
+
+    assert len(s3.objects) == 10
+    assert all(persister.status(f'w{index}')['state'] == DURABLE for index in range(10))
+    for worker in persister._workers:
+        worker.join(1)
+    assert not persister._workers_alive()